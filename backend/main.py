@@ -18,20 +18,16 @@ stream_handler = logging.StreamHandler(sys.stdout)
 stream_handler.setLevel(logging.DEBUG)
 stream_handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
 
-logging.basicConfig(
-    level=logging.DEBUG,
-    handlers=[file_handler, stream_handler],
-    force=True  # 强制重新配置
-)
+# 异步写入：根 logger 只挂 QueueHandler，文件/控制台写入在后台线程完成，
+# 抓包线程不会被磁盘或终端 I/O 阻塞
+from backend.services.capture_log import setup_async_logging, get_log_config, set_log_config
+setup_async_logging([file_handler, stream_handler], level=logging.DEBUG)
+
 logger = logging.getLogger(__name__)
 logger.info("=" * 60)
 logger.info(f"NetShark Backend Starting - Log file: {log_file}")
 logger.info("=" * 60)
 
-# 立即flush确保写入
-for handler in logging.root.handlers:
-    handler.flush()
-
 # ============================================================
 # Now import backend modules (they will use the configured logging)
 # ============================================================
@@ -41,15 +37,49 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from backend.services.process_scanner import get_running_processes
 from backend.services.packet_capture import PacketCaptureEngine
+from backend.services.wire_format import PacketWireEncoder, WIRE_VERSION, ENCODINGS
+from backend.services.session_queue import SessionQueue, OVERFLOW_POLICIES
+from backend.services.payload_store import RETENTION_MODES, RETENTION_FULL
+from backend.services.protocol_id import (ProtocolIdentifier, flow_key, http_kind, http_has_json,
+                                          http_start_line, PROTO_HTTP)
+from backend.services.pcap_import import parse_pcap_file
+from backend.services.checkpoint import (Checkpointer, checkpoint_path, list_checkpoints,
+                                         DEFAULT_CHECKPOINT_DIR, DEFAULT_INTERVAL)
 from backend.services.mitm_proxy import MitmProxyService, HttpsTransaction
+from backend.services.latency_stats import EndpointLatencyTracker
 from backend.services import cert_manager
 from backend.services.ssh_manager import ssh_manager, server_storage
 import asyncio
+import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 from pydantic import BaseModel
 from typing import Optional
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    启动时从检查点恢复之前的会话（只恢复目标进程仍在运行、PID 没有被复用的会话），
+    退出时为仍在运行的会话写入最终检查点
+    """
+    for session_id, path in list_checkpoints(CHECKPOINT_DIR).items():
+        try:
+            engine = PacketCaptureEngine.from_checkpoint(path)
+        except Exception as e:
+            logger.error(f"Failed to restore session {session_id} from {path}: {e}")
+            continue
+        if engine is not None:
+            capture_engines[session_id] = engine
+    yield
+    for session_id, engine in list(capture_engines.items()):
+        try:
+            engine.stop()
+        except Exception as e:
+            logger.error(f"Error stopping session {session_id}: {e}")
+
+
+app = FastAPI(lifespan=lifespan)
 
 # 静态文件目录（前端构建后的文件）
 STATIC_DIR = Path(__file__).parent.parent / "dist"
@@ -64,9 +94,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 全局抓包引擎实例（每个会话一个）
+# 全局抓包引擎实例（每个会话一个；启动时从检查点恢复的会话未在抓包，只供查询）
 capture_engines = {}
 
+# 会话检查点目录
+CHECKPOINT_DIR = DEFAULT_CHECKPOINT_DIR
+
+# 使用二进制编码的会话的编码器（每个会话一个字符串表）
+wire_encoders = {}
+
+# 每个会话的有界发送队列
+session_queues = {}
+
 # MITM 代理服务实例
 mitm_proxy: MitmProxyService = None
 mitm_websockets: list = []  # 存储 HTTPS 抓包的 WebSocket 连接
@@ -145,8 +184,6 @@ async def upload_pcap(file: UploadFile = File(...)):
     """
     import tempfile
     import os
-    from datetime import datetime
-    from scapy.all import rdpcap, IP, TCP, UDP, Raw, DNS
     
     # 验证文件类型
     allowed_extensions = ['.pcap', '.pcapng', '.cap']
@@ -154,78 +191,6 @@ async def upload_pcap(file: UploadFile = File(...)):
     if file_ext not in allowed_extensions:
         return {"error": f"不支持的文件格式: {file_ext}"}
     
-    def detect_protocol(pkt, sport, dport):
-        """检测应用层协议 - 只有包含实际数据时才识别为应用层协议"""
-        
-        # 检查是否有应用层数据
-        has_payload = pkt.haslayer(Raw) and len(bytes(pkt[Raw].load)) > 0
-        
-        # 常见端口映射
-        TLS_PORTS = {443, 8443, 993, 995, 465, 636}
-        SSH_PORTS = {22}
-        HTTP_PORTS = {80, 8080, 8000, 3000}
-        DNS_PORTS = {53}
-        MYSQL_PORTS = {3306}
-        REDIS_PORTS = {6379}
-        
-        # 如果没有 payload，则不识别为应用层协议
-        # 只显示传输层协议（TCP/UDP）
-        if not has_payload:
-            return None
-        
-        payload = bytes(pkt[Raw].load)
-        
-        # 检查 TLS 特征（通过数据内容判断，而不是端口）
-        if len(payload) >= 3 and payload[0] in [0x14, 0x15, 0x16, 0x17] and payload[1] == 0x03:
-            version_minor = payload[2]
-            if version_minor == 0x03:
-                return "TLSv1.2"
-            elif version_minor == 0x04:
-                return "TLSv1.3"
-            elif version_minor == 0x01:
-                return "TLSv1.0"
-            elif version_minor == 0x02:
-                return "TLSv1.1"
-            return "TLS"
-        
-        # 检查 SSH 特征（SSH 协议以 "SSH-" 开头）
-        if sport in SSH_PORTS or dport in SSH_PORTS:
-            try:
-                if payload[:4] == b'SSH-':
-                    return "SSH"
-            except:
-                pass
-            # 如果有数据但不是 SSH 握手，可能是加密的 SSH 数据
-            if len(payload) > 0:
-                return "SSH"
-        
-        # 检查 DNS（通常是 UDP）
-        if sport in DNS_PORTS or dport in DNS_PORTS:
-            return "DNS"
-        
-        # 检查 HTTP 特征
-        try:
-            payload_text = payload[:20].decode('latin-1')
-            http_methods = ['GET ', 'POST ', 'PUT ', 'DELETE ', 'HEAD ', 'OPTIONS ', 'PATCH ']
-            if any(payload_text.startswith(m) for m in http_methods):
-                return "HTTP"
-            if payload_text.startswith('HTTP/'):
-                return "HTTP"
-        except:
-            pass
-        
-        # 基于端口的猜测（仅当有 payload 时）
-        if sport in HTTP_PORTS or dport in HTTP_PORTS:
-            return "HTTP"
-        
-        if sport in MYSQL_PORTS or dport in MYSQL_PORTS:
-            return "MySQL"
-        
-        if sport in REDIS_PORTS or dport in REDIS_PORTS:
-            return "Redis"
-        
-        return None
-    
     try:
         # 保存到临时文件
         logger.info(f"[PCAP] Uploading file: {file.filename}")
@@ -237,218 +202,11 @@ async def upload_pcap(file: UploadFile = File(...)):
         logger.info(f"[PCAP] Saved to temp file: {tmp_path}, size: {len(content)} bytes")
         
         # 使用 scapy 解析 PCAP 文件
-        packets_raw = rdpcap(tmp_path)
-        logger.info(f"[PCAP] Total raw packets: {len(packets_raw)}")
-        
-        # TCP 流追踪 - 用于识别同一个 TCP 连接的所有包
-        tcp_streams = {}  # key: stream_key, value: stream_id
-        stream_counter = 0
-        
-        def get_stream_id(src_ip, dst_ip, sport, dport):
-            """获取 TCP 流 ID，双向匹配"""
-            nonlocal stream_counter
-            # 创建规范化的流键（确保双向都能匹配到同一个流）
-            key1 = (src_ip, sport, dst_ip, dport)
-            key2 = (dst_ip, dport, src_ip, sport)
-            
-            if key1 in tcp_streams:
-                return tcp_streams[key1]
-            if key2 in tcp_streams:
-                return tcp_streams[key2]
-            
-            # 新的流
-            stream_counter += 1
-            tcp_streams[key1] = stream_counter
-            return stream_counter
-        
-        # 转换为前端格式
-        packets = []
-        skipped_no_ip = 0
-        for i, pkt in enumerate(packets_raw):
-            if not pkt.haslayer(IP):
-                skipped_no_ip += 1
-                continue
-            
-            ip_layer = pkt[IP]
-            base_protocol = "TCP" if pkt.haslayer(TCP) else "UDP" if pkt.haslayer(UDP) else "IP"
-            
-            # 提取端口
-            sport = dport = 0
-            if pkt.haslayer(TCP):
-                sport = pkt[TCP].sport
-                dport = pkt[TCP].dport
-            elif pkt.haslayer(UDP):
-                sport = pkt[UDP].sport
-                dport = pkt[UDP].dport
-            
-            # 检测应用层协议
-            app_protocol = detect_protocol(pkt, sport, dport)
-            protocol = app_protocol if app_protocol else base_protocol
-            
-            # 计算大小
-            size = len(pkt)
-            
-            # 构建 info 字段
-            info = f"{sport} → {dport}"
-            if pkt.haslayer(TCP):
-                flags = pkt[TCP].flags
-                flag_str = str(flags) if flags else ""
-                info += f" [{flag_str}]"
-            
-            # TLS 特殊处理
-            if protocol.startswith("TLS"):
-                if pkt.haslayer(Raw):
-                    payload = bytes(pkt[Raw].load)
-                    if len(payload) >= 6 and payload[0] == 0x16:  # Handshake
-                        hs_type = payload[5] if len(payload) > 5 else 0
-                        hs_names = {1: "Client Hello", 2: "Server Hello", 11: "Certificate", 14: "Server Hello Done"}
-                        info = f"{protocol} Handshake: {hs_names.get(hs_type, 'Unknown')}"
-                    elif len(payload) >= 1 and payload[0] == 0x17:  # Application Data
-                        info = f"{protocol} Application Data ({len(payload)} bytes)"
-                    else:
-                        info = f"{protocol} Encrypted"
-            
-            # 获取原始时间戳（用于排序）
-            raw_time = float(pkt.time)
-            
-            # 提取 payload 内容
-            payload_raw = b""
-            payload_text = ""
-            payload_hex = ""
-            payload_base64 = ""
-            if pkt.haslayer(Raw):
-                payload_raw = bytes(pkt[Raw].load)
-                # 尝试解码为文本（可能是二进制数据）
-                try:
-                    payload_text = payload_raw.decode('utf-8', errors='replace')
-                except:
-                    payload_text = payload_raw.decode('latin-1', errors='replace')
-                # Hex 格式
-                payload_hex = ' '.join(f'{b:02x}' for b in payload_raw)
-                # Base64 格式
-                import base64
-                payload_base64 = base64.b64encode(payload_raw).decode('ascii')
-            
-            # 提取 TCP 层信息
-            tcp_data = None
-            if pkt.haslayer(TCP):
-                tcp_layer = pkt[TCP]
-                flags = tcp_layer.flags
-                tcp_data = {
-                    "src_port": tcp_layer.sport,
-                    "dst_port": tcp_layer.dport,
-                    "seq": tcp_layer.seq,
-                    "ack": tcp_layer.ack,
-                    "flags": str(flags) if flags else "",
-                    "window_size": tcp_layer.window,
-                    "payload_length": len(payload_raw),
-                    "is_retransmission": False,  # PCAP 无法直接检测
-                    "is_out_of_order": False,
-                }
-            
-            # 提取 UDP 层信息
-            udp_data = None
-            if pkt.haslayer(UDP):
-                udp_layer = pkt[UDP]
-                udp_data = {
-                    "src_port": udp_layer.sport,
-                    "dst_port": udp_layer.dport,
-                    "length": udp_layer.len,
-                }
-            
-            # 获取 TCP 流 ID
-            stream_id = None
-            stream_peer = None  # 0 = 客户端发送, 1 = 服务端发送
-            if pkt.haslayer(TCP):
-                stream_id = get_stream_id(ip_layer.src, ip_layer.dst, sport, dport)
-                # 判断是哪一方发送的（端口号较小的通常是服务端）
-                if sport < dport:
-                    stream_peer = 0  # 服务端发送
-                else:
-                    stream_peer = 1  # 客户端发送
-            
-            packet_data = {
-                "id": i + 1,
-                "timestamp": datetime.fromtimestamp(raw_time).strftime("%H:%M:%S.%f")[:-3],
-                "raw_time": raw_time,  # 保存原始时间戳用于排序
-                "source": ip_layer.src,
-                "sourceIP": ip_layer.src,
-                "destination": ip_layer.dst,
-                "destIP": ip_layer.dst,
-                "protocol": protocol,
-                "method": protocol,
-                "path": f"{ip_layer.dst}:{dport}",
-                "size": f"{size}B",
-                "info": info,
-                "traceId": f"pcap-{i+1}",
-                "category": "client",  # 默认分类
-                "body": payload_text,  # 文本格式
-                "payload_hex": payload_hex,  # Hex 格式
-                "payload_base64": payload_base64,  # Base64 格式
-                "payload_size": len(payload_raw),  # Payload 大小
-                "tcp": tcp_data,  # TCP 层信息
-                "udp": udp_data,  # UDP 层信息
-                "stream_id": stream_id,  # TCP 流 ID
-                "stream_peer": stream_peer,  # 发送方 (0/1)
-            }
-            
-            packets.append(packet_data)
-        
-        # 按原始时间戳排序
-        packets.sort(key=lambda p: p.get("raw_time", 0))
-        
-        # 计算相对时间（从第一个包开始，与 Wireshark 一致）
-        if packets:
-            first_time = packets[0].get("raw_time", 0)
-            for idx, pkt_data in enumerate(packets):
-                pkt_data["id"] = idx + 1
-                raw = pkt_data.get("raw_time", 0)
-                relative = raw - first_time
-                # 格式化为 Wireshark 风格的相对时间
-                pkt_data["timestamp"] = f"{relative:.6f}"
-        
-        # 构建 TCP 流信息（用于流追踪功能）
-        streams = {}
-        for pkt in packets:
-            sid = pkt.get("stream_id")
-            if sid is None:
-                continue
-            
-            if sid not in streams:
-                # 初始化流信息
-                streams[sid] = {
-                    "stream_id": sid,
-                    "peers": [],  # 两个通信端点
-                    "packets": [],  # 该流的所有包 ID
-                    "total_bytes": 0,
-                    "packet_count": 0,
-                }
-            
-            stream = streams[sid]
-            
-            # 添加端点信息
-            peer_info = {
-                "host": pkt.get("sourceIP"),
-                "port": pkt.get("tcp", {}).get("src_port") if pkt.get("tcp") else 0
-            }
-            # 检查是否已存在该端点
-            if not any(p["host"] == peer_info["host"] and p["port"] == peer_info["port"] for p in stream["peers"]):
-                if len(stream["peers"]) < 2:
-                    stream["peers"].append(peer_info)
-            
-            # 添加包引用
-            stream["packets"].append({
-                "id": pkt.get("id"),
-                "peer": pkt.get("stream_peer"),
-                "timestamp": pkt.get("raw_time"),
-                "payload_size": pkt.get("payload_size", 0),
-                "payload_base64": pkt.get("payload_base64", ""),
-            })
-            stream["total_bytes"] += pkt.get("payload_size", 0)
-            stream["packet_count"] += 1
-        
-        # 转换为列表
-        streams_list = list(streams.values())
+        result = parse_pcap_file(tmp_path)
+        packets = result["packets"]
+        streams_list = result["streams"]
+        tcp_expert = result["tcp_expert"]
+        skipped_no_ip = result["skipped_no_ip"]
         
         # 清理临时文件
         os.unlink(tmp_path)
@@ -468,6 +226,7 @@ async def upload_pcap(file: UploadFile = File(...)):
             "packets": packets,
             "streams": streams_list,  # TCP 流信息
             "stream_count": len(streams_list),
+            "tcp_expert": tcp_expert,  # TCP 专家分析（按服务器汇总）
         }
         
     except Exception as e:
@@ -557,6 +316,24 @@ def get_https_proxy_status():
         }
 
 
+@app.get("/api/https/latency")
+def get_https_latency(window: Optional[float] = None, method: Optional[str] = None, host: Optional[str] = None,
+                      url_template: Optional[str] = None, sort: str = "p99", limit: int = 100):
+    """MITM 代理解密的 HTTPS 事务按端点的延迟 p50/p90/p99/max（window 为滑动窗口秒数）"""
+    if not mitm_proxy:
+        return {"error": "Proxy not running"}
+    
+    try:
+        return {
+            'window': window,
+            'overall': mitm_proxy.latency.overall(window),
+            'endpoints': mitm_proxy.latency.query(window, method=method, host=host, template=url_template,
+                                                  sort_by=sort, limit=max(1, min(limit, 1000)))
+        }
+    except ValueError as e:
+        return {"error": str(e)}
+
+
 @app.get("/api/https/cert-info")
 def get_cert_info():
     """
@@ -629,7 +406,7 @@ def _transaction_to_packet(transaction: HttpsTransaction) -> dict:
         "method": req.method,
         "url": req.url,
         "headers": req.headers,
-        "body": req.body.decode('utf-8', errors='replace') if req.body else ""
+        "body": req.content.decode('utf-8', errors='replace') if req.content else ""
     }
     
     if resp:
@@ -637,7 +414,7 @@ def _transaction_to_packet(transaction: HttpsTransaction) -> dict:
             "status_code": resp.status_code,
             "reason": resp.reason,
             "headers": resp.headers,
-            "body": resp.body.decode('utf-8', errors='replace') if resp.body else ""
+            "body": resp.content.decode('utf-8', errors='replace') if resp.content else ""
         }
     
     return {
@@ -653,7 +430,7 @@ def _transaction_to_packet(transaction: HttpsTransaction) -> dict:
         "protocol": "HTTPS" if req.is_https else "HTTP",
         "http": http_data,
         "tcp": None,
-        "payload": req.body.decode('utf-8', errors='replace') if req.body else "",
+        "payload": req.content.decode('utf-8', errors='replace') if req.content else "",
         "hex_dump": req.body.hex() if req.body else "",
         "latency": f"{transaction.duration:.2f}ms" if transaction.duration else None
     }
@@ -674,6 +451,26 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
         target_pid = config.get("targetPid")
         db_ports = config.get("dbFilter", "3306,6379,5432")
         server_ips = config.get("serverFilter", "")  # 新增：服务器IP过滤
+        capture_mode = config.get("captureMode", "scapy")  # scapy | fast | pipeline
+        pipeline_workers = int(config.get("pipelineWorkers", 2))
+        stream_shards = max(1, int(config.get("streamShards", PacketCaptureEngine.STREAM_SHARDS)))  # TCP 流表分片数
+        dynamic_bpf = bool(config.get("dynamicBpf", True))  # 按目标进程端口动态生成内核过滤器
+        encoding = config.get("encoding", "json")  # json | binary
+        if encoding not in ENCODINGS:
+            encoding = "json"
+        queue_size = int(config.get("queueSize", 10000))  # 发送队列容量（数据包数量）
+        overflow_policy = config.get("overflowPolicy", "drop-oldest")  # drop-oldest | drop-newest | aggregate
+        if overflow_policy not in OVERFLOW_POLICIES:
+            overflow_policy = "drop-oldest"
+        payload_retention = config.get("payloadRetention", RETENTION_FULL)  # none | headers | full（落盘）
+        if payload_retention not in RETENTION_MODES:
+            payload_retention = RETENTION_FULL
+        checkpoint_enabled = bool(config.get("checkpoint", False))  # 可选：定期写检查点，并从同一进程上次的检查点继续
+        checkpoint_interval = float(config.get("checkpointInterval", DEFAULT_INTERVAL))
+        if checkpoint_enabled and capture_mode == "pipeline":
+            # pipeline 模式下流和 HTTP 状态在解析进程中，API 进程没有可保存的状态
+            logger.warning("Checkpoints are not supported in pipeline mode, disabled for this session")
+            checkpoint_enabled = False
         
         if not target_pid:
             await websocket.send_json({"error": "Missing targetPid"})
@@ -692,37 +489,62 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
             except Exception as e:
                 logger.error(f"Error cleaning up old session: {e}")
         
-        # 创建抓包引擎
-        engine = PacketCaptureEngine(target_pid, db_ports, server_ips)
+        # 创建抓包引擎（旧会话停止时已写入最终检查点，从它继续）
+        checkpointer = None
+        if checkpoint_enabled:
+            checkpointer = Checkpointer(checkpoint_path(CHECKPOINT_DIR, session_id),
+                                        interval=max(1.0, checkpoint_interval))
+        engine = PacketCaptureEngine(target_pid, db_ports, server_ips, capture_mode=capture_mode,
+                                     pipeline_workers=pipeline_workers, dynamic_bpf=dynamic_bpf,
+                                     payload_retention=payload_retention, checkpointer=checkpointer,
+                                     stream_shards=stream_shards)
+        if checkpointer is not None:
+            engine.restore_checkpoint(checkpointer.path)
         capture_engines[session_id] = engine
         
         # 获取当前事件循环
         loop = asyncio.get_event_loop()
         
-        # 使用队列在线程间传递数据包
-        packet_queue = asyncio.Queue()
+        # 有界队列在线程间传递数据包，浏览器消费过慢时按溢出策略丢弃/聚合
+        packet_queue = session_queues[session_id] = SessionQueue(loop, max_packets=queue_size,
+                                                                 policy=overflow_policy)
         
-        # 定义同步回调（会在抓包线程中调用）
-        def sync_callback(packet_data):
-            """在抓包线程中调用的同步回调"""
+        # 定义批量回调（会在抓包线程/批处理定时线程中调用）
+        def batch_callback(batch):
+            """按批次投递，消费者取走之前只唤醒一次事件循环"""
             try:
-                # 使用 call_soon_threadsafe 将数据放入队列
-                loop.call_soon_threadsafe(packet_queue.put_nowait, packet_data)
+                packet_queue.put(batch)
             except Exception as e:
-                logger.error(f"Failed to queue packet: {e}")
+                logger.error(f"Failed to queue packets: {e}")
+        
+        # 协商编码：确认后续批次的帧格式
+        encoder = None
+        if encoding == "binary":
+            encoder = wire_encoders[session_id] = PacketWireEncoder()
+        await websocket.send_json({"type": "config", "encoding": encoding, "version": WIRE_VERSION})
         
-        # 启动抓包
-        engine.start(sync_callback)
+        # 启动抓包（256 个包或 50ms 刷新一次）
+        engine.start(batch_callback=batch_callback, batch_size=256, batch_interval=0.05)
         
         # 创建异步任务来发送队列中的数据包
         async def send_packets():
             while True:
                 try:
-                    packet_data = await packet_queue.get()
-                    await websocket.send_json(packet_data)
-                    logger.debug(f"Sent packet to WebSocket: {packet_data['id']}")
+                    # 一次取出全部积压的数据包
+                    batch, notices = await packet_queue.get()
+                    # 丢弃/聚合通知先于数据包下发
+                    for notice in notices:
+                        await websocket.send_json(notice)
+                    if not batch:
+                        continue
+                    if encoder:
+                        for frame in encoder.encode(batch):
+                            await websocket.send_bytes(frame)
+                    else:
+                        await websocket.send_json({"type": "batch", "packets": batch})
+                    logger.debug(f"Sent {len(batch)} packets to WebSocket")
                 except Exception as e:
-                    logger.error(f"Failed to send packet: {e}")
+                    logger.error(f"Failed to send packets: {e}")
                     break
         
         # 启动发送任务
@@ -751,9 +573,219 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
         if session_id in capture_engines:
             capture_engines[session_id].stop()
             del capture_engines[session_id]
+        wire_encoders.pop(session_id, None)
+        session_queues.pop(session_id, None)
         logger.info(f"Capture stopped for session {session_id}")
 
 
+@app.get("/api/capture/{session_id}/stats")
+def get_capture_stats(session_id: str):
+    """获取抓包会话的运行统计"""
+    engine = capture_engines.get(session_id)
+    if not engine:
+        return {"error": "Session not found"}
+    stats = engine.get_stats()
+    encoder = wire_encoders.get(session_id)
+    stats['wire'] = encoder.stats() if encoder else {'encoding': 'json'}
+    packet_queue = session_queues.get(session_id)
+    if packet_queue:
+        stats['queue'] = packet_queue.stats()
+    return stats
+
+
+@app.delete("/api/capture/{session_id}/checkpoint")
+def delete_checkpoint(session_id: str):
+    """删除会话的检查点（下次同一会话从空状态开始），同时移除从检查点恢复的只读会话"""
+    engine = capture_engines.get(session_id)
+    if engine is not None and not engine.is_running:
+        del capture_engines[session_id]
+    path = checkpoint_path(CHECKPOINT_DIR, session_id)
+    if not os.path.exists(path):
+        return {"error": "Checkpoint not found"}
+    os.remove(path)
+    return {"status": "deleted", "session_id": session_id}
+
+
+@app.get("/api/capture/{session_id}/packets/{packet_id}")
+def get_packet_detail(session_id: str, packet_id: int):
+    """
+    获取数据包详情（完整协议解析）
+    快速模式下只有在这里才会调用 Scapy 解析
+    """
+    engine = capture_engines.get(session_id)
+    if not engine:
+        return {"error": "Session not found"}
+    
+    try:
+        detail = engine.get_packet_detail(packet_id)
+    except ValueError as e:
+        return {"error": str(e)}
+    if detail is None:
+        return {"error": "Packet not available"}
+    return detail
+
+
+@app.get("/api/capture/{session_id}/packets/{packet_id}/http-body")
+def get_http_body(session_id: str, packet_id: int, limit: int = 65536):
+    """
+    获取数据包完成的 HTTP 消息的完整消息体
+    按 Content-Encoding 解压（gzip/deflate/br，有大小上限）、按 charset 解码
+    """
+    engine = capture_engines.get(session_id)
+    if not engine:
+        return {"error": "Session not found"}
+    
+    try:
+        body = engine.get_http_body(packet_id, limit)
+    except ValueError as e:
+        return {"error": str(e)}
+    if body is None:
+        return {"error": "HTTP message not available"}
+    return body
+
+
+@app.get("/api/capture/{session_id}/http/transactions")
+def query_http_transactions(session_id: str, host: Optional[str] = None, url_template: Optional[str] = None,
+                            status: Optional[int] = None, status_class: Optional[int] = None,
+                            stream_id: Optional[str] = None, start: Optional[float] = None,
+                            end: Optional[float] = None, min_ms: Optional[float] = None,
+                            max_ms: Optional[float] = None, limit: int = 100, cursor: Optional[int] = None):
+    """
+    按条件查询HTTP事务（从新到旧分页）
+    status_class 为状态码类别（5 表示 5xx）；start/end 为完成时间（Unix 秒）；min_ms/max_ms 为耗时范围
+    cursor 取上一页返回的 next_cursor
+    """
+    engine = capture_engines.get(session_id)
+    if not engine:
+        return {"error": "Session not found"}
+    
+    try:
+        return engine.query_http_transactions(
+            limit=max(1, min(limit, 1000)), before=cursor, host=host, template=url_template, status=status,
+            status_class=status_class, stream_id=stream_id, start=start, end=end,
+            min_duration=min_ms, max_duration=max_ms)
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+@app.get("/api/capture/{session_id}/http/latency")
+def get_http_latency(session_id: str, window: Optional[float] = None, method: Optional[str] = None,
+                     host: Optional[str] = None, url_template: Optional[str] = None, sort: str = "p99",
+                     limit: int = 100, include_https: bool = False):
+    """
+    按端点（方法 + host + URL 模板）的HTTP延迟 p50/p90/p99/max
+    :param window: 滑动窗口（秒），省略表示全部时间
+    :param sort: p50 | p90 | p99 | max | avg | count
+    :param include_https: 合并 MITM 代理解密的 HTTPS 事务
+    """
+    engine = capture_engines.get(session_id)
+    if not engine:
+        return {"error": "Session not found"}
+    
+    limit = max(1, min(limit, 1000))
+    filters = {'method': method, 'host': host, 'template': url_template}
+    try:
+        if not (include_https and mitm_proxy):
+            return engine.get_http_latency(window, sort, limit, **filters)
+        engine.require_local_state("HTTP latency")
+        latency = EndpointLatencyTracker()
+        latency.merge(engine.http_stream_parser.latency)
+        latency.merge(mitm_proxy.latency)
+        return {
+            'window': window,
+            'overall': latency.overall(window),
+            'endpoints': latency.query(window, sort_by=sort, limit=limit, **filters)
+        }
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+@app.get("/api/capture/{session_id}/streams")
+def query_streams(session_id: str, sort: str = "bytes", limit: int = 50, cursor: Optional[str] = None):
+    """
+    按指标排序分页查询TCP流
+    :param sort: bytes | packets | retransmission_rate | duration
+    :param cursor: 上一页返回的 next_cursor
+    """
+    engine = capture_engines.get(session_id)
+    if not engine:
+        return {"error": "Session not found"}
+    
+    try:
+        return engine.query_streams(sort, max(1, min(limit, 1000)), cursor)
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+@app.get("/api/capture/{session_id}/experts")
+def get_expert_stats(session_id: str):
+    """TCP 专家分析：按服务器端点汇总的握手 RTT、数据 RTT、重复 ACK/零窗口等事件"""
+    engine = capture_engines.get(session_id)
+    if not engine:
+        return {"error": "Session not found"}
+    
+    try:
+        return {"servers": engine.get_expert_stats()}
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+@app.get("/api/capture/{session_id}/udp-flows")
+def get_udp_flows(session_id: str, stream_id: Optional[str] = None):
+    """UDP 流：计数器、payload 长度直方图和识别出的协议（DNS/QUIC），可按 stream_id 查询单个流"""
+    engine = capture_engines.get(session_id)
+    if not engine:
+        return {"error": "Session not found"}
+    
+    try:
+        flows = engine.get_udp_flows(stream_id)
+    except ValueError as e:
+        return {"error": str(e)}
+    if flows is None:
+        return {"error": "Flow not found"}
+    return {"flows": flows}
+
+
+@app.get("/api/capture/{session_id}/streams/{stream_id}/follow")
+def follow_stream(session_id: str, stream_id: str, direction: Optional[str] = None, limit: int = 1000):
+    """
+    跟踪TCP流：按到达顺序返回各报文的 payload
+    payload 按会话的保留策略读回（full 模式从落盘文件读取）
+    """
+    engine = capture_engines.get(session_id)
+    if not engine:
+        return {"error": "Session not found"}
+    
+    try:
+        segments = engine.follow_stream(stream_id, direction, limit)
+    except ValueError as e:
+        return {"error": str(e)}
+    if segments is None:
+        return {"error": "Stream not available"}
+    return {"stream_id": stream_id, "retention": engine.payload_retention, "segments": segments}
+
+
+class LogConfigRequest(BaseModel):
+    """运行时日志配置"""
+    level: Optional[str] = None  # DEBUG | INFO | WARNING | ERROR | CRITICAL
+    sample_interval: Optional[float] = None  # 热路径日志采样间隔（秒），0 表示逐条输出
+
+
+@app.get("/api/logging")
+def get_logging_config():
+    """获取抓包日志级别、采样间隔和热路径计数"""
+    return get_log_config()
+
+
+@app.put("/api/logging")
+def update_logging_config(request: LogConfigRequest):
+    """运行时调整抓包日志级别和采样间隔"""
+    try:
+        return set_log_config(level=request.level, sample_interval=request.sample_interval)
+    except ValueError as e:
+        return {"error": str(e)}
+
+
 @app.websocket("/ws/https")
 async def https_websocket_endpoint(websocket: WebSocket):
     """
@@ -992,6 +1024,7 @@ async def ssh_capture_to_file(request: SSHCaptureRequest):
         try:
             packets_raw = rdpcap(tmp_path)
             packets = []
+            protocol_identifier = ProtocolIdentifier()
             
             # 流追踪相关
             stream_map = {}
@@ -1071,38 +1104,17 @@ async def ssh_capture_to_file(request: SSHCaptureRequest):
                 app_protocol = protocol  # 默认用传输层协议
                 http_info = ""
                 
-                if payload_size > 0 and pkt.haslayer(TCP):
+                if payload_size > 0 and (tcp_data or udp_data):
                     try:
-                        payload_str = payload_raw.decode('utf-8', errors='ignore')
-                        payload_lower = payload_str.lower()
-                        
-                        # 检测是否包含 JSON 内容类型
-                        has_json = 'application/json' in payload_lower or 'content-type: application/json' in payload_lower
-                        
-                        # HTTP 请求检测
-                        if payload_str.startswith(('GET ', 'POST ', 'PUT ', 'DELETE ', 'HEAD ', 'OPTIONS ', 'PATCH ')):
-                            first_line = payload_str.split('\r\n')[0] if '\r\n' in payload_str else payload_str[:100]
-                            # POST/PUT 请求可能包含 JSON body
-                            if has_json or (payload_str.startswith(('POST ', 'PUT ', 'PATCH ')) and ('{"' in payload_str or '[{' in payload_str)):
-                                app_protocol = "HTTP/JSON"
-                            else:
-                                app_protocol = "HTTP"
-                            http_info = first_line
-                        
-                        # HTTP 响应检测
-                        elif payload_str.startswith('HTTP/'):
-                            first_line = payload_str.split('\r\n')[0] if '\r\n' in payload_str else payload_str[:100]
-                            # 检查是否包含 JSON
-                            if has_json:
-                                app_protocol = "HTTP/JSON"
-                            else:
-                                app_protocol = "HTTP"
-                            http_info = first_line
-                        
-                        # JSON 检测（非 HTTP 但包含 JSON 数据）
-                        elif payload_str.strip().startswith(('{', '[')):
-                            app_protocol = "JSON"
-                            
+                        transport = "TCP" if tcp_data else "UDP"
+                        key = flow_key(src_ip, src_port, dst_ip, dst_port, transport)
+                        detected = protocol_identifier.identify(key, payload_raw, src_port, dst_port)
+                        if detected == PROTO_HTTP and http_kind(payload_raw):
+                            # 报文起始：只解码首行，只扫描头部判断 JSON
+                            http_info = http_start_line(payload_raw)
+                            app_protocol = "HTTP/JSON" if http_has_json(payload_raw) else PROTO_HTTP
+                        elif detected:
+                            app_protocol = detected
                     except Exception as e:
                         logger.debug(f"Protocol detection error: {e}")
                 
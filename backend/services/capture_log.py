@@ -0,0 +1,173 @@
+"""
+抓包热路径日志
+- 异步输出：根 logger 只挂 QueueHandler，磁盘/控制台写入由后台 QueueListener 线程完成
+- 采样计数：逐包消息（[MATCHED-*]、[TCP-BUFFER]、[HTTP-STREAM] 等）按 key 计数，
+  每个 key 在采样间隔内最多输出一条，并附带期间被抑制的条数
+- 延迟格式化：消息使用 %-style 参数，只有真正输出时才格式化
+- 运行时调整：日志级别和采样间隔可通过 API 修改
+"""
+import time
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Dict, Iterable, Optional
+
+# 抓包相关模块的 logger（运行时调整级别的作用范围）
+CAPTURE_LOGGERS = (
+    'backend.services.packet_capture',
+    'backend.services.fast_decoder',
+    'backend.services.protocol_id',
+    'backend.services.tcp_stream',
+    'backend.services.tcp_reassembly',
+    'backend.services.payload_store',
+    'backend.services.udp_flow',
+    'backend.services.http_stream',
+    'backend.services.http_parser',
+    'backend.services.content_decoding',
+    'backend.services.packet_batcher',
+    'backend.services.wire_format',
+    'backend.services.checkpoint',
+    'backend.services.capture_pipeline',
+    'backend.services.port_mapper',
+)
+
+_listener: Optional[QueueListener] = None
+
+
+class _CaptureQueueHandler(QueueHandler):
+    """
+    不在调用线程中格式化消息，只清理无法跨线程复用的字段
+    格式化交给 QueueListener 线程中的目标 handler
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            # 异常堆栈在当前线程展开，避免 traceback 对象被后续代码修改
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_async_logging(handlers: Iterable[logging.Handler], level: int = logging.DEBUG) -> QueueListener:
+    """
+    将根 logger 改为 QueueHandler -> QueueListener(handlers)
+    :param handlers: 实际写入磁盘/控制台的 handler
+    :param level: 根 logger 级别
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    queue = SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_CaptureQueueHandler(queue))
+    root.setLevel(level)
+
+    _listener = QueueListener(queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_async_logging)
+    return _listener
+
+
+def stop_async_logging() -> None:
+    """停止后台写入线程（会先写完队列中的日志）"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class SampledLog:
+    """
+    按 key 采样的日志计数器
+    计数在每次调用时累加（整数加法，开销极低）；
+    只有当前级别可输出且距上次输出超过采样间隔时才真正写日志
+    """
+
+    def __init__(self, interval: float = 1.0):
+        """
+        :param interval: 同一 key 两次输出之间的最小间隔（秒），0 表示不采样
+        """
+        self.interval = interval
+        self.counts: Dict[str, int] = {}
+        self._suppressed: Dict[str, int] = {}
+        self._last_emit: Dict[str, float] = {}
+
+    def log(self, logger: logging.Logger, level: int, key: str, msg: str, *args) -> None:
+        """
+        记录一次事件
+        :param key: 计数 key（如 "MATCHED-OUTBOUND"）
+        :param msg: %-style 格式串，args 仅在输出时格式化
+        """
+        counts = self.counts
+        counts[key] = counts.get(key, 0) + 1
+        if not logger.isEnabledFor(level):
+            return
+
+        now = time.monotonic()
+        if self.interval and now - self._last_emit.get(key, -self.interval) < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return
+
+        self._last_emit[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            logger.log(level, msg + " (+%d suppressed)", *args, suppressed)
+        else:
+            logger.log(level, msg, *args)
+
+    def info(self, logger: logging.Logger, key: str, msg: str, *args) -> None:
+        self.log(logger, logging.INFO, key, msg, *args)
+
+    def warning(self, logger: logging.Logger, key: str, msg: str, *args) -> None:
+        self.log(logger, logging.WARNING, key, msg, *args)
+
+    def debug(self, logger: logging.Logger, key: str, msg: str, *args) -> None:
+        self.log(logger, logging.DEBUG, key, msg, *args)
+
+    def reset(self) -> None:
+        self.counts.clear()
+        self._suppressed.clear()
+        self._last_emit.clear()
+
+
+# 进程内共享的热路径采样器
+hot_log = SampledLog()
+
+_config_lock = threading.Lock()
+
+
+def get_log_config() -> dict:
+    """当前日志配置与热路径计数"""
+    return {
+        'async': _listener is not None,
+        'root_level': logging.getLevelName(logging.getLogger().level),
+        'capture_level': logging.getLevelName(logging.getLogger(CAPTURE_LOGGERS[0]).getEffectiveLevel()),
+        'sample_interval': hot_log.interval,
+        'counters': dict(hot_log.counts)
+    }
+
+
+def set_log_config(level: Optional[str] = None, sample_interval: Optional[float] = None,
+                   loggers: Iterable[str] = CAPTURE_LOGGERS) -> dict:
+    """
+    运行时调整抓包日志
+    :param level: 日志级别名（DEBUG/INFO/WARNING/ERROR/CRITICAL）
+    :param sample_interval: 热路径采样间隔（秒），0 表示逐条输出
+    """
+    with _config_lock:
+        if level is not None:
+            numeric = logging.getLevelName(level.upper())
+            if not isinstance(numeric, int):
+                raise ValueError(f"Unknown log level: {level}")
+            for name in loggers:
+                logging.getLogger(name).setLevel(numeric)
+        if sample_interval is not None:
+            if sample_interval < 0:
+                raise ValueError("sample_interval must be >= 0")
+            hot_log.interval = sample_interval
+    return get_log_config()
@@ -0,0 +1,292 @@
+"""
+多进程抓包流水线
+三个阶段：
+1. 抓包线程：只把原始帧 + 时间戳拷贝进共享内存环形缓冲区
+2. N 个解析进程：按五元组哈希分片（保证同一连接的包顺序），完成流追踪/HTTP/TLS解析
+3. 收集线程：把解析结果送回 API 进程的回调
+"""
+import struct
+import time
+import logging
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from queue import Empty
+from typing import List, Optional, Tuple
+
+from .fast_decoder import flow_hash
+
+logger = logging.getLogger(__name__)
+
+# 环形缓冲区头部：write_pos, read_pos, dropped（均为单调递增的字节/计数）
+_RING_HEADER = struct.Struct('<QQQ')
+_HEADER_SIZE = 64
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+# 帧记录头：长度, 链路层类型, 时间戳（16 字节，8 字节对齐）
+_RECORD = struct.Struct('<IHxxd')
+_WRAP_MARKER = 0xFFFFFFFF
+
+
+def _align8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+class FrameRing:
+    """
+    共享内存单生产者/单消费者环形缓冲区（变长记录）
+    - 生产者只写 write_pos，消费者只写 read_pos
+    - 空间不足时丢弃新帧并计数，不阻塞抓包线程
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int, owner: bool):
+        self.shm = shm
+        self.buf = shm.buf
+        self.capacity = capacity
+        self.owner = owner
+        self._read_pos = _U64.unpack_from(self.buf, 8)[0]
+
+    @classmethod
+    def create(cls, capacity: int = 16 * 1024 * 1024) -> 'FrameRing':
+        capacity = _align8(capacity)
+        shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + capacity)
+        _RING_HEADER.pack_into(shm.buf, 0, 0, 0, 0)
+        return cls(shm, capacity, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, capacity: int) -> 'FrameRing':
+        # spawn 子进程与父进程共用 resource_tracker，由创建方负责 unlink
+        shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, capacity, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def _load(self, offset: int) -> int:
+        # 两次读取一致才采用，防止读到写入一半的 8 字节值
+        while True:
+            first = _U64.unpack_from(self.buf, offset)[0]
+            if _U64.unpack_from(self.buf, offset)[0] == first:
+                return first
+
+    def write(self, frame: bytes, linktype: int, timestamp: float) -> bool:
+        """写入一帧（抓包线程调用），缓冲区满返回 False"""
+        capacity = self.capacity
+        write_pos = _U64.unpack_from(self.buf, 0)[0]
+        read_pos = self._load(8)
+
+        size = _align8(_RECORD.size + len(frame))
+        offset = write_pos % capacity
+        tail = capacity - offset
+        need = size if size <= tail else tail + size
+        if write_pos - read_pos + need > capacity:
+            _U64.pack_into(self.buf, 16, _U64.unpack_from(self.buf, 16)[0] + 1)
+            return False
+
+        if size > tail:
+            # 尾部放不下，写入回绕标记，从头开始
+            _U32.pack_into(self.buf, _HEADER_SIZE + offset, _WRAP_MARKER)
+            write_pos += tail
+            offset = 0
+
+        start = _HEADER_SIZE + offset
+        _RECORD.pack_into(self.buf, start, len(frame), linktype, timestamp)
+        self.buf[start + _RECORD.size:start + _RECORD.size + len(frame)] = frame
+        # 数据写完后再发布 write_pos
+        _U64.pack_into(self.buf, 0, write_pos + size)
+        return True
+
+    def read(self) -> Optional[Tuple[bytes, int, float]]:
+        """读取一帧（解析进程调用），为空返回 None"""
+        capacity = self.capacity
+        while True:
+            read_pos = self._read_pos
+            if read_pos == self._load(0):
+                return None
+
+            offset = read_pos % capacity
+            start = _HEADER_SIZE + offset
+            length = _U32.unpack_from(self.buf, start)[0]
+            if length == _WRAP_MARKER:
+                self._read_pos = read_pos + capacity - offset
+                _U64.pack_into(self.buf, 8, self._read_pos)
+                continue
+
+            length, linktype, timestamp = _RECORD.unpack_from(self.buf, start)
+            frame = bytes(self.buf[start + _RECORD.size:start + _RECORD.size + length])
+            self._read_pos = read_pos + _align8(_RECORD.size + length)
+            _U64.pack_into(self.buf, 8, self._read_pos)
+            return frame, linktype, timestamp
+
+    def stats(self) -> dict:
+        write_pos, read_pos, dropped = _RING_HEADER.unpack_from(self.buf, 0)
+        return {
+            'used_bytes': write_pos - read_pos,
+            'capacity': self.capacity,
+            'dropped': dropped
+        }
+
+    def close(self) -> None:
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _pipeline_worker(index: int, ring_name: str, ring_capacity: int,
+                     result_queue, stop_event, engine_kwargs: dict,
+                     batch_size: int, batch_interval: float) -> None:
+    """
+    解析进程入口（模块级函数，兼容 Windows spawn）
+    每个进程持有独立的 PacketCaptureEngine，只处理分到本分片的连接
+    """
+    from .packet_capture import PacketCaptureEngine
+
+    ring = FrameRing.attach(ring_name, ring_capacity)
+    engine = PacketCaptureEngine(capture_mode="fast", **engine_kwargs)
+    engine.port_mapper.refresh()
+    engine.port_mapper.start_auto_refresh(watch_pids=[engine.target_pid])
+    engine.is_running = True
+
+    batch: List[dict] = []
+    engine.packet_callback = batch.append
+    last_flush = time.monotonic()
+    idle_sleep = 0.0005
+
+    def flush():
+        nonlocal batch, last_flush
+        if batch:
+            result_queue.put((index, batch))
+            batch = []
+            engine.packet_callback = batch.append
+        last_flush = time.monotonic()
+
+    try:
+        while True:
+            item = ring.read()
+            if item is not None:
+                frame, linktype, timestamp = item
+                engine._process_frame(frame, linktype, timestamp)
+                idle_sleep = 0.0005
+                if len(batch) >= batch_size or time.monotonic() - last_flush >= batch_interval:
+                    flush()
+                continue
+
+            # 缓冲区为空：先交付已有结果，再退避等待
+            flush()
+            if stop_event.is_set():
+                break
+            time.sleep(idle_sleep)
+            idle_sleep = min(idle_sleep * 2, 0.005)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        flush()
+        engine.port_mapper.stop_auto_refresh()
+        ring.close()
+
+
+class CapturePipeline:
+    """
+    多进程抓包流水线（由 PacketCaptureEngine 在 pipeline 模式下驱动）
+    """
+
+    def __init__(self, engine, workers: int = 2, ring_capacity: int = 16 * 1024 * 1024,
+                 batch_size: int = 256, batch_interval: float = 0.05):
+        """
+        :param engine: API 进程中的 PacketCaptureEngine（负责最终回调）
+        :param workers: 解析进程数量
+        :param ring_capacity: 每个解析进程的环形缓冲区大小（字节）
+        """
+        self.engine = engine
+        self.workers = max(1, workers)
+        self.ring_capacity = ring_capacity
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+
+        self._ctx = mp.get_context("spawn")
+        self.rings: List[FrameRing] = []
+        self.processes: list = []
+        self.result_queue = None
+        self._stop_event = None
+        self._collector: Optional[threading.Thread] = None
+        self.frames_captured = 0
+
+    def start(self) -> None:
+        """创建共享内存和解析进程"""
+        self.result_queue = self._ctx.Queue()
+        self._stop_event = self._ctx.Event()
+        engine_kwargs = {
+            'target_pid': self.engine.target_pid,
+            'db_ports': self.engine.db_ports,
+            'server_ips': ",".join(self.engine.server_ips),
+            'payload_retention': self.engine.payload_retention,
+            # 每个解析进程只处理分到自己的连接，也没有并发查询，进程内不再分片
+            'stream_shards': 1
+        }
+
+        for index in range(self.workers):
+            ring = FrameRing.create(self.ring_capacity)
+            self.rings.append(ring)
+            process = self._ctx.Process(
+                target=_pipeline_worker,
+                args=(index, ring.name, ring.capacity, self.result_queue, self._stop_event,
+                      engine_kwargs, self.batch_size, self.batch_interval),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+
+        self._collector = threading.Thread(target=self._collect_loop, daemon=True)
+        self._collector.start()
+        logger.info(f"[PIPELINE] Started {self.workers} dissection workers")
+
+    def stop(self) -> None:
+        """停止解析进程，回收共享内存"""
+        if self._stop_event is None:
+            return
+        self._stop_event.set()
+        for process in self.processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        if self._collector:
+            self._collector.join(timeout=2)
+        for ring in self.rings:
+            ring.close()
+        self.rings = []
+        self.processes = []
+        self._stop_event = None
+        logger.info("[PIPELINE] Stopped")
+
+    def submit(self, frame: bytes, linktype: int, timestamp: float) -> bool:
+        """按连接分片写入对应解析进程的缓冲区（抓包线程调用）"""
+        self.frames_captured += 1
+        shard = flow_hash(frame, linktype) % self.workers
+        return self.rings[shard].write(frame, linktype, timestamp)
+
+    def _collect_loop(self) -> None:
+        """收集解析结果并交给引擎回调"""
+        while True:
+            try:
+                _, batch = self.result_queue.get(timeout=0.2)
+            except Empty:
+                if self._stop_event is None or (self._stop_event.is_set()
+                                                and not any(p.is_alive() for p in self.processes)):
+                    break
+                continue
+            except (EOFError, OSError):
+                break
+
+            for packet_data in batch:
+                self.engine._emit_pipeline_packet(packet_data)
+
+    def stats(self) -> dict:
+        rings = [ring.stats() for ring in self.rings]
+        return {
+            'workers': self.workers,
+            'frames_captured': self.frames_captured,
+            'frames_dropped': sum(r['dropped'] for r in rings),
+            'rings': rings
+        }
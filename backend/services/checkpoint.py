@@ -0,0 +1,306 @@
+"""
+抓包会话检查点
+后端重启后恢复流追踪状态（TCP/UDP 流表、已结束流摘要、专家分析、HTTP 事务、未配对的请求和延迟统计）
+
+文件格式（每个会话一个文件，小端）:
+  头部   magic 'NSCK' | version u8
+  记录   kind u8 | length u32 | crc32 u32 | zlib(pickle(state))
+第一条记录是全量快照，之后是增量，恢复时按顺序叠加；
+全量快照写入临时文件后原子替换，增量追加到末尾，写到一半的记录（进程被杀）在恢复时丢弃
+会话 ID 通常是目标进程的 PID，PID 可能被复用：记录中保存进程标识（PID + 启动时间），
+只有同一个进程仍在运行时才恢复（见 process_identity / apply_checkpoint 的 accept）
+
+state 只包含内置类型（dict/list/tuple/str/bytes/数字），读取时禁止反序列化任何类
+状态在处理数据包的线程中采集（保证一致），序列化和写盘在后台线程完成；
+数据量大的部分（如 HTTP 消息体）采集时只保存对不可变对象的引用（Deferred），在写入线程中转换
+"""
+import gc
+import io
+import logging
+import os
+import pickle
+import queue
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# state 的结构变化时递增；版本不同的检查点整体忽略，读取时不做逐字段兼容
+CHECKPOINT_VERSION = 2
+CHECKPOINT_SUFFIX = ".ckpt"
+DEFAULT_CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'checkpoints')
+
+DEFAULT_INTERVAL = 30.0     # 检查点间隔（秒）
+DEFAULT_FULL_EVERY = 10     # 每写多少个增量后重新写一次全量快照
+
+RECORD_FULL = 1
+RECORD_DELTA = 2
+
+_MAGIC = b'NSCK'
+_FILE_HEADER = struct.Struct('<4sB')
+_RECORD_HEADER = struct.Struct('<BII')
+
+
+class Deferred:
+    """
+    state 中在写入线程才生成的部分
+    build() 只能读取采集之后不再修改的对象，返回内置类型
+    """
+
+    __slots__ = ('build',)
+
+    def __init__(self, build: Callable[[], object]):
+        self.build = build
+
+
+def _resolve(state):
+    """把嵌套 dict 中的 Deferred 替换为生成的值"""
+    if isinstance(state, Deferred):
+        return state.build()
+    if isinstance(state, dict):
+        return {key: _resolve(value) for key, value in state.items()}
+    return state
+
+
+class _StateUnpickler(pickle.Unpickler):
+    """只允许内置容器和标量，文件被篡改时不会执行任何代码"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"Forbidden type in checkpoint: {module}.{name}")
+
+
+def _encode(state: dict) -> bytes:
+    return zlib.compress(pickle.dumps(_resolve(state), protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+
+def _decode(data: bytes) -> dict:
+    return _StateUnpickler(io.BytesIO(zlib.decompress(data))).load()
+
+
+def process_identity(pid) -> Optional[Tuple[int, float]]:
+    """
+    进程标识 (PID, 启动时间)：PID 被其他进程复用时启动时间不同
+    :return: 进程不存在（或 PID 无效）返回 None
+    """
+    try:
+        pid = int(pid)
+        return pid, round(psutil.Process(pid).create_time(), 2)
+    except (psutil.Error, ValueError, TypeError):
+        return None
+
+
+def is_same_process(identity) -> bool:
+    """检查点中保存的进程标识是否仍对应一个正在运行的同一进程"""
+    if not identity:
+        return False
+    return process_identity(identity[0]) == tuple(identity)
+
+
+def checkpoint_path(directory: str, session_id: str) -> str:
+    """会话的检查点文件路径（会话 ID 中文件名不允许的字符替换为 _）"""
+    return os.path.join(directory, re.sub(r'[^\w.-]', '_', session_id) + CHECKPOINT_SUFFIX)
+
+
+def list_checkpoints(directory: str) -> Dict[str, str]:
+    """目录中的检查点：会话 ID -> 文件路径"""
+    if not os.path.isdir(directory):
+        return {}
+    return {name[:-len(CHECKPOINT_SUFFIX)]: os.path.join(directory, name)
+            for name in sorted(os.listdir(directory)) if name.endswith(CHECKPOINT_SUFFIX)}
+
+
+def load_checkpoint(path: str) -> List[dict]:
+    """
+    读取检查点：全量快照 + 之后的增量（按写入顺序）
+    文件不存在或格式不对返回空列表；末尾不完整/校验失败的记录及其之后的内容被丢弃
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    if len(data) < _FILE_HEADER.size:
+        return []
+    magic, version = _FILE_HEADER.unpack_from(data, 0)
+    if magic != _MAGIC or version != CHECKPOINT_VERSION:
+        logger.warning("Ignoring checkpoint %s (magic=%r version=%d)", path, magic, version)
+        return []
+
+    states = []
+    offset = _FILE_HEADER.size
+    while offset + _RECORD_HEADER.size <= len(data):
+        kind, length, crc = _RECORD_HEADER.unpack_from(data, offset)
+        offset += _RECORD_HEADER.size
+        payload = data[offset:offset + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            logger.warning("Checkpoint %s truncated at record %d", path, len(states))
+            break
+        offset += length
+        if (kind == RECORD_FULL) != (not states):
+            logger.warning("Checkpoint %s has unexpected record kind %d", path, kind)
+            break
+        try:
+            states.append(_decode(payload))
+        except (zlib.error, pickle.UnpicklingError, EOFError, ValueError) as e:
+            logger.warning("Checkpoint %s record %d unreadable: %s", path, len(states), e)
+            break
+    return states
+
+
+def apply_checkpoint(path: str, restore: Callable[[dict], None],
+                     accept: Optional[Callable[[dict], bool]] = None) -> int:
+    """
+    读取检查点并按顺序把每条记录交给 restore
+    恢复期间一次性创建大量容器对象，暂停循环垃圾回收（否则反复全量扫描，耗时增加数倍）
+    :param accept: 检查全量快照（如进程标识），返回 False 时整个检查点都不应用
+    :return: 应用的记录数量
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        states = load_checkpoint(path)
+        if states and accept is not None and not accept(states[0]):
+            logger.warning("Ignoring checkpoint %s: written for another process", path)
+            return 0
+        for state in states:
+            restore(state)
+        return len(states)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class Checkpointer:
+    """
+    单个会话的检查点写入器
+    调用方（处理数据包的线程）在 due() 为 True 时采集状态并调用 save()，
+    序列化和写盘在后台线程完成；上一次写入完成前 due() 不会再次触发，增量不会积压
+    """
+
+    def __init__(self, path: str, interval: float = DEFAULT_INTERVAL, full_every: int = DEFAULT_FULL_EVERY):
+        """
+        :param path: 检查点文件路径
+        :param interval: 检查点间隔（秒）
+        :param full_every: 每写多少个增量后重新写一次全量快照
+        """
+        self.path = path
+        self.interval = interval
+        self.full_every = full_every
+        self._queue: "queue.SimpleQueue[Optional[dict]]" = queue.SimpleQueue()
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._last = time.monotonic()
+        # 增量必须接在成功写入的全量快照之后
+        self._need_full = True
+        self._deltas = 0
+        # 写入线程：本写入器成功写过全量快照且之后没有失败，才能追加增量
+        self._can_append = False
+        self._thread: Optional[threading.Thread] = None
+        self.closed = False
+
+        # 统计
+        self.full_written = 0
+        self.deltas_written = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.last_duration = 0.0
+
+    @property
+    def needs_full(self) -> bool:
+        """下一次检查点是否需要全量快照"""
+        return self._need_full or self._deltas >= self.full_every
+
+    def due(self) -> bool:
+        return (not self.closed and not self._pending
+                and time.monotonic() - self._last >= self.interval)
+
+    def save(self, state: dict) -> None:
+        """
+        提交一次检查点（state['full'] 决定写全量还是增量）
+        增量提交后立即计数，保证下一次按 needs_full 正确切换
+        """
+        if self.closed:
+            return
+        self._last = time.monotonic()
+        if state['full']:
+            self._need_full = False
+            self._deltas = 0
+        else:
+            self._deltas += 1
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._write_loop, name="checkpoint-writer", daemon=True)
+            self._thread.start()
+        with self._pending_lock:
+            self._pending += 1
+        self._queue.put(state)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """等待已提交的检查点写完"""
+        if self.closed:
+            return
+        self.closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+    def _write_loop(self) -> None:
+        while True:
+            state = self._queue.get()
+            if state is None:
+                return
+            start = time.perf_counter()
+            try:
+                self._write(state)
+            except Exception as e:
+                # 写入失败后下一次重新写全量快照
+                self.errors += 1
+                self._can_append = False
+                self._need_full = True
+                logger.error(f"Checkpoint write failed ({self.path}): {e}")
+            finally:
+                self.last_duration = time.perf_counter() - start
+                with self._pending_lock:
+                    self._pending -= 1
+
+    def _write(self, state: dict) -> None:
+        full = state['full']
+        payload = _encode(state)
+        record = _RECORD_HEADER.pack(RECORD_FULL if full else RECORD_DELTA, len(payload),
+                                     zlib.crc32(payload)) + payload
+        if full:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(_FILE_HEADER.pack(_MAGIC, CHECKPOINT_VERSION))
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._can_append = True
+            self.full_written += 1
+        else:
+            # 文件可能已被删除（会话的检查点被清除），追加会产生没有头部的文件
+            if not self._can_append or not os.path.exists(self.path):
+                raise RuntimeError("no full snapshot to append to")
+            with open(self.path, 'ab') as f:
+                f.write(record)
+            self.deltas_written += 1
+        self.bytes_written += len(record)
+        logger.debug("Checkpoint %s: %s record, %d bytes", self.path, "full" if full else "delta", len(record))
+
+    def stats(self) -> dict:
+        return {
+            'path': self.path,
+            'interval': self.interval,
+            'full_written': self.full_written,
+            'deltas_written': self.deltas_written,
+            'bytes_written': self.bytes_written,
+            'errors': self.errors,
+            'last_write_ms': round(self.last_duration * 1000, 3)
+        }
@@ -0,0 +1,318 @@
+"""
+HTTP 消息体的 Content-Encoding 解码
+- 按 Content-Encoding 列表（如 "gzip, br"）逆序串联增量解码器，消息体分块送入
+- 解码后的大小有上限（防止压缩炸弹），达到上限后停止并标记 truncated
+- br 需要可选依赖 brotli（或 brotlicffi），未安装时保留原始数据并记录错误
+- DecompressWorker 在后台线程解码，抓包线程和代理线程只提交任务；
+  等待队列有上限，解码跟不上时丢弃新任务（计入统计），不阻塞提交方
+"""
+import logging
+import queue
+import threading
+import time
+import zlib
+from typing import Callable, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_DECODED_BYTES = 16 * 1024 * 1024  # 解码后的大小上限
+FEED_CHUNK = 64 * 1024                        # 每次送入解码器的压缩数据大小
+BROTLI_FEED_CHUNK = 256                       # 旧版 brotli/brotlicffi 没有输出上限参数，用小块输入限制单次输出
+DEFAULT_MAX_PENDING = 256                     # 等待解码的任务数上限
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_IDENTITY = ('', 'identity')
+
+_ERRORS: Tuple[type, ...] = (zlib.error,) + ((brotli.error,) if brotli is not None else ())
+# brotli >= 1.2 的 process() 支持 output_buffer_limit，达到上限后解码器保留剩余输入
+_BROTLI_OUTPUT_LIMIT = brotli is not None and hasattr(brotli.Decompressor, 'can_accept_more_data')
+
+
+def parse_content_encoding(value: Optional[str]) -> List[str]:
+    """Content-Encoding -> 编码列表（按服务器应用的顺序，去掉 identity）"""
+    if not value:
+        return []
+    codings = (coding.strip().lower() for coding in value.split(','))
+    return [coding for coding in codings if coding not in _IDENTITY]
+
+
+class _ZlibStage:
+    """gzip / deflate 增量解码（gzip 支持多个成员首尾相接）"""
+
+    def __init__(self, coding: str):
+        self.coding = coding
+        self._obj = None
+        self._head = b''
+
+    def _create(self, data: bytes):
+        if self.coding == 'deflate':
+            # RFC 规定 deflate 带 zlib 头，但不少服务器直接发送裸 deflate 数据
+            zlib_header = (data[0] & 0x0F) == 8 and ((data[0] << 8) | data[1]) % 31 == 0
+            return zlib.decompressobj(zlib.MAX_WBITS if zlib_header else -zlib.MAX_WBITS)
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes, limit: int) -> bytes:
+        out = bytearray()
+        while data and len(out) < limit:
+            obj = self._obj
+            if obj is None:
+                data = self._head + data
+                if len(data) < 2:
+                    self._head = bytes(data)
+                    break
+                self._head = b''
+                obj = self._obj = self._create(data)
+            elif obj.eof:
+                if self.coding != 'deflate' and data[:2] == _GZIP_MAGIC:
+                    self._obj = None
+                    continue
+                # 结尾之后的多余数据忽略
+                break
+            out += obj.decompress(data, limit - len(out))
+            data = obj.unused_data if obj.eof else obj.unconsumed_tail
+        return bytes(out)
+
+
+class _BrotliStage:
+    """br 增量解码"""
+
+    def __init__(self):
+        self._obj = brotli.Decompressor()
+
+    def decompress(self, data: bytes, limit: int) -> bytes:
+        if not _BROTLI_OUTPUT_LIMIT:
+            return self._decompress_sliced(data, limit)
+        obj = self._obj
+        out = bytearray()
+        data = bytes(data)
+        while len(out) < limit:
+            # 上一次达到输出上限时解码器还有待输出的数据，只能用空输入继续取
+            if obj.can_accept_more_data():
+                if not data:
+                    break
+                chunk, data = data, b''
+            else:
+                chunk = b''
+            produced = obj.process(chunk, output_buffer_limit=limit - len(out))
+            if not produced and not chunk:
+                break
+            out += produced
+        return bytes(out)
+
+    def _decompress_sliced(self, data: bytes, limit: int) -> bytes:
+        """没有输出上限参数：每送入一小块输入检查一次，超出部分不超过一小块输入能解出的数据"""
+        out = bytearray()
+        view = memoryview(data)
+        for offset in range(0, len(view), BROTLI_FEED_CHUNK):
+            if len(out) >= limit:
+                break
+            out += self._obj.process(bytes(view[offset:offset + BROTLI_FEED_CHUNK]))
+        return bytes(out)
+
+
+def _make_stage(coding: str):
+    if coding in ('gzip', 'x-gzip', 'deflate'):
+        return _ZlibStage('deflate' if coding == 'deflate' else 'gzip')
+    if coding == 'br' and brotli is not None:
+        return _BrotliStage()
+    return None
+
+
+class DecodedBody:
+    """解码结果（出错或不支持的编码时 data 为原始消息体）"""
+
+    __slots__ = ('data', 'content_encoding', 'compressed_size', 'truncated', 'error')
+
+    def __init__(self, data, content_encoding: Optional[str], compressed_size: int,
+                 truncated: bool = False, error: Optional[str] = None):
+        self.data = data
+        self.content_encoding = content_encoding
+        self.compressed_size = compressed_size
+        self.truncated = truncated
+        self.error = error
+
+    def to_dict(self) -> dict:
+        return {
+            'content_encoding': self.content_encoding,
+            'compressed_size': self.compressed_size,
+            'size': len(self.data),
+            'truncated': self.truncated,
+            'error': self.error
+        }
+
+
+class ContentDecoder:
+    """
+    单个消息体的增量解码器：feed() 送入压缩数据，finish() 取结果
+    解码后的数据超过 max_size 时截断，之后的输入直接丢弃
+    """
+
+    def __init__(self, content_encoding: Optional[str], max_size: int = DEFAULT_MAX_DECODED_BYTES):
+        self.content_encoding = content_encoding
+        self.max_size = max_size
+        self.output = bytearray()
+        self.input_size = 0
+        self.truncated = False
+        self.error: Optional[str] = None
+        # 服务器最后应用的编码最先解开
+        self._stages = []
+        for coding in reversed(parse_content_encoding(content_encoding)):
+            stage = _make_stage(coding)
+            if stage is None:
+                self.error = f"unsupported content-encoding: {coding}"
+                break
+            self._stages.append(stage)
+
+    @property
+    def done(self) -> bool:
+        """后续输入不再产生输出（已截断或出错）"""
+        return self.truncated or self.error is not None
+
+    def feed(self, data) -> None:
+        self.input_size += len(data)
+        if self.done:
+            return
+        remaining = self.max_size - len(self.output)
+        try:
+            for stage in self._stages:
+                data = stage.decompress(data, remaining)
+                if not data:
+                    return
+        except _ERRORS as e:
+            self.error = str(e)
+            return
+        self.output += data[:remaining]
+        if len(self.output) >= self.max_size:
+            self.truncated = True
+
+    def finish(self, raw=None) -> DecodedBody:
+        """
+        :param raw: 原始消息体，出错且没有解出任何数据时作为结果数据
+        """
+        if raw is not None and self.error is not None and not self.output:
+            data = raw
+        else:
+            data = bytes(self.output)
+        return DecodedBody(data, self.content_encoding, self.input_size, self.truncated, self.error)
+
+
+def decode_content(body, content_encoding: Optional[str],
+                   max_size: int = DEFAULT_MAX_DECODED_BYTES) -> DecodedBody:
+    """按 Content-Encoding 解码整个消息体（分块送入，达到 max_size 后提前结束）"""
+    if not parse_content_encoding(content_encoding):
+        return DecodedBody(body, content_encoding, len(body))
+    decoder = ContentDecoder(content_encoding, max_size)
+    view = memoryview(body)
+    for offset in range(0, len(view), FEED_CHUNK):
+        if decoder.done:
+            break
+        decoder.feed(view[offset:offset + FEED_CHUNK])
+    decoded = decoder.finish(body)
+    decoded.compressed_size = len(view)
+    return decoded
+
+
+class DecompressWorker:
+    """
+    后台解码线程
+    调用方提交消息体和回调，解码在工作线程中按提交顺序完成后回调 callback(DecodedBody)
+    等待的任务达到 max_pending 后 submit() 丢弃新任务并返回 False
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MAX_DECODED_BYTES, name: str = "http-decompress",
+                 max_pending: int = DEFAULT_MAX_PENDING):
+        self.max_size = max_size
+        self.name = name
+        self.max_pending = max_pending
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.closed = False
+
+        # 统计
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.truncated = 0
+        self.errors = 0
+        self.busy_time = 0.0
+
+    def submit(self, body, content_encoding: Optional[str], callback: Callable[[DecodedBody], None]) -> bool:
+        """
+        提交一个消息体（不复制，解码完成前调用方不能修改 body）
+        :return: 已关闭或队列已满（任务被丢弃，不会回调）返回 False
+        """
+        if self.closed:
+            return False
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait((body, content_encoding, callback))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def close(self, timeout: float = 5.0) -> None:
+        """处理完已提交的任务后退出"""
+        if self.closed:
+            return
+        self.closed = True
+        if self._thread is not None:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                logger.warning("Decompress worker still busy after %.1fs, not waiting", timeout)
+                return
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            body, content_encoding, callback = task
+            start = time.perf_counter()
+            try:
+                decoded = decode_content(body, content_encoding, self.max_size)
+                self.bytes_in += decoded.compressed_size
+                self.bytes_out += len(decoded.data)
+                self.truncated += decoded.truncated
+                if decoded.error is not None:
+                    self.errors += 1
+                    logger.debug("Content decode failed (%s): %s", content_encoding, decoded.error)
+                callback(decoded)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Decompress task failed: {e}", exc_info=True)
+            finally:
+                self.busy_time += time.perf_counter() - start
+                self.completed += 1
+
+    def stats(self) -> dict:
+        return {
+            'submitted': self.submitted,
+            'pending': self._queue.qsize(),
+            'max_pending': self.max_pending,
+            'dropped': self.dropped,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'truncated': self.truncated,
+            'errors': self.errors,
+            'busy_ms': round(self.busy_time * 1000, 3),
+            'brotli': brotli is not None
+        }
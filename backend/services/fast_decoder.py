@@ -0,0 +1,374 @@
+"""
+快速报文头解码器
+基于 struct/memoryview 直接解析 Ethernet/IPv4/IPv6/TCP/UDP 头部，
+生成轻量级 PacketRecord，仅在需要查看详情时才进行完整的 Scapy 解析
+"""
+import socket
+import struct
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 链路层类型（与 libpcap DLT_* 取值一致）
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_VLAN = (0x8100, 0x88A8, 0x9100)
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+# IPv6 扩展头（需要跳过才能找到传输层）
+IPV6_EXT_HEADERS = (0, 43, 60)
+IPV6_FRAGMENT = 44
+
+# TCP 标志位
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+
+# TCP 选项
+TCPOPT_EOL = 0
+TCPOPT_NOP = 1
+TCPOPT_WSCALE = 3
+
+_u16 = struct.Struct('!H').unpack_from
+_ports = struct.Struct('!HH').unpack_from
+_tcp_fields = struct.Struct('!HHIIBBH').unpack_from
+
+# IP 字符串缓存（避免每个包都调用 inet_ntop）
+_IP_CACHE_LIMIT = 65536
+_ipv4_cache = {}
+_ipv6_cache = {}
+
+
+def _ipv4_str(raw: bytes) -> str:
+    ip = _ipv4_cache.get(raw)
+    if ip is None:
+        if len(_ipv4_cache) >= _IP_CACHE_LIMIT:
+            _ipv4_cache.clear()
+        ip = _ipv4_cache[raw] = socket.inet_ntop(socket.AF_INET, raw)
+    return ip
+
+
+def _ipv6_str(raw: bytes) -> str:
+    ip = _ipv6_cache.get(raw)
+    if ip is None:
+        if len(_ipv6_cache) >= _IP_CACHE_LIMIT:
+            _ipv6_cache.clear()
+        ip = _ipv6_cache[raw] = socket.inet_ntop(socket.AF_INET6, raw)
+    return ip
+
+
+def _tcp_window_scale(frame: bytes, start: int, end: int) -> Optional[int]:
+    """从 TCP 选项中读取窗口缩放因子（只出现在 SYN 中），没有时返回 None"""
+    while start < end:
+        kind = frame[start]
+        if kind == TCPOPT_EOL:
+            break
+        if kind == TCPOPT_NOP:
+            start += 1
+            continue
+        if start + 1 >= end:
+            break
+        length = frame[start + 1]
+        if length < 2:
+            break
+        if kind == TCPOPT_WSCALE and length == 3 and start + 2 < end:
+            return frame[start + 2]
+        start += length
+    return None
+
+
+def tcp_flags_str(flags: int) -> str:
+    """TCP标志位转字符串（与 TCPStreamManager 的格式一致：SYN|ACK|FIN|PSH|RST）"""
+    parts = []
+    if flags & TCP_SYN: parts.append("SYN")
+    if flags & TCP_ACK: parts.append("ACK")
+    if flags & TCP_FIN: parts.append("FIN")
+    if flags & TCP_PSH: parts.append("PSH")
+    if flags & TCP_RST: parts.append("RST")
+    return "|".join(parts)
+
+
+class PacketRecord:
+    """
+    轻量级数据包记录
+    只包含抓包热路径需要的字段，完整的 Scapy 对象按需懒加载
+    """
+    __slots__ = ('timestamp', 'frame', 'linktype', 'length', 'ip_version',
+                 'src_ip', 'dst_ip', 'protocol', 'sport', 'dport',
+                 'seq', 'ack', 'tcp_flags', 'window', 'wscale', 'payload', '_packet')
+
+    def __init__(self):
+        self.seq = 0
+        self.ack = 0
+        self.tcp_flags = 0
+        self.window = 0
+        # SYN 中的窗口缩放因子，其他报文为 None
+        self.wscale = None
+        self._packet = None
+
+    @property
+    def is_tcp(self) -> bool:
+        return self.protocol == "TCP"
+
+    @property
+    def flags(self) -> str:
+        return tcp_flags_str(self.tcp_flags)
+
+    @classmethod
+    def from_scapy(cls, pkt, timestamp: float = None) -> Optional['PacketRecord']:
+        """从已解析的 Scapy 数据包构建记录（兼容原有 sniff 路径）"""
+        from scapy.all import IP, IPv6, TCP, UDP
+
+        if pkt.haslayer(IP):
+            ip_layer = pkt[IP]
+            ip_version = 4
+        elif pkt.haslayer(IPv6):
+            ip_layer = pkt[IPv6]
+            ip_version = 6
+        else:
+            return None
+
+        if pkt.haslayer(TCP):
+            transport = pkt[TCP]
+            protocol = "TCP"
+        elif pkt.haslayer(UDP):
+            transport = pkt[UDP]
+            protocol = "UDP"
+        else:
+            return None
+
+        record = cls()
+        record.timestamp = timestamp if timestamp is not None else float(pkt.time)
+        record.frame = None
+        record.linktype = None
+        record.length = len(pkt)
+        record.ip_version = ip_version
+        record.src_ip = ip_layer.src
+        record.dst_ip = ip_layer.dst
+        record.protocol = protocol
+        record.sport = transport.sport
+        record.dport = transport.dport
+        if protocol == "TCP":
+            record.seq = transport.seq
+            record.ack = transport.ack
+            record.tcp_flags = int(transport.flags)
+            record.window = transport.window
+            if record.tcp_flags & TCP_SYN:
+                for option in transport.options:
+                    if option[0] == 'WScale':
+                        record.wscale = option[1]
+        record.payload = bytes(transport.payload) if transport.payload else b''
+        record._packet = pkt
+        return record
+
+    def dissect(self):
+        """
+        懒加载完整的 Scapy 解析结果
+        只有在查看数据包详情时才会调用
+        """
+        if self._packet is None and self.frame is not None:
+            from scapy.all import conf
+            layer = conf.l2types.num2layer.get(self.linktype, conf.raw_layer)
+            try:
+                self._packet = layer(self.frame)
+            except Exception as e:
+                logger.debug(f"[FAST-DECODE] Scapy dissect failed: {e}")
+                self._packet = conf.raw_layer(self.frame)
+            self._packet.time = self.timestamp
+        return self._packet
+
+
+def _link_offset(frame: bytes, linktype: int) -> Optional[tuple]:
+    """
+    解析链路层头部
+    :return: (网络层偏移, EtherType) 或 None
+    """
+    if linktype == LINKTYPE_ETHERNET:
+        if len(frame) < 14:
+            return None
+        offset = 12
+        ethertype = _u16(frame, offset)[0]
+        while ethertype in ETH_P_VLAN:
+            offset += 4
+            if len(frame) < offset + 2:
+                return None
+            ethertype = _u16(frame, offset)[0]
+        return offset + 2, ethertype
+
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        # 4 字节地址族（NULL 为主机字节序，LOOP 为网络字节序）
+        if len(frame) < 4:
+            return None
+        family = frame[0] if frame[0] else frame[3]
+        if family == 2:
+            return 4, ETH_P_IP
+        if family in (10, 24, 28, 30):  # 各平台的 AF_INET6
+            return 4, ETH_P_IPV6
+        return None
+
+    if linktype == LINKTYPE_LINUX_SLL:
+        if len(frame) < 16:
+            return None
+        return 16, _u16(frame, 14)[0]
+
+    if linktype == LINKTYPE_LINUX_SLL2:
+        if len(frame) < 20:
+            return None
+        return 20, _u16(frame, 0)[0]
+
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6, 12, 14):
+        if not frame:
+            return None
+        version = frame[0] >> 4
+        return 0, ETH_P_IP if version == 4 else ETH_P_IPV6
+
+    return None
+
+
+def decode_frame(frame: bytes, linktype: int = LINKTYPE_ETHERNET,
+                 timestamp: float = 0.0) -> Optional[PacketRecord]:
+    """
+    解码原始帧（不经过 Scapy）
+    :param frame: 链路层原始字节
+    :param linktype: 链路层类型（DLT_*）
+    :param timestamp: 抓包时间戳
+    :return: PacketRecord，非 IP/TCP/UDP 报文返回 None
+    """
+    link = _link_offset(frame, linktype)
+    if link is None:
+        return None
+    offset, ethertype = link
+    view = memoryview(frame)
+
+    try:
+        if ethertype == ETH_P_IP:
+            if len(frame) < offset + 20:
+                return None
+            ihl = (frame[offset] & 0x0F) * 4
+            total_len = _u16(frame, offset + 2)[0]
+            # 非首个分片没有传输层头部
+            if _u16(frame, offset + 6)[0] & 0x1FFF:
+                return None
+            proto = frame[offset + 9]
+            src_ip = _ipv4_str(bytes(view[offset + 12:offset + 16]))
+            dst_ip = _ipv4_str(bytes(view[offset + 16:offset + 20]))
+            # total_len 用于去掉以太网填充（TSO 场景下可能为 0）
+            ip_end = offset + total_len if total_len else len(frame)
+            l4 = offset + ihl
+            ip_version = 4
+        elif ethertype == ETH_P_IPV6:
+            if len(frame) < offset + 40:
+                return None
+            payload_len = _u16(frame, offset + 4)[0]
+            proto = frame[offset + 6]
+            src_ip = _ipv6_str(bytes(view[offset + 8:offset + 24]))
+            dst_ip = _ipv6_str(bytes(view[offset + 24:offset + 40]))
+            ip_end = offset + 40 + payload_len if payload_len else len(frame)
+            l4 = offset + 40
+            while proto in IPV6_EXT_HEADERS or proto == IPV6_FRAGMENT:
+                if len(frame) < l4 + 8:
+                    return None
+                next_proto = frame[l4]
+                if proto == IPV6_FRAGMENT:
+                    if _u16(frame, l4 + 2)[0] & 0xFFF8:
+                        return None
+                    l4 += 8
+                else:
+                    l4 += (frame[l4 + 1] + 1) * 8
+                proto = next_proto
+            ip_version = 6
+        else:
+            return None
+
+        ip_end = min(ip_end, len(frame))
+
+        if proto == IPPROTO_TCP:
+            if ip_end < l4 + 20:
+                return None
+            sport, dport, seq, ack, data_off, flags, window = _tcp_fields(frame, l4)
+            payload_start = l4 + (data_off >> 4) * 4
+            record = PacketRecord()
+            record.protocol = "TCP"
+            record.seq = seq
+            record.ack = ack
+            record.tcp_flags = flags
+            record.window = window
+            if flags & TCP_SYN:
+                record.wscale = _tcp_window_scale(frame, l4 + 20, min(payload_start, ip_end))
+        elif proto == IPPROTO_UDP:
+            if ip_end < l4 + 8:
+                return None
+            sport, dport = _ports(frame, l4)
+            payload_start = l4 + 8
+            record = PacketRecord()
+            record.protocol = "UDP"
+        else:
+            return None
+    except (IndexError, struct.error):
+        return None
+
+    record.timestamp = timestamp
+    record.frame = frame
+    record.linktype = linktype
+    record.length = len(frame)
+    record.ip_version = ip_version
+    record.src_ip = src_ip
+    record.dst_ip = dst_ip
+    record.sport = sport
+    record.dport = dport
+    record.payload = frame[payload_start:ip_end] if payload_start < ip_end else b''
+    return record
+
+
+def flow_hash(frame: bytes, linktype: int = LINKTYPE_ETHERNET) -> int:
+    """
+    计算帧所属连接的对称哈希（两个方向得到相同结果）
+    只读取地址和端口，不构建 PacketRecord，供分片使用
+    """
+    link = _link_offset(frame, linktype)
+    if link is None:
+        return 0
+    offset, ethertype = link
+    try:
+        if ethertype == ETH_P_IP:
+            l4 = offset + (frame[offset] & 0x0F) * 4
+            proto = frame[offset + 9]
+            src = frame[offset + 12:offset + 16]
+            dst = frame[offset + 16:offset + 20]
+        elif ethertype == ETH_P_IPV6:
+            # 扩展头较少见，按 IPv6 固定头计算
+            l4 = offset + 40
+            proto = frame[offset + 6]
+            src = frame[offset + 8:offset + 24]
+            dst = frame[offset + 24:offset + 40]
+        else:
+            return 0
+        if proto in (IPPROTO_TCP, IPPROTO_UDP) and len(frame) >= l4 + 4:
+            sport, dport = _ports(frame, l4)
+        else:
+            sport = dport = 0
+    except (IndexError, struct.error):
+        return 0
+
+    a = (src, sport)
+    b = (dst, dport)
+    return hash((proto, a, b) if a < b else (proto, b, a))
+
+
+def linktype_of(layer_cls) -> int:
+    """根据 Scapy 链路层类获取 DLT 编号（用于 recv_raw 返回的 cls）"""
+    from scapy.all import conf
+    return conf.l2types.layer2num.get(layer_cls, LINKTYPE_ETHERNET)
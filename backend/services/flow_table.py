@@ -0,0 +1,228 @@
+"""
+紧凑连接表
+- 连接键：打包后的二进制五元组（IP 原始字节 + 端口 + 协议号），双向归一化，不再逐包拼接字符串
+- 每个连接的计数器按列保存在标准库 array 中（首次/最后时间、包数、字节数、标志位），
+  连接表只额外占用一个 dict 槽位和一个 bytes 键，单连接内存固定且可预估
+- 删除的槽位进入空闲列表复用；达到容量上限时先淘汰空闲连接，再按最后活动时间淘汰最旧的一批
+"""
+import heapq
+import socket
+import struct
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+_TRANSPORTS = {"TCP": IPPROTO_TCP, "UDP": IPPROTO_UDP}
+_PORTS = struct.Struct('!HHB')
+
+# IP 字符串 -> 原始字节缓存
+_IP_CACHE_LIMIT = 65536
+_packed_ips: Dict[str, bytes] = {}
+
+
+def pack_ip(ip: str) -> bytes:
+    packed = _packed_ips.get(ip)
+    if packed is None:
+        if len(_packed_ips) >= _IP_CACHE_LIMIT:
+            _packed_ips.clear()
+        family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+        packed = _packed_ips[ip] = socket.inet_pton(family, ip)
+    return packed
+
+
+def pack_flow_key(src_ip: str, sport: int, dst_ip: str, dport: int, transport=IPPROTO_TCP) -> Tuple[bytes, bool]:
+    """
+    双向一致的打包连接键
+    :param transport: 协议号，或 "TCP"/"UDP"
+    :return: (key, forward)，forward 表示报文方向与键中端点顺序一致
+    """
+    if transport.__class__ is str:
+        transport = _TRANSPORTS.get(transport, 0)
+    a = pack_ip(src_ip)
+    b = pack_ip(dst_ip)
+    if a < b or (a == b and sport <= dport):
+        return a + b + _PORTS.pack(sport, dport, transport), True
+    return b + a + _PORTS.pack(dport, sport, transport), False
+
+
+def unpack_flow_key(key: bytes) -> Tuple[str, int, str, int, int]:
+    """打包连接键 -> (ip_a, port_a, ip_b, port_b, protocol)"""
+    ip_len = (len(key) - _PORTS.size) // 2
+    family = socket.AF_INET6 if ip_len == 16 else socket.AF_INET
+    port_a, port_b, protocol = _PORTS.unpack_from(key, ip_len * 2)
+    return (socket.inet_ntop(family, key[:ip_len]), port_a,
+            socket.inet_ntop(family, key[ip_len:ip_len * 2]), port_b, protocol)
+
+
+class FlowRecord:
+    """单个连接的计数器快照"""
+
+    __slots__ = ('key', 'first_seen', 'last_seen', 'packets', 'bytes', 'flags')
+
+    def __init__(self, key: bytes, first_seen: float, last_seen: float, packets: int, bytes_: int, flags: int):
+        self.key = key
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.packets = packets
+        self.bytes = bytes_
+        self.flags = flags
+
+    def to_dict(self) -> dict:
+        ip_a, port_a, ip_b, port_b, protocol = unpack_flow_key(self.key)
+        return {
+            'a': f"{ip_a}:{port_a}",
+            'b': f"{ip_b}:{port_b}",
+            'protocol': protocol,
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+            'packets': self.packets,
+            'bytes': self.bytes,
+            'flags': self.flags
+        }
+
+
+class FlowTable:
+    """按列存储的连接表"""
+
+    # 容量满时一次淘汰的比例
+    EVICT_FRACTION = 8
+
+    def __init__(self, max_flows: Optional[int] = None, idle_timeout: float = 300.0):
+        """
+        :param max_flows: 连接数上限，None 表示不限制
+        :param idle_timeout: 容量满时优先淘汰空闲超过该时间的连接（秒）
+        """
+        self.max_flows = max_flows
+        self.idle_timeout = idle_timeout
+        self._index: Dict[bytes, int] = {}
+        self._keys: List[Optional[bytes]] = []
+        self._free: List[int] = []
+        self.first_seen = array('d')
+        self.last_seen = array('d')
+        self.packets = array('Q')
+        self.bytes = array('Q')
+        self.flags = array('B')
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self._index
+
+    def slot(self, key: bytes) -> int:
+        """连接所在槽位，不存在返回 -1"""
+        return self._index.get(key, -1)
+
+    def add(self, key: bytes, now: float) -> int:
+        """查找或创建连接，返回槽位"""
+        slot = self._index.get(key)
+        if slot is not None:
+            return slot
+        if self.max_flows is not None and len(self._index) >= self.max_flows:
+            self._make_room(now)
+        if self._free:
+            slot = self._free.pop()
+            self._keys[slot] = key
+            self.first_seen[slot] = now
+            self.last_seen[slot] = now
+            self.packets[slot] = 0
+            self.bytes[slot] = 0
+            self.flags[slot] = 0
+        else:
+            slot = len(self._keys)
+            self._keys.append(key)
+            self.first_seen.append(now)
+            self.last_seen.append(now)
+            self.packets.append(0)
+            self.bytes.append(0)
+            self.flags.append(0)
+        self._index[key] = slot
+        return slot
+
+    def update(self, key: bytes, now: float, length: int = 0) -> int:
+        """记录一个数据包（不存在时创建），返回槽位"""
+        slot = self._index.get(key)
+        if slot is None:
+            slot = self.add(key, now)
+        self.last_seen[slot] = now
+        self.packets[slot] += 1
+        self.bytes[slot] += length
+        return slot
+
+    def set_flags(self, slot: int, bits: int) -> None:
+        self.flags[slot] |= bits
+
+    def remove(self, key: bytes) -> bool:
+        slot = self._index.pop(key, None)
+        if slot is None:
+            return False
+        self._keys[slot] = None
+        self._free.append(slot)
+        return True
+
+    def record(self, slot: int) -> FlowRecord:
+        return FlowRecord(self._keys[slot], self.first_seen[slot], self.last_seen[slot],
+                          self.packets[slot], self.bytes[slot], self.flags[slot])
+
+    def get(self, key: bytes) -> Optional[FlowRecord]:
+        slot = self._index.get(key)
+        return self.record(slot) if slot is not None else None
+
+    def keys(self) -> Iterator[bytes]:
+        return iter(self._index)
+
+    def slots(self) -> Iterator[int]:
+        return iter(self._index.values())
+
+    def items(self) -> Iterator[Tuple[bytes, int]]:
+        """(连接键, 槽位)，不创建 FlowRecord"""
+        return iter(self._index.items())
+
+    def __iter__(self) -> Iterator[FlowRecord]:
+        for slot in self._index.values():
+            yield self.record(slot)
+
+    def expire(self, before: float) -> int:
+        """删除最后活动时间早于 before 的连接，返回删除数量"""
+        last_seen = self.last_seen
+        stale = [key for key, slot in self._index.items() if last_seen[slot] < before]
+        for key in stale:
+            self.remove(key)
+        self.evicted += len(stale)
+        return len(stale)
+
+    def _make_room(self, now: float) -> None:
+        """容量满：先淘汰空闲连接，不足一批时再淘汰最旧的连接（每次至少腾出 1/EVICT_FRACTION，摊销 O(1)）"""
+        target = max(1, len(self._index) // self.EVICT_FRACTION)
+        freed = self.expire(now - self.idle_timeout)
+        if freed >= target:
+            return
+        oldest = self.oldest(target - freed)
+        for key in oldest:
+            self.remove(key)
+        self.evicted += len(oldest)
+
+    def oldest(self, count: int) -> List[bytes]:
+        """最后活动时间最早的 count 个连接（由旧到新）"""
+        last_seen = self.last_seen
+        return [key for key, _ in heapq.nsmallest(count, self._index.items(), key=lambda item: last_seen[item[1]])]
+
+    def memory_bytes(self) -> int:
+        """估算占用（列 + 索引 dict + 键对象）"""
+        columns = sum(column.itemsize * len(column)
+                      for column in (self.first_seen, self.last_seen, self.packets, self.bytes, self.flags))
+        key_size = (len(next(iter(self._index))) + 33) if self._index else 0
+        return (columns + len(self._keys) * 8 + len(self._free) * 8
+                + self._index.__sizeof__() + len(self._index) * key_size)
+
+    def stats(self) -> dict:
+        return {
+            'flows': len(self._index),
+            'slots': len(self._keys),
+            'free_slots': len(self._free),
+            'evicted': self.evicted,
+            'memory_bytes': self.memory_bytes()
+        }
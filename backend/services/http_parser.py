@@ -0,0 +1,477 @@
+"""
+增量 HTTP/1.x 解析器
+每个 TCP 流一个 HTTPConnectionParser，每个方向一个状态机，直接消费该方向的重组缓存：
+- 已解析的字节立即从重组缓存中消费，头部结束位置由缓存增量扫描，每个字节只检查一次
+- 消息体长度：Transfer-Encoding: chunked > Content-Length > 读到连接关闭（仅响应）；
+  1xx/204/304 响应和 HEAD 请求的响应没有消息体
+- 同一连接上的长连接和流水线消息依次解析，请求方法按顺序交给另一个方向判断响应是否有消息体
+- feed() 返回本次完成的事件：头部完成（EVENT_HEADERS）和消息完成（EVENT_MESSAGE）
+- 中途开始抓包或数据被丢弃时，跳到下一行重新寻找消息起始行
+头部直接在字节上解析为不区分大小写的多值映射（HTTPHeaders），字段值在读取时才解码
+"""
+import codecs
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple, Union
+
+from .protocol_id import HTTP_METHODS, HTTP_REQUEST, HTTP_RESPONSE, http_kind
+from .tcp_reassembly import ReassemblyBuffer, DEFAULT_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+EVENT_HEADERS = "headers"
+EVENT_MESSAGE = "message"
+
+# 头部块上限，超出后视为不是 HTTP 并重新同步
+MAX_HEADER_BYTES = 64 * 1024
+# chunk 大小行上限
+MAX_CHUNK_LINE = 1024
+
+# 解析状态
+_S_START = 0          # 等待起始行和头部
+_S_BODY = 1           # Content-Length 消息体
+_S_CHUNK_SIZE = 2     # chunk 大小行
+_S_CHUNK_DATA = 3     # chunk 数据
+_S_CHUNK_END = 4      # chunk 数据后的 CRLF
+_S_TRAILERS = 5       # 最后一个 chunk 之后的尾部头部
+_S_UNTIL_CLOSE = 6    # 读到连接关闭为止的响应体
+_S_TUNNEL = 7         # 协议升级/CONNECT 隧道，不再按 HTTP 解析
+
+_MESSAGE_STARTS = HTTP_METHODS + (b'HTTP/',)
+_START_PROBE = max(len(start) for start in _MESSAGE_STARTS)
+_CRLF = b'\r\n'
+
+# 文本解码顺序（与抓包数据常见的编码一致，latin-1 总能成功）
+TEXT_ENCODINGS = ('utf-8', 'gbk', 'latin-1')
+
+Event = Tuple[str, 'HTTPMessage']
+
+
+def decode_text(data: bytes) -> str:
+    """按 TEXT_ENCODINGS 顺序解码（头部字段、起始行等短文本）"""
+    for encoding in TEXT_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode('latin-1')
+
+
+def content_charset(content_type: Optional[str]) -> Optional[str]:
+    """Content-Type 中的 charset 参数（规范化的编码名），没有或无法识别返回 None"""
+    if not content_type:
+        return None
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.partition('=')
+        if key.strip().lower() == 'charset':
+            try:
+                return codecs.lookup(value.strip().strip('"\'')).name
+            except LookupError:
+                return None
+    return None
+
+
+def decode_body(body, content_type: Optional[str], limit: int) -> str:
+    """
+    消息体开头 limit 个字符的文本
+    只解码开头的 limit * 4 字节；优先使用 Content-Type 的 charset，失败时按 TEXT_ENCODINGS 尝试
+    截断处不完整的多字节字符被忽略，不会导致整段按其他编码解码
+    """
+    head = bytes(body[:limit * 4])
+    charset = content_charset(content_type)
+    for encoding in ((charset,) if charset else ()) + TEXT_ENCODINGS:
+        try:
+            return codecs.getincrementaldecoder(encoding)().decode(head)[:limit]
+        except UnicodeDecodeError:
+            continue
+    return head.decode('latin-1')[:limit]
+
+
+def _field_name(name: Union[str, bytes]) -> bytes:
+    return (name.encode('latin-1') if name.__class__ is str else name).lower()
+
+
+class HTTPHeaders:
+    """
+    HTTP 头部字段：字节形式的多值映射
+    保持原始顺序和大小写；按名称查找不区分大小写（第一次查找时建立索引），值在读取时才解码
+    """
+
+    __slots__ = ('fields', '_index')
+
+    def __init__(self, fields: Optional[List[Tuple[bytes, bytes]]] = None):
+        self.fields: List[Tuple[bytes, bytes]] = fields if fields is not None else []
+        # 小写名称 -> [值]
+        self._index: Optional[Dict[bytes, List[bytes]]] = None
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    def __contains__(self, name: Union[str, bytes]) -> bool:
+        return _field_name(name) in self._lookup()
+
+    def __repr__(self) -> str:
+        return f"HTTPHeaders({self.items()!r})"
+
+    def _lookup(self) -> Dict[bytes, List[bytes]]:
+        index = self._index
+        if index is None:
+            index = self._index = {}
+            for name, value in self.fields:
+                index.setdefault(name.lower(), []).append(value)
+        return index
+
+    def add(self, name: bytes, value: bytes) -> None:
+        self.fields.append((name, value))
+        self._index = None
+
+    def get_raw(self, name: Union[str, bytes]) -> Optional[bytes]:
+        """第一个同名字段的原始值"""
+        values = self._lookup().get(_field_name(name))
+        return values[0] if values else None
+
+    def get(self, name: Union[str, bytes], default: Optional[str] = None) -> Optional[str]:
+        """第一个同名字段的值（解码后）"""
+        value = self.get_raw(name)
+        return decode_text(value) if value is not None else default
+
+    def get_all(self, name: Union[str, bytes]) -> List[str]:
+        """所有同名字段的值（如多个 Set-Cookie）"""
+        return [decode_text(value) for value in self._lookup().get(_field_name(name), ())]
+
+    def items(self) -> List[Tuple[str, str]]:
+        return [(decode_text(name), decode_text(value)) for name, value in self.fields]
+
+    def to_dict(self) -> Dict[str, str]:
+        """展示用的字典：名称保持第一次出现时的大小写，同名字段按 ", " 合并"""
+        merged: Dict[bytes, Tuple[str, List[str]]] = {}
+        for name, value in self.fields:
+            entry = merged.get(name.lower())
+            if entry is None:
+                merged[name.lower()] = (decode_text(name), [decode_text(value)])
+            else:
+                entry[1].append(decode_text(value))
+        return {name: ", ".join(values) for name, values in merged.values()}
+
+
+def _start_kind(data) -> Tuple[Optional[str], bool]:
+    """
+    缓存开头是否是 HTTP 消息起始行
+    :return: (request/response/None, 是否需要更多数据才能判断)
+    """
+    if len(data) >= _START_PROBE:
+        return http_kind(data), False
+    head = bytes(data)
+    kind = http_kind(head)
+    if kind is not None:
+        return kind, False
+    return None, any(start.startswith(head) for start in _MESSAGE_STARTS)
+
+
+class HTTPMessage:
+    """一条 HTTP 消息（起始行、头部字段和去掉分块编码后的消息体）"""
+
+    __slots__ = ('kind', 'method', 'target', 'version', 'status', 'reason', 'headers',
+                 'body', 'body_size', 'truncated', 'chunked', 'timestamp', 'end_time')
+
+    def __init__(self, kind: str, timestamp: float):
+        self.kind = kind
+        self.method = ""
+        self.target = ""
+        self.version = ""
+        self.status = 0
+        self.reason = ""
+        self.headers = HTTPHeaders()
+        # 增量解析时为 bytearray，parse_message 解析完整消息时为原始数据的 memoryview 切片
+        self.body: Union[bytearray, memoryview] = bytearray()
+        # 消息体实际长度（超出上限时 body 只保留前面的部分）
+        self.body_size = 0
+        self.truncated = False
+        self.chunked = False
+        # 头部完成 / 消息完成时的抓包时间
+        self.timestamp = timestamp
+        self.end_time: Optional[float] = None
+
+
+def _parse_head(head: bytes, kind: str, timestamp: float) -> Optional[HTTPMessage]:
+    """起始行 + 头部字段（不含结尾的空行），格式错误返回 None"""
+    lines = head.split(b'\r\n')
+    parts = lines[0].split(b' ', 2)
+    message = HTTPMessage(kind, timestamp)
+    if kind == HTTP_REQUEST:
+        if len(parts) != 3 or not parts[2].startswith(b'HTTP/'):
+            return None
+        message.method = parts[0].decode('ascii', 'replace')
+        message.target = decode_text(parts[1])
+        message.version = parts[2].decode('ascii', 'replace')
+    else:
+        if len(parts) < 2 or not parts[1].isdigit():
+            return None
+        message.version = parts[0].decode('ascii', 'replace')
+        message.status = int(parts[1])
+        message.reason = decode_text(parts[2].strip()) if len(parts) > 2 else ""
+    headers = message.headers.fields
+    for line in lines[1:]:
+        if line[:1] in (b' ', b'\t'):
+            # 折叠的续行（已废弃的语法），并入上一个字段
+            if headers:
+                headers[-1] = (headers[-1][0], headers[-1][1] + b' ' + line.strip())
+            continue
+        name, sep, value = line.partition(b':')
+        if sep:
+            headers.append((name.strip(), value.strip()))
+    return message
+
+
+def parse_message(data: bytes, timestamp: float) -> Optional[HTTPMessage]:
+    """
+    解析一段以起始行开头的完整消息（不经过重组缓存）
+    消息体为 data 的 memoryview 切片（有 Content-Length 时按长度截取），不复制
+    :return: 不是 HTTP 消息或头部不完整返回 None
+    """
+    kind = http_kind(data)
+    if kind is None:
+        return None
+    end = data.find(b'\r\n\r\n', 0, MAX_HEADER_BYTES)
+    if end < 0:
+        return None
+    message = _parse_head(bytes(data[:end]), kind, timestamp)
+    if message is None:
+        return None
+    body = memoryview(data)[end + 4:]
+    length = message.headers.get_raw(b'content-length')
+    if length is not None and length.isdigit():
+        body = body[:int(length)]
+    message.body = body
+    message.body_size = len(body)
+    message.end_time = timestamp
+    return message
+
+
+class HTTPMessageParser:
+    """单方向的 HTTP/1.x 状态机"""
+
+    __slots__ = ('max_body', 'state', 'remaining', 'message', 'tunnel_after', '_overflows',
+                 'messages', 'bytes_skipped')
+
+    def __init__(self, max_body: int = DEFAULT_MAX_BYTES):
+        """:param max_body: 每条消息保留的消息体字节数上限（超出部分只计数）"""
+        self.max_body = max_body
+        self.state = _S_START
+        self.remaining = 0
+        self.message: Optional[HTTPMessage] = None
+        # 当前消息结束后进入隧道状态（CONNECT 请求）
+        self.tunnel_after = False
+        self._overflows = 0
+        self.messages = 0
+        self.bytes_skipped = 0
+
+    def feed(self, buffer: ReassemblyBuffer, timestamp: float, methods: Deque[str]) -> List[Event]:
+        """
+        解析缓存中新到达的数据
+        :param methods: 本连接已发出、还没有响应的请求方法（请求方向追加，响应方向取出）
+        :return: 本次完成的事件
+        """
+        events: List[Event] = []
+        if buffer.overflows != self._overflows:
+            # 缓存超出上限被清空过，当前消息不完整，重新同步
+            self._overflows = buffer.overflows
+            self._reset()
+        while True:
+            state = self.state
+            data = buffer.data
+            if state == _S_START:
+                if not data:
+                    break
+                if not self._start(buffer, timestamp, methods, events):
+                    break
+            elif state == _S_BODY or state == _S_CHUNK_DATA:
+                size = min(len(data), self.remaining)
+                if not size:
+                    break
+                self._append_body(data, size)
+                buffer.consume(size)
+                self.remaining -= size
+                if not self.remaining:
+                    if state == _S_BODY:
+                        self._complete(timestamp, events)
+                    else:
+                        self.state = _S_CHUNK_END
+            elif state == _S_CHUNK_SIZE:
+                end = data.find(b'\r\n', 0, MAX_CHUNK_LINE)
+                if end < 0:
+                    if len(data) >= MAX_CHUNK_LINE:
+                        self._resync(buffer)
+                        continue
+                    break
+                try:
+                    size = int(bytes(data[:end]).split(b';', 1)[0].strip(), 16)
+                except ValueError:
+                    self._resync(buffer)
+                    continue
+                buffer.consume(end + 2)
+                if size:
+                    self.remaining = size
+                    self.state = _S_CHUNK_DATA
+                else:
+                    self.state = _S_TRAILERS
+            elif state == _S_CHUNK_END:
+                if len(data) < 2:
+                    break
+                if data[:2] != b'\r\n':
+                    self._resync(buffer)
+                    continue
+                buffer.consume(2)
+                self.state = _S_CHUNK_SIZE
+            elif state == _S_TRAILERS:
+                if len(data) < 2:
+                    break
+                if data[:2] == b'\r\n':
+                    buffer.consume(2)
+                else:
+                    end = buffer.header_end()
+                    if end < 0:
+                        break
+                    buffer.consume(end + 4)
+                self._complete(timestamp, events)
+            elif state == _S_UNTIL_CLOSE:
+                if data:
+                    self._append_body(data, len(data))
+                    buffer.consume(len(data))
+                if buffer.fin_seen:
+                    self._complete(timestamp, events)
+                break
+            else:
+                # 隧道：后续数据不是 HTTP
+                if data:
+                    self.bytes_skipped += len(data)
+                    buffer.clear()
+                break
+        return events
+
+    def _start(self, buffer: ReassemblyBuffer, timestamp: float, methods: Deque[str],
+               events: List[Event]) -> bool:
+        """解析起始行和头部，返回是否继续处理缓存中后面的数据"""
+        data = buffer.data
+        # 消息之间多余的空行
+        if data[0] in _CRLF:
+            skip = 1
+            while skip < len(data) and data[skip] in _CRLF:
+                skip += 1
+            buffer.consume(skip)
+            return bool(buffer.data)
+        kind, need_more = _start_kind(data)
+        if kind is None:
+            if need_more:
+                return False
+            self._resync(buffer)
+            return True
+        end = buffer.header_end()
+        if end < 0:
+            if len(data) > MAX_HEADER_BYTES:
+                self._resync(buffer)
+                return True
+            return False
+        message = _parse_head(bytes(data[:end]), kind, timestamp)
+        buffer.consume(end + 4)
+        if message is None:
+            self.bytes_skipped += end + 4
+            return True
+        self.message = message
+        events.append((EVENT_HEADERS, message))
+        self._frame(message, methods)
+        if self.state == _S_START:
+            self._complete(timestamp, events)
+        return True
+
+    def _frame(self, message: HTTPMessage, methods: Deque[str]) -> None:
+        """根据头部确定消息体的编码方式"""
+        if message.kind == HTTP_REQUEST:
+            methods.append(message.method)
+            self.tunnel_after = message.method == "CONNECT"
+        else:
+            status = message.status
+            if status < 200:
+                # 1xx 中间响应不对应请求；101 之后连接切换到其他协议
+                if status == 101:
+                    self.tunnel_after = True
+                return
+            method = methods.popleft() if methods else ""
+            if method == "CONNECT" and status < 300:
+                self.tunnel_after = True
+                return
+            if method == "HEAD" or status in (204, 304):
+                return
+
+        encoding = message.headers.get_raw(b'transfer-encoding')
+        if encoding is not None and encoding.lower().endswith(b'chunked'):
+            message.chunked = True
+            self.state = _S_CHUNK_SIZE
+            return
+        length = message.headers.get_raw(b'content-length')
+        if length is not None:
+            try:
+                self.remaining = int(length)
+            except ValueError:
+                self.remaining = 0
+            if self.remaining > 0:
+                self.state = _S_BODY
+            return
+        if message.kind == HTTP_RESPONSE:
+            self.state = _S_UNTIL_CLOSE
+
+    def _append_body(self, data, size: int) -> None:
+        message = self.message
+        keep = min(size, self.max_body - len(message.body))
+        if keep > 0:
+            message.body += data[:keep]
+        if keep < size:
+            message.truncated = True
+        message.body_size += size
+
+    def _complete(self, timestamp: float, events: List[Event]) -> None:
+        message = self.message
+        message.end_time = timestamp
+        events.append((EVENT_MESSAGE, message))
+        self.messages += 1
+        self.message = None
+        self.remaining = 0
+        self.state = _S_TUNNEL if self.tunnel_after else _S_START
+
+    def _resync(self, buffer: ReassemblyBuffer) -> None:
+        """丢弃到下一行开头（或全部数据），回到等待起始行的状态"""
+        data = buffer.data
+        end = data.find(b'\n')
+        skip = end + 1 if end >= 0 else len(data)
+        self.bytes_skipped += skip
+        buffer.consume(skip)
+        self._reset()
+
+    def _reset(self) -> None:
+        self.state = _S_START
+        self.remaining = 0
+        self.message = None
+        self.tunnel_after = False
+
+
+class HTTPConnectionParser:
+    """单个 TCP 流两个方向的 HTTP 解析状态"""
+
+    __slots__ = ('outbound', 'inbound', 'methods')
+
+    def __init__(self, max_body: int = DEFAULT_MAX_BYTES):
+        self.outbound = HTTPMessageParser(max_body)
+        self.inbound = HTTPMessageParser(max_body)
+        self.methods: Deque[str] = deque()
+
+    def feed(self, outbound: ReassemblyBuffer, inbound: ReassemblyBuffer, timestamp: float) -> List[Event]:
+        """解析两个方向新到达的数据（先处理发起方向，请求先于对应的响应登记）"""
+        events = self.outbound.feed(outbound, timestamp, self.methods)
+        events += self.inbound.feed(inbound, timestamp, self.methods)
+        return events
+
+    def stats(self) -> dict:
+        return {
+            'messages': self.outbound.messages + self.inbound.messages,
+            'bytes_skipped': self.outbound.bytes_skipped + self.inbound.bytes_skipped
+        }
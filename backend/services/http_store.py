@@ -0,0 +1,415 @@
+"""
+HTTP 事务存储
+- 环形缓冲区：容量固定，满后淘汰最旧的事务；每个事务有单调递增的序号 seq（也是分页游标）
+- 字节预算：保留的消息体总字节数有上限，超出时同样从最旧的事务开始淘汰
+- 二级索引：host / URL 模板 / 状态码 / stream_id / 延迟区间，索引值为按 seq 升序的列表，
+  淘汰总是发生在最小的 seq 上，只需要移动列表头部（O(1)）
+- 时间范围：事务按完成时间（响应时间戳）写入，另存一份单调不减的时间序列，二分查找得到 seq 区间
+- 查询从候选最少的索引开始，按 seq 从新到旧遍历并校验其余条件，取到 limit 条即停止
+- 统计（状态码、平均耗时、重试数）随写入/淘汰增量维护，不扫描事务
+- 线程安全：抓包线程写入，解码线程缓存解码结果，API 线程查询，共用一把锁
+"""
+import heapq
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .content_decoding import DecodedBody
+    from .http_stream import HTTPTransaction
+
+DEFAULT_CAPACITY = 100_000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 保留的消息体总字节数上限
+
+# 延迟区间：第 i 个区间为 [2^(i-1), 2^i) 毫秒，第 0 个为 [0, 1)
+LATENCY_BUCKETS = 32
+
+_ID_SEGMENT = re.compile(
+    r'^(?:\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|[0-9a-fA-F]{16,})$')
+
+
+def url_template(url: str) -> str:
+    """
+    URL -> 模板：去掉 scheme/host、查询参数和片段，数字、UUID 和长十六进制段替换为 {id}
+    例如 /api/users/42/orders?page=2 -> /api/users/{id}/orders
+    """
+    if '://' in url:
+        url = url.split('://', 1)[1]
+        slash = url.find('/')
+        url = url[slash:] if slash >= 0 else '/'
+    for sep in ('?', '#'):
+        cut = url.find(sep)
+        if cut >= 0:
+            url = url[:cut]
+    segments = url.split('/')
+    for i, segment in enumerate(segments):
+        if segment and _ID_SEGMENT.match(segment):
+            segments[i] = '{id}'
+    return '/'.join(segments) or '/'
+
+
+def request_host(request) -> str:
+    """请求的 host（Host 头部，没有时取绝对 URL 中的主机名），小写"""
+    host = request.headers.get(b'host')
+    if not host and '://' in request.url:
+        host = request.url.split('://', 1)[1].split('/', 1)[0]
+    return (host or '').lower()
+
+
+def latency_bucket(duration: Optional[float]) -> int:
+    """耗时（毫秒）所在的延迟区间"""
+    if not duration or duration < 1:
+        return 0
+    return min(LATENCY_BUCKETS - 1, int(duration).bit_length())
+
+
+def message_bytes(message) -> int:
+    """请求/响应在字节预算中的大小：消息体 + 已缓存的解码结果"""
+    decoded = message.decoded
+    return len(message.body) + (len(decoded.data) if decoded is not None else 0)
+
+
+def transaction_bytes(transaction: 'HTTPTransaction') -> int:
+    """事务在字节预算中的大小：请求和响应"""
+    response = transaction.response
+    return message_bytes(transaction.request) + (message_bytes(response) if response is not None else 0)
+
+
+class _SeqList:
+    """升序的 seq 列表，头部淘汰只移动起点，累积到一半时压缩"""
+
+    __slots__ = ('seqs', 'head')
+
+    def __init__(self):
+        self.seqs: List[int] = []
+        self.head = 0
+
+    def __len__(self) -> int:
+        return len(self.seqs) - self.head
+
+    def popleft(self) -> None:
+        self.head += 1
+        if self.head >= 1024 and self.head * 2 >= len(self.seqs):
+            del self.seqs[:self.head]
+            self.head = 0
+
+    def span(self, lo: int, hi: int) -> Tuple[int, int]:
+        """seq 在 [lo, hi) 内的下标区间"""
+        seqs = self.seqs
+        return bisect_left(seqs, lo, self.head), bisect_left(seqs, hi, self.head)
+
+
+def _add(index: dict, key, seq: int) -> None:
+    seqs = index.get(key)
+    if seqs is None:
+        seqs = index[key] = _SeqList()
+    seqs.seqs.append(seq)
+
+
+def _evict(index: dict, key) -> None:
+    seqs = index[key]
+    seqs.popleft()
+    if not seqs:
+        del index[key]
+
+
+def _reversed_span(seqs: List[int], i: int, j: int) -> Iterator[int]:
+    for k in range(j - 1, i - 1, -1):
+        yield seqs[k]
+
+
+def _descending(parts: List[Tuple[List[int], int, int]]) -> Iterator[int]:
+    """多个 seq 列表片段按 seq 从大到小合并"""
+    if len(parts) == 1:
+        return _reversed_span(*parts[0])
+    return heapq.merge(*(_reversed_span(*part) for part in parts), reverse=True)
+
+
+class HTTPTransactionStore:
+    """有容量上限和字节预算、带二级索引的 HTTP 事务存储"""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        :param capacity: 保留的事务数量上限
+        :param max_bytes: 保留的消息体（含解码结果）总字节数上限（单个超出预算的事务仍会保留，直到被下一个事务淘汰）
+        """
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._ring: List[Optional['HTTPTransaction']] = []
+        # seq % capacity -> (host, URL 模板, 状态码, stream_id, 延迟区间)，淘汰时据此更新索引
+        self._keys: List[Optional[tuple]] = []
+        # seq % capacity -> 单调不减的完成时间（乱序到达的事务按之前的最大值计）
+        self._times = array('d')
+        self._last_time = 0.0
+        # seq % capacity -> 计入字节预算的大小
+        self._sizes = array('q')
+        self.retained_bytes = 0
+        self.first_seq = 0   # 仍保留的最旧事务
+        self.next_seq = 0    # 下一个事务的 seq
+
+        self._by_host: Dict[str, _SeqList] = {}
+        self._by_template: Dict[str, _SeqList] = {}
+        self._by_status: Dict[int, _SeqList] = {}
+        self._by_stream: Dict[str, _SeqList] = {}
+        self._by_latency: Dict[int, _SeqList] = {}
+
+        # 保留窗口内的统计
+        self._status_counts: Dict[int, int] = {}
+        self._total_duration = 0.0
+        self._retries = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return self.next_seq - self.first_seq
+
+    def __iter__(self) -> Iterator['HTTPTransaction']:
+        """从旧到新遍历（快照）"""
+        return iter(self.since(self.first_seq))
+
+    def since(self, seq: int) -> List['HTTPTransaction']:
+        """seq 不小于给定值的事务（从旧到新）"""
+        with self._lock:
+            ring, capacity = self._ring, self.capacity
+            return [ring[s % capacity] for s in range(max(seq, self.first_seq), self.next_seq)]
+
+    def get(self, seq: int) -> Optional['HTTPTransaction']:
+        with self._lock:
+            if self.first_seq <= seq < self.next_seq:
+                return self._ring[seq % self.capacity]
+            return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def append(self, transaction: 'HTTPTransaction', host: Optional[str] = None,
+               template: Optional[str] = None) -> int:
+        """
+        写入一个已配对的事务（写满或超出字节预算后淘汰最旧的），返回分配的 seq
+        :param host/template: 调用方已计算的 request_host / url_template（省略时在这里计算）
+        """
+        request, response = transaction.request, transaction.response
+        if host is None:
+            host = request_host(request)
+        if template is None:
+            template = url_template(request.url)
+        status = response.status_code if response is not None else 0
+        bucket = latency_bucket(transaction.duration)
+        keys = (host, template, status, request.stream_id, bucket)
+        timestamp = response.timestamp if response is not None else request.timestamp
+        with self._lock:
+            seq = self.next_seq
+            # 解码结果由解码线程在锁内写入，这里读到的大小与之后的 set_decoded 不会重复计算
+            size = transaction_bytes(transaction)
+            if seq - self.first_seq >= self.capacity:
+                self._evict_oldest()
+            while self.first_seq < seq and self.retained_bytes + size > self.max_bytes:
+                self._evict_oldest()
+            if timestamp > self._last_time:
+                self._last_time = timestamp
+
+            slot = seq % self.capacity
+            if slot == len(self._ring):
+                self._ring.append(transaction)
+                self._keys.append(keys)
+                self._times.append(self._last_time)
+                self._sizes.append(size)
+            else:
+                self._ring[slot] = transaction
+                self._keys[slot] = keys
+                self._times[slot] = self._last_time
+                self._sizes[slot] = size
+            self.retained_bytes += size
+            transaction.seq = request.seq = seq
+            if response is not None:
+                response.seq = seq
+            self.next_seq = seq + 1
+
+            _add(self._by_host, keys[0], seq)
+            _add(self._by_template, keys[1], seq)
+            _add(self._by_status, status, seq)
+            _add(self._by_stream, keys[3], seq)
+            _add(self._by_latency, bucket, seq)
+            self._status_counts[status] = self._status_counts.get(status, 0) + 1
+            self._total_duration += transaction.duration or 0.0
+            self._retries += transaction.is_retry
+            return seq
+
+    def set_decoded(self, message, decoded: 'DecodedBody') -> None:
+        """
+        缓存请求/响应的解码结果（DecompressWorker 回调，在解码线程中调用）
+        消息所在的事务已写入时解码数据计入字节预算，超出后淘汰最旧的事务；
+        事务已被淘汰时不再缓存（查看时按需解码）
+        """
+        with self._lock:
+            seq = message.seq
+            if seq < 0:
+                # 尚未配对写入：写入时连同消息体一起计入
+                message.decoded = decoded
+                return
+            if not self.first_seq <= seq < self.next_seq:
+                return
+            slot = seq % self.capacity
+            transaction = self._ring[slot]
+            if transaction.request is message or transaction.response is message:
+                size = len(decoded.data) - (len(message.decoded.data) if message.decoded is not None else 0)
+                message.decoded = decoded
+                self._sizes[slot] += size
+                self.retained_bytes += size
+                while self.retained_bytes > self.max_bytes and self.first_seq < self.next_seq - 1:
+                    self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        seq = self.first_seq
+        slot = seq % self.capacity
+        transaction = self._ring[slot]
+        host, template, status, stream_id, bucket = self._keys[slot]
+        self._ring[slot] = None
+        self._keys[slot] = None
+        self.first_seq = seq + 1
+        self.evicted += 1
+        self.retained_bytes -= self._sizes[slot]
+        # 释放解码缓存：消息可能仍被其他地方引用（如按 packet_id 查看消息体），之后按需解码
+        transaction.request.decoded = None
+        if transaction.response is not None:
+            transaction.response.decoded = None
+
+        _evict(self._by_host, host)
+        _evict(self._by_template, template)
+        _evict(self._by_status, status)
+        _evict(self._by_stream, stream_id)
+        _evict(self._by_latency, bucket)
+        count = self._status_counts[status] - 1
+        if count:
+            self._status_counts[status] = count
+        else:
+            del self._status_counts[status]
+        self._total_duration -= transaction.duration or 0.0
+        self._retries -= transaction.is_retry
+
+    def _seq_at(self, timestamp: float, after: bool) -> int:
+        """第一个完成时间 >= timestamp（after=True 时 > timestamp）的 seq"""
+        times, capacity = self._times, self.capacity
+        lo, hi = self.first_seq, self.next_seq
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = times[mid % capacity]
+            if value < timestamp or (after and value == timestamp):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def latest(self, limit: int = 100) -> List['HTTPTransaction']:
+        """最近的 limit 个事务（从旧到新）"""
+        return self.since(self.next_seq - limit)
+
+    def query(self, host: Optional[str] = None, template: Optional[str] = None,
+              status: Optional[int] = None, status_class: Optional[int] = None,
+              stream_id: Optional[str] = None, start: Optional[float] = None, end: Optional[float] = None,
+              min_duration: Optional[float] = None, max_duration: Optional[float] = None,
+              before: Optional[int] = None, limit: int = 100) -> List['HTTPTransaction']:
+        """
+        按条件查询事务，从新到旧返回最多 limit 条
+        :param host: 请求 host（不区分大小写）
+        :param template: URL 模板（见 url_template）
+        :param status: 状态码
+        :param status_class: 状态码类别，如 5 表示 5xx
+        :param start/end: 完成时间范围（含两端）
+        :param min_duration/max_duration: 耗时范围（毫秒，含两端）
+        :param before: 分页游标，只返回 seq 小于该值的事务
+        """
+        with self._lock:
+            lo, hi = self.first_seq, self.next_seq
+            if before is not None:
+                hi = min(hi, before)
+            if start is not None:
+                lo = max(lo, self._seq_at(start, after=False))
+            if end is not None:
+                hi = min(hi, self._seq_at(end, after=True))
+            if lo >= hi or limit <= 0:
+                return []
+
+            # 每个条件对应的候选 seq 片段，选候选最少的条件驱动遍历
+            candidates = []
+            if host is not None:
+                candidates.append([self._by_host.get(host.lower())])
+            if template is not None:
+                candidates.append([self._by_template.get(template)])
+            if status is not None:
+                candidates.append([self._by_status.get(status)])
+            if status_class is not None:
+                candidates.append([seqs for code, seqs in self._by_status.items() if code // 100 == status_class])
+            if stream_id is not None:
+                candidates.append([self._by_stream.get(stream_id)])
+            if min_duration is not None or max_duration is not None:
+                first = latency_bucket(min_duration) if min_duration is not None else 0
+                last = latency_bucket(max_duration) if max_duration is not None else LATENCY_BUCKETS - 1
+                candidates.append([self._by_latency.get(bucket) for bucket in range(first, last + 1)])
+
+            driver = None
+            driver_size = hi - lo
+            for lists in candidates:
+                parts = []
+                size = 0
+                for seqs in lists:
+                    if seqs is not None:
+                        i, j = seqs.span(lo, hi)
+                        if i < j:
+                            parts.append((seqs.seqs, i, j))
+                            size += j - i
+                if not parts:
+                    return []
+                if size <= driver_size:
+                    driver, driver_size = parts, size
+            seq_iter = _descending(driver) if driver is not None else range(hi - 1, lo - 1, -1)
+
+            host = host.lower() if host is not None else None
+            ring, keys, capacity = self._ring, self._keys, self.capacity
+            results = []
+            for seq in seq_iter:
+                slot = seq % capacity
+                key = keys[slot]
+                if ((host is not None and key[0] != host) or (template is not None and key[1] != template)
+                        or (status is not None and key[2] != status)
+                        or (status_class is not None and key[2] // 100 != status_class)
+                        or (stream_id is not None and key[3] != stream_id)):
+                    continue
+                transaction = ring[slot]
+                if min_duration is not None or max_duration is not None:
+                    duration = transaction.duration or 0.0
+                    if ((min_duration is not None and duration < min_duration)
+                            or (max_duration is not None and duration > max_duration)):
+                        continue
+                if start is not None or end is not None:
+                    response = transaction.response
+                    timestamp = response.timestamp if response is not None else transaction.request.timestamp
+                    if (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                        continue
+                results.append(transaction)
+                if len(results) >= limit:
+                    break
+            return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = len(self)
+            return {
+                'total_transactions': total,
+                'avg_duration': self._total_duration / total if total > 0 else 0,
+                'status_codes': dict(self._status_counts),
+                'retry_count': self._retries,
+                'retry_rate': self._retries / total if total > 0 else 0,
+                'capacity': self.capacity,
+                'evicted': self.evicted,
+                'retained_bytes': self.retained_bytes,
+                'max_bytes': self.max_bytes,
+                'hosts': len(self._by_host),
+                'url_templates': len(self._by_template)
+            }
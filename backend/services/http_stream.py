@@ -1,46 +1,132 @@
 """
 HTTP流解析器
 从TCP流中提取和解析HTTP请求/响应
+头部保持字节形式（HTTPHeaders），消息体保持 memoryview，只在界面需要时按 Content-Type 的 charset 解码预览
+压缩的消息体（Content-Encoding）由后台 DecompressWorker 解码，结果缓存在请求/响应上并计入事务存储的字节预算
 """
 import logging
-import re
-from typing import Optional, Dict, List, Tuple
+from typing import Optional, Dict, List, Tuple, Union
 from dataclasses import dataclass, field
-from datetime import datetime
+
+from .capture_log import hot_log
+from .checkpoint import Deferred
+from .content_decoding import DecodedBody, decode_content, parse_content_encoding
+from .http_store import DEFAULT_CAPACITY, DEFAULT_MAX_BYTES, HTTPTransactionStore, request_host, url_template
+from .latency_stats import EndpointLatencyTracker
+from .http_parser import (HTTP_REQUEST, HTTP_RESPONSE, HTTPHeaders, HTTPMessage, decode_body,
+                          parse_message)
 
 logger = logging.getLogger(__name__)
 
+BODY_PREVIEW_CHARS = 500  # 消息体文本预览的最大字符数
+
+Body = Union[bytes, bytearray, memoryview]
+
+
+class _BodyText:
+    """请求/响应共用：消息体的内容解码（Content-Encoding）和惰性文本预览"""
+
+    @property
+    def content_encoding(self) -> Optional[str]:
+        """Content-Encoding（没有或只有 identity 时为 None）"""
+        value = self.headers.get(b'content-encoding')
+        return value if parse_content_encoding(value) else None
+
+    def decoded_body(self) -> DecodedBody:
+        """解码后的消息体：没有后台解码的缓存结果时在调用线程解码（不缓存）"""
+        decoded = self.decoded
+        if decoded is None:
+            decoded = decode_content(self.body, self.content_encoding)
+        return decoded
+
+    def body_preview(self) -> str:
+        """
+        消息体开头的文本预览（第一次调用时解码，结果缓存）
+        压缩的消息体只解压预览需要的开头部分，开销与消息体大小无关
+        """
+        if self._preview is None:
+            body = self.body
+            encoding = self.content_encoding
+            if encoding:
+                decoded = self.decoded or decode_content(body, encoding, BODY_PREVIEW_CHARS * 4)
+                body = decoded.data
+            self._preview = decode_body(body, self.headers.get(b'content-type'), BODY_PREVIEW_CHARS)
+        return self._preview
+
+    def body_text(self, limit: int, decoded: Optional[DecodedBody] = None) -> str:
+        """
+        解码后消息体开头 limit 个字符的文本（不缓存）
+        :param decoded: 调用方已取得的 decoded_body()，省略时在这里取
+        """
+        if decoded is None:
+            decoded = self.decoded_body()
+        return decode_body(decoded.data, self.headers.get(b'content-type'), limit)
+
 
 @dataclass
-class HTTPRequest:
+class HTTPRequest(_BodyText):
     """HTTP请求"""
     method: str
     url: str
     version: str
-    headers: Dict[str, str]
-    body: bytes
+    headers: HTTPHeaders
+    body: Body
     timestamp: float
     stream_id: str
+    decoded: Optional[DecodedBody] = field(default=None, init=False, repr=False, compare=False)
+    seq: int = field(default=-1, init=False, repr=False, compare=False)  # 所属事务在事务存储中的序号
+    _preview: Optional[str] = field(default=None, init=False, repr=False, compare=False)
     
     def __str__(self):
         return f"{self.method} {self.url} {self.version}"
 
 
 @dataclass
-class HTTPResponse:
+class HTTPResponse(_BodyText):
     """HTTP响应"""
     version: str
     status_code: int
     reason: str
-    headers: Dict[str, str]
-    body: bytes
+    headers: HTTPHeaders
+    body: Body
     timestamp: float
     stream_id: str
+    decoded: Optional[DecodedBody] = field(default=None, init=False, repr=False, compare=False)
+    seq: int = field(default=-1, init=False, repr=False, compare=False)  # 所属事务在事务存储中的序号
+    _preview: Optional[str] = field(default=None, init=False, repr=False, compare=False)
     
     def __str__(self):
         return f"{self.version} {self.status_code} {self.reason}"
 
 
+# 检查点中头部为 [(name, value)] 字节对，消息体为 bytes
+
+def _request_state(request: HTTPRequest) -> tuple:
+    return (request.method, request.url, request.version, request.headers.fields, bytes(request.body),
+            request.timestamp, request.stream_id)
+
+
+def _response_state(response: HTTPResponse) -> tuple:
+    return (response.version, response.status_code, response.reason, response.headers.fields,
+            bytes(response.body), response.timestamp, response.stream_id)
+
+
+def _transaction_state(transaction: 'HTTPTransaction') -> tuple:
+    response = transaction.response
+    return (_request_state(transaction.request), _response_state(response) if response is not None else None,
+            transaction.duration, transaction.is_retry, transaction.retry_count)
+
+
+def _restore_request(state: tuple) -> HTTPRequest:
+    method, url, version, fields, body, timestamp, stream_id = state
+    return HTTPRequest(method, url, version, HTTPHeaders(list(fields)), body, timestamp, stream_id)
+
+
+def _restore_response(state: tuple) -> HTTPResponse:
+    version, status_code, reason, fields, body, timestamp, stream_id = state
+    return HTTPResponse(version, status_code, reason, HTTPHeaders(list(fields)), body, timestamp, stream_id)
+
+
 @dataclass
 class HTTPTransaction:
     """HTTP事务（一个请求+响应对）"""
@@ -49,177 +135,93 @@ class HTTPTransaction:
     duration: Optional[float] = None  # 响应时间（毫秒）
     is_retry: bool = False  # 是否是重试请求
     retry_count: int = 0
+    seq: int = -1  # 在事务存储中的序号
     
 
 class HTTPStreamParser:
     """HTTP流解析器"""
     
-    def __init__(self):
-        self.transactions: List[HTTPTransaction] = []
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        :param capacity: 保留的事务数量上限，超过后淘汰最旧的事务
+        :param max_bytes: 保留的消息体总字节数上限，超过后同样淘汰最旧的事务
+        """
+        self.transactions = HTTPTransactionStore(capacity, max_bytes)
+        # 按端点（方法 + host + URL 模板）的延迟分位数，包含已被淘汰的事务
+        self.latency = EndpointLatencyTracker()
         self.pending_requests: Dict[str, List[HTTPRequest]] = {}  # stream_id -> [requests]
         
         # 用于检测重试
         self.url_history: Dict[str, List[Tuple[float, str]]] = {}  # url -> [(timestamp, stream_id)]
         
+        # 上次检查点时的下一个事务 seq（增量只包含之后的事务）
+        self._checkpoint_seq = 0
+        
         logger.info("HTTP Stream Parser initialized")
     
     def parse_request(self, data: bytes, timestamp: float, stream_id: str) -> Optional[HTTPRequest]:
         """
-        解析HTTP请求
+        解析一段完整的HTTP请求（不经过重组缓存）
         
         :param data: 原始HTTP数据
         :param timestamp: 时间戳
         :param stream_id: TCP流ID
         :return: HTTPRequest或None
         """
-        try:
-            # 转换为字符串（尝试多种编码）
-            text = self._decode_data(data)
-            if not text:
-                return None
-            
-            # 分割请求行和headers/body
-            parts = text.split('\r\n\r\n', 1)
-            if len(parts) < 1:
-                return None
-            
-            header_section = parts[0]
-            # Body部分保持原始bytes，不强制解码
-            body = data.split(b'\r\n\r\n', 1)[1] if b'\r\n\r\n' in data else b''
-            
-            # 分割行
-            lines = header_section.split('\r\n')
-            if not lines:
-                return None
-            
-            # 解析请求行: "GET /api/login HTTP/1.1"
-            request_line = lines[0]
-            match = re.match(r'([A-Z]+)\s+(.+?)\s+(HTTP/[\d\.]+)', request_line)
-            if not match:
-                logger.debug(f"Invalid HTTP request line: {request_line}")
-                return None
-            
-            method, url, version = match.groups()
-            
-            # 解析headers
-            headers = self._parse_headers(lines[1:])
-            
-            # 提取body（如果有Content-Length）
-            content_length = int(headers.get('Content-Length', 0))
-            if content_length > 0 and len(parts) > 1:
-                body = parts[1].encode('utf-8')[:content_length]
-            
-            request = HTTPRequest(
-                method=method,
-                url=url,
-                version=version,
-                headers=headers,
-                body=body,
-                timestamp=timestamp,
-                stream_id=stream_id
-            )
-            
-            # 检测是否是重试
-            self._check_retry(request)
-            
-            # 添加到待处理队列
-            if stream_id not in self.pending_requests:
-                self.pending_requests[stream_id] = []
-            self.pending_requests[stream_id].append(request)
-            
-            logger.info(f"[HTTP] Parsed request: {method} {url}")
-            
-            return request
-            
-        except Exception as e:
-            logger.error(f"Failed to parse HTTP request: {e}")
+        message = parse_message(data, timestamp)
+        if message is None or message.kind != HTTP_REQUEST:
+            logger.debug("Invalid HTTP request: %r", bytes(data[:64]))
             return None
+        return self.add_request(message, stream_id)
     
     def parse_response(self, data: bytes, timestamp: float, stream_id: str) -> Optional[HTTPResponse]:
         """
-        解析HTTP响应
+        解析一段完整的HTTP响应（不经过重组缓存）
         
         :param data: 原始HTTP数据
         :param timestamp: 时间戳
         :param stream_id: TCP流ID
         :return: HTTPResponse或None
         """
-        try:
-            # 转换为字符串
-            text = self._decode_data(data)
-            if not text:
-                return None
-            
-            # 分割状态行和headers/body
-            parts = text.split('\r\n\r\n', 1)
-            if len(parts) < 1:
-                return None
-            
-            header_section = parts[0]
-            # Body从原始bytes提取，避免编码问题
-            body = data.split(b'\r\n\r\n', 1)[1] if b'\r\n\r\n' in data else b''
-            
-            # 分割行
-            lines = header_section.split('\r\n')
-            if not lines:
-                return None
-            
-            # 解析状态行: "HTTP/1.1 200 OK"
-            status_line = lines[0]
-            match = re.match(r'(HTTP/[\d\.]+)\s+(\d+)\s*(.*)', status_line)
-            if not match:
-                logger.debug(f"Invalid HTTP response line: {status_line}")
-                return None
-            
-            version, status_code, reason = match.groups()
-            status_code = int(status_code)
-            
-            # 解析headers
-            headers = self._parse_headers(lines[1:])
-            
-            # 提取body
-            content_length = int(headers.get('Content-Length', 0))
-            if content_length > 0 and len(parts) > 1:
-                body = parts[1].encode('utf-8')[:content_length]
-            
-            response = HTTPResponse(
-                version=version,
-                status_code=status_code,
-                reason=reason.strip() if reason else "",
-                headers=headers,
-                body=body,
-                timestamp=timestamp,
-                stream_id=stream_id
-            )
-            
-            # 尝试匹配对应的请求
-            self._pair_response_with_request(response)
-            
-            logger.info(f"[HTTP] Parsed response: {status_code} {reason}")
-            
-            return response
-            
-        except Exception as e:
-            logger.error(f"Failed to parse HTTP response: {e}")
+        message = parse_message(data, timestamp)
+        if message is None or message.kind != HTTP_RESPONSE:
+            logger.debug("Invalid HTTP response: %r", bytes(data[:64]))
             return None
+        return self.add_response(message, stream_id)
     
-    def _decode_data(self, data: bytes) -> Optional[str]:
-        """尝试多种编码解码数据"""
-        for encoding in ['utf-8', 'gbk', 'gb2312', 'latin-1']:
-            try:
-                return data.decode(encoding)
-            except:
-                continue
-        return None
+    def add_request(self, message: HTTPMessage, stream_id: str) -> HTTPRequest:
+        """
+        登记解析出的完整请求（HTTPConnectionParser 或 parse_request）
+        头部和消息体直接引用消息中的字节，不做解码和复制
+        """
+        request = HTTPRequest(
+            method=message.method,
+            url=message.target,
+            version=message.version,
+            headers=message.headers,
+            body=memoryview(message.body),
+            timestamp=message.timestamp,
+            stream_id=stream_id
+        )
+        self._check_retry(request)
+        self.pending_requests.setdefault(stream_id, []).append(request)
+        hot_log.info(logger, "HTTP-PARSED", "[HTTP] Parsed request: %s %s", request.method, request.url)
+        return request
     
-    def _parse_headers(self, lines: List[str]) -> Dict[str, str]:
-        """解析HTTP headers"""
-        headers = {}
-        for line in lines:
-            if ':' in line:
-                key, value = line.split(':', 1)
-                headers[key.strip()] = value.strip()
-        return headers
+    def add_response(self, message: HTTPMessage, stream_id: str) -> HTTPResponse:
+        """登记解析出的完整响应，并与同一流上最早的未配对请求配对"""
+        response = HTTPResponse(
+            version=message.version,
+            status_code=message.status,
+            reason=message.reason,
+            headers=message.headers,
+            body=memoryview(message.body),
+            timestamp=message.timestamp,
+            stream_id=stream_id
+        )
+        self._pair_response_with_request(response)
+        hot_log.info(logger, "HTTP-PARSED", "[HTTP] Parsed response: %s %s", response.status_code, response.reason)
+        return response
     
     def _check_retry(self, request: HTTPRequest):
         """检测HTTP请求重试"""
@@ -235,7 +237,7 @@ class HTTPStreamParser:
         recent_threshold = 5.0  # 5秒
         for prev_timestamp, prev_stream_id in history:
             if request.timestamp - prev_timestamp < recent_threshold:
-                logger.info(f"[HTTP] Retry detected: {request.method} {url}")
+                hot_log.info(logger, "HTTP-RETRY", "[HTTP] Retry detected: %s %s", request.method, url)
                 # 这是重试请求
                 # 可以在这里标记，但这里只记录
                 break
@@ -252,7 +254,7 @@ class HTTPStreamParser:
         stream_id = response.stream_id
         
         if stream_id not in self.pending_requests or not self.pending_requests[stream_id]:
-            logger.warning(f"[HTTP] No matching request for response in stream {stream_id}")
+            hot_log.warning(logger, "HTTP-UNPAIRED", "[HTTP] No matching request for response in stream %s", stream_id)
             return
         
         # FIFO: 取第一个请求
@@ -268,38 +270,56 @@ class HTTPStreamParser:
             duration=duration
         )
         
-        self.transactions.append(transaction)
+        host = request_host(request)
+        template = url_template(request.url)
+        self.transactions.append(transaction, host, template)
+        self.latency.record(request.method, host, template, duration, response.timestamp)
         
-        logger.info(f"[HTTP] Paired: {request} -> {response} ({duration:.2f}ms)")
+        hot_log.info(logger, "HTTP-PAIRED", "[HTTP] Paired: %s %s -> %s (%.2fms)",
+                     request.method, request.url, response.status_code, duration)
+    
+    def checkpoint_state(self, full: bool = True) -> dict:
+        """
+        检查点状态：事务历史 + 未配对的请求 + 端点延迟统计
+        full=False 时事务只包含上次检查点之后新增的（已被淘汰的不再写入）；
+        未配对的请求和延迟统计数据量小，总是完整写入
+        事务和请求创建后不再修改：这里只取引用，复制消息体在检查点的写入线程中进行
+        """
+        start = self.transactions.first_seq if full else self._checkpoint_seq
+        transactions = self.transactions.since(start)
+        pending = [(stream_id, list(requests)) for stream_id, requests in self.pending_requests.items() if requests]
+        self._checkpoint_seq = self.transactions.next_seq
+        return {
+            'full': full,
+            'transactions': Deferred(lambda: [_transaction_state(trans) for trans in transactions]),
+            'pending': Deferred(lambda: {stream_id: [_request_state(request) for request in requests]
+                                         for stream_id, requests in pending}),
+            'latency': self.latency.checkpoint_state()
+        }
+    
+    def restore_state(self, state: dict) -> None:
+        """应用 checkpoint_state() 的结果：全量状态替换事务历史，增量追加"""
+        if state['full']:
+            self.transactions.clear()
+        for request, response, duration, is_retry, retry_count in state['transactions']:
+            self.transactions.append(HTTPTransaction(
+                request=_restore_request(request),
+                response=_restore_response(response) if response is not None else None,
+                duration=duration,
+                is_retry=is_retry,
+                retry_count=retry_count
+            ))
+        self.pending_requests = {stream_id: [_restore_request(request) for request in requests]
+                                 for stream_id, requests in state['pending'].items()}
+        self.latency.restore_state(state['latency'])
+        self._checkpoint_seq = self.transactions.next_seq
     
     def get_transactions(self, limit: int = 100) -> List[HTTPTransaction]:
         """获取最近的事务"""
-        return self.transactions[-limit:]
+        return self.transactions.latest(limit)
     
     def get_stats(self) -> dict:
-        """获取统计信息"""
-        total = len(self.transactions)
-        
-        # 统计状态码
-        status_codes = {}
-        total_duration = 0
-        retry_count = 0
-        
-        for trans in self.transactions:
-            if trans.response:
-                code = trans.response.status_code
-                status_codes[code] = status_codes.get(code, 0) + 1
-            
-            if trans.duration:
-                total_duration += trans.duration
-            
-            if trans.is_retry:
-                retry_count += 1
-        
-        return {
-            'total_transactions': total,
-            'avg_duration': total_duration / total if total > 0 else 0,
-            'status_codes': status_codes,
-            'retry_count': retry_count,
-            'retry_rate': retry_count / total if total > 0 else 0
-        }
+        """获取统计信息（存储增量维护，不扫描事务）"""
+        stats = self.transactions.stats()
+        stats['latency'] = self.latency.overall()
+        return stats
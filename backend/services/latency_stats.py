@@ -0,0 +1,301 @@
+"""
+按端点（方法 + host + URL 模板）统计 HTTP 延迟分位数
+- LatencyHistogram: HDR 风格的对数-线性直方图（微秒），稀疏存储，相对误差不超过 1/64；
+  记录 O(1)，同精度的直方图直接按桶相加合并
+- 滑动窗口：每个端点按时间片（默认 10 秒）各一个直方图，查询时合并窗口内的时间片；
+  超出保留时长的时间片在记录时丢弃
+- 时间取事务自身的时间戳（抓包时间），PCAP 导入和实时抓包一致；窗口以最近一次记录的时间为终点
+"""
+import math
+import threading
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+SUB_BUCKET_BITS = 7
+_FULL = 1 << SUB_BUCKET_BITS
+_HALF_BITS = SUB_BUCKET_BITS - 1
+
+DEFAULT_SLOT_SECONDS = 10.0
+DEFAULT_HORIZON = 3600.0
+DEFAULT_MAX_ENDPOINTS = 10000
+
+# 端点数量达到上限后，新端点的记录计入这个端点
+OVERFLOW_ENDPOINT = ('*', '*', '*')
+
+SORT_KEYS = ('p50', 'p90', 'p99', 'max', 'avg', 'count')
+
+EndpointKey = Tuple[str, str, str]
+
+
+def bucket_index(value: int) -> int:
+    """微秒值 -> 桶下标（小于 128 的值每个值一个桶，之后每翻一倍 64 个桶）"""
+    if value < _FULL:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return (shift << _HALF_BITS) + (value >> shift)
+
+
+def bucket_range(index: int) -> Tuple[int, int]:
+    """桶下标 -> 值区间 [lo, hi)"""
+    if index < _FULL:
+        return index, index + 1
+    shift = (index >> _HALF_BITS) - 1
+    mantissa = index - (shift << _HALF_BITS)
+    return mantissa << shift, (mantissa + 1) << shift
+
+
+class LatencyHistogram:
+    """延迟直方图（微秒）"""
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, value: int) -> None:
+        index = bucket_index(value)
+        counts = self.counts
+        counts[index] = counts.get(index, 0) + 1
+        if not self.count or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        if not other.count:
+            return
+        counts = self.counts
+        for index, count in other.counts.items():
+            counts[index] = counts.get(index, 0) + count
+        if not self.count or other.min < self.min:
+            self.min = other.min
+        if other.max > self.max:
+            self.max = other.max
+        self.count += other.count
+        self.total += other.total
+
+    def quantiles(self, qs: Tuple[float, ...]) -> List[int]:
+        """多个分位数（升序）一次遍历求出，取所在桶的中点并限制在 [min, max] 内"""
+        results = []
+        if not self.count:
+            return [0] * len(qs)
+        ranks = [max(1, math.ceil(q * self.count)) for q in qs]
+        seen = 0
+        position = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            while position < len(ranks) and seen >= ranks[position]:
+                lo, hi = bucket_range(index)
+                results.append(min(max((lo + hi - 1) // 2, self.min), self.max))
+                position += 1
+            if position == len(ranks):
+                break
+        return results
+
+    def summary(self) -> dict:
+        """毫秒为单位的统计摘要"""
+        p50, p90, p99 = self.quantiles((0.5, 0.9, 0.99))
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count / 1000, 3) if self.count else 0,
+            'min_ms': self.min / 1000,
+            'p50_ms': p50 / 1000,
+            'p90_ms': p90 / 1000,
+            'p99_ms': p99 / 1000,
+            'max_ms': self.max / 1000
+        }
+
+    def state(self) -> tuple:
+        """检查点状态（复制桶计数，序列化在其他线程进行）"""
+        return dict(self.counts), self.count, self.total, self.min, self.max
+
+    @classmethod
+    def from_state(cls, state: tuple) -> 'LatencyHistogram':
+        histogram = cls()
+        counts, histogram.count, histogram.total, histogram.min, histogram.max = state
+        histogram.counts = dict(counts)
+        return histogram
+
+
+class _Endpoint:
+    """单个端点：全部时间的直方图 + 按时间片的直方图"""
+
+    __slots__ = ('total', 'slots')
+
+    def __init__(self):
+        self.total = LatencyHistogram()
+        self.slots: Deque[Tuple[int, LatencyHistogram]] = deque()
+
+    def slot(self, index: int, oldest: int) -> Optional[LatencyHistogram]:
+        """第 index 个时间片的直方图（不存在时创建），早于 oldest 的返回 None"""
+        slots = self.slots
+        if slots and slots[-1][0] == index:
+            return slots[-1][1]
+        while slots and slots[0][0] < oldest:
+            slots.popleft()
+        if index < oldest:
+            return None
+        if not slots or slots[-1][0] < index:
+            histogram = LatencyHistogram()
+            slots.append((index, histogram))
+            return histogram
+        # 乱序到达的旧时间片（PCAP 中少见），插入到对应位置
+        for position, (existing, histogram) in enumerate(slots):
+            if existing == index:
+                return histogram
+            if existing > index:
+                histogram = LatencyHistogram()
+                slots.insert(position, (index, histogram))
+                return histogram
+
+    def window(self, first_slot: int) -> LatencyHistogram:
+        merged = LatencyHistogram()
+        for index, histogram in reversed(self.slots):
+            if index < first_slot:
+                break
+            merged.merge(histogram)
+        return merged
+
+
+class EndpointLatencyTracker:
+    """
+    按端点的延迟分位数（线程安全：抓包/代理线程记录，API 线程查询）
+    同样时间片长度的跟踪器可以合并（如嗅探的 HTTP 和 MITM 的 HTTPS 一起看）
+    """
+
+    def __init__(self, slot_seconds: float = DEFAULT_SLOT_SECONDS, horizon: float = DEFAULT_HORIZON,
+                 max_endpoints: int = DEFAULT_MAX_ENDPOINTS):
+        """
+        :param slot_seconds: 时间片长度（滑动窗口的粒度）
+        :param horizon: 时间片保留时长，超过的只计入全部时间的统计
+        :param max_endpoints: 端点数量上限
+        """
+        self.slot_seconds = slot_seconds
+        self.max_slots = max(1, int(horizon // slot_seconds))
+        self.max_endpoints = max_endpoints
+        self._endpoints: Dict[EndpointKey, _Endpoint] = {}
+        self._last_slot = 0
+        self.last_time = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._endpoints)
+
+    def record(self, method: str, host: str, template: str, duration: Optional[float], timestamp: float) -> None:
+        """记录一次请求的耗时（毫秒），timestamp 为完成时间"""
+        if duration is None:
+            return
+        value = int(duration * 1000) if duration > 0 else 0
+        slot_index = int(timestamp // self.slot_seconds)
+        key = (method, host, template)
+        with self._lock:
+            endpoint = self._endpoints.get(key)
+            if endpoint is None:
+                if len(self._endpoints) >= self.max_endpoints:
+                    key = OVERFLOW_ENDPOINT
+                    endpoint = self._endpoints.get(key)
+                if endpoint is None:
+                    endpoint = self._endpoints[key] = _Endpoint()
+            if timestamp > self.last_time:
+                self.last_time = timestamp
+                self._last_slot = slot_index
+            endpoint.total.record(value)
+            histogram = endpoint.slot(slot_index, self._last_slot - self.max_slots + 1)
+            if histogram is not None:
+                histogram.record(value)
+
+    def merge(self, other: 'EndpointLatencyTracker') -> None:
+        """把另一个跟踪器的统计合并进来（时间片长度必须相同）"""
+        if other.slot_seconds != self.slot_seconds:
+            raise ValueError("Cannot merge trackers with different slot lengths")
+        with other._lock:
+            endpoints = [(key, LatencyHistogram.from_state(endpoint.total.state()),
+                          [(index, LatencyHistogram.from_state(histogram.state()))
+                           for index, histogram in endpoint.slots])
+                         for key, endpoint in other._endpoints.items()]
+            last_time = other.last_time
+        with self._lock:
+            if last_time > self.last_time:
+                self.last_time = last_time
+                self._last_slot = int(last_time // self.slot_seconds)
+            oldest = self._last_slot - self.max_slots + 1
+            for key, total, slots in endpoints:
+                endpoint = self._endpoints.get(key)
+                if endpoint is None:
+                    endpoint = self._endpoints[key] = _Endpoint()
+                endpoint.total.merge(total)
+                for index, histogram in slots:
+                    target = endpoint.slot(index, oldest)
+                    if target is not None:
+                        target.merge(histogram)
+
+    def _first_slot(self, window: Optional[float]) -> Optional[int]:
+        if window is None:
+            return None
+        return self._last_slot - max(1, math.ceil(window / self.slot_seconds)) + 1
+
+    def query(self, window: Optional[float] = None, method: Optional[str] = None, host: Optional[str] = None,
+              template: Optional[str] = None, sort_by: str = 'p99', limit: int = 100) -> List[dict]:
+        """
+        各端点的延迟分位数，按 sort_by 降序
+        :param window: 滑动窗口（秒，按时间片取整），None 表示全部时间
+        :param sort_by: p50 | p90 | p99 | max | avg | count（无效时抛出 ValueError）
+        """
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"Invalid sort key: {sort_by}")
+        field = sort_by if sort_by == 'count' else f"{sort_by}_ms"
+        host = host.lower() if host is not None else None
+        results = []
+        with self._lock:
+            first_slot = self._first_slot(window)
+            for (ep_method, ep_host, ep_template), endpoint in self._endpoints.items():
+                if ((method is not None and ep_method != method) or (host is not None and ep_host != host)
+                        or (template is not None and ep_template != template)):
+                    continue
+                histogram = endpoint.total if first_slot is None else endpoint.window(first_slot)
+                if not histogram.count:
+                    continue
+                summary = histogram.summary()
+                summary.update(method=ep_method, host=ep_host, url_template=ep_template)
+                results.append(summary)
+        results.sort(key=lambda item: item[field], reverse=True)
+        return results[:limit]
+
+    def overall(self, window: Optional[float] = None) -> dict:
+        """所有端点合并后的分位数"""
+        merged = LatencyHistogram()
+        with self._lock:
+            first_slot = self._first_slot(window)
+            for endpoint in self._endpoints.values():
+                merged.merge(endpoint.total if first_slot is None else endpoint.window(first_slot))
+        return merged.summary()
+
+    def checkpoint_state(self) -> dict:
+        """检查点状态（只含内置类型）"""
+        with self._lock:
+            return {
+                'slot_seconds': self.slot_seconds,
+                'last_time': self.last_time,
+                'endpoints': [(key, endpoint.total.state(),
+                               [(index, histogram.state()) for index, histogram in endpoint.slots])
+                              for key, endpoint in self._endpoints.items()]
+            }
+
+    def restore_state(self, state: dict) -> None:
+        """用 checkpoint_state() 的结果替换当前统计"""
+        endpoints = {}
+        for key, total, slots in state['endpoints']:
+            endpoint = endpoints[tuple(key)] = _Endpoint()
+            endpoint.total = LatencyHistogram.from_state(total)
+            endpoint.slots.extend((index, LatencyHistogram.from_state(histogram)) for index, histogram in slots)
+        with self._lock:
+            self.slot_seconds = state['slot_seconds']
+            self.last_time = state['last_time']
+            self._last_slot = int(self.last_time // self.slot_seconds)
+            self._endpoints = endpoints
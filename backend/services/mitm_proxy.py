@@ -1,17 +1,30 @@
 """
 MITM 代理服务
 用于拦截和解密 HTTPS 流量
+消息体保存原始（压缩的）数据，由后台 DecompressWorker 按 Content-Encoding 解压后再通知回调
 """
 import asyncio
 import logging
 import threading
 from typing import Callable, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 
+from .content_decoding import DecodedBody, DecompressWorker
+from .http_store import url_template
+from .latency_stats import EndpointLatencyTracker
+
 logger = logging.getLogger(__name__)
 
 
+def _header(headers: dict, name: str) -> Optional[str]:
+    """按名称（不区分大小写）取头部字段"""
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
 @dataclass
 class HttpsRequest:
     """HTTPS 请求数据"""
@@ -23,6 +36,12 @@ class HttpsRequest:
     body: bytes
     timestamp: float
     is_https: bool = True
+    decoded: Optional[DecodedBody] = field(default=None, repr=False)  # 解压后的消息体
+
+    @property
+    def content(self) -> bytes:
+        """解压后的消息体（未解压时为原始数据）"""
+        return self.decoded.data if self.decoded is not None else self.body
 
 
 @dataclass
@@ -33,6 +52,12 @@ class HttpsResponse:
     headers: dict
     body: bytes
     timestamp: float
+    decoded: Optional[DecodedBody] = field(default=None, repr=False)  # 解压后的消息体
+
+    @property
+    def content(self) -> bytes:
+        """解压后的消息体（未解压时为原始数据）"""
+        return self.decoded.data if self.decoded is not None else self.body
 
 
 @dataclass
@@ -64,6 +89,12 @@ class MitmProxyService:
         # 存储待匹配的请求（用于请求/响应配对）
         self._pending_requests: dict = {}
         
+        # 消息体解压（不阻塞代理的事件循环）
+        self._decompress = DecompressWorker(name="mitm-decompress")
+        
+        # 按端点（方法 + host + URL 模板）的延迟分位数
+        self.latency = EndpointLatencyTracker()
+        
         logger.info(f"MITM Proxy Service initialized on port {proxy_port}")
     
     def start(self, callback: Callable):
@@ -94,6 +125,7 @@ class MitmProxyService:
         
         if self._thread and self._thread.is_alive():
             self._thread.join(timeout=5)
+        self._decompress.close()
         
         logger.info("MITM Proxy stopped")
     
@@ -154,7 +186,7 @@ class MitmProxyService:
                 host=request.host,
                 path=request.path,
                 headers=dict(request.headers),
-                body=request.content or b'',
+                body=request.raw_content or b'',
                 timestamp=datetime.now().timestamp(),
                 is_https=request.scheme == "https"
             )
@@ -185,7 +217,7 @@ class MitmProxyService:
                 status_code=response.status_code,
                 reason=response.reason or "",
                 headers=dict(response.headers),
-                body=response.content or b'',
+                body=response.raw_content or b'',
                 timestamp=datetime.now().timestamp()
             )
             
@@ -200,14 +232,28 @@ class MitmProxyService:
             )
             
             logger.debug(f"[MITM] Response: {response.status_code} {https_request.url} ({duration:.2f}ms)")
+            self.latency.record(https_request.method, https_request.host.lower(), url_template(https_request.path),
+                                duration, https_response.timestamp)
             
-            # 回调通知
-            if self.callback:
-                self.callback(transaction)
+            # 解压请求和响应的消息体（同一个工作线程按顺序处理），完成后回调通知
+            self._decompress.submit(https_request.body, _header(https_request.headers, 'content-encoding'),
+                                    lambda decoded: setattr(https_request, 'decoded', decoded))
+            encoding = _header(https_response.headers, 'content-encoding')
+            if not self._decompress.submit(https_response.body, encoding,
+                                           lambda decoded: self._deliver(transaction, decoded)):
+                # 解压队列已满：不解压，直接通知
+                self._deliver(transaction, DecodedBody(https_response.body, encoding, len(https_response.body),
+                                                       error="decompress queue full"))
             
         except Exception as e:
             logger.error(f"Error processing response: {e}")
     
+    def _deliver(self, transaction: HttpsTransaction, decoded: DecodedBody) -> None:
+        """响应消息体解压完成（在解压线程中调用）"""
+        transaction.response.decoded = decoded
+        if self.callback:
+            self.callback(transaction)
+    
     def get_ca_cert_path(self) -> str:
         """
         获取 CA 证书路径
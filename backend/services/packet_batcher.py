@@ -0,0 +1,98 @@
+"""
+数据包批处理器
+在抓包线程中累积数据包，按数量或时间窗口批量投递，
+减少跨线程唤醒事件循环和逐包 JSON 编码的开销
+"""
+import threading
+import time
+import logging
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PacketBatcher:
+    """
+    按大小/时间窗口刷新的批处理器
+    - 达到 max_size 时在调用线程立即刷新
+    - 后台定时线程负责刷新超过 max_delay 的残留数据
+    """
+
+    def __init__(self, flush_callback: Callable[[List[dict]], None],
+                 max_size: int = 256, max_delay: float = 0.05):
+        """
+        :param flush_callback: 批量回调 callback(list_of_packet_dict)
+        :param max_size: 单批最大数据包数
+        :param max_delay: 最长等待时间（秒）
+        """
+        self.flush_callback = flush_callback
+        self.max_size = max_size
+        self.max_delay = max_delay
+
+        self._buffer: List[dict] = []
+        self._first_time = 0.0  # 当前批次第一个包的入队时间
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._timer_thread: Optional[threading.Thread] = None
+
+        # 统计
+        self.batches_flushed = 0
+        self.packets_flushed = 0
+
+    def start(self) -> None:
+        """启动定时刷新线程"""
+        self._stop_event.clear()
+        self._timer_thread = threading.Thread(target=self._timer_loop, daemon=True)
+        self._timer_thread.start()
+
+    def stop(self) -> None:
+        """停止定时线程并刷新剩余数据"""
+        self._stop_event.set()
+        if self._timer_thread:
+            self._timer_thread.join(timeout=1)
+            self._timer_thread = None
+        self.flush()
+
+    def add(self, packet: dict) -> None:
+        """添加一个数据包（在抓包线程中调用）"""
+        batch = None
+        with self._lock:
+            if not self._buffer:
+                self._first_time = time.monotonic()
+            self._buffer.append(packet)
+            if len(self._buffer) >= self.max_size:
+                batch = self._buffer
+                self._buffer = []
+
+        if batch:
+            self._deliver(batch)
+
+    def flush(self) -> None:
+        """立即刷新当前批次"""
+        with self._lock:
+            batch = self._buffer
+            self._buffer = []
+
+        if batch:
+            self._deliver(batch)
+
+    def _timer_loop(self) -> None:
+        """定时检查超时批次"""
+        interval = self.max_delay / 2
+        while not self._stop_event.wait(interval):
+            batch = None
+            with self._lock:
+                if self._buffer and time.monotonic() - self._first_time >= self.max_delay:
+                    batch = self._buffer
+                    self._buffer = []
+
+            if batch:
+                self._deliver(batch)
+
+    def _deliver(self, batch: List[dict]) -> None:
+        self.batches_flushed += 1
+        self.packets_flushed += len(batch)
+        try:
+            self.flush_callback(batch)
+        except Exception as e:
+            logger.error(f"Batch callback error: {e}")
@@ -2,20 +2,63 @@
 网络抓包引擎
 基于 Scapy 实现，支持PID过滤、流追踪、异常检测
 """
-from scapy.all import sniff, TCP, UDP, IP, Raw, Packet
-from typing import Optional, Callable
+from scapy.all import conf, Packet
+from typing import Dict, Optional, Callable, Tuple, Union
+from collections import OrderedDict
+from functools import partial
 import threading
 import logging
 from datetime import datetime
 
+from .fast_decoder import PacketRecord, decode_frame, linktype_of, TCP_SYN, TCP_ACK, TCP_FIN, TCP_PSH, TCP_RST
+from .capture_pipeline import CapturePipeline
+from .packet_batcher import PacketBatcher
 from .port_mapper import PortMapper
+from .capture_log import hot_log
+from .protocol_id import (ProtocolIdentifier, classify, http_request_target,
+                          PROTO_HTTP, PROTO_TLS, HTTP_REQUEST, HTTP_PORTS)
 from .traffic_classifier import TrafficClassifier
-from .tcp_stream import TCPStreamManager
-from .http_stream import HTTPStreamParser
+from .flow_table import FlowTable, pack_flow_key
+from .tcp_stream import ShardedTCPStreamManager, TCPPacket
+from .udp_flow import UDPFlowTracker
+from .payload_store import RETENTION_FULL
+from .http_stream import HTTPStreamParser, HTTPRequest, HTTPResponse
+from .content_decoding import DecompressWorker
+from .http_store import request_host, url_template
+from .http_parser import HTTPConnectionParser, EVENT_HEADERS
+from .checkpoint import Checkpointer, apply_checkpoint, process_identity, is_same_process
 
 logger = logging.getLogger(__name__)
 
 
+def _transaction_summary(transaction) -> dict:
+    """HTTP 事务的列表展示信息（不含消息体）"""
+    request, response = transaction.request, transaction.response
+    return {
+        'seq': transaction.seq,
+        'stream_id': request.stream_id,
+        'method': request.method,
+        'url': request.url,
+        'host': request_host(request),
+        'url_template': url_template(request.url),
+        'request_time': request.timestamp,
+        'request_size': len(request.body),
+        'status_code': response.status_code if response else None,
+        'reason': response.reason if response else None,
+        'response_time': response.timestamp if response else None,
+        'response_size': len(response.body) if response else None,
+        'duration': transaction.duration,
+        'is_retry': transaction.is_retry
+    }
+
+# _known_connections 标志位：见过哪个方向的出站包（相对于打包key中的端点顺序）
+_OUTBOUND_FORWARD = 0x01
+_OUTBOUND_REVERSE = 0x02
+
+# 动态过滤器中始终放行的 SYN（IPv4 用 tcp[] 语法；IPv6 假定没有扩展头部：下一头部为 TCP，标志位在第 53 字节）
+SYN_FILTER = "tcp[tcpflags] & tcp-syn != 0 or (ip6 and ip6[6] == 6 and ip6[53] & 0x02 != 0)"
+
+
 class PacketCaptureEngine:
     """
     网络抓包引擎
@@ -23,55 +66,143 @@ class PacketCaptureEngine:
     - TCP流追踪
     - HTTP解析
     - 重传/重试检测
+    
+    抓包模式:
+    - scapy: Scapy 完整解析每个包（默认）
+    - fast:  recv_raw 读取原始帧，struct 解码头部，详情按需解析
+    - pipeline: 抓包线程只写共享内存，多个进程按连接分片并行解析
     """
     
-    def __init__(self, target_pid: int, db_ports: str = "3306,6379,5432", server_ips: str = ""):
+    CAPTURE_MODES = ("scapy", "fast", "pipeline")
+    
+    # 快速模式下保留的原始帧数量（用于按需查看详情）
+    DETAIL_CACHE_SIZE = 2048
+    
+    # 原始帧过期后仍可按 packet_id 读回 payload 的 TCP 报文数量（只保存引用，payload 在落盘存储中）
+    PAYLOAD_REF_CACHE_SIZE = 65536
+    
+    # 可按 packet_id 查看完整（解压后）消息体的 HTTP 消息数量和消息体总字节数
+    HTTP_BODY_CACHE_SIZE = 4096
+    HTTP_BODY_CACHE_BYTES = 64 * 1024 * 1024
+    
+    # 动态过滤器最多编译的端口数，超过后退回通用过滤器
+    MAX_BPF_PORTS = 200
+    
+    # 连接跟踪表的连接数上限，满后先淘汰空闲连接再淘汰最旧的连接
+    MAX_KNOWN_CONNECTIONS = 1_000_000
+    
+    # TCP 流表的分片数量：API 查询逐个分片加锁，每次只阻塞抓包线程一个分片的时间
+    STREAM_SHARDS = 4
+    
+    def __init__(self, target_pid: int, db_ports: str = "3306,6379,5432", server_ips: str = "",
+                 capture_mode: str = "scapy", pipeline_workers: int = 2, dynamic_bpf: bool = True,
+                 payload_retention: str = RETENTION_FULL, checkpointer: Optional[Checkpointer] = None,
+                 stream_shards: int = STREAM_SHARDS):
         """
         初始化抓包引擎
         :param target_pid: 目标进程PID
         :param db_ports: 数据库端口列表（逗号分隔）
         :param server_ips: 服务器IP列表（逗号分隔），用于过滤流量，例如"192.168.2.33,14.119.115.229"
+        :param capture_mode: 抓包模式 "scapy" | "fast" | "pipeline"
+        :param pipeline_workers: pipeline 模式下的解析进程数量
+        :param dynamic_bpf: 是否根据目标进程端口动态生成内核过滤器
+        :param payload_retention: 流中数据包 payload 的保留策略 "none" | "headers" | "full"（落盘）
+        :param checkpointer: 检查点写入器，抓包期间按间隔写入，停止时写入全量快照（pipeline 模式不支持）
+        :param stream_shards: TCP 流表的分片数量
         """
+        if capture_mode not in self.CAPTURE_MODES:
+            raise ValueError(f"Unknown capture mode: {capture_mode}")
+        if capture_mode == "pipeline" and checkpointer is not None:
+            raise ValueError("Checkpoints are not supported in pipeline mode: "
+                             "stream and HTTP state lives in the dissection workers")
+        
         self.target_pid = target_pid
         self.db_ports = db_ports
         self.server_ips = [ip.strip() for ip in server_ips.split(',') if ip.strip()] if server_ips else []
+        self.capture_mode = capture_mode
+        self.pipeline_workers = pipeline_workers
+        self.dynamic_bpf = dynamic_bpf
+        self.payload_retention = payload_retention
+        self.checkpointer = checkpointer
+        self.stream_shards = stream_shards
+        # 目标进程标识（PID + 启动时间），写入检查点，恢复时确认 PID 没有被其他进程复用
+        self.process_identity = process_identity(target_pid)
         
         # 核心组件
         self.port_mapper = PortMapper()
         self.classifier = TrafficClassifier(db_ports)
-        self.tcp_stream_manager = TCPStreamManager()
+        # 抓包线程处理数据包，API 线程并发查询：每个分片由自己的锁保护
+        self.tcp_stream_manager = ShardedTCPStreamManager(shards=stream_shards, payload_retention=payload_retention)
+        self.tcp_stream_manager.on_retire = self._on_stream_retired
+        # 只有 HTTP 流保留重组数据（由增量解析器消费），其他流只跟踪序列号
+        self.tcp_stream_manager.wants_reassembly = self._wants_reassembly
         self.http_stream_parser = HTTPStreamParser()
+        # stream_id -> 增量 HTTP 解析状态（识别为 HTTP 的 TCP 流）
+        self._http_connections: Dict[str, HTTPConnectionParser] = {}
+        # 压缩的 HTTP 消息体在后台线程解压，结果缓存在请求/响应上（计入事务存储的字节预算）
+        self.decompress_worker = DecompressWorker()
+        self.protocol_identifier = ProtocolIdentifier()
+        self.udp_flow_tracker = UDPFlowTracker()
+        # 见过出站包的连接（用于匹配入站方向）
+        self._known_connections = FlowTable(max_flows=self.MAX_KNOWN_CONNECTIONS)
         
         self.is_running = False
         self.capture_thread: Optional[threading.Thread] = None
         self.packet_callback: Optional[Callable] = None
+        self.batcher: Optional[PacketBatcher] = None
+        self.pipeline: Optional[CapturePipeline] = None
         
-        # 请求时间戳字典（用于计算延迟）
-        self.request_times = {}
+        # 动态BPF过滤器状态
+        self.active_bpf_filter: Optional[str] = None
+        self._pending_bpf_filter: Optional[str] = None
+        self._pending_filter_lock = threading.Lock()
+        self.bpf_swaps = 0
+        if dynamic_bpf:
+            self.port_mapper.add_listener(self._on_port_mapping_changed)
         
         # 数据包计数器（生成唯一ID）
         self.packet_counter = 0
         self.packet_counter_lock = threading.Lock()
         
-        logger.info(f"PacketCaptureEngine initialized for PID {target_pid}")
+        # packet_id -> PacketRecord（最近的数据包，按需完整解析）
+        self._recent_records: "OrderedDict[int, PacketRecord]" = OrderedDict()
+        # packet_id -> TCPPacket（原始帧过期后按需读回 payload）
+        self._payload_refs: "OrderedDict[int, TCPPacket]" = OrderedDict()
+        # packet_id -> 该报文完成的 HTTP 请求/响应（按需查看完整消息体）
+        self._http_messages: "OrderedDict[int, Union[HTTPRequest, HTTPResponse]]" = OrderedDict()
+        self._http_message_bytes = 0
+        
+        logger.info(f"PacketCaptureEngine initialized for PID {target_pid} (mode={capture_mode})")
         if self.server_ips:
             logger.warning(f"[IP-FILTER] Server IPs: {self.server_ips}")
         
-    def start(self, callback: Callable) -> None:
+    def start(self, callback: Optional[Callable] = None, batch_callback: Optional[Callable] = None,
+              batch_size: int = 256, batch_interval: float = 0.05) -> None:
         """
         启动抓包
         :param callback: 数据包处理回调函数 callback(packet_dict)
+        :param batch_callback: 批量回调函数 callback(list_of_packet_dict)，设置后优先使用
+        :param batch_size: 批量回调的最大批次大小
+        :param batch_interval: 批量回调的最长等待时间（秒）
         """
         if self.is_running:
             logger.warning("Capture already running")
             return
         
         self.packet_callback = callback
+        if batch_callback:
+            self.batcher = PacketBatcher(batch_callback, max_size=batch_size, max_delay=batch_interval)
+            self.batcher.start()
+        if self.capture_mode == "pipeline":
+            self.pipeline = CapturePipeline(self, workers=self.pipeline_workers,
+                                            batch_size=batch_size, batch_interval=batch_interval)
+            self.pipeline.start()
         self.is_running = True
         
-        # 刷新端口映射
+        # 刷新端口映射，并在后台持续增量更新（捕获目标进程后续新建的连接）
         logger.info(f"Refreshing port mapping for PID {self.target_pid}...")
         self.port_mapper.refresh()
+        self.port_mapper.start_auto_refresh(watch_pids=[self.target_pid])
         
         # 输出调试信息
         target_ports = self.port_mapper.get_ports_by_pid(self.target_pid)
@@ -89,33 +220,144 @@ class PacketCaptureEngine:
     def stop(self) -> None:
         """停止抓包"""
         self.is_running = False
+        self.port_mapper.stop_auto_refresh()
         if self.capture_thread:
             self.capture_thread.join(timeout=2)
+        if self.pipeline:
+            self.pipeline.stop()
+        if self.batcher:
+            self.batcher.stop()
+        if self.checkpointer is not None and not self.checkpointer.closed:
+            self.checkpoint(full=True)
+            self.checkpointer.close()
+        self.decompress_worker.close()
+        self.tcp_stream_manager.close()
         logger.info("Packet capture stopped")
     
+    def _build_bpf_filter(self) -> str:
+        """
+        构建BPF过滤器
+        dynamic_bpf 开启时把目标进程当前的本地端口编译进过滤器，
+        无关流量在内核中直接丢弃；SYN 包始终放行，用于发现新建连接
+        IPv6 没有 tcp[] 偏移语法，按固定 40 字节头部读取 TCP 标志位，
+        带扩展头部的 IPv6 SYN 不会放行，这类连接要等端口映射定时刷新后才进入过滤器
+        """
+        bpf_filter = "tcp or udp"
+        
+        if self.dynamic_bpf:
+            ports = sorted(self.port_mapper.get_ports_by_pid(self.target_pid))
+            if ports and len(ports) <= self.MAX_BPF_PORTS:
+                port_filter = " or ".join(f"port {port}" for port in ports)
+                bpf_filter = f"({bpf_filter}) and ({port_filter} or {SYN_FILTER})"
+        
+        # 添加服务器IP过滤（类似Wireshark的 ip.addr == X.X.X.X）
+        if self.server_ips:
+            ip_filters = [f"host {ip}" for ip in self.server_ips]
+            ip_filter_str = " or ".join(ip_filters)
+            bpf_filter = f"({bpf_filter}) and ({ip_filter_str})"
+        
+        return bpf_filter
+    
+    def _on_port_mapping_changed(self, changed_pids: set) -> None:
+        """端口映射变化回调（端口映射线程中调用），目标进程端口变化时重建过滤器"""
+        if self.target_pid not in changed_pids or not self.is_running:
+            return
+        bpf_filter = self._build_bpf_filter()
+        if bpf_filter != self.active_bpf_filter:
+            # 交给抓包线程在两次读取之间切换，避免与 recv 并发操作同一个句柄
+            with self._pending_filter_lock:
+                self._pending_bpf_filter = bpf_filter
+    
+    def _apply_pending_filter(self, sock) -> None:
+        """在抓包线程中原子替换内核过滤器（无需重建 socket）"""
+        if self._pending_bpf_filter is None:
+            return
+        # 取出和清空在锁内完成，不会丢掉期间新写入的过滤器
+        with self._pending_filter_lock:
+            bpf_filter, self._pending_bpf_filter = self._pending_bpf_filter, None
+        if bpf_filter is None:
+            return
+        
+        try:
+            ins = getattr(sock, 'ins', None)
+            if hasattr(ins, 'setfilter'):
+                # libpcap / Npcap
+                ins.setfilter(bpf_filter)
+            else:
+                # Linux PF_PACKET: SO_ATTACH_FILTER 会原子替换已有过滤器
+                from scapy.arch.linux import attach_filter
+                attach_filter(ins, bpf_filter, getattr(sock, 'iface', None))
+        except Exception as e:
+            logger.error(f"[BPF-FILTER] Failed to swap filter: {e}")
+            return
+        
+        self.active_bpf_filter = bpf_filter
+        self.bpf_swaps += 1
+        logger.info(f"[BPF-FILTER] Swapped: {bpf_filter}")
+    
     def _capture_loop(self) -> None:
         """抓包主循环（在独立线程中运行）"""
         try:
-            # 构建BPF过滤器
-            bpf_filter = "tcp or udp"
-            
-            # 添加服务器IP过滤（类似Wireshark的 ip.addr == X.X.X.X）
-            if self.server_ips:
-                ip_filters = [f"host {ip}" for ip in self.server_ips]
-                ip_filter_str = " or ".join(ip_filters)
-                bpf_filter = f"({bpf_filter}) and ({ip_filter_str})"
-                logger.warning(f"[BPF-FILTER] {bpf_filter}")
+            bpf_filter = self._build_bpf_filter()
+            logger.warning(f"[BPF-FILTER] {bpf_filter}")
             
-            # 使用 Scapy 嗅探网络流量
-            sniff(
-                prn=self._process_packet,
-                filter=bpf_filter,  # 应用BPF过滤器
-                store=False,  # 不存储数据包（节省内存）
-                stop_filter=lambda _: not self.is_running
-            )
+            # 自行持有监听 socket，以便运行中替换过滤器
+            sock = conf.L2listen(filter=bpf_filter)
+            self.active_bpf_filter = bpf_filter
         except Exception as e:
             logger.error(f"Capture loop error: {e}")
             self.is_running = False
+            return
+        
+        if self.capture_mode == "fast":
+            handler = self._process_frame
+        elif self.capture_mode == "pipeline":
+            handler = self.pipeline.submit
+        else:
+            handler = None
+        
+        checkpointer = self.checkpointer
+        try:
+            while self.is_running:
+                self._apply_pending_filter(sock)
+                # 检查点在抓包线程中采集状态，与数据包处理互不交错
+                if checkpointer is not None and checkpointer.due():
+                    self.checkpoint()
+                
+                # 带超时的 select，保证 stop() 和过滤器切换能及时生效
+                if not sock.select([sock], 0.2):
+                    continue
+                
+                if handler is None:
+                    # scapy 模式：完整解析
+                    pkt = sock.recv()
+                    if pkt is not None:
+                        self._process_packet(pkt)
+                    continue
+                
+                # fast / pipeline 模式：直接读取原始帧，跳过 Scapy 的逐包解析
+                layer_cls, frame, ts = sock.recv_raw()
+                if frame:
+                    handler(frame, linktype_of(layer_cls), ts or datetime.now().timestamp())
+        except Exception as e:
+            logger.error(f"Capture loop error: {e}")
+            self.is_running = False
+        finally:
+            sock.close()
+    
+    def _process_frame(self, frame: bytes, linktype: int, timestamp: float) -> None:
+        """
+        处理原始帧（快速模式）
+        :param frame: 链路层原始字节
+        :param linktype: 链路层类型（DLT_*）
+        :param timestamp: 抓包时间戳
+        """
+        if not self.is_running:
+            return
+        
+        record = decode_frame(frame, linktype, timestamp)
+        if record is not None:
+            self._process_record(record)
     
     def _process_packet(self, pkt: Packet) -> None:
         """
@@ -125,24 +367,20 @@ class PacketCaptureEngine:
         if not self.is_running:
             return
         
-        # 检查是否是 IP 数据包
-        if not pkt.haslayer(IP):
-            return
-        
-        ip_layer = pkt[IP]
-        
-        # 获取传输层信息
-        if pkt.haslayer(TCP):
-            transport = pkt[TCP]
-            protocol = "TCP"
-        elif pkt.haslayer(UDP):
-            transport = pkt[UDP]
-            protocol = "UDP"
-        else:
-            return
-        
-        sport = transport.sport  # 源端口
-        dport = transport.dport  # 目标端口
+        record = PacketRecord.from_scapy(pkt, datetime.now().timestamp())
+        if record is not None:
+            self._process_record(record)
+    
+    def _process_record(self, record: PacketRecord) -> None:
+        """
+        处理单个数据包记录（两种抓包模式共用）
+        :param record: 解码后的数据包记录
+        """
+        protocol = record.protocol
+        sport = record.sport  # 源端口
+        dport = record.dport  # 目标端口
+        src_ip_str = record.src_ip
+        dst_ip_str = record.dst_ip
         
         # 获取本机IP（一次性）- 跳过回环地址
         if not hasattr(self, '_local_ip'):
@@ -181,9 +419,12 @@ class PacketCaptureEngine:
         is_outbound_port = self.port_mapper.belongs_to_pid(sport, self.target_pid)
         is_inbound_port = self.port_mapper.belongs_to_pid(dport, self.target_pid)
         
+        # 未知端口的 SYN 可能是目标进程的新连接：请求端口映射线程立即刷新，
+        # 过滤器也在该线程中重建，抓包线程不等待
+        if self.dynamic_bpf and record.tcp_flags & TCP_SYN and not (is_outbound_port or is_inbound_port):
+            self.port_mapper.request_refresh()
+        
         # 方案2: IP地址匹配（更可靠）
-        src_ip_str = str(ip_layer.src)
-        dst_ip_str = str(ip_layer.dst)
         is_from_local = (src_ip_str == self._local_ip)
         is_to_local = (dst_ip_str == self._local_ip)
         
@@ -192,26 +433,31 @@ class PacketCaptureEngine:
         is_inbound = is_inbound_port or is_to_local
         
         # 🔧智能修复：如果我们之前见过这个连接的出站包，那么对应的入站包也应该捕获
-        conn_key = f"{ip_layer.src}:{sport}-{ip_layer.dst}:{dport}"
-        conn_key_reverse = f"{ip_layer.dst}:{dport}-{ip_layer.src}:{sport}"
-        
-        if not hasattr(self, '_known_connections'):
-            self._known_connections = set()
+        # 双向一致的打包key，forward 表示本包方向与key中端点顺序一致
+        flow_key, forward = pack_flow_key(src_ip_str, sport, dst_ip_str, dport, protocol)
+        known_connections = self._known_connections
         
-        # 如果这是出站包，记录这个连接
+        # 如果这是出站包，记录这个连接及其方向
         if is_outbound:
-            self._known_connections.add(conn_key)
+            slot = known_connections.update(flow_key, record.timestamp, record.length)
+            known_connections.set_flags(slot, _OUTBOUND_FORWARD if forward else _OUTBOUND_REVERSE)
         
         # 如果这是已知连接的反向包（入站），也应该捕获
-        if not is_inbound and conn_key_reverse in self._known_connections:
-            is_inbound = True
-            logger.debug(f"[SMART-MATCH] Inbound packet matched by connection tracking: {conn_key}")
+        if not is_inbound:
+            slot = known_connections.slot(flow_key)
+            if slot >= 0 and known_connections.flags[slot] & (_OUTBOUND_REVERSE if forward else _OUTBOUND_FORWARD):
+                if not is_outbound:
+                    known_connections.update(flow_key, record.timestamp, record.length)
+                is_inbound = True
+                logger.debug("[SMART-MATCH] Inbound packet matched by connection tracking: %s:%s -> %s:%s",
+                             src_ip_str, sport, dst_ip_str, dport)
         
         # 调试：输出匹配逻辑（移除emoji避免编码错误）
-        logger.debug(f"[FILTER] {ip_layer.src}:{sport} -> {ip_layer.dst}:{dport} | "
-                    f"Out={is_outbound} In={is_inbound} | "
-                    f"PortOut={is_outbound_port} PortIn={is_inbound_port} | "
-                    f"FromLocal={is_from_local} ToLocal={is_to_local} | LocalIP={self._local_ip}")
+        hot_log.debug(logger, "FILTER",
+                      "[FILTER] %s:%s -> %s:%s | Out=%s In=%s | PortOut=%s PortIn=%s | "
+                      "FromLocal=%s ToLocal=%s | LocalIP=%s",
+                      src_ip_str, sport, dst_ip_str, dport, is_outbound, is_inbound,
+                      is_outbound_port, is_inbound_port, is_from_local, is_to_local, self._local_ip)
         
         # 调试：每捕获100个包输出一次调试信息
         if not hasattr(self, '_packet_count'):
@@ -219,8 +465,8 @@ class PacketCaptureEngine:
         self._packet_count += 1
         
         if self._packet_count % 100 == 0:
-            logger.debug(f"Processed {self._packet_count} packets. " 
-                        f"Last packet: {ip_layer.src}:{sport} -> {ip_layer.dst}:{dport}")
+            logger.debug("Processed %d packets. Last packet: %s:%s -> %s:%s",
+                         self._packet_count, src_ip_str, sport, dst_ip_str, dport)
         
         if not (is_outbound or is_inbound):
             # 不属于目标进程，跳过
@@ -228,167 +474,52 @@ class PacketCaptureEngine:
         
         # 成功匹配到目标进程的包！
         direction = "OUTBOUND" if is_outbound else "INBOUND"
-        logger.info(f"[MATCHED-{direction}] Packet for PID {self.target_pid}: "
-                   f"{ip_layer.src}:{sport} -> {ip_layer.dst}:{dport} ({protocol})")
+        hot_log.info(logger, "MATCHED-" + direction, "[MATCHED-%s] Packet for PID %s: %s:%s -> %s:%s (%s)",
+                     direction, self.target_pid, src_ip_str, sport, dst_ip_str, dport, protocol)
         
         # ═══════════════════════════════════════════════════════════
         # TCP流追踪和分析
         # ═══════════════════════════════════════════════════════════
         tcp_analysis = {}
+        udp_analysis = {}
+        tcp_packet = None
         http_data = None
+        http_message = None
         tls_data = None  # TLS 协议数据
+        flow_protocol = None  # 连接级的协议识别结果（按流缓存）
         
-        if pkt.haslayer(TCP):
+        if record.is_tcp:
             # 使用TCP流管理器处理
-            timestamp = datetime.now().timestamp()
-            stream, tcp_packet, tcp_analysis = self.tcp_stream_manager.process_packet(pkt, timestamp)
+            timestamp = record.timestamp
+            stream, tcp_packet, tcp_analysis = self.tcp_stream_manager.process_record(record, timestamp)
             
             if stream and tcp_packet:
-                logger.debug(f"[TCP] Stream {stream.stream_id}: "
-                           f"SEQ={tcp_packet.seq}, ACK={tcp_packet.ack}, "
-                           f"Flags={tcp_packet.flags}, Retrans={tcp_packet.is_retransmission}")
+                hot_log.debug(logger, "TCP", "[TCP] Stream %s: SEQ=%s, ACK=%s, Flags=%s, Retrans=%s",
+                              stream.stream_id, tcp_packet.seq, tcp_packet.ack,
+                              tcp_packet.flags, tcp_packet.is_retransmission)
                 
                 # 如果有payload，尝试解析协议
                 if tcp_packet.payload_len > 0:
-                    payload = tcp_packet.payload
+                    payload = record.payload
+                    # 按首字节识别（连接级缓存），只对 TLS/HTTP 报文做进一步解析
+                    flow_protocol = self.protocol_identifier.identify(stream.stream_id, payload, sport, dport)
                     
                     # 首先尝试检测 TLS
-                    tls_data = self._parse_tls(payload)
+                    if flow_protocol == PROTO_TLS:
+                        tls_data = self._parse_tls(payload)
                     if tls_data:
-                        logger.info(f"[TLS] Detected {tls_data['version']} {tls_data['content_type']}")
+                        hot_log.info(logger, "TLS", "[TLS] Detected %s %s",
+                                     tls_data['version'], tls_data['content_type'])
                         if 'sni' in tls_data:
-                            logger.info(f"[TLS] SNI: {tls_data['sni']}")
-                    
-                    # 如果不是 TLS，检测是否是 HTTP
-                    if not tls_data:
-                        try:
-                            payload_text = payload.decode('latin-1')
-                            logger.debug(f"[HTTP] Checking payload: {payload_text[:100]}")
-                            
-                            # HTTP请求特征
-                            if any(payload_text.startswith(m) for m in ['GET ', 'POST ', 'PUT ', 'DELETE ', 'HEAD ', 'OPTIONS ', 'PATCH ']):
-                                logger.info(f"[HTTP] Detected HTTP request")
-                                http_request = self.http_stream_parser.parse_request(payload, timestamp, stream.stream_id)
-                                if http_request:
-                                    body_str = http_request.body.decode('utf-8', errors='ignore')[:500]
-                                    http_data = {
-                                        'type': 'request',
-                                        'method': http_request.method,
-                                        'url': http_request.url,
-                                        'headers': http_request.headers,
-                                        'body': body_str
-                                    }
-                                    logger.warning(f"[HTTP-BODY] Request body length: {len(http_request.body)} bytes, preview: {body_str[:100]}")
-                                    logger.info(f"[HTTP] Parsed request: {http_request.method} {http_request.url}")
-                            
-                            # HTTP响应特征
-                            elif payload_text.startswith('HTTP/'):
-                                logger.info(f"[HTTP] Detected HTTP response")
-                                http_response = self.http_stream_parser.parse_response(payload, timestamp, stream.stream_id)
-                                if http_response:
-                                    http_data = {
-                                        'type': 'response',
-                                        'status_code': http_response.status_code,
-                                        'reason': http_response.reason,
-                                        'headers': http_response.headers,
-                                        'body': http_response.body.decode('utf-8', errors='ignore')[:500]
-                                    }
-                                    logger.info(f"[HTTP] Parsed response: {http_response.status_code} {http_response.reason}")
-                        except Exception as e:
-                            logger.error(f"[HTTP] Failed to parse HTTP: {e}", exc_info=True)
-                
-                # === 新增：尝试从TCP流缓存解析完整HTTP消息 ===
-                # 检查流的outbound buffer（客户端请求）
-                if not http_data and len(stream.outbound_buffer) > 50:
-                    try:
-                        buffer_preview = stream.outbound_buffer.decode('latin-1', errors='ignore')[:50]
-                        if any(buffer_preview.startswith(m) for m in ['GET ', 'POST ', 'PUT ', 'DELETE ', 'HEAD ', 'OPTIONS ', 'PATCH ']):
-                            # 检查是否有完整headers
-                            if b'\r\n\r\n' in stream.outbound_buffer:
-                                # 提取headers部分检查Content-Length
-                                header_end = stream.outbound_buffer.index(b'\r\n\r\n')
-                                headers_part = stream.outbound_buffer[:header_end].decode('latin-1', errors='ignore')
-                                
-                                # 查找Content-Length
-                                content_length = 0
-                                for line in headers_part.split('\r\n'):
-                                    if line.lower().startswith('content-length:'):
-                                        try:
-                                            content_length = int(line.split(':', 1)[1].strip())
-                                        except:
-                                            pass
-                                        break
-                                
-                                # 检查body是否完整
-                                expected_total = header_end + 4 + content_length  # 4 = len('\r\n\r\n')
-                                current_size = len(stream.outbound_buffer)
-                                
-                                if current_size >= expected_total:
-                                    logger.info(f"[HTTP-STREAM] Parsing request: {current_size}B (need {expected_total}B)")
-                                    http_request = self.http_stream_parser.parse_request(stream.outbound_buffer, timestamp, stream.stream_id)
-                                    if http_request:
-                                        body_str = http_request.body.decode('utf-8', errors='ignore')[:500]
-                                        http_data = {
-                                            'type': 'request',
-                                            'method': http_request.method,
-                                            'url': http_request.url,
-                                            'headers': http_request.headers,
-                                            'body': body_str
-                                        }
-                                        logger.warning(f"[HTTP-STREAM] SUCCESS {http_request.method} {http_request.url} body={len(http_request.body)}B")
-                                        stream.outbound_buffer = b''  # 清空
-                                    else:
-                                        logger.warning(f"[HTTP-STREAM] parse_request returned None")
-                                else:
-                                    logger.debug(f"[HTTP-STREAM] Waiting for more data: {current_size}/{expected_total}B")
-                    except Exception as e:
-                        logger.error(f"[HTTP-STREAM] Request parse error: {e}", exc_info=True)
+                            logger.info("[TLS] SNI: %s", tls_data['sni'])
                 
-                # 检查流的inbound buffer（服务器响应）
-                if not http_data and len(stream.inbound_buffer) > 50:
-                    try:
-                        buffer_preview = stream.inbound_buffer.decode('latin-1', errors='ignore')[:50]
-                        if buffer_preview.startswith('HTTP/'):
-                            # 检查是否有完整headers
-                            if b'\r\n\r\n' in stream.inbound_buffer:
-                                # 提取headers部分检查Content-Length
-                                header_end = stream.inbound_buffer.index(b'\r\n\r\n')
-                                headers_part = stream.inbound_buffer[:header_end].decode('latin-1', errors='ignore')
-                                
-                                # 查找Content-Length
-                                content_length = 0
-                                for line in headers_part.split('\r\n'):
-                                    if line.lower().startswith('content-length:'):
-                                        try:
-                                            content_length = int(line.split(':', 1)[1].strip())
-                                        except:
-                                            pass
-                                        break
-                                
-                                # 检查body是否完整
-                                expected_total = header_end + 4 + content_length
-                                current_size = len(stream.inbound_buffer)
-                                
-                                if current_size >= expected_total:
-                                    logger.info(f"[HTTP-STREAM] Parsing response: {current_size}B (need {expected_total}B)")
-                                    http_response = self.http_stream_parser.parse_response(stream.inbound_buffer, timestamp, stream.stream_id)
-                                    if http_response:
-                                        body_str = http_response.body.decode('utf-8', errors='ignore')[:500]
-                                        http_data = {
-                                            'type': 'response',
-                                            'status_code': http_response.status_code,
-                                            'reason': http_response.reason,
-                                            'headers': http_response.headers,
-                                            'body': body_str
-                                        }
-                                        logger.warning(f"[HTTP-STREAM] SUCCESS {http_response.status_code} body={len(http_response.body)}B")
-                                        stream.inbound_buffer = b''  # 清空
-                                    else:
-                                        logger.warning(f"[HTTP-STREAM] parse_response returned None")
-                                else:
-                                    logger.debug(f"[HTTP-STREAM] Waiting for more data: {current_size}/{expected_total}B")
-                    except Exception as e:
-                        logger.error(f"[HTTP-STREAM] Response parse error: {e}", exc_info=True)
+                # 增量解析两个方向重组缓存中新到达的数据（FIN 也可能结束一条读到关闭为止的响应）
+                connection = self._http_connections.get(stream.stream_id)
+                if connection is not None:
+                    http_data, http_message = self._feed_http(connection, stream, timestamp)
+        elif protocol == "UDP":
+            # UDP 流追踪：流 ID、计数器和按流缓存的协议识别（DNS/QUIC）
+            udp_analysis = self.udp_flow_tracker.process_record(record, record.timestamp)
         
         # ═══════════════════════════════════════════════════════════
         # 构建数据包字典（包含TCP和HTTP层信息）
@@ -401,15 +532,19 @@ class PacketCaptureEngine:
         # 确定应用层协议
         app_protocol = protocol  # 默认为传输层协议 (TCP/UDP)
         
-        # 优先级：HTTP > TLS > TCP
+        # 优先级：HTTP > TLS > UDP 流识别的协议 > TCP/UDP
         if http_data:
             app_protocol = "HTTP"
         elif tls_data:
             app_protocol = "TLS"
+        elif udp_analysis.get('protocol'):
+            app_protocol = udp_analysis['protocol']
         
-        # 提取 HTTP 路径（如果有）
-        path = self._extract_http_path(pkt)
-        method = self._extract_http_method(pkt) if path else app_protocol
+        # 提取 HTTP 方法和路径：只检查 HTTP 连接（或尚未识别的连接）的报文
+        request = None
+        if record.is_tcp and flow_protocol in (PROTO_HTTP, None):
+            request = self._extract_http_request(record.payload)
+        method, path = request if request else (app_protocol, None)
         
         # 如果从HTTP解析器获得了更准确的信息，使用它
         if http_data and http_data['type'] == 'request':
@@ -464,30 +599,29 @@ class PacketCaptureEngine:
                 info_parts.append(f"{sport} → {dport}")
                 
                 # 添加TCP标志信息
-                if pkt.haslayer(TCP):
-                    tcp_layer = pkt[TCP]
+                if record.is_tcp:
+                    tcp_flags = record.tcp_flags
                     flags = []
-                    if tcp_layer.flags.P: flags.append("PSH")
-                    if tcp_layer.flags.A: flags.append("ACK")
-                    if tcp_layer.flags.S: flags.append("SYN")
-                    if tcp_layer.flags.F: flags.append("FIN")
-                    if tcp_layer.flags.R: flags.append("RST")
+                    if tcp_flags & TCP_PSH: flags.append("PSH")
+                    if tcp_flags & TCP_ACK: flags.append("ACK")
+                    if tcp_flags & TCP_SYN: flags.append("SYN")
+                    if tcp_flags & TCP_FIN: flags.append("FIN")
+                    if tcp_flags & TCP_RST: flags.append("RST")
                     
                     if flags:
                         info_parts.append(f"[{', '.join(flags)}]")
                     
                     # 添加序列号
-                    info_parts.append(f"Seq={tcp_layer.seq}")
-                    if tcp_layer.flags.A:
-                        info_parts.append(f"Ack={tcp_layer.ack}")
+                    info_parts.append(f"Seq={record.seq}")
+                    if tcp_flags & TCP_ACK:
+                        info_parts.append(f"Ack={record.ack}")
                     
                     # 添加payload长度
-                    if pkt.haslayer(Raw):
-                        payload_len = len(pkt[Raw].load)
-                        info_parts.append(f"Len={payload_len}")
+                    if record.payload:
+                        info_parts.append(f"Len={len(record.payload)}")
                 else:
-                    # 非TCP包
-                    info_parts.append(f"{protocol}")
+                    # 非TCP包（UDP 显示识别出的协议）
+                    info_parts.append(f"{app_protocol}")
         except Exception as e:
             logger.error(f"Failed to generate info: {e}")
             info_parts = [f"{sport} → {dport} {protocol}"]
@@ -498,19 +632,19 @@ class PacketCaptureEngine:
         packet_data = {
             'id': int(packet_id),  # 确保是整数
             'timestamp': str(datetime.now().strftime('%H:%M:%S.%f')[:-3]),
-            'source': str(ip_layer.src),
-            'sourceIP': str(ip_layer.src),
-            'destination': str(ip_layer.dst),
+            'source': str(src_ip_str),
+            'sourceIP': str(src_ip_str),
+            'destination': str(dst_ip_str),
             'method': str(method),
-            'path': str(path or f"{ip_layer.dst}:{dport}"),
+            'path': str(path or f"{dst_ip_str}:{dport}"),
             'protocol': str(app_protocol),  # 应用层协议 (HTTP/TLS/TCP/UDP)
             'status': int(200),
             'latency': str("-"),  # 延迟功能已移除
-            'size': str(f"{len(pkt)}B"),
+            'size': str(f"{record.length}B"),
             'info': str(info),  # 新增Info字段
             'traceId': str(f"pkt_{packet_id}"),
             'category': str(category),
-            'body': str(self._extract_payload(pkt)),
+            'body': str(self._extract_payload(record.payload)),
             
             # === TCP层信息 ===
             'tcp': {
@@ -527,6 +661,13 @@ class PacketCaptureEngine:
             'tls': tls_data if tls_data else None
         }
         
+        # 专家分析事件只在出现时附带（二进制编码中作为扩展字段，大部分数据包没有）
+        if tcp_analysis and tcp_analysis.get('expert'):
+            packet_data['tcp']['expert'] = list(tcp_analysis['expert'])
+        # UDP 流信息（二进制编码中作为扩展字段）
+        if udp_analysis:
+            packet_data['udp'] = udp_analysis
+        
         # 验证数据完整性
         required_fields = ['id', 'timestamp', 'source', 'destination', 'method', 'path', 'size']
         for field in required_fields:
@@ -535,61 +676,408 @@ class PacketCaptureEngine:
                 return
         
         # DEBUG: 输出数据包信息
-        logger.debug(f"Packet data: id={packet_data['id']}, "
-                    f"tcp_retrans={packet_data['tcp']['is_retransmission'] if packet_data['tcp'] else False}, "
-                    f"http_type={packet_data['http']['type'] if packet_data['http'] else None}")
+        if logger.isEnabledFor(logging.DEBUG):
+            hot_log.debug(logger, "PACKET-DATA", "Packet data: id=%s, tcp_retrans=%s, http_type=%s",
+                          packet_data['id'],
+                          packet_data['tcp']['is_retransmission'] if packet_data['tcp'] else False,
+                          packet_data['http']['type'] if packet_data['http'] else None)
+        
+        # 保留记录，查看详情时再完整解析
+        self._recent_records[packet_id] = record
+        if len(self._recent_records) > self.DETAIL_CACHE_SIZE:
+            self._recent_records.popitem(last=False)
+        if tcp_packet is not None and tcp_packet.payload_len:
+            self._payload_refs[packet_id] = tcp_packet
+            if len(self._payload_refs) > self.PAYLOAD_REF_CACHE_SIZE:
+                self._payload_refs.popitem(last=False)
+        if http_message is not None:
+            self._http_messages[packet_id] = http_message
+            self._http_message_bytes += len(http_message.body)
+            while len(self._http_messages) > 1 and (len(self._http_messages) > self.HTTP_BODY_CACHE_SIZE
+                                                    or self._http_message_bytes > self.HTTP_BODY_CACHE_BYTES):
+                self._http_message_bytes -= len(self._http_messages.popitem(last=False)[1].body)
         
         # 调用回调函数
-        if self.packet_callback:
+        self._emit(packet_data)
+    
+    def _emit(self, packet_data: dict) -> None:
+        """把数据包交给批处理器或单包回调"""
+        if self.batcher:
+            self.batcher.add(packet_data)
+        elif self.packet_callback:
             try:
                 self.packet_callback(packet_data)
             except Exception as e:
                 logger.error(f"Callback error: {e}")
     
-    def _extract_http_path(self, pkt: Packet) -> Optional[str]:
-        """提取 HTTP 请求路径"""
-        if not pkt.haslayer(Raw):
+    def _emit_pipeline_packet(self, packet_data: dict) -> None:
+        """
+        接收解析进程返回的数据包
+        各进程的计数器相互独立，这里统一重新编号
+        """
+        with self.packet_counter_lock:
+            self.packet_counter += 1
+            packet_id = self.packet_counter
+        packet_data['id'] = packet_id
+        packet_data['traceId'] = f"pkt_{packet_id}"
+        self._emit(packet_data)
+    
+    def _wants_reassembly(self, stream, record: PacketRecord) -> Optional[bool]:
+        """
+        流的重组数据只由增量 HTTP 解析器消费（流管理器在流尚未决定时对带数据的报文调用）：
+        报文是 HTTP（或内容无法识别但在 HTTP 端口上）时创建解析器并开始重组，
+        识别为其他协议（TLS 等）的流只跟踪序列号，无法识别时等下一个报文
+        """
+        match = classify(record.payload)
+        if match is None:
+            if record.sport not in HTTP_PORTS and record.dport not in HTTP_PORTS:
+                # 识别器已给出结论（或多次无法识别后放弃）的连接不再逐包检查
+                return False if self.protocol_identifier.is_settled(stream.stream_id) else None
+        elif match.protocol != PROTO_HTTP:
+            return False
+        self._http_connections[stream.stream_id] = HTTPConnectionParser()
+        return True
+    
+    def _on_stream_retired(self, stream) -> None:
+        """TCP 流被淘汰后清理按流缓存的协议识别结果、HTTP 解析状态和未配对的请求"""
+        self.protocol_identifier.forget(stream.stream_id)
+        self.http_stream_parser.pending_requests.pop(stream.stream_id, None)
+        self._http_connections.pop(stream.stream_id, None)
+    
+    def get_stats(self) -> dict:
+        """获取抓包引擎运行统计"""
+        stats = {
+            'target_pid': self.target_pid,
+            'capture_mode': self.capture_mode,
+            'is_running': self.is_running,
+            'packets_emitted': self.packet_counter,
+            'port_mapper': self.port_mapper.get_metrics(),
+            'bpf': {
+                'dynamic': self.dynamic_bpf,
+                'filter': self.active_bpf_filter,
+                'swaps': self.bpf_swaps
+            },
+            'streams': self.tcp_stream_manager.get_eviction_stats(),
+            'known_connections': self._known_connections.stats(),
+            'udp_flows': self.udp_flow_tracker.stats(),
+            'http_transactions': len(self.http_stream_parser.transactions),
+            'decompress': self.decompress_worker.stats(),
+            'checkpoint': self.checkpointer.stats() if self.checkpointer is not None else None
+        }
+        if self.batcher:
+            stats['batches'] = {
+                'batches_flushed': self.batcher.batches_flushed,
+                'packets_flushed': self.batcher.packets_flushed
+            }
+        if self.pipeline:
+            stats['pipeline'] = self.pipeline.stats()
+        return stats
+    
+    def require_local_state(self, feature: str) -> None:
+        """
+        pipeline 模式下流追踪/HTTP/TLS 解析在解析进程中进行，API 进程只收到数据包摘要，
+        依赖这些状态的查询抛出 ValueError，而不是返回空结果
+        """
+        if self.capture_mode == "pipeline":
+            raise ValueError(f"{feature} is not available in pipeline mode: "
+                             f"stream and HTTP state lives in the dissection workers")
+    
+    def get_packet_detail(self, packet_id: int) -> Optional[dict]:
+        """
+        获取数据包详情（按需完整解析，pipeline 模式下抛出 ValueError）
+        :param packet_id: 数据包ID
+        :return: 各协议层字段，数据包已过期返回 None
+        """
+        self.require_local_state("Packet detail")
+        record = self._recent_records.get(packet_id)
+        if record is None:
+            return self._payload_detail(packet_id)
+        
+        pkt = record.dissect()
+        if pkt is None:
+            return None
+        
+        layers = []
+        layer = pkt
+        while layer:
+            fields = {}
+            for fld in layer.fields_desc:
+                value = layer.getfieldval(fld.name)
+                fields[fld.name] = value if isinstance(value, (int, float, str, type(None))) else repr(value)
+            layers.append({'name': layer.name, 'fields': fields})
+            layer = layer.payload
+        
+        return {
+            'id': packet_id,
+            'summary': pkt.summary(),
+            'length': record.length,
+            'layers': layers,
+            'hex': bytes(pkt).hex()
+        }
+    
+    def get_http_body(self, packet_id: int, limit: int = 65536) -> Optional[dict]:
+        """
+        报文完成的 HTTP 消息的完整消息体（按 Content-Encoding 解压、按 charset 解码）
+        后台尚未解压完成时在调用线程解压（pipeline 模式下抛出 ValueError）
+        :param limit: 返回的最大字符数
+        :return: 没有 HTTP 消息或已过期返回 None
+        """
+        self.require_local_state("HTTP message body")
+        message = self._http_messages.get(packet_id)
+        if message is None:
+            return None
+        decoded = message.decoded_body()
+        detail = decoded.to_dict()
+        detail['id'] = packet_id
+        detail['type'] = 'request' if isinstance(message, HTTPRequest) else 'response'
+        detail['body'] = message.body_text(limit, decoded)
+        return detail
+    
+    def query_http_transactions(self, limit: int = 100, before: Optional[int] = None, **filters) -> dict:
+        """
+        按 host / URL 模板 / 状态码 / stream_id / 时间 / 耗时查询 HTTP 事务（从新到旧）
+        pipeline 模式下抛出 ValueError
+        :param filters: HTTPTransactionStore.query 的过滤条件
+        :return: {'transactions': [...], 'next_cursor': 下一页的 before（没有更多时为 None）}
+        """
+        self.require_local_state("HTTP transactions")
+        transactions = self.http_stream_parser.transactions.query(before=before, limit=limit, **filters)
+        return {
+            'transactions': [_transaction_summary(trans) for trans in transactions],
+            'next_cursor': transactions[-1].seq if len(transactions) == limit else None
+        }
+    
+    def get_http_latency(self, window: Optional[float] = None, sort_by: str = 'p99', limit: int = 100,
+                         **filters) -> dict:
+        """
+        按端点的 HTTP 延迟分位数（排序键无效或 pipeline 模式下抛出 ValueError）
+        :param window: 滑动窗口（秒），None 表示全部时间
+        :param filters: method / host / template
+        """
+        self.require_local_state("HTTP latency")
+        latency = self.http_stream_parser.latency
+        return {
+            'window': window,
+            'overall': latency.overall(window),
+            'endpoints': latency.query(window, sort_by=sort_by, limit=limit, **filters)
+        }
+    
+    def _payload_detail(self, packet_id: int) -> Optional[dict]:
+        """原始帧已过期：只返回从保留策略中读回的 TCP payload"""
+        tcp_packet = self._payload_refs.get(packet_id)
+        if tcp_packet is None:
             return None
+        payload = self.tcp_stream_manager.read_payload(tcp_packet)
+        if payload is None:
+            return None
+        return {
+            'id': packet_id,
+            'summary': f"TCP seq={tcp_packet.seq} ack={tcp_packet.ack} flags={tcp_packet.flags} "
+                       f"len={tcp_packet.payload_len}",
+            'length': tcp_packet.payload_len,
+            'layers': [],
+            'hex': payload.hex(),
+            'truncated': len(payload) < tcp_packet.payload_len
+        }
+    
+    def query_streams(self, sort_by: str = "bytes", limit: int = 50, cursor: Optional[str] = None) -> dict:
+        """按指标排序分页查询TCP流（排序键或游标无效、pipeline 模式下抛出 ValueError）"""
+        self.require_local_state("Stream queries")
+        return self.tcp_stream_manager.query_streams(sort_by, limit, cursor)
+    
+    def checkpoint_state(self, full: bool = True) -> dict:
+        """
+        引擎的检查点状态：TCP/UDP 流表 + HTTP 事务，以及恢复时重建引擎所需的配置
+        （pipeline 模式下这些状态在解析进程中，不支持检查点）
+        """
+        return {
+            'full': full,
+            'engine': {
+                'target_pid': self.target_pid,
+                'db_ports': self.db_ports,
+                'server_ips': ",".join(self.server_ips),
+                'capture_mode': self.capture_mode,
+                'payload_retention': self.payload_retention,
+                'stream_shards': self.stream_shards
+            },
+            'process': self.process_identity,
+            'streams': self.tcp_stream_manager.checkpoint_state(full),
+            'udp': self.udp_flow_tracker.checkpoint_state(full),
+            'http': self.http_stream_parser.checkpoint_state(full)
+        }
+    
+    def restore_state(self, state: dict) -> None:
+        """应用一条检查点记录（全量或增量）"""
+        self.tcp_stream_manager.restore_state(state['streams'])
+        self.udp_flow_tracker.restore_state(state['udp'])
+        self.http_stream_parser.restore_state(state['http'])
+    
+    def checkpoint(self, full: Optional[bool] = None) -> None:
+        """
+        采集并提交一次检查点（在处理数据包的线程中调用，或抓包停止后调用）
+        :param full: None 时由写入器决定全量还是增量
+        """
+        checkpointer = self.checkpointer
+        if checkpointer is None or checkpointer.closed:
+            return
+        if full is None:
+            full = checkpointer.needs_full
+        checkpointer.save(self.checkpoint_state(full))
+    
+    def restore_checkpoint(self, path: str) -> int:
+        """
+        从检查点文件恢复（启动抓包之前调用）
+        只接受同一个目标进程写入的检查点（PID 被复用的新进程不继承旧的状态）
+        :return: 应用的记录数量，没有可用的检查点返回 0
+        """
+        identity = self.process_identity
+        records = apply_checkpoint(path, self.restore_state,
+                                   accept=lambda state: identity is not None and state.get('process') == identity)
+        if records:
+            logger.info(f"Restored checkpoint {path}: {records} records, "
+                        f"{self.tcp_stream_manager.get_eviction_stats()['active_streams']} active streams, "
+                        f"{len(self.http_stream_parser.transactions)} HTTP transactions")
+        return records
+    
+    @classmethod
+    def from_checkpoint(cls, path: str) -> Optional['PacketCaptureEngine']:
+        """
+        按检查点中保存的配置重建一个（未启动的）引擎，供重启后查询之前会话的状态
+        目标进程已退出或 PID 已被其他进程复用时不恢复，返回 None
+        """
+        engines = []
         
+        def restore(state: dict) -> None:
+            if not engines:
+                engines.append(cls(**state['engine']))
+            engines[0].restore_state(state)
+        
+        if not apply_checkpoint(path, restore, accept=lambda state: is_same_process(state.get('process'))):
+            return None
+        engine = engines[0]
+        active_streams = engine.tcp_stream_manager.get_eviction_stats()['active_streams']
+        logger.info(f"Restored session from {path}: {active_streams} active streams, "
+                    f"{len(engine.http_stream_parser.transactions)} HTTP transactions")
+        return engine
+    
+    def get_udp_flows(self, stream_id: Optional[str] = None) -> Optional[list]:
+        """
+        UDP 流（活动流 + 已结束流的摘要）；指定 stream_id 时只返回该流，不存在返回 None
+        pipeline 模式下抛出 ValueError
+        """
+        self.require_local_state("UDP flows")
+        if stream_id is None:
+            return self.udp_flow_tracker.get_all_flows()
+        summary = self.udp_flow_tracker.get_flow_stats(stream_id)
+        return [summary] if summary is not None else None
+    
+    def get_expert_stats(self) -> list:
+        """TCP 专家分析：按服务器端点汇总的握手/数据 RTT 和事件计数（pipeline 模式下抛出 ValueError）"""
+        self.require_local_state("TCP expert analysis")
+        return self.tcp_stream_manager.get_server_stats()
+    
+    def follow_stream(self, stream_id: str, direction: Optional[str] = None, limit: int = 1000) -> Optional[list]:
+        """
+        跟踪TCP流：按到达顺序返回各报文的 payload（从保留策略中按需读回）
+        pipeline 模式下抛出 ValueError
+        :return: 流不存在返回 None
+        """
+        self.require_local_state("Follow stream")
+        segments = self.tcp_stream_manager.follow_stream(stream_id, direction, limit)
+        if segments is None:
+            return None
+        for segment in segments:
+            data = segment.pop('data')
+            segment['hex'] = data.hex() if data is not None else None
+            segment['text'] = data.decode('utf-8', errors='replace') if data is not None else None
+        return segments
+    
+    def _feed_http(self, connection: HTTPConnectionParser, stream,
+                   timestamp: float) -> Tuple[Optional[dict], Optional[Union[HTTPRequest, HTTPResponse]]]:
+        """
+        把流两个方向的新数据交给增量解析器，登记完成的请求/响应，压缩的消息体交给后台解压
+        :return: (本报文完成的第一条消息的展示信息, 该消息)；只完成了头部时返回头部信息（body 为空）和 None
+        """
         try:
-            payload = pkt[Raw].load
-            # 尝试多种编码
-            for encoding in ['utf-8', 'latin-1']:
-                try:
-                    decoded = payload.decode(encoding)
-                    lines = decoded.split('\r\n')
-                    if lines and (lines[0].startswith('GET') or 
-                                 lines[0].startswith('POST') or 
-                                 lines[0].startswith('PUT')):
-                        parts = lines[0].split(' ')
-                        if len(parts) >= 2:
-                            return parts[1]
-                except UnicodeDecodeError:
-                    continue
+            events = connection.feed(stream.outbound, stream.inbound, timestamp)
         except Exception as e:
-            logger.debug(f"HTTP path extract error: {e}")
-        return None
+            logger.error(f"[HTTP-STREAM] parse error in {stream.stream_id}: {e}", exc_info=True)
+            self._http_connections.pop(stream.stream_id, None)
+            self.tcp_stream_manager.stop_reassembly(stream)
+            return None, None
+        
+        http_data = None
+        http_message = None
+        headers_only = None
+        for event, message in events:
+            if event == EVENT_HEADERS:
+                if headers_only is None:
+                    headers_only = message
+                continue
+            if message.kind == HTTP_REQUEST:
+                http_request = self.http_stream_parser.add_request(message, stream.stream_id)
+                hot_log.info(logger, "HTTP-STREAM-SUCCESS", "[HTTP-STREAM] SUCCESS %s %s body=%dB",
+                             http_request.method, http_request.url, message.body_size)
+                self._submit_decode(http_request)
+                if http_data is None:
+                    http_message = http_request
+                    http_data = {
+                        'type': 'request',
+                        'method': http_request.method,
+                        'url': http_request.url,
+                        'headers': http_request.headers.to_dict(),
+                        'body': http_request.body_preview()
+                    }
+            else:
+                http_response = self.http_stream_parser.add_response(message, stream.stream_id)
+                hot_log.info(logger, "HTTP-STREAM-SUCCESS", "[HTTP-STREAM] SUCCESS %s body=%dB",
+                             http_response.status_code, message.body_size)
+                self._submit_decode(http_response)
+                if http_data is None:
+                    http_message = http_response
+                    http_data = {
+                        'type': 'response',
+                        'status_code': http_response.status_code,
+                        'reason': http_response.reason,
+                        'headers': http_response.headers.to_dict(),
+                        'body': http_response.body_preview()
+                    }
+        
+        if http_data is None and headers_only is not None:
+            headers = headers_only.headers.to_dict()
+            if headers_only.kind == HTTP_REQUEST:
+                http_data = {'type': 'request', 'method': headers_only.method, 'url': headers_only.target,
+                             'headers': headers, 'body': ''}
+            else:
+                http_data = {'type': 'response', 'status_code': headers_only.status,
+                             'reason': headers_only.reason, 'headers': headers, 'body': ''}
+        return http_data, http_message
+    
+    def _submit_decode(self, message: Union[HTTPRequest, HTTPResponse]) -> None:
+        """
+        压缩的消息体交给后台线程解压（预览只解压开头部分，在本线程完成）
+        解压结果缓存在消息上并计入事务存储的字节预算；队列已满时跳过，查看时按需解压
+        """
+        encoding = message.content_encoding
+        if encoding and message.body:
+            self.decompress_worker.submit(message.body, encoding,
+                                          partial(self.http_stream_parser.transactions.set_decoded, message))
     
-    def _extract_http_method(self, pkt: Packet) -> str:
-        """提取 HTTP 方法"""
-        if not pkt.haslayer(Raw):
-            return "TCP"
+    def _extract_http_request(self, payload: bytes) -> Optional[Tuple[str, str]]:
+        """提取 HTTP 请求的 (方法, 路径)（只识别一次、只解码请求首行），不是请求起始报文返回 None"""
+        if not payload:
+            return None
         
         try:
-            payload = pkt[Raw].load.decode('utf-8', errors='ignore')
-            for method in ['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'HEAD']:
-                if payload.startswith(method):
-                    return method
-        except:
-            pass
-        return "TCP"
-    
-    def _extract_payload(self, pkt: Packet) -> str:
+            return http_request_target(payload)
+        except Exception as e:
+            logger.debug(f"HTTP request line extract error: {e}")
+        return None
+    
+    def _extract_payload(self, payload: bytes) -> str:
         """提取数据包负载（智能编码处理）"""
-        if pkt.haslayer(Raw):
+        if payload:
             try:
-                payload = pkt[Raw].load
-                
                 # 限制大小
                 if len(payload) > 1024:
                     payload = payload[:1024]
@@ -614,36 +1102,6 @@ class PacketCaptureEngine:
                 return "(error)"
         return "(No payload)"
     
-    def _calculate_latency(self, conn_key: str, is_outbound: bool) -> str:
-        """
-        简化的延迟计算
-        :param conn_key: 连接标识符
-        :param is_outbound: 是否是出站包
-        :return: 延迟字符串
-        """
-        import time
-        
-        if is_outbound:
-            # 出站包：记录时间
-            self.request_times[conn_key] = time.time()
-            logger.debug(f"[LATENCY] OUT: {conn_key}")
-            return "-"
-        else:
-            # 入站包：计算延迟
-            if conn_key in self.request_times:
-                request_time = self.request_times[conn_key]
-                latency_ms = int((time.time() - request_time) * 1000)
-                
-                # 清理
-                del self.request_times[conn_key]
-                
-                result = f"{latency_ms}ms"
-                logger.info(f"[LATENCY] IN: {conn_key} -> {result}")
-                return result
-            else:
-                logger.debug(f"[LATENCY] IN (no pair): {conn_key}")
-                return "-"
-    
     def _parse_tls(self, payload: bytes) -> dict:
         """
         解析 TLS 协议（类似 Wireshark 的 TLS 识别）
@@ -0,0 +1,146 @@
+"""
+TCP payload 保留策略与落盘存储
+- none:    不保留 payload，只记录长度
+- headers: 只在内存中保留应用层头部（HTTP 头部块或前 HEADERS_LIMIT 字节）
+- full:    payload 追加写入内存映射的段文件，内存中只保留 (offset, length)，查看时再按需读回
+
+段文件是固定大小的临时文件，按全局偏移线性编址，写满后创建下一个段；
+总大小超过上限时删除最旧的段，已删除区域的读取返回 None
+"""
+import logging
+import mmap
+import tempfile
+import threading
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+RETENTION_NONE = "none"
+RETENTION_HEADERS = "headers"
+RETENTION_FULL = "full"
+RETENTION_MODES = (RETENTION_NONE, RETENTION_HEADERS, RETENTION_FULL)
+
+# headers 模式下单个报文最多保留的字节数
+HEADERS_LIMIT = 1024
+
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 1024 * 1024 * 1024
+
+
+def header_prefix(payload: bytes, limit: int = HEADERS_LIMIT) -> bytes:
+    """应用层头部：到 \\r\\n\\r\\n 为止（含），没有找到时取前 limit 字节"""
+    end = payload.find(b'\r\n\r\n', 0, limit)
+    if end >= 0:
+        return bytes(payload[:end + 4])
+    return bytes(payload[:limit])
+
+
+class _Segment:
+    __slots__ = ('file', 'map')
+
+    def __init__(self, directory: Optional[str], size: int):
+        self.file = tempfile.TemporaryFile(prefix="netshark-payload-", dir=directory)
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+    def close(self) -> None:
+        self.map.close()
+        self.file.close()
+
+
+class PayloadStore:
+    """只追加的 payload 段文件（写入方为抓包线程，读取方为 API 线程）"""
+
+    def __init__(self, directory: Optional[str] = None, segment_size: int = DEFAULT_SEGMENT_SIZE,
+                 max_bytes: int = DEFAULT_MAX_DISK_BYTES):
+        """
+        :param directory: 段文件目录，None 使用系统临时目录
+        :param segment_size: 单个段文件大小
+        :param max_bytes: 保留的总字节数上限，超出后删除最旧的段
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max(1, max_bytes // segment_size)
+        # 下标为段编号（全局偏移 // segment_size），已删除的段为 None
+        self._segments: List[Optional[_Segment]] = []
+        self._first_live = 0
+        self._write_pos = 0
+        self._lock = threading.Lock()
+        self.closed = False
+        self.bytes_written = 0
+        self.segments_dropped = 0
+
+    def append(self, payload: bytes) -> int:
+        """
+        追加 payload（可跨段），返回全局偏移
+        存储已关闭时返回 -1
+        """
+        with self._lock:
+            if self.closed:
+                return -1
+            offset = self._write_pos
+            size = self.segment_size
+            view = memoryview(payload)
+            position = 0
+            while position < len(view):
+                index, start = divmod(self._write_pos, size)
+                segment = self._segment_for_write(index)
+                chunk = min(len(view) - position, size - start)
+                segment.map[start:start + chunk] = view[position:position + chunk]
+                position += chunk
+                self._write_pos += chunk
+            self.bytes_written += len(view)
+            return offset
+
+    def _segment_for_write(self, index: int) -> _Segment:
+        if index < len(self._segments):
+            return self._segments[index]
+        segment = _Segment(self.directory, self.segment_size)
+        self._segments.append(segment)
+        # 超出上限：删除最旧的段
+        while len(self._segments) - self._first_live > self.max_segments:
+            self._segments[self._first_live].close()
+            self._segments[self._first_live] = None
+            self._first_live += 1
+            self.segments_dropped += 1
+        return segment
+
+    def read(self, offset: int, length: int) -> Optional[bytes]:
+        """读回 [offset, offset + length)，数据已被删除或越界时返回 None"""
+        if offset < 0 or length < 0:
+            return None
+        with self._lock:
+            if self.closed or offset + length > self._write_pos:
+                return None
+            size = self.segment_size
+            if offset // size < self._first_live:
+                return None
+            parts = []
+            end = offset + length
+            while offset < end:
+                index, start = divmod(offset, size)
+                chunk = min(end - offset, size - start)
+                parts.append(self._segments[index].map[start:start + chunk])
+                offset += chunk
+            return b''.join(parts)
+
+    def close(self) -> None:
+        """关闭并删除所有段文件"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            for segment in self._segments[self._first_live:]:
+                segment.close()
+            self._segments = [None] * len(self._segments)
+            self._first_live = len(self._segments)
+        logger.debug("Payload store closed (%d bytes written)", self.bytes_written)
+
+    def stats(self) -> dict:
+        live = len(self._segments) - self._first_live
+        return {
+            'bytes_written': self.bytes_written,
+            'segments': live,
+            'disk_bytes': live * self.segment_size,
+            'segments_dropped': self.segments_dropped
+        }
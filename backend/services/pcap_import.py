@@ -0,0 +1,296 @@
+"""
+PCAP 导入
+把 rdpcap 读出的数据包转换为前端格式，并构建 TCP/UDP 流信息（用于流追踪）
+TCP 报文经过与实时抓包相同的 TCPStreamManager，得到重传/乱序分类和专家分析；
+UDP 报文经过 UDPFlowTracker，得到流计数器、payload 长度直方图和按流识别的协议（DNS/QUIC）
+供 /api/pcap/upload 和基准测试共用
+"""
+import base64
+import logging
+from datetime import datetime
+
+from scapy.all import rdpcap, IP, TCP, UDP, Raw
+
+from .fast_decoder import PacketRecord
+from .payload_store import RETENTION_NONE
+from .protocol_id import ProtocolIdentifier, flow_key
+from .tcp_stream import TCPStreamManager
+from .udp_flow import UDPFlowTracker
+
+logger = logging.getLogger(__name__)
+
+
+def parse_pcap_file(path: str) -> dict:
+    """读取并解析 PCAP 文件"""
+    packets_raw = rdpcap(path)
+    logger.info(f"[PCAP] Total raw packets: {len(packets_raw)}")
+    return parse_packets(packets_raw)
+
+
+def parse_packets(packets_raw) -> dict:
+    """
+    解析数据包列表
+    :param packets_raw: Scapy 数据包序列（rdpcap 的返回值）
+    :return: {"packets": 前端格式数据包, "streams": TCP/UDP 流信息, "tcp_expert": 按服务器汇总的专家分析,
+              "skipped_no_ip": 非 IP 包数量}
+    """
+    # 按连接缓存识别结果，同一连接的后续报文不再重复识别
+    protocol_identifier = ProtocolIdentifier()
+    
+    def detect_protocol(pkt, sport, dport):
+        """检测应用层协议 - 只有包含实际数据时才识别为应用层协议"""
+        if not pkt.haslayer(Raw):
+            return None
+        ip_layer = pkt[IP]
+        transport = "TCP" if pkt.haslayer(TCP) else "UDP"
+        key = flow_key(ip_layer.src, sport, ip_layer.dst, dport, transport)
+        return protocol_identifier.identify(key, bytes(pkt[Raw].load), sport, dport)
+    
+    # 流追踪 - 用于识别同一个 TCP/UDP 连接的所有包（TCP 和 UDP 共用编号，前端按 stream_id 过滤）
+    tcp_streams = {}  # key: stream_key, value: stream_id
+    stream_counter = 0
+    # 重传/乱序/专家分析（payload 由本模块自己输出，不需要保留）
+    stream_manager = TCPStreamManager(payload_retention=RETENTION_NONE)
+    tracked_streams = {}  # stream_id -> TCPStream
+    # UDP 流计数器和协议识别（与实时抓包相同的空闲超时）
+    udp_tracker = UDPFlowTracker()
+    udp_flows = {}  # stream_id -> UDPFlowTracker 中的流 ID
+
+    def get_stream_id(src_ip, dst_ip, sport, dport, transport="TCP"):
+        """获取流 ID，双向匹配"""
+        nonlocal stream_counter
+        # 创建规范化的流键（确保双向都能匹配到同一个流）
+        key1 = (transport, src_ip, sport, dst_ip, dport)
+        key2 = (transport, dst_ip, dport, src_ip, sport)
+
+        if key1 in tcp_streams:
+            return tcp_streams[key1]
+        if key2 in tcp_streams:
+            return tcp_streams[key2]
+
+        # 新的流
+        stream_counter += 1
+        tcp_streams[key1] = stream_counter
+        return stream_counter
+
+    # 转换为前端格式
+    packets = []
+    skipped_no_ip = 0
+    for i, pkt in enumerate(packets_raw):
+        if not pkt.haslayer(IP):
+            skipped_no_ip += 1
+            continue
+
+        ip_layer = pkt[IP]
+        base_protocol = "TCP" if pkt.haslayer(TCP) else "UDP" if pkt.haslayer(UDP) else "IP"
+
+        # 提取端口
+        sport = dport = 0
+        if pkt.haslayer(TCP):
+            sport = pkt[TCP].sport
+            dport = pkt[TCP].dport
+        elif pkt.haslayer(UDP):
+            sport = pkt[UDP].sport
+            dport = pkt[UDP].dport
+
+        # UDP 流追踪（按流缓存的 DNS/QUIC 识别）
+        udp_analysis = {}
+        if base_protocol == "UDP":
+            record = PacketRecord.from_scapy(pkt, float(pkt.time))
+            if record is not None:
+                udp_analysis = udp_tracker.process_record(record, float(pkt.time))
+
+        # 检测应用层协议
+        app_protocol = udp_analysis.get("protocol") or detect_protocol(pkt, sport, dport)
+        protocol = app_protocol if app_protocol else base_protocol
+
+        # 计算大小
+        size = len(pkt)
+
+        # 构建 info 字段
+        info = f"{sport} → {dport}"
+        if pkt.haslayer(TCP):
+            flags = pkt[TCP].flags
+            flag_str = str(flags) if flags else ""
+            info += f" [{flag_str}]"
+
+        # TLS 特殊处理
+        if protocol.startswith("TLS"):
+            if pkt.haslayer(Raw):
+                payload = bytes(pkt[Raw].load)
+                if len(payload) >= 6 and payload[0] == 0x16:  # Handshake
+                    hs_type = payload[5] if len(payload) > 5 else 0
+                    hs_names = {1: "Client Hello", 2: "Server Hello", 11: "Certificate", 14: "Server Hello Done"}
+                    info = f"{protocol} Handshake: {hs_names.get(hs_type, 'Unknown')}"
+                elif len(payload) >= 1 and payload[0] == 0x17:  # Application Data
+                    info = f"{protocol} Application Data ({len(payload)} bytes)"
+                else:
+                    info = f"{protocol} Encrypted"
+
+        # 获取原始时间戳（用于排序）
+        raw_time = float(pkt.time)
+
+        # 提取 payload 内容
+        payload_raw = b""
+        payload_text = ""
+        payload_hex = ""
+        payload_base64 = ""
+        if pkt.haslayer(Raw):
+            payload_raw = bytes(pkt[Raw].load)
+            # 尝试解码为文本（可能是二进制数据）
+            try:
+                payload_text = payload_raw.decode('utf-8', errors='replace')
+            except:
+                payload_text = payload_raw.decode('latin-1', errors='replace')
+            # Hex 格式
+            payload_hex = ' '.join(f'{b:02x}' for b in payload_raw)
+            # Base64 格式
+            payload_base64 = base64.b64encode(payload_raw).decode('ascii')
+
+        # 提取 TCP 层信息
+        tcp_data = None
+        if pkt.haslayer(TCP):
+            tcp_layer = pkt[TCP]
+            flags = tcp_layer.flags
+            analysis = {}
+            record = PacketRecord.from_scapy(pkt, raw_time)
+            if record is not None:
+                tracked, _, analysis = stream_manager.process_record(record, raw_time)
+            tcp_data = {
+                "src_port": tcp_layer.sport,
+                "dst_port": tcp_layer.dport,
+                "seq": tcp_layer.seq,
+                "ack": tcp_layer.ack,
+                "flags": str(flags) if flags else "",
+                "window_size": tcp_layer.window,
+                "payload_length": len(payload_raw),
+                "is_retransmission": analysis.get("is_retransmission", False),
+                "is_out_of_order": analysis.get("is_out_of_order", False),
+                "expert": list(analysis.get("expert", ())),
+            }
+
+        # 提取 UDP 层信息
+        udp_data = None
+        if pkt.haslayer(UDP):
+            udp_layer = pkt[UDP]
+            udp_data = {
+                "src_port": udp_layer.sport,
+                "dst_port": udp_layer.dport,
+                "length": udp_layer.len,
+            }
+
+        # 获取流 ID
+        stream_id = None
+        stream_peer = None  # 0 = 客户端发送, 1 = 服务端发送
+        if pkt.haslayer(TCP):
+            stream_id = get_stream_id(ip_layer.src, ip_layer.dst, sport, dport)
+            if analysis:
+                tracked_streams[stream_id] = tracked
+            # 判断是哪一方发送的（端口号较小的通常是服务端）
+            if sport < dport:
+                stream_peer = 0  # 服务端发送
+            else:
+                stream_peer = 1  # 客户端发送
+        elif udp_analysis:
+            stream_id = get_stream_id(ip_layer.src, ip_layer.dst, sport, dport, "UDP")
+            udp_flows[stream_id] = udp_analysis["stream_id"]
+            # UDP 没有端口约定，按流的第一个报文判断（发起方为客户端）
+            stream_peer = 1 if udp_analysis["outbound"] else 0
+
+        packet_data = {
+            "id": i + 1,
+            "timestamp": datetime.fromtimestamp(raw_time).strftime("%H:%M:%S.%f")[:-3],
+            "raw_time": raw_time,  # 保存原始时间戳用于排序
+            "source": ip_layer.src,
+            "sourceIP": ip_layer.src,
+            "destination": ip_layer.dst,
+            "destIP": ip_layer.dst,
+            "protocol": protocol,
+            "method": protocol,
+            "path": f"{ip_layer.dst}:{dport}",
+            "size": f"{size}B",
+            "info": info,
+            "traceId": f"pcap-{i+1}",
+            "category": "client",  # 默认分类
+            "body": payload_text,  # 文本格式
+            "payload_hex": payload_hex,  # Hex 格式
+            "payload_base64": payload_base64,  # Base64 格式
+            "payload_size": len(payload_raw),  # Payload 大小
+            "tcp": tcp_data,  # TCP 层信息
+            "udp": udp_data,  # UDP 层信息
+            "stream_id": stream_id,  # TCP/UDP 流 ID
+            "stream_peer": stream_peer,  # 发送方 (0/1)
+        }
+
+        packets.append(packet_data)
+
+    # 按原始时间戳排序
+    packets.sort(key=lambda p: p.get("raw_time", 0))
+
+    # 计算相对时间（从第一个包开始，与 Wireshark 一致）
+    if packets:
+        first_time = packets[0].get("raw_time", 0)
+        for idx, pkt_data in enumerate(packets):
+            pkt_data["id"] = idx + 1
+            raw = pkt_data.get("raw_time", 0)
+            relative = raw - first_time
+            # 格式化为 Wireshark 风格的相对时间
+            pkt_data["timestamp"] = f"{relative:.6f}"
+
+    # 构建流信息（用于流追踪功能）
+    streams = {}
+    for pkt in packets:
+        sid = pkt.get("stream_id")
+        if sid is None:
+            continue
+
+        if sid not in streams:
+            # 初始化流信息
+            streams[sid] = {
+                "stream_id": sid,
+                "transport": "UDP" if sid in udp_flows else "TCP",
+                "peers": [],  # 两个通信端点
+                "packets": [],  # 该流的所有包 ID
+                "total_bytes": 0,
+                "packet_count": 0,
+                "expert": None,
+            }
+            tracked = tracked_streams.get(sid)
+            if tracked is not None:
+                streams[sid]["expert"] = tracked.expert.to_dict()
+            if sid in udp_flows:
+                streams[sid]["udp"] = udp_tracker.get_flow_stats(udp_flows[sid])
+
+        stream = streams[sid]
+
+        # 添加端点信息
+        layer = pkt.get("tcp") or pkt.get("udp")
+        peer_info = {
+            "host": pkt.get("sourceIP"),
+            "port": layer.get("src_port") if layer else 0
+        }
+        # 检查是否已存在该端点
+        if not any(p["host"] == peer_info["host"] and p["port"] == peer_info["port"] for p in stream["peers"]):
+            if len(stream["peers"]) < 2:
+                stream["peers"].append(peer_info)
+
+        # 添加包引用
+        stream["packets"].append({
+            "id": pkt.get("id"),
+            "peer": pkt.get("stream_peer"),
+            "timestamp": pkt.get("raw_time"),
+            "payload_size": pkt.get("payload_size", 0),
+            "payload_base64": pkt.get("payload_base64", ""),
+        })
+        stream["total_bytes"] += pkt.get("payload_size", 0)
+        stream["packet_count"] += 1
+
+    # 转换为列表
+    streams_list = list(streams.values())
+    
+    return {
+        "packets": packets,
+        "streams": streams_list,
+        "tcp_expert": {"servers": stream_manager.get_server_stats()},
+        "skipped_no_ip": skipped_no_ip,
+    }
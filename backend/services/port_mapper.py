@@ -1,52 +1,306 @@
 """
 端口-进程 映射器
 用于将网络端口映射到具体的进程PID，实现进程级流量过滤
+
+后台线程定期增量刷新：
+- Linux: 读取 /proc/net/{tcp,tcp6,udp,udp6} 获取 inode->端口，
+  inode->PID 结果缓存，只有出现新 inode 时才扫描 /proc/<pid>/fd
+- 其他平台: psutil.net_connections
+只把变化的端口写入映射表，查询端始终无锁 O(1)
 """
+import os
+import sys
+import time
+import threading
 import psutil
-from typing import Dict, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Set
 import logging
 
 logger = logging.getLogger(__name__)
 
+_PROC_NET_FILES = ('/proc/net/tcp', '/proc/net/tcp6', '/proc/net/udp', '/proc/net/udp6')
+
+
+# 按需刷新（request_refresh）之间的最小间隔（秒），SYN 风暴时限制刷新频率
+MIN_REQUESTED_REFRESH_GAP = 0.05
+
 
 class PortMapper:
     """端口到PID的映射管理器"""
-    
-    def __init__(self):
+
+    def __init__(self, refresh_interval: float = 0.5, full_scan_interval: float = 2.0):
+        """
+        :param refresh_interval: 后台增量刷新间隔（秒）
+        :param full_scan_interval: Linux 下全量扫描 /proc/*/fd 的最小间隔（秒）
+        """
         self.port_to_pid: Dict[int, int] = {}
         self.pid_to_ports: Dict[int, set] = {}
-        
+
+        self.refresh_interval = refresh_interval
+        self.full_scan_interval = full_scan_interval
+        self.use_procfs = sys.platform.startswith('linux') and os.path.exists(_PROC_NET_FILES[0])
+
+        # 优先解析的进程（抓包目标），每轮都扫描其 fd
+        self.watch_pids: Set[int] = set()
+
+        # inode -> PID 缓存（仅 procfs 模式）
+        self._inode_pid: Dict[int, int] = {}
+        self._unresolvable: Set[int] = set()
+        self._last_full_scan = 0.0
+
+        # 映射变化监听器 callback(changed_pids)
+        self._listeners: List[Callable[[Set[int]], None]] = []
+
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        # 按需刷新请求，唤醒后台线程提前刷新
+        self._wake_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # 刷新开销与数据新鲜度统计
+        self.refresh_count = 0
+        self.last_refresh_ms = 0.0
+        self.max_refresh_ms = 0.0
+        self.total_refresh_ms = 0.0
+        self.last_refresh_time: Optional[float] = None
+        self.ports_added = 0
+        self.ports_removed = 0
+        self.last_changes = 0
+        self.refresh_requests = 0
+
     def refresh(self) -> None:
-        """刷新端口映射表"""
-        self.port_to_pid.clear()
-        self.pid_to_ports.clear()
-        
-        try:
-            connections = psutil.net_connections(kind='inet')
-            for conn in connections:
-                if conn.laddr and conn.pid:
-                    port = conn.laddr.port
-                    pid = conn.pid
-                    
-                    # 建立双向映射
-                    self.port_to_pid[port] = pid
-                    
-                    if pid not in self.pid_to_ports:
-                        self.pid_to_ports[pid] = set()
-                    self.pid_to_ports[pid].add(port)
-                    
-            logger.info(f"Port mapping refreshed: {len(self.port_to_pid)} active ports")
-        except Exception as e:
-            logger.error(f"Failed to refresh port mapping: {e}")
-    
+        """刷新端口映射表（只应用变化部分）"""
+        with self._refresh_lock:
+            start = time.perf_counter()
+            try:
+                snapshot = self._snapshot_procfs() if self.use_procfs else self._snapshot_psutil()
+                self._apply(snapshot)
+            except Exception as e:
+                logger.error(f"Failed to refresh port mapping: {e}")
+                return
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.refresh_count += 1
+            self.last_refresh_ms = elapsed_ms
+            self.total_refresh_ms += elapsed_ms
+            self.max_refresh_ms = max(self.max_refresh_ms, elapsed_ms)
+            self.last_refresh_time = time.time()
+
+            if self.last_changes:
+                logger.debug(f"Port mapping refreshed: {self.last_changes} changes, "
+                             f"{len(self.port_to_pid)} active ports ({elapsed_ms:.1f}ms)")
+
+    def request_refresh(self) -> None:
+        """
+        请求后台线程尽快刷新一次（不阻塞调用方，可在抓包线程中调用）
+        刷新和监听器回调都在后台线程中进行；未启动后台刷新时不生效
+        """
+        self.refresh_requests += 1
+        self._wake_event.set()
+
+    def add_listener(self, callback: Callable[[Set[int]], None]) -> None:
+        """注册映射变化回调，参数为端口发生变化的PID集合"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[Set[int]], None]) -> None:
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def start_auto_refresh(self, watch_pids: Iterable[int] = ()) -> None:
+        """
+        启动后台增量刷新线程
+        :param watch_pids: 需要优先跟踪的进程PID
+        """
+        self.watch_pids.update(watch_pids)
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._wake_event.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._thread.start()
+        logger.info(f"Port mapper auto refresh started (interval={self.refresh_interval}s, "
+                    f"procfs={self.use_procfs})")
+
+    def stop_auto_refresh(self) -> None:
+        """停止后台刷新线程"""
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _refresh_loop(self) -> None:
+        last_refresh = 0.0
+        while True:
+            requested = self._wake_event.wait(self.refresh_interval)
+            if requested:
+                # 按需刷新限频，等待期间到达的请求合并为一次
+                delay = last_refresh + MIN_REQUESTED_REFRESH_GAP - time.monotonic()
+                if delay > 0:
+                    self._stop_event.wait(delay)
+                self._wake_event.clear()
+            if self._stop_event.is_set():
+                return
+            self.refresh()
+            last_refresh = time.monotonic()
+
+    def _snapshot_psutil(self) -> Dict[int, int]:
+        """通过 psutil 获取当前 端口->PID"""
+        snapshot = {}
+        for conn in psutil.net_connections(kind='inet'):
+            if conn.laddr and conn.pid:
+                snapshot[conn.laddr.port] = conn.pid
+        return snapshot
+
+    def _snapshot_procfs(self) -> Dict[int, int]:
+        """通过 /proc/net 获取当前 端口->PID（inode 解析结果缓存复用）"""
+        inode_port = {}
+        for path in _PROC_NET_FILES:
+            try:
+                f = open(path, 'r')
+            except OSError:
+                continue
+            with f:
+                next(f, None)  # 表头
+                for line in f:
+                    fields = line.split()
+                    if len(fields) < 10:
+                        continue
+                    inode = int(fields[9])
+                    if inode:
+                        inode_port[inode] = int(fields[1].rsplit(':', 1)[1], 16)
+
+        # 清理已关闭 socket 的缓存
+        for inode in [i for i in self._inode_pid if i not in inode_port]:
+            del self._inode_pid[inode]
+        self._unresolvable.intersection_update(inode_port)
+
+        unknown = {i for i in inode_port if i not in self._inode_pid and i not in self._unresolvable}
+        if unknown:
+            self._resolve_inodes(unknown)
+
+        snapshot = {}
+        inode_pid = self._inode_pid
+        for inode, port in inode_port.items():
+            pid = inode_pid.get(inode)
+            if pid:
+                snapshot[port] = pid
+        return snapshot
+
+    def _resolve_inodes(self, unknown: Set[int]) -> None:
+        """扫描 /proc/<pid>/fd 解析 socket inode 所属进程"""
+        self._scan_pids(self.watch_pids, unknown)
+        if not unknown:
+            return
+
+        # 全量扫描开销较大，限制频率
+        now = time.monotonic()
+        if now - self._last_full_scan < self.full_scan_interval:
+            return
+        self._last_full_scan = now
+
+        pids = [int(name) for name in os.listdir('/proc') if name.isdigit()]
+        self._scan_pids(pids, unknown)
+        # 全量扫描后仍无法解析（无权限或已退出），不再重复扫描
+        self._unresolvable.update(unknown)
+
+    def _scan_pids(self, pids: Iterable[int], unknown: Set[int]) -> None:
+        for pid in pids:
+            fd_dir = f'/proc/{pid}/fd'
+            try:
+                fds = os.listdir(fd_dir)
+            except OSError:
+                continue
+            for fd in fds:
+                try:
+                    link = os.readlink(f'{fd_dir}/{fd}')
+                except OSError:
+                    continue
+                if link.startswith('socket:['):
+                    inode = int(link[8:-1])
+                    if inode in unknown:
+                        self._inode_pid[inode] = pid
+                        unknown.discard(inode)
+            if not unknown:
+                return
+
+    def _apply(self, snapshot: Dict[int, int]) -> None:
+        """
+        将新快照与当前映射做差异，只写入变化部分
+        单个 key 的赋值/删除在 GIL 下是原子的；pid_to_ports 的集合采用写时复制，
+        查询线程无需加锁
+        """
+        port_to_pid = self.port_to_pid
+        # pid -> (新增端口, 移除端口)
+        pid_changes: Dict[int, tuple] = {}
+        added = removed = 0
+
+        def change(pid):
+            if pid not in pid_changes:
+                pid_changes[pid] = (set(), set())
+            return pid_changes[pid]
+
+        for port, pid in snapshot.items():
+            old_pid = port_to_pid.get(port)
+            if old_pid != pid:
+                port_to_pid[port] = pid
+                change(pid)[0].add(port)
+                if old_pid is not None:
+                    change(old_pid)[1].add(port)
+                added += 1
+
+        for port in [p for p in port_to_pid if p not in snapshot]:
+            change(port_to_pid.pop(port))[1].add(port)
+            removed += 1
+
+        for pid, (ports_in, ports_out) in pid_changes.items():
+            ports = (self.pid_to_ports.get(pid, set()) - ports_out) | ports_in
+            if ports:
+                self.pid_to_ports[pid] = ports
+            else:
+                self.pid_to_ports.pop(pid, None)
+
+        self.ports_added += added
+        self.ports_removed += removed
+        self.last_changes = added + removed
+
+        if pid_changes:
+            changed = set(pid_changes)
+            for callback in list(self._listeners):
+                try:
+                    callback(changed)
+                except Exception as e:
+                    logger.error(f"Port mapper listener error: {e}")
+
+    def get_metrics(self) -> dict:
+        """刷新开销和映射新鲜度"""
+        staleness_ms = (time.time() - self.last_refresh_time) * 1000 if self.last_refresh_time else None
+        return {
+            'backend': 'procfs' if self.use_procfs else 'psutil',
+            'auto_refresh': bool(self._thread and self._thread.is_alive()),
+            'refresh_interval': self.refresh_interval,
+            'refresh_count': self.refresh_count,
+            'refresh_requests': self.refresh_requests,
+            'last_refresh_ms': round(self.last_refresh_ms, 3),
+            'avg_refresh_ms': round(self.total_refresh_ms / self.refresh_count, 3) if self.refresh_count else 0,
+            'max_refresh_ms': round(self.max_refresh_ms, 3),
+            'staleness_ms': round(staleness_ms, 1) if staleness_ms is not None else None,
+            'active_ports': len(self.port_to_pid),
+            'ports_added': self.ports_added,
+            'ports_removed': self.ports_removed,
+            'last_changes': self.last_changes,
+            'unresolved_inodes': len(self._unresolvable)
+        }
+
     def get_pid_by_port(self, port: int) -> Optional[int]:
         """通过端口号获取进程PID"""
         return self.port_to_pid.get(port)
-    
+
     def get_ports_by_pid(self, pid: int) -> set:
         """通过进程PID获取所有相关端口"""
         return self.pid_to_ports.get(pid, set())
-    
+
     def belongs_to_pid(self, port: int, target_pid: int) -> bool:
         """判断某个端口是否属于目标进程"""
         pid = self.get_pid_by_port(port)
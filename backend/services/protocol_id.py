@@ -0,0 +1,278 @@
+"""
+应用层协议识别
+实时抓包、PCAP 导入和 SSH 远程抓包共用：
+- 按首字节查表（首字节 -> 候选前缀），只比较报文开头的几个字节，不解码整个 payload
+- ProtocolIdentifier 按连接缓存识别结果，已识别的连接后续报文直接复用
+- classify_udp 识别 UDP 报文（DNS/QUIC），按流缓存由 UDPFlowTracker 负责
+"""
+from collections import OrderedDict, namedtuple
+from typing import Dict, Hashable, Optional, Tuple
+
+PROTO_HTTP = "HTTP"
+PROTO_TLS = "TLS"
+PROTO_SSH = "SSH"
+PROTO_DNS = "DNS"
+PROTO_MYSQL = "MySQL"
+PROTO_REDIS = "Redis"
+PROTO_JSON = "JSON"
+PROTO_QUIC = "QUIC"
+
+HTTP_REQUEST = "request"
+HTTP_RESPONSE = "response"
+
+# protocol: 协议名；kind: HTTP 为 request/response，TLS 为记录层版本名
+Match = namedtuple('Match', 'protocol kind')
+
+HTTP_METHODS = (b'GET ', b'POST ', b'PUT ', b'DELETE ', b'HEAD ', b'OPTIONS ', b'PATCH ')
+
+# 端口提示（仅在内容特征无法判断且存在 payload 时使用）
+SSH_PORTS = frozenset((22,))
+DNS_PORTS = frozenset((53, 5353))
+QUIC_PORTS = frozenset((443, 8443))
+HTTP_PORTS = frozenset((80, 8080, 8000, 3000))
+MYSQL_PORTS = frozenset((3306,))
+REDIS_PORTS = frozenset((6379,))
+
+_TLS_VERSIONS = {0x00: "TLS", 0x01: "TLSv1.0", 0x02: "TLSv1.1", 0x03: "TLSv1.2", 0x04: "TLSv1.3"}
+_TLS_CONTENT_TYPES = (0x14, 0x15, 0x16, 0x17)
+_JSON_MATCH = Match(PROTO_JSON, None)
+_WHITESPACE = b' \t\r\n'
+# HTTP 头部扫描上限（用于 Content-Type 判断）
+_HEADER_SCAN_LIMIT = 4096
+# QUIC v1 (RFC 9000) / v2 (RFC 9369)
+_QUIC_VERSIONS = frozenset((0x00000001, 0x6b3343cf))
+_DNS_HEADER_SIZE = 12
+
+
+def _build_dispatch() -> Dict[int, Tuple[Tuple[bytes, Match], ...]]:
+    """首字节 -> ((前缀, 结果), ...)"""
+    table: Dict[int, list] = {}
+
+    def add(prefix: bytes, match: Match):
+        table.setdefault(prefix[0], []).append((prefix, match))
+
+    request = Match(PROTO_HTTP, HTTP_REQUEST)
+    for method in HTTP_METHODS:
+        add(method, request)
+    add(b'HTTP/', Match(PROTO_HTTP, HTTP_RESPONSE))
+    add(b'SSH-', Match(PROTO_SSH, None))
+    # TLS 记录层：content_type | 0x03 | minor
+    for content_type in _TLS_CONTENT_TYPES:
+        for minor, name in _TLS_VERSIONS.items():
+            add(bytes((content_type, 0x03, minor)), Match(PROTO_TLS, name))
+    add(b'{', _JSON_MATCH)
+    add(b'[', _JSON_MATCH)
+    return {byte: tuple(candidates) for byte, candidates in table.items()}
+
+
+_DISPATCH = _build_dispatch()
+
+
+def classify(payload: bytes) -> Optional[Match]:
+    """
+    根据开头字节识别协议（无状态）
+    :return: Match，无法识别返回 None
+    """
+    if not payload:
+        return None
+    candidates = _DISPATCH.get(payload[0])
+    if candidates is not None:
+        for prefix, match in candidates:
+            if payload.startswith(prefix):
+                return match
+        return None
+    if payload[0] in _WHITESPACE:
+        # 带前导空白的 JSON，只检查开头一小段
+        head = bytes(payload[:32]).lstrip(_WHITESPACE)
+        if head[:1] in (b'{', b'['):
+            return _JSON_MATCH
+    return None
+
+
+def http_kind(payload: bytes) -> Optional[str]:
+    """HTTP 报文起始判断：request / response / None"""
+    match = classify(payload)
+    if match is not None and match.protocol == PROTO_HTTP:
+        return match.kind
+    return None
+
+
+def tls_version(payload: bytes) -> Optional[str]:
+    """TLS 记录层版本名（不是 TLS 记录返回 None）"""
+    match = classify(payload)
+    if match is not None and match.protocol == PROTO_TLS:
+        return match.kind
+    return None
+
+
+def http_start_line(payload: bytes, limit: int = 8192) -> str:
+    """只解码 HTTP 报文的首行"""
+    end = payload.find(b'\r\n', 0, limit)
+    line = payload[:end if end >= 0 else min(len(payload), 100)]
+    try:
+        return bytes(line).decode('utf-8')
+    except UnicodeDecodeError:
+        return bytes(line).decode('latin-1')
+
+
+def http_request_target(payload: bytes) -> Optional[Tuple[str, str]]:
+    """从请求首行提取 (method, target)，不是 HTTP 请求返回 None"""
+    if http_kind(payload) != HTTP_REQUEST:
+        return None
+    parts = http_start_line(payload).split(' ')
+    if len(parts) < 2:
+        return None
+    return parts[0], parts[1]
+
+
+def http_has_json(payload: bytes) -> bool:
+    """
+    HTTP 报文是否携带 JSON：
+    只扫描头部（Content-Type）和 body 开头几个字节
+    """
+    header_end = payload.find(b'\r\n\r\n', 0, _HEADER_SCAN_LIMIT)
+    headers = bytes(payload[:header_end if header_end >= 0 else _HEADER_SCAN_LIMIT]).lower()
+    if b'application/json' in headers:
+        return True
+    if header_end < 0 or http_kind(payload) != HTTP_REQUEST or not payload.startswith((b'POST ', b'PUT ', b'PATCH ')):
+        return False
+    body_start = bytes(payload[header_end + 4:header_end + 36]).lstrip(_WHITESPACE)
+    return body_start.startswith((b'{"', b'[{'))
+
+
+def quic_version(payload: bytes) -> Optional[int]:
+    """
+    QUIC 长头部中的版本号，不是 QUIC 长头部返回 None
+    接受 v1/v2、draft 版本（0xff0000xx）、保留的 GREASE 版本（0x?a?a?a?a）和版本协商（0）
+    """
+    if len(payload) < 7 or not payload[0] & 0x80:
+        return None
+    version = int.from_bytes(payload[1:5], 'big')
+    if not (version in _QUIC_VERSIONS or version == 0 or version >> 8 == 0xff0000
+            or version & 0x0f0f0f0f == 0x0a0a0a0a):
+        return None
+    # 目标连接 ID 长度不超过 20 字节
+    if payload[5] > 20:
+        return None
+    return version
+
+
+def classify_udp(payload: bytes, sport: int = 0, dport: int = 0) -> Optional[str]:
+    """
+    UDP 报文的应用层协议（无状态）
+    - DNS 端口上至少包含完整 DNS 头部的报文
+    - QUIC 长头部按版本号识别；短头部没有特征，只在 QUIC 端口上按固定位识别
+    :return: 协议名，无法识别返回 None
+    """
+    if not payload:
+        return None
+    if sport in DNS_PORTS or dport in DNS_PORTS:
+        return PROTO_DNS if len(payload) >= _DNS_HEADER_SIZE else None
+    if quic_version(payload) is not None:
+        return PROTO_QUIC
+    if (sport in QUIC_PORTS or dport in QUIC_PORTS) and payload[0] & 0x40:
+        return PROTO_QUIC
+    return None
+
+
+def flow_key(src_ip: str, sport: int, dst_ip: str, dport: int, transport: str = "TCP") -> tuple:
+    """双向一致的连接标识"""
+    a = (src_ip, sport)
+    b = (dst_ip, dport)
+    return (transport, a, b) if a <= b else (transport, b, a)
+
+
+def _port_hint(sport: int, dport: int) -> Optional[str]:
+    """根据端口猜测协议（仅在有 payload 时调用）"""
+    for ports, protocol in ((HTTP_PORTS, PROTO_HTTP), (MYSQL_PORTS, PROTO_MYSQL), (REDIS_PORTS, PROTO_REDIS)):
+        if sport in ports or dport in ports:
+            return protocol
+    return None
+
+
+class ProtocolIdentifier:
+    """
+    带连接缓存的协议识别器
+    识别成功的连接直接返回缓存结果；无法识别的连接最多重试 MAX_ATTEMPTS 个带数据的报文
+    """
+
+    MAX_FLOWS = 65536
+    MAX_ATTEMPTS = 4
+
+    def __init__(self, max_flows: int = MAX_FLOWS):
+        self.max_flows = max_flows
+        # flow_key -> 协议名，或失败次数（int）
+        self._flows: "OrderedDict[Hashable, object]" = OrderedDict()
+        self.cache_hits = 0
+        self.detections = 0
+
+    def identify(self, key: Hashable, payload: bytes, sport: int = 0, dport: int = 0) -> Optional[str]:
+        """
+        识别报文所属连接的应用层协议
+        没有 payload 的报文不识别（只显示传输层协议）；已识别的连接直接返回缓存结果，不再检查报文内容
+        :param key: 连接标识（见 flow_key），None 表示不使用缓存
+        :return: 协议名（TLS 连接统一为 TLS，记录层版本用 tls_version() 按报文获取），无法识别返回 None
+        """
+        if not payload:
+            return None
+
+        flows = self._flows
+        cached = flows.get(key) if key is not None else None
+        if cached.__class__ is str:
+            self.cache_hits += 1
+            return cached or None
+
+        self.detections += 1
+        protocol = self._detect(payload, sport, dport)
+        if key is None:
+            return protocol
+
+        if protocol is not None:
+            self._remember(key, protocol)
+        elif (cached or 0) + 1 >= self.MAX_ATTEMPTS:
+            # 多次无法识别，不再尝试
+            self._remember(key, "")
+        else:
+            self._remember(key, (cached or 0) + 1)
+        return protocol
+
+    def _detect(self, payload: bytes, sport: int, dport: int) -> Optional[str]:
+        """内容特征优先，端口提示兜底"""
+        match = classify(payload)
+        if match is not None and match.protocol == PROTO_TLS:
+            return PROTO_TLS
+        # SSH/DNS 端口上的数据（包括加密的 SSH 数据）直接按端口归类
+        if sport in SSH_PORTS or dport in SSH_PORTS:
+            return PROTO_SSH
+        if sport in DNS_PORTS or dport in DNS_PORTS:
+            return PROTO_DNS
+        if match is not None:
+            return match.protocol
+        return _port_hint(sport, dport)
+
+    def _remember(self, key: Hashable, value) -> None:
+        flows = self._flows
+        flows[key] = value
+        flows.move_to_end(key)
+        if len(flows) > self.max_flows:
+            flows.popitem(last=False)
+
+    def forget(self, key: Hashable) -> None:
+        """连接结束后移除缓存"""
+        self._flows.pop(key, None)
+
+    def is_settled(self, key: Hashable) -> bool:
+        """连接已识别，或多次无法识别后已放弃（之后的报文不再检查内容）"""
+        return self._flows.get(key).__class__ is str
+
+    def get_verdict(self, key: Hashable) -> Optional[str]:
+        """已缓存的连接协议（未识别返回 None）"""
+        cached = self._flows.get(key)
+        return cached if cached.__class__ is str and cached else None
+
+    def stats(self) -> dict:
+        return {
+            'flows': len(self._flows),
+            'cache_hits': self.cache_hits,
+            'detections': self.detections
+        }
@@ -0,0 +1,172 @@
+"""
+实时抓包会话的有界发送队列
+抓包线程（生产者）与 WebSocket 发送协程（消费者）之间的缓冲，
+浏览器消费过慢时按溢出策略丢弃或降级，保证单个会话的内存占用有上限
+
+溢出策略:
+- drop-oldest: 丢弃队列中最旧的数据包（默认，保证看到最新流量）
+- drop-newest: 丢弃新到的数据包（保留连续的历史）
+- aggregate:   队列满后不再逐包推送，只累计按协议/目标的聚合统计，
+               发送端取空队列后恢复逐包推送
+丢弃和聚合信息以 {"type": "drops"} / {"type": "aggregate"} 消息随数据流下发
+"""
+import asyncio
+import threading
+from collections import deque
+from typing import List, Tuple
+
+OVERFLOW_POLICIES = ("drop-oldest", "drop-newest", "aggregate")
+
+
+class SessionQueue:
+    """单个 WebSocket 会话的有界数据包队列（线程安全写入，协程读取）"""
+
+    # 聚合消息中最多保留的目标地址数量
+    MAX_AGGREGATE_KEYS = 50
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_packets: int = 10000,
+                 policy: str = "drop-oldest"):
+        """
+        :param loop: WebSocket 所在的事件循环
+        :param max_packets: 队列容量（数据包数量）
+        :param policy: 溢出策略，见 OVERFLOW_POLICIES
+        """
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.loop = loop
+        self.max_packets = max(1, max_packets)
+        self.policy = policy
+
+        self._packets = deque()
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+        self._wakeup_pending = False
+
+        # 聚合模式状态
+        self.aggregating = False
+        self._aggregate = None
+
+        # 统计
+        self.enqueued = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.aggregated = 0
+        self.high_water = 0
+        self._dropped_unreported = 0
+
+    def put(self, batch: List[dict]) -> None:
+        """写入一批数据包（抓包线程/批处理线程调用）"""
+        with self._lock:
+            self.enqueued += len(batch)
+            packets = self._packets
+
+            if self.policy == "aggregate":
+                if self.aggregating:
+                    self._add_aggregate(batch)
+                    batch = ()
+                else:
+                    room = self.max_packets - len(packets)
+                    if len(batch) > room:
+                        self.aggregating = True
+                        self._add_aggregate(batch[room:])
+                        batch = batch[:room]
+                packets.extend(batch)
+            elif self.policy == "drop-newest":
+                room = self.max_packets - len(packets)
+                if len(batch) > room:
+                    dropped = len(batch) - max(room, 0)
+                    self.dropped += dropped
+                    self._dropped_unreported += dropped
+                    batch = batch[:max(room, 0)]
+                packets.extend(batch)
+            else:
+                packets.extend(batch)
+                overflow = len(packets) - self.max_packets
+                if overflow > 0:
+                    for _ in range(overflow):
+                        packets.popleft()
+                    self.dropped += overflow
+                    self._dropped_unreported += overflow
+
+            if len(packets) > self.high_water:
+                self.high_water = len(packets)
+
+            # 每轮消费只唤醒一次事件循环
+            if self._wakeup_pending:
+                return
+            self._wakeup_pending = True
+        self.loop.call_soon_threadsafe(self._ready.set)
+
+    async def get(self) -> Tuple[List[dict], List[dict]]:
+        """
+        取出当前积压的全部数据包（协程调用）
+        :return: (数据包列表, 带内通知消息列表)
+        """
+        await self._ready.wait()
+        self._ready.clear()
+        with self._lock:
+            self._wakeup_pending = False
+            packets = list(self._packets)
+            self._packets.clear()
+            self.delivered += len(packets)
+            notices = self._take_notices()
+        return packets, notices
+
+    def _take_notices(self) -> List[dict]:
+        """生成丢弃/聚合通知（持有锁时调用）"""
+        notices = []
+        if self._dropped_unreported:
+            notices.append({
+                "type": "drops",
+                "policy": self.policy,
+                "dropped": self._dropped_unreported,
+                "total_dropped": self.dropped,
+                "capacity": self.max_packets
+            })
+            self._dropped_unreported = 0
+        if self._aggregate:
+            notice = {"type": "aggregate", "policy": self.policy}
+            notice.update(self._aggregate)
+            notices.append(notice)
+            self._aggregate = None
+        # 队列已被取空，恢复逐包推送
+        if self.aggregating:
+            self.aggregating = False
+            notices.append({"type": "aggregate-end", "total_aggregated": self.aggregated})
+        return notices
+
+    def _add_aggregate(self, batch) -> None:
+        """聚合模式：只累计统计（持有锁时调用）"""
+        aggregate = self._aggregate
+        if aggregate is None:
+            aggregate = self._aggregate = {"packets": 0, "bytes": 0, "protocols": {}, "destinations": {}}
+        protocols = aggregate["protocols"]
+        destinations = aggregate["destinations"]
+        total_bytes = 0
+        for packet in batch:
+            protocol = packet.get("protocol", "")
+            protocols[protocol] = protocols.get(protocol, 0) + 1
+            destination = packet.get("destination", "")
+            if destination in destinations or len(destinations) < self.MAX_AGGREGATE_KEYS:
+                destinations[destination] = destinations.get(destination, 0) + 1
+            size = packet.get("size", "")
+            if size[:-1].isdigit():
+                total_bytes += int(size[:-1])
+        aggregate["packets"] += len(batch)
+        aggregate["bytes"] += total_bytes
+        self.aggregated += len(batch)
+
+    def stats(self) -> dict:
+        with self._lock:
+            depth = len(self._packets)
+        return {
+            'policy': self.policy,
+            'capacity': self.max_packets,
+            'depth': depth,
+            'high_water': self.high_water,
+            'enqueued': self.enqueued,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'aggregated': self.aggregated,
+            'aggregating': self.aggregating
+        }
@@ -0,0 +1,91 @@
+"""
+流统计排序索引
+- 每个排序指标一个惰性最大堆：流的指标变化后追加新条目，旧条目留在堆中，查询时按当前值校验后跳过
+- 查询按堆的层次做最优优先遍历，取前 K 个只需要 O(K log K)，不修改堆本身
+- 条目顺序为 (指标降序, stream_id, 是否活动)，与分页游标使用同一个排序键，翻页时不会重复或遗漏
+- 过期条目超过有效条目数量后整体重建（摊销 O(1)）
+"""
+import base64
+import heapq
+import json
+from typing import Callable, Iterator, List, Optional, Tuple
+
+SORT_BYTES = "bytes"
+SORT_PACKETS = "packets"
+SORT_RETRANSMISSION_RATE = "retransmission_rate"
+SORT_DURATION = "duration"
+SORT_KEYS = (SORT_BYTES, SORT_PACKETS, SORT_RETRANSMISSION_RATE, SORT_DURATION)
+
+# 排序指标 -> 流摘要（get_stream_stats）中对应的字段
+SUMMARY_FIELDS = {
+    SORT_BYTES: 'total_bytes',
+    SORT_PACKETS: 'total_packets',
+    SORT_RETRANSMISSION_RATE: 'retransmission_rate',
+    SORT_DURATION: 'duration',
+}
+
+# 条目：(-value, stream_id, active, key)；key 为活动流的流表key，已结束的流为 b''
+Entry = Tuple[float, str, int, bytes]
+
+
+def encode_cursor(entry: Entry) -> str:
+    """排序键 -> 不透明的分页游标"""
+    raw = json.dumps([-entry[0], entry[1], entry[2]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str, int]:
+    """分页游标 -> 可与条目前三项比较的排序键，格式错误抛出 ValueError"""
+    try:
+        value, stream_id, active = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return -float(value), str(stream_id), int(active)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+class LazyTopK:
+    """单个指标的惰性最大堆"""
+
+    __slots__ = ('_heap',)
+
+    def __init__(self):
+        self._heap: List[Entry] = []
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, value: float, stream_id: str, key: bytes) -> None:
+        heapq.heappush(self._heap, (-value, stream_id, 1 if key else 0, key))
+
+    def rebuild(self, entries: List[Entry]) -> None:
+        heapq.heapify(entries)
+        self._heap = entries
+
+    def ordered(self, is_current: Callable[[Entry], bool],
+                after: Optional[Tuple[float, str, int]] = None) -> Iterator[Entry]:
+        """
+        按排序键升序（指标降序）产出当前有效的条目
+        :param is_current: 条目是否仍是该流的当前值
+        :param after: 只产出排序键大于该游标的条目
+        """
+        heap = self._heap
+        if not heap:
+            return
+        size = len(heap)
+        frontier = [(heap[0], 0)]
+        seen = set()
+        while frontier:
+            entry, index = heapq.heappop(frontier)
+            child = 2 * index + 1
+            if child < size:
+                heapq.heappush(frontier, (heap[child], child))
+                if child + 1 < size:
+                    heapq.heappush(frontier, (heap[child + 1], child + 1))
+            if after is not None and entry[:3] <= after:
+                continue
+            # 同一个流可能有多个值相同的条目（比率类指标会回到旧值）
+            identity = entry[1:3]
+            if identity in seen or not is_current(entry):
+                continue
+            seen.add(identity)
+            yield entry
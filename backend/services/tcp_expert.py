@@ -0,0 +1,301 @@
+"""
+TCP 专家分析（类似 Wireshark 的 Expert Info / tcp.analysis）
+每个数据包 O(1) 摊销：
+- 握手 RTT：SYN -> SYN/ACK -> ACK（客户端侧与服务器侧各一段）
+- 数据 RTT：按方向记录新数据段的结束偏移和时间，ACK 覆盖后取样（Karn 算法：重传期间的样本丢弃）
+- 事件：重复 ACK、零窗口、窗口已满、保活、数据传输后的 RST，以及重传/乱序分类
+结果按流保存（StreamExpert），同时增量汇总到服务器端点（ServerExpert）
+"""
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from .fast_decoder import TCP_SYN, TCP_ACK, TCP_FIN, TCP_RST
+from .tcp_retrans import (RetransmissionDetector, RETRANSMISSIONS, SEG_NEW, SEG_KEEP_ALIVE,
+                          SEG_RETRANSMISSION, SEG_FAST_RETRANSMISSION, SEG_SPURIOUS_RETRANSMISSION,
+                          SEG_OUT_OF_ORDER)
+
+EXPERT_DUP_ACK = "dup_ack"
+EXPERT_ZERO_WINDOW = "zero_window"
+EXPERT_WINDOW_FULL = "window_full"
+EXPERT_KEEP_ALIVE = "keep_alive"
+EXPERT_RST_AFTER_DATA = "rst_after_data"
+EXPERT_RETRANSMISSION = SEG_RETRANSMISSION
+EXPERT_FAST_RETRANSMISSION = SEG_FAST_RETRANSMISSION
+EXPERT_SPURIOUS_RETRANSMISSION = SEG_SPURIOUS_RETRANSMISSION
+EXPERT_OUT_OF_ORDER = SEG_OUT_OF_ORDER
+
+EXPERT_EVENTS = (EXPERT_DUP_ACK, EXPERT_ZERO_WINDOW, EXPERT_WINDOW_FULL, EXPERT_KEEP_ALIVE,
+                 EXPERT_RST_AFTER_DATA, EXPERT_RETRANSMISSION, EXPERT_FAST_RETRANSMISSION,
+                 EXPERT_SPURIOUS_RETRANSMISSION, EXPERT_OUT_OF_ORDER)
+
+# 每个方向等待确认的数据段上限（超出后丢弃最旧的，只影响 RTT 取样）
+MAX_PENDING_SEGMENTS = 1024
+
+# 方向下标
+OUT = 0
+IN = 1
+
+_NO_EVENTS: Tuple[str, ...] = ()
+
+
+class RTTStats:
+    """RTT 样本的累计统计（秒）"""
+
+    __slots__ = ('count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, sample: float) -> None:
+        self.count += 1
+        self.total += sample
+        if self.min is None or sample < self.min:
+            self.min = sample
+        if self.max is None or sample > self.max:
+            self.max = sample
+
+    def merge(self, other: 'RTTStats') -> None:
+        if not other.count:
+            return
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def to_state(self) -> tuple:
+        return self.count, self.total, self.min, self.max
+
+    def load_state(self, state: tuple) -> None:
+        self.count, self.total, self.min, self.max = state
+
+    def to_dict(self) -> dict:
+        """毫秒"""
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'min_ms': round(self.min * 1000, 3),
+            'avg_ms': round(self.total / self.count * 1000, 3),
+            'max_ms': round(self.max * 1000, 3)
+        }
+
+
+def _new_counts() -> Dict[str, int]:
+    return dict.fromkeys(EXPERT_EVENTS, 0)
+
+
+class ServerExpert:
+    """按服务器端点汇总的专家分析"""
+
+    __slots__ = ('server', 'streams', 'handshake_rtt', 'request_rtt', 'response_rtt', 'counts')
+
+    def __init__(self, server: str):
+        self.server = server
+        self.streams = 0
+        self.handshake_rtt = RTTStats()
+        self.request_rtt = RTTStats()
+        self.response_rtt = RTTStats()
+        self.counts = _new_counts()
+
+    def merge(self, other: 'ServerExpert') -> None:
+        self.streams += other.streams
+        self.handshake_rtt.merge(other.handshake_rtt)
+        self.request_rtt.merge(other.request_rtt)
+        self.response_rtt.merge(other.response_rtt)
+        for event, count in other.counts.items():
+            self.counts[event] += count
+
+    def to_state(self) -> tuple:
+        """检查点状态（只含内置类型）"""
+        return (self.streams, self.handshake_rtt.to_state(), self.request_rtt.to_state(),
+                self.response_rtt.to_state(), {event: count for event, count in self.counts.items() if count})
+
+    def load_state(self, state: tuple) -> None:
+        """原地恢复（仍在使用该对象的流继续计入）"""
+        self.streams, handshake_rtt, request_rtt, response_rtt, counts = state
+        self.handshake_rtt.load_state(handshake_rtt)
+        self.request_rtt.load_state(request_rtt)
+        self.response_rtt.load_state(response_rtt)
+        self.counts = _new_counts()
+        self.counts.update(counts)
+
+    def to_dict(self) -> dict:
+        return {
+            'server': self.server,
+            'streams': self.streams,
+            'handshake_rtt': self.handshake_rtt.to_dict(),
+            'request_rtt': self.request_rtt.to_dict(),
+            'response_rtt': self.response_rtt.to_dict(),
+            'events': {event: count for event, count in self.counts.items() if count}
+        }
+
+
+class StreamExpert:
+    """单个流的专家分析状态（方向：OUT 为流的发起方向，与 TCPStream.outbound 一致）"""
+
+    __slots__ = ('server', 'client_is_out', 'syn_time', 'synack_time', 'handshake_rtt',
+                 'server_rtt', 'client_rtt', 'rtt', '_pending', '_wscale', '_scaling',
+                 '_edge', 'data_seen', 'counts')
+
+    def __init__(self, server: ServerExpert, client_is_out: bool):
+        """
+        :param server: 服务器端点的汇总对象（事件和 RTT 样本同时计入）
+        :param client_is_out: 客户端（连接发起方）是否为 OUT 方向
+        """
+        self.server = server
+        self.client_is_out = client_is_out
+        self.syn_time: Optional[float] = None
+        self.synack_time: Optional[float] = None
+        # 握手 RTT（SYN -> ACK），服务器侧（SYN -> SYN/ACK），客户端侧（SYN/ACK -> ACK）
+        self.handshake_rtt: Optional[float] = None
+        self.server_rtt: Optional[float] = None
+        self.client_rtt: Optional[float] = None
+        # 数据 RTT：rtt[d] 是 d 方向发送的数据被对端确认的耗时
+        self.rtt = (RTTStats(), RTTStats())
+        # 等待确认的新数据段：(结束偏移, 发送时间)，该方向第一次发送数据时才创建
+        self._pending: List[Optional[deque]] = [None, None]
+        # 窗口缩放：各方向 SYN 中的 WScale（None 表示未携带）；_scaling 为 None 表示没看到握手
+        self._wscale = [None, None]
+        self._scaling: Optional[bool] = None
+        # _edge[d]：d 方向发送的数据可用的窗口右边界（流内偏移），未知为 None
+        self._edge = [None, None]
+        self.data_seen = False
+        self.counts = _new_counts()
+
+    def on_packet(self, outbound: bool, tcp_flags: int, window: int, wscale: Optional[int],
+                  payload_len: int, timestamp: float, sender: RetransmissionDetector,
+                  receiver: RetransmissionDetector, segment_kind: Optional[str],
+                  dup_ack: bool) -> Tuple[str, ...]:
+        """
+        处理一个数据包（在 sender.on_segment / receiver.on_ack 之后调用）
+        :param sender: 本包方向的发送记分板
+        :param receiver: 对端方向的发送记分板（本包的 ACK 确认的是它的数据）
+        :return: 本包触发的事件
+        """
+        events = None
+        direction = OUT if outbound else IN
+        other = IN if outbound else OUT
+
+        # 握手
+        if tcp_flags & TCP_SYN:
+            self._on_syn(direction, tcp_flags, wscale, timestamp)
+        elif (tcp_flags & TCP_ACK and self.synack_time is not None and self.handshake_rtt is None
+              and outbound == self.client_is_out):
+            self.handshake_rtt = timestamp - self.syn_time
+            self.client_rtt = timestamp - self.synack_time
+            self.server.handshake_rtt.add(self.handshake_rtt)
+
+        # ACK：数据 RTT 取样 + 对端可用窗口
+        if tcp_flags & TCP_ACK and receiver.acked is not None:
+            pending = self._pending[other]
+            acked = receiver.acked
+            sent_time = None
+            while pending and pending[0][0] <= acked:
+                sent_time = pending.popleft()[1]
+            if sent_time is not None:
+                sample = timestamp - sent_time
+                self.rtt[other].add(sample)
+                server = self.server
+                (server.request_rtt if (other == OUT) == self.client_is_out else server.response_rtt).add(sample)
+            window_bytes = self._window_bytes(direction, tcp_flags, window)
+            self._edge[other] = acked + window_bytes if window_bytes is not None else None
+
+        # 本方向的数据段
+        if segment_kind is not None:
+            if segment_kind in RETRANSMISSIONS:
+                # Karn 算法：重传后无法区分 ACK 确认的是哪一次发送
+                if self._pending[direction] is not None:
+                    self._pending[direction].clear()
+                events = (segment_kind,)
+            elif segment_kind == SEG_NEW:
+                if payload_len:
+                    pending = self._pending[direction]
+                    if pending is None:
+                        pending = self._pending[direction] = deque(maxlen=MAX_PENDING_SEGMENTS)
+                    pending.append((sender.next_offset, timestamp))
+                    edge = self._edge[direction]
+                    if edge is not None and sender.next_offset >= edge:
+                        events = (EXPERT_WINDOW_FULL,)
+            elif segment_kind == SEG_KEEP_ALIVE:
+                events = (EXPERT_KEEP_ALIVE,)
+            elif segment_kind == SEG_OUT_OF_ORDER:
+                events = (EXPERT_OUT_OF_ORDER,)
+
+        if dup_ack:
+            events = (events or _NO_EVENTS) + (EXPERT_DUP_ACK,)
+        if window == 0 and not tcp_flags & (TCP_SYN | TCP_FIN | TCP_RST):
+            events = (events or _NO_EVENTS) + (EXPERT_ZERO_WINDOW,)
+        if tcp_flags & TCP_RST:
+            if self.data_seen:
+                events = (events or _NO_EVENTS) + (EXPERT_RST_AFTER_DATA,)
+                self.data_seen = False
+        elif payload_len:
+            self.data_seen = True
+
+        if events is None:
+            return _NO_EVENTS
+        counts = self.counts
+        server_counts = self.server.counts
+        for event in events:
+            counts[event] += 1
+            server_counts[event] += 1
+        return events
+
+    def _on_syn(self, direction: int, tcp_flags: int, wscale: Optional[int], timestamp: float) -> None:
+        self._wscale[direction] = wscale
+        if not tcp_flags & TCP_ACK:
+            if self.syn_time is None:
+                self.syn_time = timestamp
+            self._scaling = None
+        elif self.syn_time is not None and self.synack_time is None:
+            self.synack_time = timestamp
+            self.server_rtt = timestamp - self.syn_time
+            # 双方都携带 WScale 才启用窗口缩放
+            self._scaling = self._wscale[0] is not None and self._wscale[1] is not None
+
+    def _window_bytes(self, direction: int, tcp_flags: int, window: int) -> Optional[int]:
+        """本包通告的接收窗口（字节），缩放因子未知时返回 None"""
+        if tcp_flags & TCP_SYN:
+            return window
+        if self._scaling is None:
+            return None
+        if self._scaling:
+            return window << min(self._wscale[direction], 14)
+        return window
+
+    def to_state(self) -> tuple:
+        """
+        检查点状态（只含内置类型）
+        等待确认的数据段和窗口边界与记分板一起在恢复后重新建立
+        """
+        return (self.client_is_out, self.syn_time, self.synack_time, self.handshake_rtt, self.server_rtt,
+                self.client_rtt, self.rtt[OUT].to_state(), self.rtt[IN].to_state(), tuple(self._wscale),
+                self._scaling, self.data_seen, {event: count for event, count in self.counts.items() if count})
+
+    def load_state(self, state: tuple) -> None:
+        (self.client_is_out, self.syn_time, self.synack_time, self.handshake_rtt, self.server_rtt,
+         self.client_rtt, rtt_out, rtt_in, wscale, self._scaling, self.data_seen, counts) = state
+        self.rtt[OUT].load_state(rtt_out)
+        self.rtt[IN].load_state(rtt_in)
+        self._wscale = list(wscale)
+        self.counts = _new_counts()
+        self.counts.update(counts)
+
+    def to_dict(self) -> dict:
+        def ms(value):
+            return round(value * 1000, 3) if value is not None else None
+
+        client, server = (OUT, IN) if self.client_is_out else (IN, OUT)
+        return {
+            'server': self.server.server,
+            'handshake_rtt_ms': ms(self.handshake_rtt),
+            'handshake_server_rtt_ms': ms(self.server_rtt),
+            'handshake_client_rtt_ms': ms(self.client_rtt),
+            # 客户端发送的数据由服务器确认，反之亦然
+            'request_rtt': self.rtt[client].to_dict(),
+            'response_rtt': self.rtt[server].to_dict(),
+            'events': {event: count for event, count in self.counts.items() if count}
+        }
@@ -0,0 +1,299 @@
+"""
+TCP 单方向字节流重组
+- 每个方向独立维护序列号状态（处理 32 位回绕）
+- 乱序到达的报文按区间缓存，缺失的报文到达后自动补齐并按序交付
+- 已按序的数据保存在 bytearray 中，消费方通过 memoryview 切片读取，消费后从头部删除
+- 按序缓存和乱序缓存都有字节上限，超出后丢弃并计数
+- 没有消费方的方向只跟踪序列号（keep_data=False），不保存任何数据
+"""
+import logging
+from bisect import bisect_right
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 单方向按序缓存上限（未被消费的字节）
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+# 单方向乱序缓存上限
+DEFAULT_MAX_PENDING = 2 * 1024 * 1024
+# 超过该距离的报文视为无效（不属于当前窗口）
+MAX_SEQ_GAP = 1 << 30
+
+# add() 的结果
+SEG_EMPTY = "empty"            # 无数据
+SEG_IN_ORDER = "in_order"      # 按序到达
+SEG_HOLE_FILL = "hole_fill"    # 补齐了之前的空洞（迟到的乱序报文）
+SEG_AHEAD = "ahead"            # 前面有缺失，已放入乱序缓存
+SEG_DUPLICATE = "duplicate"    # 数据全部已收到过
+SEG_DROPPED = "dropped"        # 超出上限或序列号异常，已丢弃
+
+_SEQ_MOD = 1 << 32
+_SEQ_HALF = 1 << 31
+
+
+def seq_diff(a: int, b: int) -> int:
+    """序列号差值 a - b（考虑 32 位回绕，结果为有符号数）"""
+    return ((a - b + _SEQ_HALF) % _SEQ_MOD) - _SEQ_HALF
+
+
+class ReassemblyBuffer:
+    """单方向的 TCP 重组缓存"""
+
+    __slots__ = ('max_bytes', 'max_pending', 'keep_data', 'next_seq', 'offset', 'data', 'fin_seen', '_fin_offset',
+                 '_starts', '_segments', '_pending_bytes', '_scan_pos', '_header_end',
+                 'bytes_delivered', 'bytes_duplicate', 'bytes_dropped', 'holes_filled', 'overflows')
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, max_pending: int = DEFAULT_MAX_PENDING,
+                 keep_data: bool = True):
+        """
+        :param keep_data: False 时只跟踪序列号：按序和乱序的数据都不保存，空洞直接跳过，
+                          之后设为 True 从当前的 next_seq 开始重组
+        """
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending
+        self.keep_data = keep_data
+        # 下一个期望的序列号（32 位），None 表示尚未同步
+        self.next_seq: Optional[int] = None
+        # next_seq 对应的流内偏移（不回绕）
+        self.offset = 0
+        # 已按序、未被消费的数据
+        self.data = bytearray()
+        self.fin_seen = False
+        # FIN 所在的流内偏移（FIN 先于前面的数据到达时使用）
+        self._fin_offset: Optional[int] = None
+
+        # 乱序缓存：按流内偏移排序、互不重叠的区间
+        self._starts: List[int] = []
+        self._segments: List[bytes] = []
+        self._pending_bytes = 0
+
+        # HTTP 头部结束位置的增量扫描状态
+        self._scan_pos = 0
+        self._header_end = -1
+
+        self.bytes_delivered = 0
+        self.bytes_duplicate = 0
+        self.bytes_dropped = 0
+        self.holes_filled = 0
+        self.overflows = 0
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def pending_bytes(self) -> int:
+        """乱序缓存中的字节数"""
+        return self._pending_bytes
+
+    def add(self, seq: int, payload: bytes, syn: bool = False, fin: bool = False) -> str:
+        """
+        加入一个报文段
+        :param seq: 报文序列号
+        :param payload: TCP payload
+        :param syn: 是否带 SYN（占用一个序列号）
+        :param fin: 是否带 FIN（占用一个序列号）
+        :return: SEG_* 之一
+        """
+        if self.next_seq is None:
+            if syn:
+                self.next_seq = (seq + 1) % _SEQ_MOD
+            elif payload:
+                # 中途开始抓包的连接：从第一个带数据的报文开始同步
+                self.next_seq = seq
+            else:
+                return SEG_EMPTY
+        elif syn:
+            # 重复的 SYN 不影响已同步的序列号
+            return SEG_EMPTY
+
+        size = len(payload)
+        delta = seq_diff(seq, self.next_seq)
+        if delta > MAX_SEQ_GAP or delta < -MAX_SEQ_GAP:
+            self.bytes_dropped += size
+            return SEG_DROPPED
+
+        start = self.offset + delta
+        end = start + size
+        if fin and not self.fin_seen:
+            self._fin_offset = end
+        if not size:
+            self._check_fin()
+            return SEG_EMPTY
+        if end <= self.offset:
+            self.bytes_duplicate += size
+            return SEG_DUPLICATE
+
+        if not self.keep_data:
+            return self._skip_to(start, end)
+
+        if start > self.offset:
+            return self._store_ahead(start, payload)
+
+        # 与已交付数据部分重叠：只保留新数据
+        if start < self.offset:
+            self.bytes_duplicate += self.offset - start
+            payload = memoryview(payload)[self.offset - start:]
+
+        filled = bool(self._starts)
+        self._deliver(payload)
+        if filled:
+            self._drain()
+        self._check_fin()
+        return SEG_HOLE_FILL if filled else SEG_IN_ORDER
+
+    def _deliver(self, payload) -> None:
+        size = len(payload)
+        if len(self.data) + size > self.max_bytes:
+            # 超出上限：丢弃未消费的数据，继续跟踪序列号
+            self.overflows += 1
+            self.bytes_dropped += len(self.data) + size
+            self.data.clear()
+            self._scan_pos = 0
+            self._header_end = -1
+        else:
+            self.data += payload
+        self.offset += size
+        self.next_seq = (self.next_seq + size) % _SEQ_MOD
+        self.bytes_delivered += size
+
+    def _skip_to(self, start: int, end: int) -> str:
+        """只跟踪序列号：推进到报文结尾，不保存数据（前面的空洞视为已跳过）"""
+        ahead = start > self.offset
+        self.next_seq = (self.next_seq + end - self.offset) % _SEQ_MOD
+        self.offset = end
+        self._check_fin()
+        return SEG_AHEAD if ahead else SEG_IN_ORDER
+
+    def track_only(self) -> None:
+        """不再保存数据：丢弃按序和乱序缓存，之后只跟踪序列号"""
+        self.keep_data = False
+        self.clear()
+        self._starts.clear()
+        self._segments.clear()
+        self._pending_bytes = 0
+
+    def _check_fin(self) -> None:
+        """FIN 之前的数据全部到齐后，FIN 占用一个序列号"""
+        if self._fin_offset is not None and self._fin_offset == self.offset and not self.fin_seen:
+            self.fin_seen = True
+            self.next_seq = (self.next_seq + 1) % _SEQ_MOD
+            self.offset += 1
+
+    def _store_ahead(self, start: int, payload: bytes) -> str:
+        """放入乱序缓存，只保存与已有区间不重叠的部分"""
+        starts = self._starts
+        segments = self._segments
+        end = start + len(payload)
+        cursor = start
+        stored = 0
+        index = bisect_right(starts, cursor) - 1
+        if index < 0:
+            index = 0
+        while cursor < end:
+            # 跳过已被覆盖的部分
+            if index < len(starts) and starts[index] <= cursor:
+                covered_end = starts[index] + len(segments[index])
+                if covered_end > cursor:
+                    cursor = covered_end
+                index += 1
+                continue
+            gap_end = min(end, starts[index]) if index < len(starts) else end
+            piece = payload[cursor - start:gap_end - start]
+            if self._pending_bytes + len(piece) > self.max_pending:
+                self.bytes_dropped += end - cursor
+                break
+            starts.insert(index, cursor)
+            segments.insert(index, bytes(piece))
+            self._pending_bytes += len(piece)
+            stored += len(piece)
+            index += 1
+            cursor = gap_end
+
+        if not stored:
+            if cursor < end:
+                return SEG_DROPPED
+            self.bytes_duplicate += len(payload)
+            return SEG_DUPLICATE
+        return SEG_AHEAD
+
+    def _drain(self) -> None:
+        """把已经连续的乱序区间移入按序缓存"""
+        starts = self._starts
+        segments = self._segments
+        count = 0
+        while count < len(starts) and starts[count] <= self.offset:
+            start = starts[count]
+            segment = segments[count]
+            self._pending_bytes -= len(segment)
+            skip = self.offset - start
+            if skip < len(segment):
+                self._deliver(memoryview(segment)[skip:])
+            count += 1
+        if count:
+            del starts[:count]
+            del segments[:count]
+            self.holes_filled += 1
+
+    def view(self, start: int = 0, end: Optional[int] = None) -> memoryview:
+        """
+        按序数据的零拷贝视图
+        视图有效期到下一次 add/consume 之前，使用完应及时 release（或用 with 语句）
+        """
+        return memoryview(self.data)[start:end]
+
+    def consume(self, size: int) -> None:
+        """消费（删除）头部 size 字节"""
+        if size >= len(self.data):
+            self.data.clear()
+            self._scan_pos = 0
+            self._header_end = -1
+            return
+        del self.data[:size]
+        if self._header_end >= size:
+            self._header_end -= size
+            self._scan_pos = max(0, self._scan_pos - size)
+        elif self._header_end >= 0:
+            # 已找到的头部被消费，下一条消息从头扫描
+            self._header_end = -1
+            self._scan_pos = 0
+        else:
+            self._scan_pos = max(0, self._scan_pos - size)
+
+    def clear(self) -> None:
+        """丢弃未消费的按序数据（不影响序列号跟踪）"""
+        self.consume(len(self.data))
+
+    def header_end(self) -> int:
+        """
+        HTTP 头部结束位置（\\r\\n\\r\\n 的下标，未找到返回 -1）
+        增量扫描：新到达的数据只扫描一次，大 body 不会被反复查找
+        """
+        if self._header_end < 0:
+            data = self.data
+            position = data.find(b'\r\n\r\n', self._scan_pos)
+            if position >= 0:
+                self._header_end = position
+            else:
+                self._scan_pos = max(0, len(data) - 3)
+        return self._header_end
+
+    def missing_bytes(self) -> int:
+        """乱序缓存前的空洞总长度"""
+        missing = 0
+        cursor = self.offset
+        for start, segment in zip(self._starts, self._segments):
+            missing += start - cursor
+            cursor = start + len(segment)
+        return missing
+
+    def stats(self) -> dict:
+        return {
+            'buffered': len(self.data),
+            'pending': self._pending_bytes,
+            'pending_segments': len(self._starts),
+            'delivered': self.bytes_delivered,
+            'duplicate': self.bytes_duplicate,
+            'dropped': self.bytes_dropped,
+            'holes_filled': self.holes_filled,
+            'overflows': self.overflows
+        }
@@ -0,0 +1,183 @@
+"""
+TCP 重传检测（单方向）
+按发送方向维护已发送、未确认的序列号区间集合（类似 SACK 记分板），
+对端 ACK 推进时裁剪已确认的区间，内存占用与窗口大小相关，而不是与连接时长相关
+
+分类（与 Wireshark 的 tcp.analysis 含义一致）:
+- retransmission:         数据与之前发送过的区间重叠（包括部分重叠）
+- fast_retransmission:    对端已发送 >= 2 个重复 ACK，且重传的正是对端等待的序列号
+- spurious_retransmission: 数据已经被对端确认过
+- keep_alive:             序列号为 next_seq - 1、长度 <= 1 的探测报文
+- out_of_order:           序列号小于已发送的最高序列号，但该区间之前没有出现过（补洞）
+"""
+from bisect import bisect_left, bisect_right
+from typing import List, Optional
+
+from .fast_decoder import TCP_SYN, TCP_FIN, TCP_RST
+from .tcp_reassembly import seq_diff
+
+SEG_NONE = None
+SEG_NEW = "new"
+SEG_RETRANSMISSION = "retransmission"
+SEG_FAST_RETRANSMISSION = "fast_retransmission"
+SEG_SPURIOUS_RETRANSMISSION = "spurious_retransmission"
+SEG_KEEP_ALIVE = "keep_alive"
+SEG_OUT_OF_ORDER = "out_of_order"
+
+RETRANSMISSIONS = frozenset((SEG_RETRANSMISSION, SEG_FAST_RETRANSMISSION, SEG_SPURIOUS_RETRANSMISSION))
+
+# 快速重传需要的重复 ACK 数量
+FAST_RETRANSMIT_DUP_ACKS = 2
+# 区间数量上限（只有对端 ACK 丢失/未抓到时才会累积），超出后合并最低的两个区间
+DEFAULT_MAX_RANGES = 256
+
+_SEQ_MOD = 1 << 32
+
+
+class RetransmissionDetector:
+    """单方向的发送记分板"""
+
+    __slots__ = ('max_ranges', 'next_seq', 'next_offset', 'acked', '_starts', '_ends',
+                 'last_ack', 'last_window', 'dup_acks', 'dup_ack_total', 'merges')
+
+    def __init__(self, max_ranges: int = DEFAULT_MAX_RANGES):
+        self.max_ranges = max_ranges
+        # 已发送的最高序列号 + 1（32 位），None 表示尚未看到该方向的报文
+        self.next_seq: Optional[int] = None
+        # next_seq 对应的流内偏移（不回绕）
+        self.next_offset = 0
+        # 对端已确认到的流内偏移
+        self.acked: Optional[int] = None
+        # 已发送、未确认的区间 [start, end)，按 start 排序且互不重叠
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+
+        # 对端 ACK 状态（用于重复 ACK / 快速重传判断）
+        self.last_ack: Optional[int] = None
+        self.last_window = None
+        self.dup_acks = 0
+        self.dup_ack_total = 0
+        self.merges = 0
+
+    def __len__(self) -> int:
+        """在途区间数量"""
+        return len(self._starts)
+
+    def _offset(self, seq: int) -> int:
+        return self.next_offset + seq_diff(seq, self.next_seq)
+
+    def on_ack(self, ack: int, window: int = None, pure: bool = False) -> bool:
+        """
+        处理对端发来的 ACK（确认本方向的数据）
+        :param ack: 确认号
+        :param window: 对端通告窗口
+        :param pure: 是否为不带数据、不带 SYN/FIN/RST 的纯 ACK（只有纯 ACK 计入重复 ACK）
+        :return: 是否为重复 ACK
+        """
+        if self.next_seq is None:
+            return False
+        offset = self._offset(ack)
+        duplicate = False
+        if self.last_ack is not None and offset == self.last_ack:
+            if pure and window == self.last_window and self._starts:
+                self.dup_acks += 1
+                self.dup_ack_total += 1
+                duplicate = True
+        elif self.last_ack is None or offset > self.last_ack:
+            self.dup_acks = 0
+            self.last_ack = offset
+        self.last_window = window
+
+        if self.acked is None or offset > self.acked:
+            self.acked = offset
+            self._prune(offset)
+        return duplicate
+
+    def _prune(self, acked: int) -> None:
+        """删除已确认的区间"""
+        starts = self._starts
+        ends = self._ends
+        count = bisect_right(ends, acked)
+        if count:
+            del starts[:count]
+            del ends[:count]
+        if starts and starts[0] < acked:
+            starts[0] = acked
+
+    def on_segment(self, seq: int, payload_len: int, tcp_flags: int) -> Optional[str]:
+        """
+        处理本方向发送的报文
+        :return: SEG_* 分类，纯 ACK 返回 None
+        """
+        size = payload_len + (1 if tcp_flags & TCP_SYN else 0) + (1 if tcp_flags & TCP_FIN else 0)
+        if self.next_seq is None:
+            if not size:
+                return SEG_NONE
+            self.next_seq = seq
+        if not size or tcp_flags & TCP_RST:
+            return SEG_NONE
+
+        start = self._offset(seq)
+        end = start + size
+        next_offset = self.next_offset
+
+        if (payload_len <= 1 and start == next_offset - 1
+                and not tcp_flags & (TCP_SYN | TCP_FIN)):
+            kind = SEG_KEEP_ALIVE
+        elif start >= next_offset:
+            kind = SEG_NEW
+        elif self.acked is not None and end <= self.acked:
+            kind = SEG_SPURIOUS_RETRANSMISSION
+        elif self._overlaps(start, end) or (self.acked is not None and start < self.acked):
+            if self.dup_acks >= FAST_RETRANSMIT_DUP_ACKS and start == self.last_ack:
+                kind = SEG_FAST_RETRANSMISSION
+            else:
+                kind = SEG_RETRANSMISSION
+        else:
+            kind = SEG_OUT_OF_ORDER
+
+        if kind is not SEG_KEEP_ALIVE:
+            if self.acked is not None and start < self.acked:
+                start = self.acked
+            if end > start:
+                self._insert(start, end)
+            if end > next_offset:
+                self.next_seq = (self.next_seq + end - next_offset) % _SEQ_MOD
+                self.next_offset = end
+        return kind
+
+    def _overlaps(self, start: int, end: int) -> bool:
+        index = bisect_right(self._starts, start) - 1
+        if index >= 0 and self._ends[index] > start:
+            return True
+        index += 1
+        return index < len(self._starts) and self._starts[index] < end
+
+    def _insert(self, start: int, end: int) -> None:
+        """加入区间并与相邻/重叠区间合并"""
+        starts = self._starts
+        ends = self._ends
+        # 第一个可能与 [start, end) 相交或相邻的区间
+        low = bisect_left(ends, start)
+        high = bisect_right(starts, end)
+        if low < high:
+            start = min(start, starts[low])
+            end = max(end, ends[high - 1])
+            del starts[low:high]
+            del ends[low:high]
+        starts.insert(low, start)
+        ends.insert(low, end)
+        if len(starts) > self.max_ranges:
+            # 对端 ACK 缺失时防止无限增长：合并最低的两个区间
+            ends[0] = ends[1]
+            del starts[1]
+            del ends[1]
+            self.merges += 1
+
+    def stats(self) -> dict:
+        return {
+            'in_flight_ranges': len(self._starts),
+            'in_flight_bytes': sum(e - s for s, e in zip(self._starts, self._ends)),
+            'dup_acks': self.dup_ack_total,
+            'merges': self.merges
+        }
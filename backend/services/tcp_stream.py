@@ -2,29 +2,73 @@
 TCP流管理器
 负责追踪TCP连接、重组数据、检测重传
 """
+import heapq
 import logging
-from typing import Dict, Optional, List, Tuple
+import threading
+from collections import OrderedDict
+from itertools import islice
+from typing import Callable, Dict, Optional, List, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
-from scapy.all import TCP, IP
+from scapy.all import TCP
+
+from .fast_decoder import PacketRecord, TCP_SYN, TCP_FIN, TCP_RST, TCP_ACK
+from .capture_log import hot_log
+from .flow_table import pack_flow_key
+from .payload_store import (PayloadStore, header_prefix, RETENTION_MODES,
+                            RETENTION_NONE, RETENTION_HEADERS, RETENTION_FULL)
+from .tcp_expert import StreamExpert, ServerExpert
+from .tcp_reassembly import ReassemblyBuffer, DEFAULT_MAX_BYTES, DEFAULT_MAX_PENDING
+from .tcp_retrans import (RetransmissionDetector, RETRANSMISSIONS, SEG_FAST_RETRANSMISSION,
+                          SEG_SPURIOUS_RETRANSMISSION, SEG_KEEP_ALIVE, SEG_OUT_OF_ORDER)
+from .timer_wheel import TimerWheel
+from .stream_index import (LazyTopK, Entry, encode_cursor, decode_cursor, SORT_KEYS, SUMMARY_FIELDS,
+                           SORT_BYTES, SORT_PACKETS, SORT_RETRANSMISSION_RATE, SORT_DURATION)
 
 logger = logging.getLogger(__name__)
 
+# 流表淘汰默认参数
+DEFAULT_IDLE_TIMEOUT = 300.0       # 空闲超时（秒）
+DEFAULT_CLOSE_LINGER = 5.0         # FIN/RST 后保留的时间，用于接收最后的 ACK/重传
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+DEFAULT_MAX_RETIRED = 10000        # 保留的已结束流摘要数量
+DEFAULT_MAX_SERVERS = 4096         # 专家分析按服务器汇总的端点数量上限
+
+# 内存估算（字节）：对象本身的开销，不含 payload
+_STREAM_OVERHEAD = 2048
+_PACKET_OVERHEAD = 200
+_RANGE_OVERHEAD = 64
+
+# TCPStream.close_mask
+CLOSE_FIN_OUT = 0x01
+CLOSE_FIN_IN = 0x02
+CLOSE_RST = 0x04
+CLOSE_FIN_BOTH = CLOSE_FIN_OUT | CLOSE_FIN_IN
 
-@dataclass
+# 流结束原因
+RETIRED_FIN = "fin"
+RETIRED_RST = "rst"
+RETIRED_IDLE = "idle"
+RETIRED_MEMORY = "memory"
+
+
+@dataclass(slots=True)
 class TCPPacket:
     """TCP数据包信息"""
     timestamp: float
     seq: int
     ack: int
     flags: str  # SYN, ACK, FIN, PSH, RST
-    payload: bytes
+    payload: bytes  # 内存中保留的 payload（按保留策略：空 / 头部 / 完整）
     payload_len: int
     window_size: int
     is_retransmission: bool = False
+    outbound: bool = True
+    # full 模式下 payload 在 PayloadStore 中的偏移，-1 表示未落盘
+    payload_offset: int = -1
     
 
-@dataclass
+@dataclass(slots=True)
 class TCPStream:
     """TCP流（单个连接）"""
     stream_id: str  # 五元组标识符
@@ -41,36 +85,199 @@ class TCPStream:
     # 数据包列表
     packets: List[TCPPacket] = field(default_factory=list)
     
-    # 序列号追踪（用于检测重传）
-    seen_sequences: Dict[int, float] = field(default_factory=dict)  # seq -> timestamp
+    # 序列号追踪（用于检测重传，每个方向一个发送记分板）
+    outbound_tx: RetransmissionDetector = field(default_factory=RetransmissionDetector)
+    inbound_tx: RetransmissionDetector = field(default_factory=RetransmissionDetector)
     
     # 统计信息
     total_packets: int = 0
     total_bytes: int = 0
-    retransmission_count: int = 0
+    retransmission_count: int = 0  # 包括快速重传和虚假重传
+    fast_retransmission_count: int = 0
+    spurious_retransmission_count: int = 0
+    keep_alive_count: int = 0
     out_of_order_count: int = 0
     
-    # 期望的下一个序列号
-    expected_seq: Optional[int] = None
+    # 最后一个包的时间（空闲超时依据）
+    last_seen: float = 0.0
+    # 连接关闭标志：CLOSE_FIN_OUT | CLOSE_FIN_IN | CLOSE_RST
+    close_mask: int = 0
+    # 估算的内存占用（字节，不含重组缓存）
+    memory: int = 0
+    # 重组缓存中未被消费的字节数（两个方向，含乱序缓存）
+    buffered: int = 0
+    # 数据包在内存中保留的 payload 字节数
+    retained_bytes: int = 0
+    # 专家分析（RTT、重复 ACK、零窗口等）
+    expert: Optional[StreamExpert] = None
+    
+    # === HTTP重组缓存（每个方向独立的序列号状态） ===
+    # 出站方向（客户端 -> 服务器）
+    outbound: ReassemblyBuffer = field(default_factory=lambda: ReassemblyBuffer(keep_data=False))
+    # 入站方向（服务器 -> 客户端）
+    inbound: ReassemblyBuffer = field(default_factory=lambda: ReassemblyBuffer(keep_data=False))
+    # 是否保留重组数据：None 尚未决定，False 只跟踪序列号（见 TCPStreamManager.wants_reassembly）
+    reassembly: Optional[bool] = None
+    
+    @property
+    def outbound_buffer(self) -> bytearray:
+        """出站方向已按序重组、未被消费的数据"""
+        return self.outbound.data
+    
+    @property
+    def inbound_buffer(self) -> bytearray:
+        """入站方向已按序重组、未被消费的数据"""
+        return self.inbound.data
+    
+
+def _stream_duration(stream: TCPStream) -> float:
+    """流持续时间（抓包时间，活动流到最后一个包为止）"""
+    if not stream.start_time:
+        return 0
+    return (stream.end_time or stream.last_seen) - stream.start_time
+
+
+# 排序指标 -> 活动流的当前值
+_STREAM_METRICS = {
+    SORT_BYTES: lambda stream: stream.total_bytes,
+    SORT_PACKETS: lambda stream: stream.total_packets,
+    SORT_RETRANSMISSION_RATE: lambda stream: (stream.retransmission_count / stream.total_packets
+                                              if stream.total_packets > 0 else 0),
+    SORT_DURATION: _stream_duration,
+}
+
+
+def _stream_last_seen(stream: TCPStream) -> float:
+    return stream.last_seen
+
+
+def _server_order(server: ServerExpert) -> Tuple[int, str]:
+    """服务器汇总的排序：连接数降序，相同时按端点"""
+    return -server.streams, server.server
+
+
+def _stream_page(page: List[Tuple[Entry, dict]], sort_by: str, limit: int, total: int) -> dict:
+    return {
+        'sort_by': sort_by,
+        'streams': [summary for _, summary in page],
+        'next_cursor': encode_cursor(page[-1][0]) if page and len(page) >= limit else None,
+        'total': total
+    }
+
+
+class SharedMemoryBudget:
+    """
+    多个流管理器（分片）共用的内存预算
+    每个分片只写自己的 memory_used；总用量超出预算时，由用量超过平均份额的分片淘汰自己最久未活动的流，
+    流量集中在少数分片时这些分片可以使用其他分片空闲的预算；
+    超出份额的分片没有新数据包时，在推进定时器时淘汰（ShardedTCPStreamManager 每秒一次）。
+    读取其他分片的用量不加锁（只读一个 int），短暂的不一致只影响淘汰的时机
+    """
+    
+    def __init__(self, total: int):
+        self.total = total
+        self.managers: List["TCPStreamManager"] = []
+        self.share = total
+    
+    def attach(self, manager: "TCPStreamManager") -> None:
+        self.managers.append(manager)
+        manager.shared_budget = self
+        self.share = max(1, self.total // len(self.managers))
+    
+    def used(self) -> int:
+        return sum(manager.memory_used for manager in self.managers)
     
-    # === HTTP重组缓存 ===
-    # 出站方向payload（客户端 -> 服务器）
-    outbound_buffer: bytes = field(default_factory=bytes)
-    # 入站方向payload（服务器 -> 客户端）
-    inbound_buffer: bytes = field(default_factory=bytes)
+    def exceeded_by(self, manager: "TCPStreamManager") -> bool:
+        """总用量超出预算，且该分片的用量超过平均份额（应由它淘汰）"""
+        return manager.memory_used > self.share and self.used() > self.total
     
 
 class TCPStreamManager:
-    """TCP流管理器 - 追踪所有TCP连接"""
+    """
+    TCP流管理器 - 追踪所有TCP连接
+    不加锁：只能在一个线程中使用，处理数据包的同时需要查询时使用 ShardedTCPStreamManager
+    """
     
-    def __init__(self):
-        self.streams: Dict[str, TCPStream] = {}
+    def __init__(self, max_stream_bytes: int = DEFAULT_MAX_BYTES, max_pending_bytes: int = DEFAULT_MAX_PENDING,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT, close_linger: float = DEFAULT_CLOSE_LINGER,
+                 memory_budget: int = DEFAULT_MEMORY_BUDGET, max_retired: int = DEFAULT_MAX_RETIRED,
+                 payload_retention: str = RETENTION_FULL, payload_store: Optional[PayloadStore] = None):
+        """
+        :param max_stream_bytes: 每个流每个方向未被消费的重组数据上限
+        :param max_pending_bytes: 每个流每个方向乱序缓存上限
+        :param idle_timeout: 无数据包超过该时间的流被淘汰（秒）
+        :param close_linger: 双向 FIN 或 RST 之后再保留的时间（秒）
+        :param memory_budget: 所有活动流的估算内存上限，超出后按 LRU 淘汰
+        :param max_retired: 保留的已结束流摘要数量
+        :param payload_retention: 数据包 payload 保留策略 none | headers | full
+        :param payload_store: full 模式的落盘存储，None 时在第一次写入时创建
+        """
+        if payload_retention not in RETENTION_MODES:
+            raise ValueError(f"Unknown payload retention: {payload_retention}")
+        # 按最近活动排序（LRU：最久未活动的在最前）
+        self.streams: Dict[bytes, TCPStream] = OrderedDict()
+        self.max_stream_bytes = max_stream_bytes
+        self.max_pending_bytes = max_pending_bytes
+        self.idle_timeout = idle_timeout
+        self.close_linger = close_linger
+        self.memory_budget = memory_budget
+        # 与其他分片共用的预算（由 SharedMemoryBudget.attach 设置），None 时只受 memory_budget 限制
+        self.shared_budget: Optional[SharedMemoryBudget] = None
+        self.max_retired = max_retired
+        self.payload_retention = payload_retention
+        self.payload_store = payload_store
+        
+        # 已结束流的摘要（stream_id -> get_stream_stats 格式的字典）
+        self.retired: Dict[str, dict] = OrderedDict()
+        self._timers = TimerWheel(tick=1.0, slots=512)
+        self.memory_used = 0
+        # 重组缓存中未被消费的字节（由消费方决定何时释放，不计入 memory_budget，每个方向受 max_stream_bytes 限制）
+        self.reassembly_bytes = 0
+        # 流被淘汰时的回调（参数为 stream），用于清理其他组件中按流缓存的状态
+        self.on_retire: Optional[Callable[[TCPStream], None]] = None
+        # 重组数据的消费方（如 HTTP 解析器）：流尚未决定时对每个带数据的报文调用（参数为 stream, record），
+        # 返回 True 开始保留两个方向的重组数据，False 只跟踪序列号，None 留到下一个报文再决定；
+        # 未设置时所有流只跟踪序列号
+        self.wants_reassembly: Optional[Callable[[TCPStream, PacketRecord], Optional[bool]]] = None
+        
+        # 淘汰统计
+        self.eviction_counts = {RETIRED_FIN: 0, RETIRED_RST: 0, RETIRED_IDLE: 0, RETIRED_MEMORY: 0}
+        self.summaries_dropped = 0
+        self.peak_streams = 0
+        self.peak_memory = 0
+        
+        # 排序索引：每个指标一个惰性堆；有新数据包的流先记为脏，查询时才写入索引
+        self._rankings = {sort_by: LazyTopK() for sort_by in SORT_KEYS}
+        self._dirty = set()
+        # 需要整体重建的索引（下次按该指标查询时重建）
+        self._stale_rankings = set()
+        
+        # 专家分析的服务器端点汇总（"ip:port" -> ServerExpert），按最近新建连接排序
+        self.servers: Dict[str, ServerExpert] = OrderedDict()
+        self.max_servers = DEFAULT_MAX_SERVERS
+        
+        # 检查点：上次检查点之后有数据包的流和汇总有变化的服务器端点（第一次检查点之前为 None，不产生开销）
+        # 端点单独记录：流在两次检查点之间结束后不再出现在 _changed 中，但它对端点汇总的更新仍需写入
+        self._changed: Optional[set] = None
+        self._changed_servers: Optional[set] = None
+        # 累计结束的流数量，以及上次检查点时的值（增量中只包含之后结束的流）
+        self.retired_total = 0
+        self._checkpoint_retired = 0
         logger.info("TCP Stream Manager initialized")
     
-    def _get_stream_key(self, src_ip: str, src_port: int, dst_ip: str, dst_port: int) -> str:
+    @staticmethod
+    def _get_stream_key(src_ip: str, src_port: int, dst_ip: str, dst_port: int) -> bytes:
+        """
+        生成双向连接标识符（打包的二进制五元组）
+        无论方向，都生成相同的key；逐包只做字节拼接，不再格式化字符串
+        """
+        return pack_flow_key(src_ip, src_port, dst_ip, dst_port)[0]
+    
+    @staticmethod
+    def format_stream_id(src_ip: str, src_port: int, dst_ip: str, dst_port: int) -> str:
         """
-        生成双向连接标识符
-        无论方向，都生成相同的key
+        对外展示的流ID（只在创建流时生成一次）
+        无论方向，都生成相同的ID
         """
         # 排序确保双向一致
         if (src_ip, src_port) < (dst_ip, dst_port):
@@ -78,9 +285,32 @@ class TCPStreamManager:
         else:
             return f"{dst_ip}:{dst_port}-{src_ip}:{src_port}"
     
+    def _new_stream_id(self, src_ip: str, src_port: int, dst_ip: str, dst_port: int) -> str:
+        """
+        新建流的ID：同一五元组的流结束（或被淘汰）后再次出现时，摘要仍保留着原来的ID，
+        新的流加上序号（"...#2"），保证每个流ID只对应一个流
+        """
+        stream_id = self.format_stream_id(src_ip, src_port, dst_ip, dst_port)
+        if stream_id not in self.retired:
+            return stream_id
+        generation = 2
+        while f"{stream_id}#{generation}" in self.retired:
+            generation += 1
+        return f"{stream_id}#{generation}"
+    
+    def _key_from_stream_id(self, stream_id: str) -> Optional[bytes]:
+        """流ID字符串（可带 #序号）-> 打包的流表key，格式错误返回 None"""
+        try:
+            a, b = stream_id.partition('#')[0].split('-', 1)
+            ip_a, port_a = a.rsplit(':', 1)
+            ip_b, port_b = b.rsplit(':', 1)
+            return self._get_stream_key(ip_a, int(port_a), ip_b, int(port_b))
+        except (ValueError, OSError):
+            return None
+    
     def process_packet(self, pkt, timestamp: float = None) -> Tuple[TCPStream, TCPPacket, dict]:
         """
-        处理TCP数据包
+        处理TCP数据包（Scapy 对象）
         
         :return: (stream, tcp_packet, analysis) 
                  analysis包含: is_retransmission, is_out_of_order等
@@ -89,154 +319,399 @@ class TCPStreamManager:
             timestamp = datetime.now().timestamp()
         
         # 提取IP和TCP层
-        if not pkt.haslayer(IP) or not pkt.haslayer(TCP):
+        if not pkt.haslayer(TCP):
             return None, None, {}
         
-        ip_layer = pkt[IP]
-        tcp_layer = pkt[TCP]
+        record = PacketRecord.from_scapy(pkt, timestamp)
+        if record is None:
+            return None, None, {}
+        
+        return self.process_record(record, timestamp)
+    
+    def process_record(self, record: PacketRecord, timestamp: float = None,
+                       stream_key: Optional[bytes] = None) -> Tuple[TCPStream, TCPPacket, dict]:
+        """
+        处理TCP数据包（快速解码记录）
+        
+        :param stream_key: 调用方已计算好的流表key（分片管理器传入，避免重复打包）
+        :return: (stream, tcp_packet, analysis) 
+                 analysis包含: is_retransmission, is_out_of_order等
+        """
+        if not record.is_tcp:
+            return None, None, {}
+        
+        if not timestamp:
+            timestamp = record.timestamp or datetime.now().timestamp()
         
         # 获取五元组
-        src_ip = ip_layer.src
-        dst_ip = ip_layer.dst
-        src_port = tcp_layer.sport
-        dst_port = tcp_layer.dport
+        src_ip = record.src_ip
+        dst_ip = record.dst_ip
+        src_port = record.sport
+        dst_port = record.dport
+        
+        # 处理到期的空闲/已关闭流
+        self.expire(timestamp)
         
         # 获取或创建流
-        stream_key = self._get_stream_key(src_ip, src_port, dst_ip, dst_port)
+        if stream_key is None:
+            stream_key = self._get_stream_key(src_ip, src_port, dst_ip, dst_port)
         
-        if stream_key not in self.streams:
-            self.streams[stream_key] = TCPStream(
-                stream_id=stream_key,
+        stream = self.streams.get(stream_key)
+        if stream is None:
+            stream = self.streams[stream_key] = TCPStream(
+                stream_id=self._new_stream_id(src_ip, src_port, dst_ip, dst_port),
                 src_ip=src_ip,
                 src_port=src_port,
                 dst_ip=dst_ip,
                 dst_port=dst_port,
-                start_time=timestamp
+                start_time=timestamp,
+                outbound=ReassemblyBuffer(self.max_stream_bytes, self.max_pending_bytes, keep_data=False),
+                inbound=ReassemblyBuffer(self.max_stream_bytes, self.max_pending_bytes, keep_data=False)
             )
-        
-        stream = self.streams[stream_key]
+            stream.expert = self._new_expert(record)
+            self._timers.schedule(stream_key, timestamp + self.idle_timeout)
+            if len(self.streams) > self.peak_streams:
+                self.peak_streams = len(self.streams)
+        else:
+            self.streams.move_to_end(stream_key)
+        stream.last_seen = timestamp
+        self._dirty.add(stream_key)
+        if self._changed is not None:
+            self._changed.add(stream_key)
+            self._changed_servers.add(stream.expert.server.server)
         
         # 提取TCP信息
-        seq = tcp_layer.seq
-        ack = tcp_layer.ack
-        flags = self._get_tcp_flags(tcp_layer)
-        payload = bytes(tcp_layer.payload) if tcp_layer.payload else b''
+        seq = record.seq
+        ack = record.ack
+        flags = record.flags
+        payload = record.payload
         payload_len = len(payload)
-        window_size = tcp_layer.window
+        window_size = record.window
+        
+        tcp_flags = record.tcp_flags
+        
+        # 出站：与流的发起方向一致
+        outbound = src_ip == stream.src_ip and src_port == stream.src_port
+        if outbound:
+            sender, receiver = stream.outbound_tx, stream.inbound_tx
+        else:
+            sender, receiver = stream.inbound_tx, stream.outbound_tx
+        
+        # ACK 确认的是对端方向的数据；纯 ACK 才计入重复 ACK
+        dup_ack = False
+        if tcp_flags & TCP_ACK:
+            pure = not payload_len and not tcp_flags & (TCP_SYN | TCP_FIN | TCP_RST)
+            dup_ack = receiver.on_ack(ack, window_size, pure)
+        
+        # 检测重传/乱序/保活
+        segment_kind = sender.on_segment(seq, payload_len, tcp_flags)
+        is_retransmission = segment_kind in RETRANSMISSIONS
+        is_out_of_order = segment_kind == SEG_OUT_OF_ORDER
         
-        # 检测重传
-        is_retransmission = self._detect_retransmission(stream, seq, payload_len)
+        # 专家分析（依赖上面更新后的记分板）
+        expert_events = stream.expert.on_packet(outbound, tcp_flags, window_size, record.wscale, payload_len,
+                                                timestamp, sender, receiver, segment_kind, dup_ack)
         
-        # 检测乱序
-        is_out_of_order = self._detect_out_of_order(stream, seq, payload_len)
+        # 按方向重组：只有消费方需要的流保留数据，其他流只跟踪序列号
+        if payload_len and stream.reassembly is None and self.wants_reassembly is not None:
+            self._decide_reassembly(stream, record)
+        buffer = stream.outbound if outbound else stream.inbound
+        buffered = len(buffer)
+        buffer.add(seq, payload, bool(tcp_flags & TCP_SYN), bool(tcp_flags & TCP_FIN))
         
         # 更新连接状态
-        self._update_state(stream, flags)
+        self._update_state(stream, flags, timestamp)
         
-        # 创建TCP包对象
+        # 创建TCP包对象（payload 按保留策略保存）
+        retained, payload_offset = self._retain_payload(payload)
         tcp_packet = TCPPacket(
             timestamp=timestamp,
             seq=seq,
             ack=ack,
             flags=flags,
-            payload=payload,
+            payload=retained,
             payload_len=payload_len,
             window_size=window_size,
-            is_retransmission=is_retransmission
+            is_retransmission=is_retransmission,
+            outbound=outbound,
+            payload_offset=payload_offset
         )
         
         # 添加到流
         stream.packets.append(tcp_packet)
         stream.total_packets += 1
         stream.total_bytes += payload_len
+        stream.retained_bytes += len(retained)
         
         if is_retransmission:
             stream.retransmission_count += 1
+            if segment_kind == SEG_FAST_RETRANSMISSION:
+                stream.fast_retransmission_count += 1
+            elif segment_kind == SEG_SPURIOUS_RETRANSMISSION:
+                stream.spurious_retransmission_count += 1
+        elif segment_kind == SEG_KEEP_ALIVE:
+            stream.keep_alive_count += 1
         
         if is_out_of_order:
             stream.out_of_order_count += 1
         
-        # 记录序列号
-        if payload_len > 0 and not is_retransmission:
-            stream.seen_sequences[seq] = timestamp
-            # 更新期望序列号
-            stream.expected_seq = seq + payload_len
-            
-            # === 添加payload到HTTP重组缓存 ===
-            # 判断方向：基于IP地址匹配
-            # 出站：src_ip == stream.src_ip (客户端发送)
-            # 入站：src_ip == stream.dst_ip (服务器响应)
-            if src_ip == stream.src_ip and dst_ip == stream.dst_ip:
-                # 出站数据
-                stream.outbound_buffer += payload
-                logger.warning(f"[TCP-BUFFER] Outbound += {payload_len}B, total={len(stream.outbound_buffer)}B")
-                
-                # 检查是否包含完整HTTP请求（不输出preview避免编码问题）
-                if len(stream.outbound_buffer) > 20 and b'\r\n\r\n' in stream.outbound_buffer:
-                    # 检测HTTP方法
-                    first_line = stream.outbound_buffer.split(b'\r\n')[0]
-                    if any(first_line.startswith(m.encode()) for m in ['GET ', 'POST ', 'PUT ', 'DELETE ']):
-                        logger.warning(f"[TCP-BUFFER] Complete HTTP request detected ({len(stream.outbound_buffer)}B)")
-                
-            elif src_ip == stream.dst_ip and dst_ip == stream.src_ip:
-                # 入站数据
-                stream.inbound_buffer += payload
-                logger.warning(f"[TCP-BUFFER] Inbound += {payload_len}B, total={len(stream.inbound_buffer)}B")
-                
-                # 检查是否包含完整HTTP响应
-                if len(stream.inbound_buffer) > 20 and b'\r\n\r\n' in stream.inbound_buffer:
-                    if stream.inbound_buffer.startswith(b'HTTP/'):
-                        logger.warning(f"[TCP-BUFFER] Complete HTTP response detected ({len(stream.inbound_buffer)}B)")
+        if len(buffer) > buffered:
+            direction = "Outbound" if outbound else "Inbound"
+            hot_log.debug(logger, "TCP-BUFFER", "[TCP-BUFFER] %s += %dB, total=%dB",
+                          direction, len(buffer) - buffered, len(buffer))
+        
+        # 双向 FIN 或 RST：缩短超时，稍后结束该流
+        if tcp_flags & (TCP_FIN | TCP_RST):
+            if tcp_flags & TCP_RST:
+                stream.close_mask |= CLOSE_RST
+            else:
+                stream.close_mask |= CLOSE_FIN_OUT if outbound else CLOSE_FIN_IN
+            if self._is_closing(stream):
+                self._timers.schedule(stream_key, timestamp + self.close_linger)
+        
+        # 更新内存估算，超出预算时按 LRU 淘汰
+        self._update_memory(stream)
+        if self._over_budget():
+            self._enforce_budget()
         
         # 分析结果
         analysis = {
             'is_retransmission': is_retransmission,
             'is_out_of_order': is_out_of_order,
+            'segment_kind': segment_kind,
+            'expert': expert_events,
             'stream_state': stream.state,
             'total_packets': stream.total_packets,
             'retransmission_rate': stream.retransmission_count / stream.total_packets if stream.total_packets > 0 else 0
         }
         
-        logger.debug(f"[TCP] Stream {stream_key}: SEQ={seq}, ACK={ack}, Flags={flags}, "
-                    f"Retrans={is_retransmission}, OutOfOrder={is_out_of_order}")
+        hot_log.debug(logger, "TCP", "[TCP] Stream %s: SEQ=%s, ACK=%s, Flags=%s, Retrans=%s, OutOfOrder=%s",
+                      stream.stream_id, seq, ack, flags, is_retransmission, is_out_of_order)
         
         return stream, tcp_packet, analysis
     
-    def _get_tcp_flags(self, tcp_layer) -> str:
-        """提取TCP标志"""
-        flags = []
-        if tcp_layer.flags.S: flags.append("SYN")
-        if tcp_layer.flags.A: flags.append("ACK")
-        if tcp_layer.flags.F: flags.append("FIN")
-        if tcp_layer.flags.P: flags.append("PSH")
-        if tcp_layer.flags.R: flags.append("RST")
-        return "|".join(flags) if flags else ""
+    def _decide_reassembly(self, stream: TCPStream, record: PacketRecord) -> None:
+        decision = self.wants_reassembly(stream, record)
+        if decision is None:
+            return
+        stream.reassembly = decision
+        if decision:
+            stream.outbound.keep_data = True
+            stream.inbound.keep_data = True
+    
+    @staticmethod
+    def stop_reassembly(stream: TCPStream) -> None:
+        """消费方不再读取该流（如解析出错）：丢弃两个方向的重组数据，之后只跟踪序列号"""
+        stream.reassembly = False
+        stream.outbound.track_only()
+        stream.inbound.track_only()
     
-    def _detect_retransmission(self, stream: TCPStream, seq: int, payload_len: int) -> bool:
+    def _new_expert(self, record: PacketRecord) -> StreamExpert:
         """
-        检测TCP重传
-        重传的特征：相同的序列号再次出现
+        新流的专家分析状态：SYN 的目的端 / SYN-ACK 的源端是服务器，
+        中途捕获的连接按端口号较小的一端作为服务器
         """
-        if payload_len == 0:
-            return False
+        tcp_flags = record.tcp_flags
+        if tcp_flags & TCP_SYN:
+            server_is_dst = not tcp_flags & TCP_ACK
+        else:
+            server_is_dst = record.dport <= record.sport
+        if server_is_dst:
+            endpoint = f"{record.dst_ip}:{record.dport}"
+        else:
+            endpoint = f"{record.src_ip}:{record.sport}"
         
-        # 检查序列号是否已见过
-        if seq in stream.seen_sequences:
+        servers = self.servers
+        server = servers.get(endpoint)
+        if server is None:
+            server = servers[endpoint] = ServerExpert(endpoint)
+            # 超出上限时丢弃最久没有新连接的端点（仍在使用它的流继续更新已脱离的对象）
+            if len(servers) > self.max_servers:
+                servers.popitem(last=False)
+        else:
+            servers.move_to_end(endpoint)
+        server.streams += 1
+        # 流的出站方向就是第一个数据包的方向
+        return StreamExpert(server, client_is_out=server_is_dst)
+    
+    def get_server_stats(self) -> List[dict]:
+        """按服务器端点汇总的专家分析（握手 RTT、数据 RTT、事件计数），按连接数降序"""
+        servers = sorted(self.servers.values(), key=_server_order)
+        return [server.to_dict() for server in servers]
+    
+    def _retain_payload(self, payload: bytes) -> Tuple[bytes, int]:
+        """按保留策略处理 payload，返回 (内存中保留的字节, 落盘偏移)"""
+        if not payload or self.payload_retention == RETENTION_NONE:
+            return b'', -1
+        if self.payload_retention == RETENTION_HEADERS:
+            return header_prefix(payload), -1
+        if self.payload_store is None:
+            self.payload_store = PayloadStore()
+        return b'', self.payload_store.append(payload)
+    
+    def read_payload(self, tcp_packet: TCPPacket) -> Optional[bytes]:
+        """
+        读回数据包的 payload（full 模式从落盘存储按需读取）
+        :return: payload；headers 模式可能只有头部；未保留或已被覆盖时返回 None
+        """
+        if tcp_packet.payload_offset >= 0:
+            if self.payload_store is None:
+                return None
+            return self.payload_store.read(tcp_packet.payload_offset, tcp_packet.payload_len)
+        if tcp_packet.payload or not tcp_packet.payload_len:
+            return tcp_packet.payload
+        return None
+    
+    def follow_stream(self, stream_id: str, direction: Optional[str] = None,
+                      limit: int = 1000) -> Optional[List[dict]]:
+        """
+        按到达顺序返回流中带数据的报文及其 payload（类似 Wireshark 的 Follow TCP Stream）
+        :param direction: None 表示双向，"outbound" / "inbound" 只返回一个方向
+        :param limit: 最多返回的报文数量
+        :return: 流不存在（或已结束）返回 None
+        """
+        stream = self._active_stream(stream_id)
+        if stream is None:
+            return None
+        return self._follow_packets(list(stream.packets), direction, limit)
+    
+    def _follow_packets(self, packets: List[TCPPacket], direction: Optional[str], limit: int) -> List[dict]:
+        segments = []
+        for tcp_packet in packets:
+            if not tcp_packet.payload_len:
+                continue
+            if direction is not None and (direction == "outbound") != tcp_packet.outbound:
+                continue
+            data = self.read_payload(tcp_packet)
+            segments.append({
+                'timestamp': tcp_packet.timestamp,
+                'direction': "outbound" if tcp_packet.outbound else "inbound",
+                'seq': tcp_packet.seq,
+                'length': tcp_packet.payload_len,
+                'is_retransmission': tcp_packet.is_retransmission,
+                'data': data,
+                'truncated': data is None or len(data) < tcp_packet.payload_len
+            })
+            if len(segments) >= limit:
+                break
+        return segments
+    
+    def close(self) -> None:
+        """释放落盘存储"""
+        if self.payload_store is not None:
+            self.payload_store.close()
+    
+    @staticmethod
+    def _is_closing(stream: TCPStream) -> bool:
+        return bool(stream.close_mask & CLOSE_RST) or stream.close_mask & CLOSE_FIN_BOTH == CLOSE_FIN_BOTH
+    
+    def _update_memory(self, stream: TCPStream) -> None:
+        """
+        估算流的内存占用（对象开销 + 内存中保留的 payload + 记分板区间）
+        重组缓存中未被消费的数据单独统计：它们等待消费方读取，按 LRU 结束整个流并不能让消费方更快释放，
+        只会让仍在传输的流被拆成多个
+        """
+        outbound = stream.outbound
+        inbound = stream.inbound
+        memory = (_STREAM_OVERHEAD + len(stream.packets) * _PACKET_OVERHEAD + stream.retained_bytes
+                  + (len(stream.outbound_tx) + len(stream.inbound_tx)) * _RANGE_OVERHEAD)
+        self.memory_used += memory - stream.memory
+        stream.memory = memory
+        buffered = len(outbound) + outbound.pending_bytes + len(inbound) + inbound.pending_bytes
+        self.reassembly_bytes += buffered - stream.buffered
+        stream.buffered = buffered
+        if self.memory_used > self.peak_memory:
+            self.peak_memory = self.memory_used
+    
+    def _over_budget(self) -> bool:
+        if self.memory_used > self.memory_budget:
             return True
-        
-        return False
+        shared = self.shared_budget
+        return shared is not None and shared.exceeded_by(self)
+    
+    def _enforce_budget(self) -> None:
+        """淘汰最久未活动的流，直到内存回到预算以内（至少保留当前活动的流）"""
+        streams = self.streams
+        while self._over_budget() and len(streams) > 1:
+            self.retire(next(iter(streams)), RETIRED_MEMORY)
+    
+    def expire(self, now: float) -> int:
+        """
+        处理到期的定时器：空闲超时的流和已关闭的流被淘汰
+        :param now: 当前时间（抓包时间戳）
+        :return: 本次淘汰的流数量
+        """
+        retired = 0
+        for stream_key in self._timers.advance(now):
+            stream = self.streams.get(stream_key)
+            if stream is None:
+                continue
+            if self._is_closing(stream):
+                due = stream.last_seen + self.close_linger
+                reason = RETIRED_RST if stream.close_mask & CLOSE_RST else RETIRED_FIN
+            else:
+                due = stream.last_seen + self.idle_timeout
+                reason = RETIRED_IDLE
+            if due > now:
+                # 期间有新的数据包，按最后活动时间重新调度
+                self._timers.schedule(stream_key, due)
+                continue
+            self.retire(stream_key, reason)
+            retired += 1
+        return retired
     
-    def _detect_out_of_order(self, stream: TCPStream, seq: int, payload_len: int) -> bool:
+    def enforce_budget(self) -> int:
         """
-        检测乱序包
-        如果收到的序列号小于期望序列号，说明乱序
+        没有新数据包时检查预算（共享预算的总用量可能因为其他分片的流量超出）
+        :return: 本次淘汰的流数量
         """
-        if stream.expected_seq is None or payload_len == 0:
-            return False
+        before = len(self.streams)
+        if self._over_budget():
+            self._enforce_budget()
+        return before - len(self.streams)
+    
+    def retire(self, stream_key: bytes, reason: str) -> Optional[dict]:
+        """
+        结束一个流：释放数据包和重组缓存，只保留摘要
+        :param stream_key: 流表key（_get_stream_key 的结果）
+        :return: 流摘要，流不存在返回 None
+        """
+        stream = self.streams.pop(stream_key, None)
+        if stream is None:
+            return None
+        self._timers.cancel(stream_key)
+        self._dirty.discard(stream_key)
+        if self._changed_servers is not None and stream.expert is not None:
+            self._changed_servers.add(stream.expert.server.server)
+        stream_id = stream.stream_id
+        self.memory_used -= stream.memory
+        self.reassembly_bytes -= stream.buffered
+        self.eviction_counts[reason] += 1
+        self.retired_total += 1
+        
+        if stream.end_time is None:
+            stream.end_time = stream.last_seen
+        summary = self._summarize(stream)
+        summary['active'] = False
+        summary['close_reason'] = reason
+        
+        retired = self.retired
+        retired.pop(stream_id, None)
+        retired[stream_id] = summary
+        if len(retired) > self.max_retired:
+            retired.popitem(last=False)
+            self.summaries_dropped += 1
+        for sort_by, ranking in self._rankings.items():
+            if sort_by not in self._stale_rankings:
+                ranking.push(summary[SUMMARY_FIELDS[sort_by]], stream_id, b'')
         
-        return seq < stream.expected_seq
+        hot_log.debug(logger, "TCP-RETIRE", "[TCP] Retired stream %s (%s), %d packets",
+                      stream_id, reason, stream.total_packets)
+        if self.on_retire is not None:
+            self.on_retire(stream)
+        return summary
     
-    def _update_state(self, stream: TCPStream, flags: str):
+    def _update_state(self, stream: TCPStream, flags: str, timestamp: float):
         """更新TCP连接状态"""
         # SYN包 - 连接开始
         if "SYN" in flags and "ACK" not in flags:
@@ -256,15 +731,30 @@ class TCPStreamManager:
         # RST包 - 连接重置
         elif "RST" in flags:
             stream.state = "CLOSED"
-            stream.end_time = datetime.now().timestamp()
+            stream.end_time = timestamp
     
-    def get_stream_stats(self, stream_id: str) -> Optional[dict]:
-        """获取流统计信息"""
-        if stream_id not in self.streams:
+    def _active_stream(self, stream_id: str) -> Optional[TCPStream]:
+        """ID 对应的活动流（同一五元组的活动流是之后新建的流时返回 None）"""
+        stream_key = self._key_from_stream_id(stream_id)
+        stream = self.streams.get(stream_key) if stream_key is not None else None
+        if stream is None or stream.stream_id != stream_id:
             return None
-        
-        stream = self.streams[stream_id]
-        
+        return stream
+    
+    def get_stream_stats(self, stream_id: str) -> Optional[dict]:
+        """获取流统计信息（包括已结束的流）"""
+        stream = self._active_stream(stream_id)
+        if stream is None:
+            return self.retired.get(stream_id)
+        return self._active_summary(stream)
+    
+    def _active_summary(self, stream: TCPStream) -> dict:
+        summary = self._summarize(stream)
+        summary['active'] = True
+        summary['close_reason'] = None
+        return summary
+    
+    def _summarize(self, stream: TCPStream) -> dict:
         return {
             'stream_id': stream.stream_id,
             'src': f"{stream.src_ip}:{stream.src_port}",
@@ -274,10 +764,514 @@ class TCPStreamManager:
             'total_bytes': stream.total_bytes,
             'retransmissions': stream.retransmission_count,
             'retransmission_rate': stream.retransmission_count / stream.total_packets if stream.total_packets > 0 else 0,
+            'fast_retransmissions': stream.fast_retransmission_count,
+            'spurious_retransmissions': stream.spurious_retransmission_count,
+            'keep_alives': stream.keep_alive_count,
             'out_of_order': stream.out_of_order_count,
-            'duration': (stream.end_time or datetime.now().timestamp()) - stream.start_time if stream.start_time else 0
+            'duration': _stream_duration(stream),
+            'expert': stream.expert.to_dict() if stream.expert is not None else None
         }
     
     def get_all_streams(self) -> List[dict]:
-        """获取所有流的统计信息"""
-        return [self.get_stream_stats(sid) for sid in self.streams.keys()]
+        """获取所有流的统计信息（活动流 + 已结束流的摘要）"""
+        return [self._active_summary(stream) for stream in self.streams.values()] + list(self.retired.values())
+    
+    def _refresh_rankings(self) -> None:
+        """把有新数据包的流写入排序索引；大部分流都有变化或过期条目过多时标记为整体重建（O(n) 建堆）"""
+        streams = self.streams
+        live = len(streams) + len(self.retired)
+        if len(self._dirty) * 4 > live:
+            self._dirty.clear()
+            self._stale_rankings.update(SORT_KEYS)
+            return
+        
+        rankings = [(ranking, _STREAM_METRICS[sort_by]) for sort_by, ranking in self._rankings.items()
+                    if sort_by not in self._stale_rankings]
+        for stream_key in self._dirty:
+            stream = streams.get(stream_key)
+            if stream is None:
+                continue
+            for ranking, metric in rankings:
+                ranking.push(metric(stream), stream.stream_id, stream_key)
+        self._dirty.clear()
+        
+        for sort_by, ranking in self._rankings.items():
+            if len(ranking) > 2 * live + 1024:
+                self._stale_rankings.add(sort_by)
+    
+    def _rebuild_ranking(self, sort_by: str) -> None:
+        metric = _STREAM_METRICS[sort_by]
+        field_name = SUMMARY_FIELDS[sort_by]
+        entries = [(-metric(stream), stream.stream_id, 1, stream_key)
+                   for stream_key, stream in self.streams.items()]
+        entries.extend((-summary[field_name], stream_id, 0, b'')
+                       for stream_id, summary in self.retired.items())
+        self._rankings[sort_by].rebuild(entries)
+        self._stale_rankings.discard(sort_by)
+    
+    def _ranked(self, sort_by: str, after: Optional[Tuple[float, str, int]] = None):
+        """按指标降序产出 (排序键, 流摘要)，包括已结束的流"""
+        self._refresh_rankings()
+        if sort_by in self._stale_rankings:
+            self._rebuild_ranking(sort_by)
+        metric = _STREAM_METRICS[sort_by]
+        field_name = SUMMARY_FIELDS[sort_by]
+        streams = self.streams
+        retired = self.retired
+        
+        def is_current(entry: Entry) -> bool:
+            if entry[2]:
+                stream = streams.get(entry[3])
+                return stream is not None and stream.stream_id == entry[1] and metric(stream) == -entry[0]
+            summary = retired.get(entry[1])
+            return summary is not None and summary[field_name] == -entry[0]
+        
+        for entry in self._rankings[sort_by].ordered(is_current, after):
+            summary = self._active_summary(streams[entry[3]]) if entry[2] else retired[entry[1]]
+            yield entry, summary
+    
+    def query_streams(self, sort_by: str = SORT_BYTES, limit: int = 50, cursor: Optional[str] = None) -> dict:
+        """
+        按指标排序分页查询流（活动流 + 已结束流的摘要）
+        第一页是 Top-K，O(K log K)；之后的页面用上一页返回的 next_cursor 继续
+        :param sort_by: bytes | packets | retransmission_rate | duration
+        :param cursor: 上一页的 next_cursor，None 表示第一页
+        :return: {'sort_by', 'streams', 'next_cursor', 'total'}，没有更多数据时 next_cursor 为 None
+        """
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {sort_by}")
+        after = decode_cursor(cursor) if cursor else None
+        page = list(islice(self._ranked(sort_by, after), limit))
+        return _stream_page(page, sort_by, limit, len(self.streams) + len(self.retired))
+    
+    def checkpoint_state(self, full: bool = True) -> dict:
+        """
+        流表检查点状态（只含内置类型，可在其他线程序列化）
+        必须在处理数据包的线程中调用；full=False 时只包含上次检查点之后的变化
+        不包含数据包列表、payload 和重组缓存，恢复后的流从下一个数据包重新开始重组
+        """
+        streams = self.streams
+        if full or self._changed is None:
+            full = True
+            changed = list(streams.values())
+            retired = list(self.retired.items())
+            servers = self.servers.values()
+        else:
+            # 按最后活动时间排序，恢复后的 LRU 顺序与原来一致
+            changed = sorted((streams[stream_key] for stream_key in self._changed if stream_key in streams),
+                             key=_stream_last_seen)
+            count = min(self.retired_total - self._checkpoint_retired, len(self.retired))
+            retired = list(islice(reversed(self.retired.items()), count))[::-1]
+            servers = [self.servers[endpoint] for endpoint in self._changed_servers if endpoint in self.servers]
+        self._changed = set()
+        self._changed_servers = set()
+        self._checkpoint_retired = self.retired_total
+        return {
+            'full': full,
+            'streams': [self._stream_state(stream) for stream in changed],
+            # 摘要字典创建后不再修改，直接共享
+            'retired': retired,
+            'servers': [(server.server, server.to_state()) for server in servers],
+            'counters': (dict(self.eviction_counts), self.summaries_dropped, self.peak_streams,
+                         self.peak_memory, self.retired_total)
+        }
+    
+    @staticmethod
+    def _stream_state(stream: TCPStream) -> tuple:
+        return (stream.stream_id, stream.src_ip, stream.src_port, stream.dst_ip, stream.dst_port, stream.state,
+                stream.start_time, stream.end_time, stream.last_seen, stream.close_mask, stream.total_packets,
+                stream.total_bytes, stream.retransmission_count, stream.fast_retransmission_count,
+                stream.spurious_retransmission_count, stream.keep_alive_count, stream.out_of_order_count,
+                stream.expert.server.server, stream.expert.to_state())
+    
+    def restore_state(self, state: dict) -> None:
+        """
+        应用 checkpoint_state() 的结果：全量状态替换当前流表，增量按顺序叠加
+        恢复的流按原来的最后活动时间重新调度定时器，之后的抓包时间推进时照常淘汰
+        """
+        if state['full']:
+            for stream_key in list(self.streams):
+                self._timers.cancel(stream_key)
+            self.streams.clear()
+            self.retired.clear()
+            self.servers.clear()
+            self.memory_used = 0
+            self.reassembly_bytes = 0
+        
+        for endpoint, server_state in state['servers']:
+            server = self.servers.get(endpoint)
+            if server is None:
+                server = self.servers[endpoint] = ServerExpert(endpoint)
+            server.load_state(server_state)
+        
+        # 之后结束的流先移出活动流表，再写入摘要
+        retired = self.retired
+        for stream_id, summary in state['retired']:
+            stream = self._active_stream(stream_id)
+            if stream is not None:
+                stream_key = self._key_from_stream_id(stream_id)
+                del self.streams[stream_key]
+                self._timers.cancel(stream_key)
+                self.memory_used -= stream.memory
+                self.reassembly_bytes -= stream.buffered
+            retired.pop(stream_id, None)
+            retired[stream_id] = summary
+        while len(retired) > self.max_retired:
+            retired.popitem(last=False)
+        
+        for stream_state in state['streams']:
+            self._restore_stream(stream_state)
+        
+        (eviction_counts, self.summaries_dropped, self.peak_streams, self.peak_memory,
+         self.retired_total) = state['counters']
+        self.eviction_counts.update(eviction_counts)
+        self._checkpoint_retired = self.retired_total
+        self._dirty.clear()
+        self._stale_rankings.update(SORT_KEYS)
+    
+    def _restore_stream(self, stream_state: tuple) -> None:
+        (stream_id, src_ip, src_port, dst_ip, dst_port, state, start_time, end_time, last_seen, close_mask,
+         total_packets, total_bytes, retransmissions, fast_retransmissions, spurious_retransmissions,
+         keep_alives, out_of_order, endpoint, expert_state) = stream_state
+        stream_key = self._get_stream_key(src_ip, src_port, dst_ip, dst_port)
+        old = self.streams.pop(stream_key, None)
+        if old is not None:
+            self.memory_used -= old.memory
+            self.reassembly_bytes -= old.buffered
+        
+        server = self.servers.get(endpoint)
+        if server is None:
+            server = self.servers[endpoint] = ServerExpert(endpoint)
+        expert = StreamExpert(server, client_is_out=True)
+        expert.load_state(expert_state)
+        stream = self.streams[stream_key] = TCPStream(
+            stream_id=stream_id,
+            src_ip=src_ip,
+            src_port=src_port,
+            dst_ip=dst_ip,
+            dst_port=dst_port,
+            state=state,
+            start_time=start_time,
+            end_time=end_time,
+            total_packets=total_packets,
+            total_bytes=total_bytes,
+            retransmission_count=retransmissions,
+            fast_retransmission_count=fast_retransmissions,
+            spurious_retransmission_count=spurious_retransmissions,
+            keep_alive_count=keep_alives,
+            out_of_order_count=out_of_order,
+            last_seen=last_seen,
+            close_mask=close_mask,
+            expert=expert,
+            outbound=ReassemblyBuffer(self.max_stream_bytes, self.max_pending_bytes, keep_data=False),
+            inbound=ReassemblyBuffer(self.max_stream_bytes, self.max_pending_bytes, keep_data=False)
+        )
+        timeout = self.close_linger if self._is_closing(stream) else self.idle_timeout
+        self._timers.schedule(stream_key, last_seen + timeout)
+        self._update_memory(stream)
+    
+    def get_eviction_stats(self) -> dict:
+        """流表淘汰统计"""
+        return {
+            'active_streams': len(self.streams),
+            'peak_streams': self.peak_streams,
+            'retired_summaries': len(self.retired),
+            'summaries_dropped': self.summaries_dropped,
+            'evicted': dict(self.eviction_counts),
+            'memory_used': self.memory_used,
+            'reassembly_bytes': self.reassembly_bytes,
+            'payload_retention': self.payload_retention,
+            'payload_store': self.payload_store.stats() if self.payload_store is not None else None,
+            'peak_memory': self.peak_memory,
+            'memory_budget': self.memory_budget,
+            'idle_timeout': self.idle_timeout,
+            'close_linger': self.close_linger,
+            'timers': len(self._timers)
+        }
+
+
+class ShardedTCPStreamManager:
+    """
+    按五元组哈希分片的TCP流管理器
+    - 每个分片是独立的 TCPStreamManager（各自的流表、定时器），由各自的锁保护
+    - 同一连接的两个方向总是落在同一个分片，分片之间没有共享的可变状态（落盘存储除外，它自带锁）
+    - 内存预算是全局的（SharedMemoryBudget）：总用量超出时由用量超过平均份额的分片淘汰，
+      流量不均匀时不会在总用量仍低于预算时淘汰活动流
+    - 并行解析时按 shard_of() 把连接固定分配给工作线程/进程，process_record 返回的 stream
+      只应由处理该连接的线程继续使用
+    - 分片只在收到自己的数据包时推进定时器。expire_others=True 时每秒替其他分片推进一次，
+      适用于按抓包顺序同步调用的场景；工作线程带队列、进度不一致时应关闭，
+      由调度方按顺序向各工作线程投递时间标记，工作线程调用 expire_shard()
+    - 跨分片查询逐个分片加锁取快照再合并，不会长时间阻塞抓包线程
+    - 检查点合并各分片的状态，恢复时按当前的分片重新分配
+    """
+    
+    def __init__(self, shards: int = 4, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 max_retired: int = DEFAULT_MAX_RETIRED, payload_retention: str = RETENTION_FULL,
+                 payload_store: Optional[PayloadStore] = None, expire_others: bool = True,
+                 **manager_kwargs):
+        """
+        :param shards: 分片数量（通常等于工作线程/进程数量）
+        :param memory_budget: 所有分片共用的总内存预算
+        :param max_retired: 保留的已结束流摘要总数，平均分配给各分片
+        :param expire_others: 处理数据包时是否顺带推进其他分片的定时器
+        :param manager_kwargs: 其余参数原样传给每个分片的 TCPStreamManager
+        """
+        if shards < 1:
+            raise ValueError(f"Invalid shard count: {shards}")
+        if payload_retention not in RETENTION_MODES:
+            raise ValueError(f"Unknown payload retention: {payload_retention}")
+        # 所有分片共用一个落盘存储（创建时不产生文件，第一次写入时才创建段文件）
+        if payload_store is None and payload_retention == RETENTION_FULL:
+            payload_store = PayloadStore()
+        self.payload_retention = payload_retention
+        self.payload_store = payload_store
+        self.shards: List[TCPStreamManager] = [
+            TCPStreamManager(memory_budget=memory_budget,
+                             max_retired=max(1, max_retired // shards),
+                             payload_retention=payload_retention, payload_store=payload_store,
+                             **manager_kwargs)
+            for _ in range(shards)
+        ]
+        self.memory_budget = memory_budget
+        self.shared_budget = SharedMemoryBudget(memory_budget)
+        for shard in self.shards:
+            self.shared_budget.attach(shard)
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self.expire_others = expire_others
+        # 最近一次推进所有分片定时器的时间（秒级，与定时器粒度一致）
+        self._expire_tick: Optional[int] = None
+        logger.info("Sharded TCP Stream Manager initialized (%d shards)", shards)
+    
+    def __len__(self) -> int:
+        return len(self.shards)
+    
+    def shard_of(self, stream_key: bytes) -> int:
+        """流表key所属的分片（同一进程内稳定）"""
+        return hash(stream_key) % len(self.shards)
+    
+    def shard_of_record(self, record: PacketRecord) -> int:
+        """数据包所属的分片，供调度器把连接固定分配给工作线程"""
+        return self.shard_of(TCPStreamManager._get_stream_key(record.src_ip, record.sport,
+                                                              record.dst_ip, record.dport))
+    
+    @property
+    def on_retire(self) -> Optional[Callable[[TCPStream], None]]:
+        return self.shards[0].on_retire
+    
+    @on_retire.setter
+    def on_retire(self, callback: Optional[Callable[[TCPStream], None]]) -> None:
+        """回调在持有分片锁的线程中调用"""
+        for shard in self.shards:
+            shard.on_retire = callback
+    
+    @property
+    def wants_reassembly(self) -> Optional[Callable[[TCPStream, PacketRecord], Optional[bool]]]:
+        return self.shards[0].wants_reassembly
+    
+    @wants_reassembly.setter
+    def wants_reassembly(self, callback: Optional[Callable[[TCPStream, PacketRecord], Optional[bool]]]) -> None:
+        """回调在持有分片锁的线程中调用"""
+        for shard in self.shards:
+            shard.wants_reassembly = callback
+    
+    @staticmethod
+    def stop_reassembly(stream: TCPStream) -> None:
+        TCPStreamManager.stop_reassembly(stream)
+    
+    def process_packet(self, pkt, timestamp: float = None) -> Tuple[TCPStream, TCPPacket, dict]:
+        """处理TCP数据包（Scapy 对象）"""
+        if not timestamp:
+            timestamp = datetime.now().timestamp()
+        if not pkt.haslayer(TCP):
+            return None, None, {}
+        record = PacketRecord.from_scapy(pkt, timestamp)
+        if record is None:
+            return None, None, {}
+        return self.process_record(record, timestamp)
+    
+    def process_record(self, record: PacketRecord, timestamp: float = None) -> Tuple[TCPStream, TCPPacket, dict]:
+        """处理TCP数据包（快速解码记录），只锁定该连接所在的分片"""
+        if not record.is_tcp:
+            return None, None, {}
+        if not timestamp:
+            timestamp = record.timestamp or datetime.now().timestamp()
+        stream_key = TCPStreamManager._get_stream_key(record.src_ip, record.sport, record.dst_ip, record.dport)
+        index = hash(stream_key) % len(self.shards)
+        with self._locks[index]:
+            result = self.shards[index].process_record(record, timestamp, stream_key)
+        
+        # 分片只在收到自己的数据包时推进定时器：每秒替其他分片推进一次，保证空闲流按时淘汰
+        tick = int(timestamp)
+        if self.expire_others and tick != self._expire_tick:
+            self._expire_tick = tick
+            for other, (shard, lock) in enumerate(zip(self.shards, self._locks)):
+                if other != index:
+                    with lock:
+                        shard.expire(timestamp)
+                        shard.enforce_budget()
+        return result
+    
+    def expire(self, now: float) -> int:
+        """推进所有分片的定时器并检查共享预算（没有流量的分片不会自己推进）"""
+        retired = 0
+        for shard, lock in zip(self.shards, self._locks):
+            with lock:
+                retired += shard.expire(now) + shard.enforce_budget()
+        return retired
+    
+    def expire_shard(self, index: int, now: float) -> int:
+        """推进单个分片的定时器并检查共享预算（由拥有该分片的工作线程按数据包顺序调用）"""
+        with self._locks[index]:
+            shard = self.shards[index]
+            return shard.expire(now) + shard.enforce_budget()
+    
+    def _shard_for_stream_id(self, stream_id: str) -> Optional[int]:
+        stream_key = self.shards[0]._key_from_stream_id(stream_id)
+        return self.shard_of(stream_key) if stream_key is not None else None
+    
+    def get_stream_stats(self, stream_id: str) -> Optional[dict]:
+        """获取流统计信息（包括已结束的流），只访问该流所在的分片"""
+        index = self._shard_for_stream_id(stream_id)
+        if index is None:
+            return None
+        with self._locks[index]:
+            return self.shards[index].get_stream_stats(stream_id)
+    
+    def get_all_streams(self) -> List[dict]:
+        """获取所有流的统计信息：逐个分片取快照，活动流在前、已结束流在后"""
+        active = []
+        retired = []
+        for shard, lock in zip(self.shards, self._locks):
+            with lock:
+                active.extend(shard._active_summary(stream) for stream in shard.streams.values())
+                retired.extend(shard.retired.values())
+        return active + retired
+    
+    def query_streams(self, sort_by: str = SORT_BYTES, limit: int = 50, cursor: Optional[str] = None) -> dict:
+        """
+        按指标排序分页查询：每个分片取排序后的前 limit 个，再按同一个排序键归并
+        各分片使用相同的排序键和游标，翻页结果与单个管理器一致
+        """
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key: {sort_by}")
+        after = decode_cursor(cursor) if cursor else None
+        pages = []
+        total = 0
+        for shard, lock in zip(self.shards, self._locks):
+            with lock:
+                pages.append(list(islice(shard._ranked(sort_by, after), limit)))
+                total += len(shard.streams) + len(shard.retired)
+        page = list(islice(heapq.merge(*pages, key=lambda item: item[0][:3]), limit))
+        return _stream_page(page, sort_by, limit, total)
+    
+    def follow_stream(self, stream_id: str, direction: Optional[str] = None,
+                      limit: int = 1000) -> Optional[List[dict]]:
+        """跟踪TCP流（payload 读取在锁外进行）"""
+        index = self._shard_for_stream_id(stream_id)
+        if index is None:
+            return None
+        shard = self.shards[index]
+        with self._locks[index]:
+            stream = shard._active_stream(stream_id)
+            packets = list(stream.packets) if stream is not None else None
+        if packets is None:
+            return None
+        return shard._follow_packets(packets, direction, limit)
+    
+    def get_server_stats(self) -> List[dict]:
+        """合并各分片的服务器端点汇总（同一服务器的连接可能分布在多个分片）"""
+        merged: Dict[str, ServerExpert] = {}
+        for shard, lock in zip(self.shards, self._locks):
+            with lock:
+                for endpoint, server in shard.servers.items():
+                    total = merged.get(endpoint)
+                    if total is None:
+                        total = merged[endpoint] = ServerExpert(endpoint)
+                    total.merge(server)
+        servers = sorted(merged.values(), key=_server_order)
+        return [server.to_dict() for server in servers]
+    
+    def read_payload(self, tcp_packet: TCPPacket) -> Optional[bytes]:
+        # 落盘存储是共享的，任意分片都可以读取
+        return self.shards[0].read_payload(tcp_packet)
+    
+    def close(self) -> None:
+        if self.payload_store is not None:
+            self.payload_store.close()
+    
+    def checkpoint_state(self, full: bool = True) -> dict:
+        """
+        合并各分片的检查点状态（格式与 TCPStreamManager 相同，分片数量不影响恢复）
+        同一服务器端点在各分片中的汇总合并为一条；必须在处理数据包的线程中调用
+        """
+        # 任一分片还没有写过检查点时所有分片一起写全量，保证增量的基准一致
+        full = full or any(shard._changed is None for shard in self.shards)
+        states = []
+        for shard, lock in zip(self.shards, self._locks):
+            with lock:
+                states.append(shard.checkpoint_state(full))
+        
+        endpoints = {endpoint for state in states for endpoint, _ in state['servers']}
+        merged: Dict[str, ServerExpert] = {}
+        for shard, lock in zip(self.shards, self._locks):
+            with lock:
+                for endpoint in endpoints:
+                    server = shard.servers.get(endpoint)
+                    if server is not None:
+                        total = merged.get(endpoint)
+                        if total is None:
+                            total = merged[endpoint] = ServerExpert(endpoint)
+                        total.merge(server)
+        
+        counters = [state['counters'] for state in states]
+        eviction_counts = {reason: sum(counts[0][reason] for counts in counters) for reason in counters[0][0]}
+        return {
+            'full': full,
+            # 按最后活动时间合并，恢复后的 LRU 顺序与原来一致
+            'streams': sorted((stream_state for state in states for stream_state in state['streams']),
+                              key=lambda stream_state: stream_state[8]),
+            'retired': [item for state in states for item in state['retired']],
+            'servers': [(endpoint, server.to_state()) for endpoint, server in merged.items()],
+            'counters': (eviction_counts,) + tuple(sum(counts[i] for counts in counters) for i in range(1, 5))
+        }
+    
+    def restore_state(self, state: dict) -> None:
+        """
+        应用 checkpoint_state() 的结果：流和摘要按当前的分片重新分配（哈希在每个进程中不同），
+        服务器端点汇总和计数器记在第一个分片上（查询时各分片合并）
+        """
+        shards = self.shards
+        parts = [{'full': state['full'], 'streams': [], 'retired': [], 'servers': [],
+                  'counters': (dict.fromkeys(shard.eviction_counts, 0), 0, 0, 0, 0)} for shard in shards]
+        parts[0]['servers'] = state['servers']
+        parts[0]['counters'] = state['counters']
+        for stream_state in state['streams']:
+            stream_key = TCPStreamManager._get_stream_key(*stream_state[1:5])
+            parts[self.shard_of(stream_key)]['streams'].append(stream_state)
+        for item in state['retired']:
+            index = self._shard_for_stream_id(item[0])
+            parts[index if index is not None else 0]['retired'].append(item)
+        for shard, lock, part in zip(shards, self._locks, parts):
+            with lock:
+                shard.restore_state(part)
+    
+    def get_eviction_stats(self) -> dict:
+        """合并各分片的淘汰统计"""
+        per_shard = []
+        for shard, lock in zip(self.shards, self._locks):
+            with lock:
+                per_shard.append(shard.get_eviction_stats())
+        merged = dict(per_shard[0])
+        for key in ('active_streams', 'peak_streams', 'retired_summaries', 'summaries_dropped',
+                    'memory_used', 'reassembly_bytes', 'peak_memory', 'timers'):
+            merged[key] = sum(stats[key] for stats in per_shard)
+        merged['memory_budget'] = self.memory_budget
+        merged['evicted'] = {reason: sum(stats['evicted'][reason] for stats in per_shard)
+                             for reason in merged['evicted']}
+        merged['payload_store'] = self.payload_store.stats() if self.payload_store is not None else None
+        merged['shards'] = len(self.shards)
+        merged['streams_per_shard'] = [stats['active_streams'] for stats in per_shard]
+        merged['memory_per_shard'] = [stats['memory_used'] for stats in per_shard]
+        return merged
+
@@ -0,0 +1,82 @@
+"""
+哈希时间轮
+用于连接表的空闲超时：调度/取消 O(1)，推进时只检查经过的槽位
+时间由调用方传入（实时抓包用抓包时间戳，PCAP 导入用报文时间），不依赖系统时钟
+"""
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+
+class TimerWheel:
+    """
+    每个 key 最多一个定时器，重复调度会覆盖之前的到期时间
+    超过一圈的定时器留在槽位中，到期时间未到时跳过
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        """
+        :param tick: 槽位时间粒度（秒）
+        :param slots: 槽位数量
+        """
+        self.tick = tick
+        self.slots: List[Set[Hashable]] = [set() for _ in range(slots)]
+        # key -> (到期时间, 槽位下标)
+        self._entries: Dict[Hashable, Tuple[float, int]] = {}
+        # 下一个待检查的 tick
+        self._cursor: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def schedule(self, key: Hashable, deadline: float) -> None:
+        """设置（或更新）key 的到期时间"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.slots[entry[1]].discard(key)
+        tick = int(deadline // self.tick)
+        if self._cursor is not None and tick < self._cursor:
+            # 已经过去的 tick 不会再被检查，放到下一个待检查的槽位
+            tick = self._cursor
+        index = tick % len(self.slots)
+        self._entries[key] = (deadline, index)
+        self.slots[index].add(key)
+
+    def cancel(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.slots[entry[1]].discard(key)
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        """key 当前的到期时间，未调度返回 None"""
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def advance(self, now: float) -> List[Hashable]:
+        """
+        推进到 now，取出所有已到期的 key（取出后不再调度）
+        只检查已经完整经过的 tick，定时器最多延迟一个 tick 触发；同一 tick 内重复调用没有开销
+        """
+        now_tick = int(now // self.tick)
+        if self._cursor is None:
+            self._cursor = now_tick
+        if now_tick <= self._cursor:
+            return []
+
+        expired = []
+        entries = self._entries
+        slot_count = len(self.slots)
+        # 间隔超过一圈时，每个槽位只需检查一次
+        start = max(self._cursor, now_tick - slot_count)
+        for tick in range(start, now_tick):
+            slot = self.slots[tick % slot_count]
+            if not slot:
+                continue
+            due = [key for key in slot if entries[key][0] <= now]
+            for key in due:
+                slot.discard(key)
+                del entries[key]
+            expired.extend(due)
+        self._cursor = now_tick
+        return expired
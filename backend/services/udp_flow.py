@@ -0,0 +1,417 @@
+"""
+UDP 流追踪
+与 TCP 流使用相同的流模型：双向五元组、相同格式的 stream_id、空闲超时淘汰、已结束流的摘要
+- 每个流的计数器沿用 FlowTable 的紧凑列式存储；流编号、发起方向的计数、协议和
+  payload 长度直方图按同一槽位保存在额外的 array 列中
+- 空闲超时用 TimerWheel：流创建时调度一次，到期时按最后活动时间淘汰或顺延，逐包不重新调度
+- 应用层协议（DNS/QUIC）按流缓存：识别成功后不再检查，无法识别的流最多尝试 MAX_ATTEMPTS 个报文
+- 处理数据包和查询都在同一把锁内进行，API 线程查询时不会遍历正在修改的流表
+"""
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .capture_log import hot_log
+from .fast_decoder import PacketRecord
+from .flow_table import FlowTable, IPPROTO_UDP, pack_flow_key, unpack_flow_key
+from .protocol_id import classify_udp
+from .tcp_stream import TCPStreamManager
+from .timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_UDP_IDLE_TIMEOUT = 60.0     # 空闲超时（秒），UDP 没有关闭握手，比 TCP 短
+DEFAULT_MAX_UDP_FLOWS = 262144
+DEFAULT_MAX_RETIRED = 10000         # 保留的已结束流摘要数量
+
+RETIRED_IDLE = "idle"
+RETIRED_CAPACITY = "capacity"
+
+# FlowTable 标志位：第一个报文（发起方）的方向与打包key中的端点顺序相反
+_INITIATOR_REVERSE = 0x01
+
+# payload 长度直方图：桶 b 统计长度在 [2^(b-1), 2^b) 内的报文，桶 0 为空报文
+HIST_BUCKETS = 17
+HIST_LABELS = tuple(["0"] + [f"{1 << (b - 1)}-{(1 << b) - 1}" for b in range(1, HIST_BUCKETS)])
+_EMPTY_HISTOGRAM = array('I', [0]) * HIST_BUCKETS
+
+MAX_ATTEMPTS = 4
+
+
+class UDPFlowTracker:
+    """UDP 流表（线程安全：抓包线程处理数据包，API 线程查询）"""
+
+    def __init__(self, idle_timeout: float = DEFAULT_UDP_IDLE_TIMEOUT, max_flows: int = DEFAULT_MAX_UDP_FLOWS,
+                 max_retired: int = DEFAULT_MAX_RETIRED):
+        """
+        :param idle_timeout: 无数据包超过该时间的流被淘汰（秒）
+        :param max_flows: 活动流数量上限，满后淘汰最久未活动的一批
+        :param max_retired: 保留的已结束流摘要数量
+        """
+        self.idle_timeout = idle_timeout
+        self.max_flows = max_flows
+        self.max_retired = max_retired
+        # 淘汰由本类负责（需要先生成摘要），流表本身不限容量
+        self.table = FlowTable(max_flows=None)
+        self._timers = TimerWheel(tick=1.0, slots=512)
+
+        # 额外的列（下标与 FlowTable 槽位一致）
+        self._stream_ids: List[Optional[str]] = []
+        self._indexes = array('Q')
+        self._out_packets = array('Q')
+        self._out_bytes = array('Q')
+        # >0: 协议编号（_protocol_names 下标）；<=0: 已尝试识别的次数取负
+        self._protocols = array('b')
+        self._histograms = array('I')
+        self._protocol_names: List[Optional[str]] = [None]
+        self._protocol_codes: Dict[str, int] = {}
+
+        # 已结束流的摘要（stream_id -> get_flow_stats 格式的字典）
+        self.retired: Dict[str, dict] = OrderedDict()
+        self.flows_created = 0
+        self.eviction_counts = {RETIRED_IDLE: 0, RETIRED_CAPACITY: 0}
+        self.summaries_dropped = 0
+        self.peak_flows = 0
+
+        # 检查点：上次检查点之后有数据包的流（第一次检查点之前为 None，不产生开销）
+        self._changed: Optional[set] = None
+        self.retired_total = 0
+        self._checkpoint_retired = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def process_record(self, record: PacketRecord, timestamp: float = None) -> dict:
+        """
+        处理 UDP 数据包（快速解码记录）
+        :return: {'stream_id', 'stream_index', 'protocol', 'outbound', 'flow_packets'}，
+                 outbound 表示与流的第一个报文同方向；不是 UDP 报文返回空字典
+        """
+        if record.protocol != "UDP":
+            return {}
+        if not timestamp:
+            timestamp = record.timestamp or datetime.now().timestamp()
+        with self._lock:
+            return self._process(record, timestamp)
+
+    def _process(self, record: PacketRecord, timestamp: float) -> dict:
+        self._expire(timestamp)
+
+        key, forward = pack_flow_key(record.src_ip, record.sport, record.dst_ip, record.dport, IPPROTO_UDP)
+        table = self.table
+        slot = table.slot(key)
+        if slot < 0:
+            slot = self._create(key, forward, record, timestamp)
+
+        payload = record.payload
+        length = len(payload)
+        table.last_seen[slot] = timestamp
+        table.packets[slot] += 1
+        table.bytes[slot] += length
+        outbound = forward != bool(table.flags[slot] & _INITIATOR_REVERSE)
+        if outbound:
+            self._out_packets[slot] += 1
+            self._out_bytes[slot] += length
+        self._histograms[slot * HIST_BUCKETS + min(length.bit_length(), HIST_BUCKETS - 1)] += 1
+
+        code = self._protocols[slot]
+        if code <= 0 and length and code > -MAX_ATTEMPTS:
+            protocol = classify_udp(payload, record.sport, record.dport)
+            code = self._protocol_code(protocol) if protocol is not None else code - 1
+            self._protocols[slot] = code
+
+        if self._changed is not None:
+            self._changed.add(key)
+        return {
+            'stream_id': self._stream_ids[slot],
+            'stream_index': self._indexes[slot],
+            'protocol': self._protocol_names[code] if code > 0 else None,
+            'outbound': outbound,
+            'flow_packets': table.packets[slot]
+        }
+
+    def _protocol_code(self, protocol: str) -> int:
+        code = self._protocol_codes.get(protocol)
+        if code is None:
+            code = self._protocol_codes[protocol] = len(self._protocol_names)
+            self._protocol_names.append(protocol)
+        return code
+
+    def _create(self, key: bytes, forward: bool, record: PacketRecord, timestamp: float) -> int:
+        """新建流：分配槽位并初始化额外的列"""
+        table = self.table
+        if len(table) >= self.max_flows:
+            self._make_room()
+        self.flows_created += 1
+        stream_id = TCPStreamManager.format_stream_id(record.src_ip, record.sport, record.dst_ip, record.dport)
+        slot = self._allocate(key, stream_id, self.flows_created, timestamp)
+        if not forward:
+            table.set_flags(slot, _INITIATOR_REVERSE)
+        self._timers.schedule(key, timestamp + self.idle_timeout)
+        if len(table) > self.peak_flows:
+            self.peak_flows = len(table)
+        hot_log.debug(logger, "UDP-NEW", "[UDP] New flow %s", stream_id)
+        return slot
+
+    def _allocate(self, key: bytes, stream_id: str, index: int, timestamp: float) -> int:
+        slot = self.table.add(key, timestamp)
+        if slot < len(self._stream_ids):
+            self._stream_ids[slot] = stream_id
+            self._indexes[slot] = index
+            self._out_packets[slot] = 0
+            self._out_bytes[slot] = 0
+            self._protocols[slot] = 0
+            start = slot * HIST_BUCKETS
+            self._histograms[start:start + HIST_BUCKETS] = _EMPTY_HISTOGRAM
+        else:
+            self._stream_ids.append(stream_id)
+            self._indexes.append(index)
+            self._out_packets.append(0)
+            self._out_bytes.append(0)
+            self._protocols.append(0)
+            self._histograms.extend(_EMPTY_HISTOGRAM)
+        return slot
+
+    def _make_room(self) -> None:
+        """容量满：淘汰最久未活动的 1/8（摊销 O(1)）"""
+        for key in self.table.oldest(max(1, len(self.table) // FlowTable.EVICT_FRACTION)):
+            self._retire(key, RETIRED_CAPACITY)
+
+    def expire(self, now: float) -> int:
+        """
+        处理到期的定时器：空闲超时的流被淘汰
+        :param now: 当前时间（抓包时间戳）
+        :return: 本次淘汰的流数量
+        """
+        with self._lock:
+            return self._expire(now)
+
+    def _expire(self, now: float) -> int:
+        retired = 0
+        table = self.table
+        for key in self._timers.advance(now):
+            slot = table.slot(key)
+            if slot < 0:
+                continue
+            due = table.last_seen[slot] + self.idle_timeout
+            if due > now:
+                # 期间有新的数据包，按最后活动时间重新调度
+                self._timers.schedule(key, due)
+                continue
+            self._retire(key, RETIRED_IDLE)
+            retired += 1
+        return retired
+
+    def retire(self, key: bytes, reason: str) -> Optional[dict]:
+        """结束一个流，只保留摘要；流不存在返回 None"""
+        with self._lock:
+            return self._retire(key, reason)
+
+    def _retire(self, key: bytes, reason: str) -> Optional[dict]:
+        slot = self.table.slot(key)
+        if slot < 0:
+            return None
+        summary = self._summarize(key, slot)
+        summary['active'] = False
+        summary['close_reason'] = reason
+        self.table.remove(key)
+        self._timers.cancel(key)
+        self._stream_ids[slot] = None
+        self.eviction_counts[reason] += 1
+        self.retired_total += 1
+
+        stream_id = summary['stream_id']
+        retired = self.retired
+        retired.pop(stream_id, None)
+        retired[stream_id] = summary
+        if len(retired) > self.max_retired:
+            retired.popitem(last=False)
+            self.summaries_dropped += 1
+        hot_log.debug(logger, "UDP-RETIRE", "[UDP] Retired flow %s (%s), %d packets",
+                      stream_id, reason, summary['total_packets'])
+        return summary
+
+    def _summarize(self, key: bytes, slot: int) -> dict:
+        table = self.table
+        ip_a, port_a, ip_b, port_b, _ = unpack_flow_key(key)
+        src, dst = f"{ip_a}:{port_a}", f"{ip_b}:{port_b}"
+        if table.flags[slot] & _INITIATOR_REVERSE:
+            src, dst = dst, src
+        packets = table.packets[slot]
+        total_bytes = table.bytes[slot]
+        out_packets = self._out_packets[slot]
+        out_bytes = self._out_bytes[slot]
+        code = self._protocols[slot]
+        start = slot * HIST_BUCKETS
+        histogram = self._histograms[start:start + HIST_BUCKETS]
+        return {
+            'stream_id': self._stream_ids[slot],
+            'stream_index': self._indexes[slot],
+            'transport': "UDP",
+            'src': src,
+            'dst': dst,
+            'protocol': self._protocol_names[code] if code > 0 else None,
+            'total_packets': packets,
+            'total_bytes': total_bytes,
+            'outbound_packets': out_packets,
+            'outbound_bytes': out_bytes,
+            'inbound_packets': packets - out_packets,
+            'inbound_bytes': total_bytes - out_bytes,
+            'payload_histogram': {HIST_LABELS[bucket]: count for bucket, count in enumerate(histogram) if count},
+            'start_time': table.first_seen[slot],
+            'last_seen': table.last_seen[slot],
+            'duration': table.last_seen[slot] - table.first_seen[slot]
+        }
+
+    def _active_summary(self, key: bytes, slot: int) -> dict:
+        summary = self._summarize(key, slot)
+        summary['active'] = True
+        summary['close_reason'] = None
+        return summary
+
+    @staticmethod
+    def _key_from_stream_id(stream_id: str) -> Optional[bytes]:
+        """流ID字符串 -> 打包的流表key，格式错误返回 None"""
+        try:
+            a, b = stream_id.split('-', 1)
+            ip_a, port_a = a.rsplit(':', 1)
+            ip_b, port_b = b.rsplit(':', 1)
+            return pack_flow_key(ip_a, int(port_a), ip_b, int(port_b), IPPROTO_UDP)[0]
+        except (ValueError, OSError):
+            return None
+
+    def get_flow_stats(self, stream_id: str) -> Optional[dict]:
+        """获取流统计信息（包括已结束的流）"""
+        key = self._key_from_stream_id(stream_id)
+        with self._lock:
+            slot = self.table.slot(key) if key is not None else -1
+            if slot < 0:
+                return self.retired.get(stream_id)
+            return self._active_summary(key, slot)
+
+    def get_all_flows(self) -> List[dict]:
+        """获取所有流的统计信息（活动流 + 已结束流的摘要）"""
+        with self._lock:
+            return ([self._active_summary(key, slot) for key, slot in self.table.items()]
+                    + list(self.retired.values()))
+
+    def get_protocol_stats(self) -> Dict[str, int]:
+        """活动流按协议计数（未识别的流计为 UDP）"""
+        with self._lock:
+            return self._protocol_stats()
+
+    def _protocol_stats(self) -> Dict[str, int]:
+        names = self._protocol_names
+        protocols = self._protocols
+        counts: Dict[str, int] = {}
+        for slot in self.table.slots():
+            code = protocols[slot]
+            name = names[code] if code > 0 else "UDP"
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def checkpoint_state(self, full: bool = True) -> dict:
+        """
+        UDP 流表检查点状态（只含内置类型），必须在处理数据包的线程中调用
+        full=False 时只包含上次检查点之后有数据包的流和之后结束的流
+        """
+        with self._lock:
+            return self._checkpoint_state(full)
+
+    def _checkpoint_state(self, full: bool) -> dict:
+        table = self.table
+        if full or self._changed is None:
+            full = True
+            changed = list(table.items())
+            retired = list(self.retired.items())
+        else:
+            changed = sorted(((key, table.slot(key)) for key in self._changed if key in table),
+                             key=lambda item: table.last_seen[item[1]])
+            count = min(self.retired_total - self._checkpoint_retired, len(self.retired))
+            retired = list(self.retired.items())[len(self.retired) - count:]
+        self._changed = set()
+        self._checkpoint_retired = self.retired_total
+        return {
+            'full': full,
+            'flows': [self._flow_state(key, slot) for key, slot in changed],
+            'retired': retired,
+            'counters': (dict(self.eviction_counts), self.summaries_dropped, self.peak_flows,
+                         self.flows_created, self.retired_total)
+        }
+
+    def _flow_state(self, key: bytes, slot: int) -> tuple:
+        table = self.table
+        code = self._protocols[slot]
+        start = slot * HIST_BUCKETS
+        return (key, self._stream_ids[slot], self._indexes[slot], table.flags[slot], table.first_seen[slot],
+                table.last_seen[slot], table.packets[slot], table.bytes[slot], self._out_packets[slot],
+                self._out_bytes[slot], self._protocol_names[code] if code > 0 else code,
+                tuple(self._histograms[start:start + HIST_BUCKETS]))
+
+    def restore_state(self, state: dict) -> None:
+        """应用 checkpoint_state() 的结果：全量状态替换当前流表，增量按顺序叠加"""
+        with self._lock:
+            self._restore_state(state)
+
+    def _restore_state(self, state: dict) -> None:
+        table = self.table
+        if state['full']:
+            for key in list(table.keys()):
+                table.remove(key)
+                self._timers.cancel(key)
+            self.retired.clear()
+
+        retired = self.retired
+        for stream_id, summary in state['retired']:
+            key = self._key_from_stream_id(stream_id)
+            if key is not None and table.remove(key):
+                self._timers.cancel(key)
+            retired.pop(stream_id, None)
+            retired[stream_id] = summary
+        while len(retired) > self.max_retired:
+            retired.popitem(last=False)
+
+        for (key, stream_id, index, flags, first_seen, last_seen, packets, total_bytes, out_packets,
+             out_bytes, protocol, histogram) in state['flows']:
+            table.remove(key)
+            slot = self._allocate(key, stream_id, index, first_seen)
+            table.flags[slot] = flags
+            table.last_seen[slot] = last_seen
+            table.packets[slot] = packets
+            table.bytes[slot] = total_bytes
+            self._out_packets[slot] = out_packets
+            self._out_bytes[slot] = out_bytes
+            self._protocols[slot] = self._protocol_code(protocol) if protocol.__class__ is str else protocol
+            start = slot * HIST_BUCKETS
+            self._histograms[start:start + HIST_BUCKETS] = array('I', histogram)
+            self._timers.schedule(key, last_seen + self.idle_timeout)
+
+        (eviction_counts, self.summaries_dropped, self.peak_flows, self.flows_created,
+         self.retired_total) = state['counters']
+        self.eviction_counts.update(eviction_counts)
+        self._checkpoint_retired = self.retired_total
+
+    def stats(self) -> dict:
+        with self._lock:
+            return self._stats()
+
+    def _stats(self) -> dict:
+        table = self.table
+        columns = sum(column.itemsize * len(column) for column in
+                      (self._indexes, self._out_packets, self._out_bytes, self._protocols, self._histograms))
+        return {
+            'active_flows': len(table),
+            'peak_flows': self.peak_flows,
+            'flows_created': self.flows_created,
+            'retired_summaries': len(self.retired),
+            'summaries_dropped': self.summaries_dropped,
+            'evicted': dict(self.eviction_counts),
+            'protocols': self._protocol_stats(),
+            'idle_timeout': self.idle_timeout,
+            'memory_bytes': table.memory_bytes() + columns + len(self._stream_ids) * 8,
+            'timers': len(self._timers)
+        }
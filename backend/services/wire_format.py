@@ -0,0 +1,432 @@
+"""
+实时抓包紧凑二进制编码
+在 WebSocket 配置消息中通过 "encoding": "binary" 协商启用，
+每个批次编码为一个二进制帧，前端由 CaptureEngine.js 中的 decodeBinaryBatch 还原为
+与 JSON 模式完全相同的数据包对象
+
+帧格式（小端）:
+  头部       magic 'NS' | version u8 | flags u8 | table_base u32 | new_strings u32 | packets u32
+  新增字符串 new_strings 个变长字符串，依次追加到会话字符串表 table_base 处
+  数据包     固定头 + 可选 TCP 段 + 内联字符串（info/body）+ 可选 HTTP 段 + 可选 JSON 段（tls/extra）
+
+变长字符串 = 长度（< 255 时 1 字节，否则 0xFF + u32）+ UTF-8
+source/destination/method/path/protocol/category/latency、HTTP 头部等低基数字段写入会话字符串表，
+之后只传 u16 索引；sourceIP、traceId 由解码端根据 source、id 还原
+字符串表写满时重置（FLAG_RESET_TABLE）；一批的不同字符串超过表容量时拆成多个帧
+
+decode_batch 是与 decodeBinaryBatch 对应的 Python 实现，用于测试和调试
+"""
+import json
+import struct
+from typing import Dict, List, Optional
+
+WIRE_VERSION = 1
+ENCODINGS = ("json", "binary")
+
+# 头部 flags
+FLAG_RESET_TABLE = 0x01
+
+# 数据包 flags
+PKT_TCP = 0x01
+PKT_HTTP = 0x02
+PKT_TLS = 0x04
+PKT_RETRANS = 0x08
+PKT_OUT_OF_ORDER = 0x10
+PKT_RAW_TIME = 0x20
+PKT_EXTRA = 0x40
+PKT_HTTP_JSON = 0x80
+
+_HEADER = struct.Struct('<2sBBIII')
+# 数据包固定头（29 字节）:
+# id, time_ms | source, destination, method, path, protocol, category, latency | size, status, flags
+_PACKET_HEAD = struct.Struct('<II')
+_PACKET_ROW = struct.Struct('<7H')
+_PACKET_TAIL = struct.Struct('<IHB')
+_TCP = struct.Struct('<Hf')
+# type, method | status_code, url | reason, header_count
+_HTTP = struct.Struct('<BHHH')
+_U16 = struct.Struct('<H')
+_U16_PAIR = struct.Struct('<HH')
+_U32 = struct.Struct('<I')
+_LONG_STRING = struct.Struct('<BI')
+
+HTTP_REQUEST = 0
+HTTP_RESPONSE = 1
+_HTTP_REQUEST_FIELDS = frozenset(('type', 'method', 'url', 'headers', 'body'))
+_HTTP_RESPONSE_FIELDS = frozenset(('type', 'status_code', 'reason', 'headers', 'body'))
+
+# 解码端可以直接还原的字段
+_KNOWN_FIELDS = frozenset((
+    'id', 'timestamp', 'source', 'sourceIP', 'destination', 'method', 'path', 'protocol',
+    'status', 'latency', 'size', 'info', 'traceId', 'category', 'body', 'tcp', 'http', 'tls'
+))
+_KNOWN_TCP_FIELDS = frozenset(('is_retransmission', 'is_out_of_order', 'stream_state', 'retransmission_rate'))
+
+_json_dumps = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+
+
+class _TableFull(ValueError):
+    """字符串表已满（索引超出 u16）"""
+
+
+def _put_string(out: bytearray, text: str) -> None:
+    """写入变长字符串"""
+    data = text.encode('utf-8')
+    if len(data) < 0xFF:
+        out.append(len(data))
+    else:
+        out += _LONG_STRING.pack(0xFF, len(data))
+    out += data
+
+
+def _compact_http(http: dict) -> bool:
+    """HTTP 段是否可以用结构化编码（否则退回 JSON）"""
+    keys = http.keys()
+    if keys == _HTTP_REQUEST_FIELDS:
+        if http['type'] != 'request':
+            return False
+    elif keys == _HTTP_RESPONSE_FIELDS:
+        if http['type'] != 'response' or type(http['status_code']) is not int \
+                or not 0 <= http['status_code'] <= 0xFFFF:
+            return False
+    else:
+        return False
+    headers = http['headers']
+    return (type(headers) is dict and len(headers) <= 0xFFFF and type(http['body']) is str
+            and all(type(k) is str and type(v) is str for k, v in headers.items()))
+
+
+class PacketWireEncoder:
+    """
+    单个 WebSocket 会话的二进制编码器
+    字符串表随会话增长，写满时重置并重新编码当前批次
+    """
+
+    MAX_STRINGS = 65536
+    # 单帧最多包含的数据包数量
+    MAX_BATCH = 1024
+    # 时间戳/长度解析缓存上限
+    _CACHE_LIMIT = 4096
+
+    def __init__(self):
+        self._strings: Dict[str, int] = {}
+        self._pending: List[str] = []
+        # 低基数列组合 -> 已打包的索引（随字符串表一起重置）
+        self._rows: Dict[tuple, bytes] = {}
+        self._times: Dict[str, int] = {}
+        self._sizes: Dict[str, int] = {}
+        self.table_resets = 0
+        self.batches_encoded = 0
+        self.packets_encoded = 0
+        self.bytes_encoded = 0
+
+    def _intern(self, value) -> int:
+        value = value if type(value) is str else str(value)
+        index = self._strings.get(value)
+        if index is None:
+            index = len(self._strings)
+            if index >= self.MAX_STRINGS:
+                raise _TableFull()
+            self._strings[value] = index
+            self._pending.append(value)
+        return index
+
+    def _parse_time(self, timestamp) -> Optional[int]:
+        """HH:MM:SS.mmm -> 当天毫秒数，格式不符返回 None"""
+        try:
+            if len(timestamp) != 12:
+                return None
+            time_ms = (int(timestamp[0:2]) * 3600000 + int(timestamp[3:5]) * 60000 +
+                       int(timestamp[6:8]) * 1000 + int(timestamp[9:12]))
+        except (ValueError, TypeError):
+            return None
+        if len(self._times) >= self._CACHE_LIMIT:
+            self._times.clear()
+        self._times[timestamp] = time_ms
+        return time_ms
+
+    def _parse_size(self, size) -> Optional[int]:
+        """'123B' -> 123，格式不符返回 None"""
+        try:
+            value = int(size[:-1]) if size.endswith('B') else None
+        except (ValueError, AttributeError):
+            return None
+        if value is None or not 0 <= value <= 0xFFFFFFFF:
+            return None
+        if len(self._sizes) >= self._CACHE_LIMIT:
+            self._sizes.clear()
+        self._sizes[size] = value
+        return value
+
+    def encode(self, packets: List[dict]) -> List[bytes]:
+        """编码任意数量的数据包，按 MAX_BATCH 拆分为多个帧"""
+        step = self.MAX_BATCH
+        frames = []
+        for i in range(0, len(packets), step):
+            frames += self.encode_batch(packets[i:i + step])
+        return frames
+
+    def encode_batch(self, packets: List[dict]) -> List[bytes]:
+        """
+        将一批数据包编码为二进制帧
+        通常是一个帧；字符串表写满时清空后重新编码，本批次的不同字符串超过表容量时拆成多个帧
+        """
+        try:
+            return [self._encode_batch(packets, 0)]
+        except _TableFull:
+            return self._encode_after_reset(packets)
+
+    def _reset_table(self) -> None:
+        """丢弃已追加但未发送的字符串，清空字符串表"""
+        self._strings.clear()
+        self._rows.clear()
+        self._pending = []
+        self.table_resets += 1
+
+    def _encode_after_reset(self, packets: List[dict]) -> List[bytes]:
+        self._reset_table()
+        try:
+            return [self._encode_batch(packets, FLAG_RESET_TABLE)]
+        except _TableFull:
+            pass
+        if len(packets) > 1:
+            half = len(packets) // 2
+            return self._encode_after_reset(packets[:half]) + self.encode_batch(packets[half:])
+        # 单个数据包的 HTTP 头部就超过表容量：HTTP 段改用 JSON，不再写入字符串表
+        self._reset_table()
+        return [self._encode_batch(packets, FLAG_RESET_TABLE, compact_http=False)]
+
+    def _encode_batch(self, packets: List[dict], flags: int, compact_http: bool = True) -> bytes:
+        table_base = len(self._strings)
+
+        intern = self._intern
+        strings_get = self._strings.get
+        rows = self._rows
+        times_get = self._times.get
+        sizes_get = self._sizes.get
+        pack_head = _PACKET_HEAD.pack
+        pack_row = _PACKET_ROW.pack
+        pack_tail = _PACKET_TAIL.pack
+        pack_tcp = _TCP.pack
+        body = bytearray()
+
+        for packet in packets:
+            get = packet.get
+            pkt_flags = 0
+            extra = None
+
+            timestamp = get('timestamp', '')
+            time_ms = times_get(timestamp)
+            if time_ms is None:
+                time_ms = self._parse_time(timestamp)
+                if time_ms is None:
+                    time_ms = intern(timestamp)
+                    pkt_flags |= PKT_RAW_TIME
+
+            size = get('size', '')
+            size_value = sizes_get(size)
+            if size_value is None:
+                size_value = self._parse_size(size)
+                if size_value is None:
+                    size_value = 0
+                    extra = {'size': size}
+
+            tcp = get('tcp')
+            if tcp:
+                pkt_flags |= PKT_TCP
+                if tcp.get('is_retransmission'):
+                    pkt_flags |= PKT_RETRANS
+                if tcp.get('is_out_of_order'):
+                    pkt_flags |= PKT_OUT_OF_ORDER
+                if not tcp.keys() <= _KNOWN_TCP_FIELDS:
+                    extra = extra or {}
+                    extra['tcp'] = tcp
+            http = get('http')
+            if http:
+                pkt_flags |= PKT_HTTP if compact_http and _compact_http(http) else PKT_HTTP_JSON
+            tls = get('tls')
+            if tls:
+                pkt_flags |= PKT_TLS
+
+            # 无法由解码端推导的字段放入 extra（JSON）
+            packet_id = get('id', 0)
+            source = get('source', '')
+            if get('sourceIP', source) != source:
+                extra = extra or {}
+                extra['sourceIP'] = packet['sourceIP']
+            trace_id = get('traceId')
+            if trace_id is not None and trace_id != f"pkt_{packet_id}":
+                extra = extra or {}
+                extra['traceId'] = trace_id
+            if not packet.keys() <= _KNOWN_FIELDS:
+                extra = extra or {}
+                for key in packet.keys() - _KNOWN_FIELDS:
+                    extra[key] = packet[key]
+            if extra:
+                pkt_flags |= PKT_EXTRA
+
+            row_key = (source, get('destination', ''), get('method', ''), get('path', ''),
+                       get('protocol', ''), get('category', ''), get('latency', '-'))
+            row = rows.get(row_key)
+            if row is None:
+                row = rows[row_key] = pack_row(*[intern(value) for value in row_key])
+
+            body += pack_head(packet_id, time_ms)
+            body += row
+            body += pack_tail(size_value, get('status', 0), pkt_flags)
+            if tcp:
+                state = tcp.get('stream_state', 'UNKNOWN')
+                index = strings_get(state)
+                body += pack_tcp(intern(state) if index is None else index,
+                                 tcp.get('retransmission_rate', 0))
+            _put_string(body, get('info', ''))
+            _put_string(body, get('body', ''))
+
+            if pkt_flags & PKT_HTTP:
+                headers = http['headers']
+                if http['type'] == 'request':
+                    body += _HTTP.pack(HTTP_REQUEST, intern(http['method']), intern(http['url']),
+                                       len(headers))
+                else:
+                    body += _HTTP.pack(HTTP_RESPONSE, http['status_code'], intern(http['reason']),
+                                       len(headers))
+                for name, value in headers.items():
+                    body += _U16.pack(intern(name))
+                    body += _U16.pack(intern(value))
+                _put_string(body, http['body'])
+            elif pkt_flags & PKT_HTTP_JSON:
+                _put_string(body, _json_dumps(http))
+            if tls:
+                _put_string(body, _json_dumps(tls))
+            if extra:
+                _put_string(body, _json_dumps(extra))
+
+        if len(rows) > self.MAX_STRINGS:
+            rows.clear()
+
+        pending = self._pending
+        frame = bytearray(_HEADER.pack(b'NS', WIRE_VERSION, flags, table_base, len(pending), len(packets)))
+        for value in pending:
+            _put_string(frame, value)
+        self._pending = []
+        frame += body
+
+        self.batches_encoded += 1
+        self.packets_encoded += len(packets)
+        self.bytes_encoded += len(frame)
+        return bytes(frame)
+
+    def stats(self) -> dict:
+        return {
+            'encoding': 'binary',
+            'version': WIRE_VERSION,
+            'strings': len(self._strings),
+            'table_resets': self.table_resets,
+            'batches': self.batches_encoded,
+            'packets': self.packets_encoded,
+            'bytes': self.bytes_encoded,
+            'bytes_per_packet': round(self.bytes_encoded / self.packets_encoded, 1) if self.packets_encoded else 0
+        }
+
+
+def _format_time(time_ms: int) -> str:
+    return (f"{time_ms // 3600000:02d}:{time_ms // 60000 % 60:02d}:"
+            f"{time_ms // 1000 % 60:02d}.{time_ms % 1000:03d}")
+
+
+def decode_batch(frame: bytes, strings: List[str]) -> List[dict]:
+    """
+    解码一个二进制帧（与 CaptureEngine.js 的 decodeBinaryBatch 相同）
+    :param strings: 会话字符串表（原地追加/重置）
+    :return: 与 JSON 模式结构相同的数据包
+    """
+    view = memoryview(frame)
+    offset = 0
+
+    def read_string() -> str:
+        nonlocal offset
+        length = view[offset]
+        offset += 1
+        if length == 0xFF:
+            length = _U32.unpack_from(view, offset)[0]
+            offset += 4
+        text = str(view[offset:offset + length], 'utf-8')
+        offset += length
+        return text
+
+    magic, version, flags, table_base, new_strings, count = _HEADER.unpack_from(view, 0)
+    if magic != b'NS':
+        raise ValueError("Bad wire magic")
+    if version != WIRE_VERSION:
+        raise ValueError(f"Unsupported wire version {version}")
+    offset = _HEADER.size
+    if flags & FLAG_RESET_TABLE:
+        strings.clear()
+    if table_base != len(strings):
+        raise ValueError("Wire string table out of sync")
+    for _ in range(new_strings):
+        strings.append(read_string())
+
+    packets = []
+    for _ in range(count):
+        packet_id, time_ms = _PACKET_HEAD.unpack_from(view, offset)
+        offset += _PACKET_HEAD.size
+        source, destination, method, path, protocol, category, latency = (
+            strings[index] for index in _PACKET_ROW.unpack_from(view, offset))
+        offset += _PACKET_ROW.size
+        size, status, pkt_flags = _PACKET_TAIL.unpack_from(view, offset)
+        offset += _PACKET_TAIL.size
+
+        tcp = None
+        if pkt_flags & PKT_TCP:
+            state, rate = _TCP.unpack_from(view, offset)
+            offset += _TCP.size
+            tcp = {'is_retransmission': bool(pkt_flags & PKT_RETRANS),
+                   'is_out_of_order': bool(pkt_flags & PKT_OUT_OF_ORDER),
+                   'stream_state': strings[state], 'retransmission_rate': rate}
+        info = read_string()
+        body = read_string()
+
+        http = None
+        if pkt_flags & PKT_HTTP:
+            kind, first, second, header_count = _HTTP.unpack_from(view, offset)
+            offset += _HTTP.size
+            if kind == HTTP_REQUEST:
+                http = {'type': 'request', 'method': strings[first], 'url': strings[second]}
+            else:
+                http = {'type': 'response', 'status_code': first, 'reason': strings[second]}
+            headers = {}
+            for _ in range(header_count):
+                name, value = _U16_PAIR.unpack_from(view, offset)
+                offset += 4
+                headers[strings[name]] = strings[value]
+            http['headers'] = headers
+            http['body'] = read_string()
+        elif pkt_flags & PKT_HTTP_JSON:
+            http = json.loads(read_string())
+        tls = json.loads(read_string()) if pkt_flags & PKT_TLS else None
+
+        packet = {
+            'id': packet_id,
+            'timestamp': strings[time_ms] if pkt_flags & PKT_RAW_TIME else _format_time(time_ms),
+            'source': source,
+            'sourceIP': source,
+            'destination': destination,
+            'method': method,
+            'path': path,
+            'protocol': protocol,
+            'status': status,
+            'latency': latency,
+            'size': f"{size}B",
+            'info': info,
+            'traceId': f"pkt_{packet_id}",
+            'category': category,
+            'body': body,
+            'tcp': tcp,
+            'http': http,
+            'tls': tls
+        }
+        if pkt_flags & PKT_EXTRA:
+            packet.update(json.loads(read_string()))
+        packets.append(packet)
+    return packets
@@ -0,0 +1,89 @@
+"""
+快速解码器基准测试
+对比 Scapy 完整解析路径与 struct 快速解码路径的吞吐量（pps）
+
+运行: python -m benchmarks.bench_fast_decoder [--packets N]
+"""
+import argparse
+import logging
+import os
+import time
+
+from scapy.all import Ether, IP, TCP, UDP, Raw
+
+from backend.services.fast_decoder import decode_frame, LINKTYPE_ETHERNET
+from backend.services.packet_capture import PacketCaptureEngine
+
+CLIENT_IP = "192.168.1.10"
+SERVER_IP = "10.0.0.5"
+
+
+def build_frames(count: int) -> list:
+    """生成混合流量：HTTP 请求/响应、纯 ACK、UDP"""
+    templates = []
+    seq = 1000
+    for i in range(64):
+        sport = 40000 + i
+        req = b"GET /api/items/%d HTTP/1.1\r\nHost: example.com\r\n\r\n" % i
+        resp = b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello"
+        templates.append(Ether() / IP(src=CLIENT_IP, dst=SERVER_IP) /
+                         TCP(sport=sport, dport=80, flags="PA", seq=seq, ack=1) / Raw(req))
+        templates.append(Ether() / IP(src=SERVER_IP, dst=CLIENT_IP) /
+                         TCP(sport=80, dport=sport, flags="PA", seq=1, ack=seq + len(req)) / Raw(resp))
+        templates.append(Ether() / IP(src=CLIENT_IP, dst=SERVER_IP) /
+                         TCP(sport=sport, dport=80, flags="A", seq=seq + len(req), ack=1 + len(resp)))
+        templates.append(Ether() / IP(src=CLIENT_IP, dst="8.8.8.8") /
+                         UDP(sport=sport, dport=53) / Raw(b"\x12\x34\x01\x00" + b"\x00" * 28))
+    frames = [bytes(p) for p in templates]
+    return [frames[i % len(frames)] for i in range(count)]
+
+
+def _new_engine() -> PacketCaptureEngine:
+    engine = PacketCaptureEngine(os.getpid())
+    engine.is_running = True
+    engine._local_ip = CLIENT_IP  # 跳过本机IP探测
+    return engine
+
+
+def bench(name: str, func, frames: list) -> float:
+    start = time.perf_counter()
+    for frame in frames:
+        func(frame)
+    elapsed = time.perf_counter() - start
+    pps = len(frames) / elapsed
+    print(f"  {name:<32} {pps:>12,.0f} pps  ({elapsed:.3f}s)")
+    return pps
+
+
+def _scapy_decode(frame: bytes):
+    pkt = Ether(frame)
+    if pkt.haslayer(IP):
+        ip = pkt[IP]
+        transport = pkt[TCP] if pkt.haslayer(TCP) else pkt[UDP]
+        return ip.src, ip.dst, transport.sport, transport.dport, bytes(transport.payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--packets", type=int, default=20000)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    frames = build_frames(args.packets)
+    now = time.time()
+
+    print(f"Header decode ({args.packets} packets)")
+    slow = bench("scapy dissect", _scapy_decode, frames)
+    fast = bench("fast_decoder.decode_frame", lambda f: decode_frame(f, LINKTYPE_ETHERNET, now), frames)
+    print(f"  speedup: {fast / slow:.1f}x")
+
+    print(f"End-to-end engine ({args.packets} packets)")
+    scapy_engine = _new_engine()
+    slow = bench("_process_packet (scapy)", lambda f: scapy_engine._process_packet(Ether(f)), frames)
+    fast_engine = _new_engine()
+    fast = bench("_process_frame (fast)", lambda f: fast_engine._process_frame(f, LINKTYPE_ETHERNET, now), frames)
+    print(f"  speedup: {fast / slow:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
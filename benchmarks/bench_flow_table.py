@@ -0,0 +1,118 @@
+"""
+连接表基准测试
+对比旧实现（f-string 五元组 key + 每连接一个计数器对象）与 FlowTable（打包二进制 key + 按列 array）：
+- insert: 首次见到连接（生成 key + 建表）
+- update: 已有连接的后续数据包（生成 key + 更新计数器）
+- 每连接内存: tracemalloc 统计建表前后的增量
+
+运行: python -m benchmarks.bench_flow_table [--flows N ...] [--updates N]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from backend.services.flow_table import FlowTable, pack_flow_key
+
+
+class _Counters:
+    """旧实现中每个连接的计数器对象"""
+
+    def __init__(self, now: float):
+        self.first_seen = now
+        self.last_seen = now
+        self.packets = 0
+        self.bytes = 0
+
+
+def build_tuples(count: int) -> list:
+    """生成 count 个不同的五元组：客户端 IP/端口变化，服务器固定几个"""
+    tuples = []
+    for i in range(count):
+        client = f"10.{(i >> 16) & 0xff}.{(i >> 8) & 0xff}.{i & 0xff}"
+        server = f"192.168.0.{1 + i % 8}"
+        tuples.append((client, 1024 + i % 60000, server, 443))
+    return tuples
+
+
+def _string_key(src_ip, sport, dst_ip, dport) -> str:
+    if (src_ip, sport) < (dst_ip, dport):
+        return f"{src_ip}:{sport}-{dst_ip}:{dport}"
+    return f"{dst_ip}:{dport}-{src_ip}:{sport}"
+
+
+def run_baseline(tuples: list, now: float) -> dict:
+    table = {}
+    for src_ip, sport, dst_ip, dport in tuples:
+        key = _string_key(src_ip, sport, dst_ip, dport)
+        counters = table.get(key)
+        if counters is None:
+            counters = table[key] = _Counters(now)
+        counters.last_seen = now
+        counters.packets += 1
+        counters.bytes += 1500
+    return table
+
+
+def run_flow_table(tuples: list, now: float) -> FlowTable:
+    table = FlowTable()
+    update = table.update
+    for src_ip, sport, dst_ip, dport in tuples:
+        update(pack_flow_key(src_ip, sport, dst_ip, dport)[0], now, 1500)
+    return table
+
+
+def measure(name: str, runner, tuples: list, updates: list) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    table = runner(tuples, 1.0)
+    insert_elapsed = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # 更新阶段不开 tracemalloc，避免拖慢计时
+    start = time.perf_counter()
+    if isinstance(table, FlowTable):
+        update = table.update
+        for src_ip, sport, dst_ip, dport in updates:
+            update(pack_flow_key(dst_ip, dport, src_ip, sport)[0], 2.0, 60)
+    else:
+        for src_ip, sport, dst_ip, dport in updates:
+            counters = table[_string_key(dst_ip, dport, src_ip, sport)]
+            counters.last_seen = 2.0
+            counters.packets += 1
+            counters.bytes += 60
+    update_elapsed = time.perf_counter() - start
+
+    result = {
+        'insert_per_s': len(tuples) / insert_elapsed,
+        'update_per_s': len(updates) / update_elapsed if updates else 0,
+        'bytes_per_flow': memory / len(tuples),
+    }
+    print(f"  {name:<22} insert {result['insert_per_s']:>12,.0f} /s  "
+          f"update {result['update_per_s']:>12,.0f} /s  {result['bytes_per_flow']:>7.0f} B/flow")
+    del table
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flows", type=int, action="append",
+                        help="连接数量，可重复指定（默认 100000 和 1000000）")
+    parser.add_argument("--updates", type=int, default=1_000_000, help="更新阶段的数据包数量")
+    args = parser.parse_args()
+
+    for count in args.flows or (100_000, 1_000_000):
+        tuples = build_tuples(count)
+        # 更新阶段使用反方向的数据包，覆盖双向归一化
+        updates = [tuples[i % count] for i in range(args.updates)]
+        print(f"{count:,} flows, {len(updates):,} updates")
+        baseline = measure("f-string + object", run_baseline, tuples, updates)
+        compact = measure("FlowTable", run_flow_table, tuples, updates)
+        print(f"  memory: {baseline['bytes_per_flow'] / compact['bytes_per_flow']:.1f}x smaller, "
+              f"update: {compact['update_per_s'] / baseline['update_per_s']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+HTTP 事务存储基准测试
+对比旧实现（事务列表 + 每次查询/统计全量扫描）与 HTTPTransactionStore（环形缓冲区 + 二级索引）：
+- append:  写入事务（含索引维护和满后淘汰）
+- 查询:    单个 host、5xx、单个 stream、时间窗口、慢请求，各取最新 100 条
+- stats:   get_stats
+
+运行: python -m benchmarks.bench_http_store [--transactions N] [--capacity N]
+"""
+import argparse
+import random
+import time
+
+from backend.services.http_parser import HTTPHeaders
+from backend.services.http_store import HTTPTransactionStore, request_host
+from backend.services.http_stream import HTTPRequest, HTTPResponse, HTTPTransaction
+
+HOSTS = [f"svc{i}.example.com".encode() for i in range(200)]
+PATHS = ["/api/users/{}", "/api/orders/{}/items", "/static/app.js", "/api/search?q={}", "/health"]
+STATUSES = [200] * 90 + [201, 204, 301, 304, 400, 404, 404, 500, 502, 503]
+
+
+def build_transactions(count: int, seed: int = 1) -> list:
+    """生成 count 个已配对的事务（按响应时间排序）"""
+    rng = random.Random(seed)
+    transactions = []
+    now = 1_700_000_000.0
+    for i in range(count):
+        now += rng.random() * 0.002
+        duration = rng.lognormvariate(3, 1.2)
+        stream_id = f"10.0.{(i >> 8) & 0xff}.{i & 0xff}:{1024 + i % 3000}-10.1.0.1:80"
+        request = HTTPRequest("GET", rng.choice(PATHS).format(rng.randrange(100000)), "HTTP/1.1",
+                              HTTPHeaders([(b'Host', rng.choice(HOSTS))]), b'', now, stream_id)
+        response = HTTPResponse("HTTP/1.1", rng.choice(STATUSES), "", HTTPHeaders(), b'',
+                                now + duration / 1000, stream_id)
+        transactions.append(HTTPTransaction(request=request, response=response, duration=duration))
+    # 抓包时事务在收到响应时配对写入
+    transactions.sort(key=lambda trans: trans.response.timestamp)
+    return transactions
+
+
+def _timed(fn, repeat: int = 20) -> float:
+    """多次执行取最小值（毫秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def _scan(transactions: list, predicate, limit: int = 100) -> list:
+    """旧实现：从最新开始扫描列表"""
+    results = []
+    for trans in reversed(transactions):
+        if predicate(trans):
+            results.append(trans)
+            if len(results) >= limit:
+                break
+    return results
+
+
+def _scan_stats(transactions: list) -> dict:
+    status_codes = {}
+    total_duration = 0
+    for trans in transactions:
+        code = trans.response.status_code
+        status_codes[code] = status_codes.get(code, 0) + 1
+        total_duration += trans.duration
+    return {'status_codes': status_codes, 'avg_duration': total_duration / len(transactions)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HTTP transaction store benchmark")
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--capacity", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"building {args.transactions:,} transactions ...")
+    transactions = build_transactions(args.transactions)
+    retained = transactions[-args.capacity:]
+
+    store = HTTPTransactionStore(args.capacity)
+    start = time.perf_counter()
+    for trans in transactions:
+        store.append(trans)
+    elapsed = time.perf_counter() - start
+    print(f"  append            {len(transactions) / elapsed:>12,.0f} /s  (retained {len(store):,}, "
+          f"evicted {store.evicted:,})")
+
+    probe = retained[len(retained) // 2]
+    host = request_host(probe.request)
+    stream_id = probe.request.stream_id
+    t_mid = probe.response.timestamp
+    queries = [
+        ("host",        dict(host=host),
+         lambda t: request_host(t.request) == host),
+        ("5xx",         dict(status_class=5),
+         lambda t: t.response.status_code // 100 == 5),
+        ("stream",      dict(stream_id=stream_id),
+         lambda t: t.request.stream_id == stream_id),
+        ("time 1s",     dict(start=t_mid, end=t_mid + 1),
+         lambda t: t_mid <= t.response.timestamp <= t_mid + 1),
+        ("slow >2s",    dict(min_duration=2000),
+         lambda t: t.duration >= 2000),
+        ("host+5xx",    dict(host=host, status_class=5),
+         lambda t: request_host(t.request) == host and t.response.status_code // 100 == 5),
+    ]
+    print(f"  {'query':<12} {'list scan':>12} {'store':>12} {'matches':>8}")
+    for name, filters, predicate in queries:
+        expected = _scan(retained, predicate)
+        got = store.query(**filters)
+        assert [t.seq for t in got] == [t.seq for t in expected], name
+        baseline = _timed(lambda: _scan(retained, predicate), repeat=3)
+        indexed = _timed(lambda: store.query(**filters))
+        print(f"  {name:<12} {baseline:>10.3f}ms {indexed:>10.3f}ms {len(got):>8}")
+
+    baseline = _timed(lambda: _scan_stats(retained), repeat=3)
+    indexed = _timed(store.stats)
+    print(f"  {'stats':<12} {baseline:>10.3f}ms {indexed:>10.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
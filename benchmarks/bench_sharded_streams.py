@@ -0,0 +1,139 @@
+"""
+分片流管理器基准测试
+同一批确定性流量（traffic_gen）分别用三种方式做TCP流追踪：
+- single:   单个 TCPStreamManager，单线程
+- threads:  ShardedTCPStreamManager，调度线程按 shard_of_record 把连接固定分配给 N 个工作线程
+- processes: 按 flow_hash 把帧分给 N 个进程，每个进程独占一个 TCPStreamManager（与 pipeline 模式相同）
+
+CPython 的 GIL 下线程模式主要衡量加锁开销，进程模式才能随工作进程数扩展
+
+运行: python -m benchmarks.bench_sharded_streams [--packets N] [--workers N ...] [--scenario NAME]
+"""
+import argparse
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+
+from backend.services.fast_decoder import decode_frame, flow_hash, LINKTYPE_ETHERNET
+from backend.services.tcp_stream import TCPStreamManager, ShardedTCPStreamManager
+from benchmarks.traffic_gen import SCENARIOS, generate
+
+
+def _frames(scenario: str, count: int, seed: int) -> list:
+    return [(bytes(pkt), float(pkt.time)) for pkt in generate(scenario, count, seed)]
+
+
+def _decode(frames: list) -> list:
+    records = []
+    for frame, timestamp in frames:
+        record = decode_frame(frame, LINKTYPE_ETHERNET, timestamp)
+        if record is not None and record.is_tcp:
+            records.append(record)
+    return records
+
+
+def run_single(records: list) -> tuple:
+    manager = TCPStreamManager(payload_retention="none")
+    start = time.perf_counter()
+    for record in records:
+        manager.process_record(record)
+    return time.perf_counter() - start, len(manager.get_all_streams())
+
+
+def run_threads(records: list, workers: int) -> tuple:
+    # 工作线程进度不一致：由调度线程按顺序投递时间标记，各分片在自己的线程中推进定时器
+    manager = ShardedTCPStreamManager(shards=workers, payload_retention="none", expire_others=False)
+    queues = [queue.SimpleQueue() for _ in range(workers)]
+
+    def worker(index, inbox):
+        process = manager.process_record
+        while True:
+            batch = inbox.get()
+            if batch is None:
+                return
+            for item in batch:
+                if item.__class__ is float:
+                    manager.expire_shard(index, item)
+                else:
+                    process(item)
+
+    threads = [threading.Thread(target=worker, args=(index, inbox)) for index, inbox in enumerate(queues)]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    # 按连接分批投递，减少队列操作
+    batches = [[] for _ in range(workers)]
+    last_tick = None
+    for record in records:
+        tick = int(record.timestamp)
+        if tick != last_tick:
+            last_tick = tick
+            for batch in batches:
+                batch.append(record.timestamp)
+        index = manager.shard_of_record(record)
+        batch = batches[index]
+        batch.append(record)
+        if len(batch) >= 256:
+            queues[index].put(batch)
+            batches[index] = []
+    for index, batch in enumerate(batches):
+        if batch:
+            queues[index].put(batch)
+        queues[index].put(None)
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, len(manager.get_all_streams())
+
+
+def _process_partition(frames: list) -> int:
+    """工作进程：解码并追踪本分片的连接，返回流数量"""
+    logging.disable(logging.CRITICAL)
+    manager = TCPStreamManager(payload_retention="none")
+    for record in _decode(frames):
+        manager.process_record(record)
+    return len(manager.get_all_streams())
+
+
+def run_processes(frames: list, workers: int, pool) -> tuple:
+    start = time.perf_counter()
+    partitions = [[] for _ in range(workers)]
+    for item in frames:
+        partitions[flow_hash(item[0], LINKTYPE_ETHERNET) % workers].append(item)
+    streams = sum(pool.map(_process_partition, partitions))
+    return time.perf_counter() - start, streams
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--packets", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="short_flows")
+    parser.add_argument("--workers", type=int, action="append", help="可重复指定（默认 2 和 4）")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    frames = _frames(args.scenario, args.packets, args.seed)
+    records = _decode(frames)
+    print(f"{args.scenario}: {len(records)} TCP packets")
+
+    elapsed, streams = run_single(records)
+    baseline = len(records) / elapsed
+    print(f"  {'single':<14} {baseline:>12,.0f} pps  {streams} streams")
+
+    for workers in args.workers or (2, 4):
+        elapsed, streams = run_threads(records, workers)
+        pps = len(records) / elapsed
+        print(f"  {f'threads x{workers}':<14} {pps:>12,.0f} pps  {streams} streams  ({pps / baseline:.2f}x)")
+        with multiprocessing.Pool(workers) as pool:
+            pool.map(_process_partition, [[] for _ in range(workers)])  # 预热进程
+            elapsed, streams = run_processes(frames, workers, pool)
+        # 进程模式的计时包含帧解码和进程间传输
+        pps = len(records) / elapsed
+        print(f"  {f'processes x{workers}':<14} {pps:>12,.0f} pps  {streams} streams  ({pps / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
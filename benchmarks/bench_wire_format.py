@@ -0,0 +1,60 @@
+"""
+实时推送编码基准测试
+对比 JSON（send_json 等价序列化）与紧凑二进制编码的每包字节数和编码耗时
+
+运行: python -m benchmarks.bench_wire_format [--packets N] [--batch N]
+"""
+import argparse
+import json
+import logging
+import time
+
+from backend.services.fast_decoder import LINKTYPE_ETHERNET
+from backend.services.wire_format import PacketWireEncoder
+from benchmarks.bench_fast_decoder import build_frames, _new_engine
+
+
+def capture_packets(count: int) -> list:
+    """通过快速路径生成与线上一致的数据包字典"""
+    engine = _new_engine()
+    packets = []
+    engine.packet_callback = packets.append
+    now = time.time()
+    for frame in build_frames(count):
+        engine._process_frame(frame, LINKTYPE_ETHERNET, now)
+    return packets
+
+
+def bench(name: str, encode, batches: list, packet_count: int) -> tuple:
+    start = time.perf_counter()
+    total = sum(len(encode(batch)) for batch in batches)
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<10} {total / packet_count:>8.1f} B/pkt  "
+          f"{elapsed / packet_count * 1e6:>7.2f} us/pkt  ({total:,} bytes, {elapsed:.3f}s)")
+    return total, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--packets", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=256)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    packets = capture_packets(args.packets)
+    batches = [packets[i:i + args.batch] for i in range(0, len(packets), args.batch)]
+    print(f"Wire encoding ({len(packets)} packets, batch={args.batch})")
+
+    # 与 Starlette send_json 相同的序列化参数
+    dumps = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+    json_bytes, json_time = bench("json", lambda b: dumps({"type": "batch", "packets": b}).encode('utf-8'),
+                                  batches, len(packets))
+    encoder = PacketWireEncoder()
+    binary_bytes, binary_time = bench("binary", lambda b: b"".join(encoder.encode_batch(b)), batches, len(packets))
+
+    print(f"  size:   {json_bytes / binary_bytes:.1f}x smaller")
+    print(f"  encode: {json_time / binary_time:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+抓包流水线基准测试套件
+用 traffic_gen 生成的确定性流量，分阶段测量各组件的吞吐量：
+- engine:      PacketCaptureEngine._process_packet（完整实时处理路径）
+- tcp_stream:  TCPStreamManager.process_packet
+- http_parser: HTTPStreamParser.parse_request / parse_response（仅 HTTP 报文）
+- rdpcap:      Scapy 读取 PCAP 文件
+- pcap_import: pcap_import.parse_packets（/api/pcap/upload 的解析循环）
+
+每个阶段报告 pps、耗时和阶段结束时的进程峰值 RSS，结果写入 JSON 便于前后对比
+
+运行: python -m benchmarks.run_suite [--packets N] [--scenario NAME ...] [--output results.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable, Optional
+
+from scapy.all import rdpcap, wrpcap, Ether, Raw, TCP
+
+from backend.services.http_stream import HTTPStreamParser
+from backend.services.packet_capture import PacketCaptureEngine
+from backend.services.pcap_import import parse_packets
+from backend.services.protocol_id import http_kind, HTTP_REQUEST, HTTP_RESPONSE
+from backend.services.tcp_stream import TCPStreamManager
+from benchmarks.bench_fast_decoder import CLIENT_IP
+from benchmarks.traffic_gen import SCENARIOS, generate
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def peak_rss_kb() -> Optional[int]:
+    """进程峰值 RSS（KB），平台不支持时返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以 KB 为单位
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _new_engine() -> PacketCaptureEngine:
+    # 关闭动态 BPF，避免 SYN 触发端口映射刷新影响计时
+    engine = PacketCaptureEngine(os.getpid(), dynamic_bpf=False)
+    engine.is_running = True
+    engine._local_ip = CLIENT_IP  # 跳过本机IP探测
+    return engine
+
+
+def run_stage(name: str, items: list, func: Callable) -> dict:
+    rss_before = peak_rss_kb()
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    elapsed = time.perf_counter() - start
+    return _stage_result(name, len(items), elapsed, rss_before)
+
+
+def _stage_result(name: str, count: int, elapsed: float, rss_before: Optional[int]) -> dict:
+    rss_after = peak_rss_kb()
+    result = {
+        "stage": name,
+        "items": count,
+        "seconds": round(elapsed, 6),
+        "pps": round(count / elapsed, 1) if elapsed > 0 else None,
+        "peak_rss_kb": rss_after,
+        "peak_rss_growth_kb": rss_after - rss_before if rss_after is not None else None,
+    }
+    print(f"  {name:<12} {count:>8} items  {result['pps'] or 0:>12,.0f} /s  "
+          f"{elapsed:>8.3f}s  peak RSS {rss_after or 0:>8} KB")
+    return result
+
+
+def _dissect(packets: list) -> list:
+    """重新解析生成的报文，使其与网卡/文件读入的数据包一致（字段已解码）"""
+    dissected = []
+    for pkt in packets:
+        frame = Ether(bytes(pkt))
+        frame.time = pkt.time
+        dissected.append(frame)
+    return dissected
+
+
+def _http_messages(packets: list) -> list:
+    """提取以 HTTP 起始行开头的 TCP 报文：(kind, payload, timestamp, stream_id)"""
+    messages = []
+    for pkt in packets:
+        if not pkt.haslayer(Raw):
+            continue
+        payload = bytes(pkt[Raw].load)
+        kind = http_kind(payload)
+        if kind is None:
+            continue
+        tcp = pkt[TCP]
+        a, b = (tcp.sport, tcp.dport) if tcp.sport < tcp.dport else (tcp.dport, tcp.sport)
+        messages.append((kind, payload, float(pkt.time), f"{a}-{b}"))
+    return messages
+
+
+def run_scenario(scenario: str, packet_count: int, seed: int) -> dict:
+    gen_start = time.perf_counter()
+    packets = _dissect(generate(scenario, packet_count, seed))
+    gen_elapsed = time.perf_counter() - gen_start
+    print(f"{scenario} ({len(packets)} packets, seed={seed}, generated in {gen_elapsed:.2f}s)")
+
+    stages = []
+    engine = _new_engine()
+    stages.append(run_stage("engine", packets, engine._process_packet))
+
+    manager = TCPStreamManager()
+    stages.append(run_stage("tcp_stream", packets, lambda pkt: manager.process_packet(pkt, float(pkt.time))))
+
+    parser = HTTPStreamParser()
+
+    def parse_http(message):
+        kind, payload, timestamp, stream_id = message
+        if kind == HTTP_REQUEST:
+            parser.parse_request(payload, timestamp, stream_id)
+        elif kind == HTTP_RESPONSE:
+            parser.parse_response(payload, timestamp, stream_id)
+
+    stages.append(run_stage("http_parser", _http_messages(packets), parse_http))
+
+    fd, path = tempfile.mkstemp(prefix=f"netshark-{scenario}-", suffix=".pcap")
+    os.close(fd)
+    try:
+        wrpcap(path, packets)
+        rss_before = peak_rss_kb()
+        start = time.perf_counter()
+        packets_raw = rdpcap(path)
+        stages.append(_stage_result("rdpcap", len(packets_raw), time.perf_counter() - start, rss_before))
+
+        rss_before = peak_rss_kb()
+        start = time.perf_counter()
+        imported = parse_packets(packets_raw)
+        stages.append(_stage_result("pcap_import", len(packets_raw), time.perf_counter() - start, rss_before))
+    finally:
+        os.unlink(path)
+
+    return {
+        "scenario": scenario,
+        "packets": len(packets),
+        "seed": seed,
+        "flows": len(imported["streams"]),
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--packets", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="可重复指定；默认运行全部场景")
+    parser.add_argument("--output", help=f"JSON 结果路径（默认写入 {RESULTS_DIR}）")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "packets": args.packets,
+        "seed": args.seed,
+        "scenarios": [run_scenario(scenario, args.packets, args.seed)
+                      for scenario in (args.scenario or SCENARIOS)],
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"suite-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
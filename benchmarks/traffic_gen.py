@@ -0,0 +1,260 @@
+"""
+确定性合成流量生成器
+同一 (scenario, packets, seed) 总是生成逐字节相同的数据包序列（包括时间戳），
+用于基准测试套件和回归对比
+
+场景:
+- http_keepalive:  长连接上的多轮 HTTP 请求/响应
+- tls:             TLS 握手 + 应用数据
+- large_bodies:    大响应体，按 MSS 分段
+- retransmissions: 带重传和乱序的 HTTP 流量
+- short_flows:     大量短连接（握手、一次请求、挥手）
+- mixed:           以上场景交替混合
+
+运行: python -m benchmarks.traffic_gen --scenario mixed --packets 10000 --output mixed.pcap
+"""
+import argparse
+import random
+from typing import Callable, Dict, List
+
+from scapy.all import Ether, IP, TCP, Raw, wrpcap
+
+from benchmarks.bench_fast_decoder import CLIENT_IP
+
+MSS = 1460
+# 固定起始时间，保证输出可复现
+BASE_TIME = 1700000000.0
+SERVER_IPS = ["10.0.0.5", "10.0.0.6", "10.0.1.20", "172.16.3.7"]
+PATHS = ["/api/items", "/api/users", "/api/orders", "/static/app.js", "/health"]
+
+
+class _Flow:
+    """单个 TCP 连接的报文构造器（维护双方 seq/ack）"""
+
+    def __init__(self, gen: "_Generator", sport: int, server_ip: str, dport: int):
+        self.gen = gen
+        self.sport = sport
+        self.server_ip = server_ip
+        self.dport = dport
+        self.client_seq = gen.rng.randrange(1 << 31)
+        self.server_seq = gen.rng.randrange(1 << 31)
+
+    def _emit(self, from_client: bool, flags: str, payload: bytes = b"", seq: int = None) -> None:
+        if from_client:
+            ip = IP(src=CLIENT_IP, dst=self.server_ip)
+            tcp = TCP(sport=self.sport, dport=self.dport, flags=flags,
+                      seq=self.client_seq if seq is None else seq,
+                      ack=self.server_seq if "A" in flags else 0, window=64240)
+        else:
+            ip = IP(src=self.server_ip, dst=CLIENT_IP)
+            tcp = TCP(sport=self.dport, dport=self.sport, flags=flags,
+                      seq=self.server_seq if seq is None else seq,
+                      ack=self.client_seq, window=65160)
+        pkt = Ether(src="02:00:00:00:00:01", dst="02:00:00:00:00:02") / ip / tcp
+        if payload:
+            pkt = pkt / Raw(payload)
+        self.gen.add(pkt)
+
+    def handshake(self) -> None:
+        self._emit(True, "S")
+        self.client_seq += 1
+        self._emit(False, "SA")
+        self.server_seq += 1
+        self._emit(True, "A")
+
+    def send(self, from_client: bool, data: bytes, ack_every: int = 2) -> None:
+        """按 MSS 分段发送，对端每 ack_every 段回一个 ACK"""
+        for index, offset in enumerate(range(0, len(data), MSS)):
+            segment = data[offset:offset + MSS]
+            flags = "PA" if offset + MSS >= len(data) else "A"
+            self._emit(from_client, flags, segment)
+            if from_client:
+                self.client_seq += len(segment)
+            else:
+                self.server_seq += len(segment)
+            if (index + 1) % ack_every == 0 or offset + MSS >= len(data):
+                self._emit(not from_client, "A")
+
+    def send_with_loss(self, from_client: bool, data: bytes) -> None:
+        """分段发送：随机重传已发送的段，或交换相邻两段的顺序（乱序）"""
+        rng = self.gen.rng
+        segments = []
+        for offset in range(0, len(data), MSS):
+            segment = data[offset:offset + MSS]
+            seq = self.client_seq if from_client else self.server_seq
+            segments.append((seq, segment))
+            if from_client:
+                self.client_seq += len(segment)
+            else:
+                self.server_seq += len(segment)
+        index = 0
+        while index < len(segments):
+            seq, segment = segments[index]
+            if index + 1 < len(segments) and rng.random() < 0.15:
+                # 乱序：先发下一段
+                next_seq, next_segment = segments[index + 1]
+                self._emit(from_client, "A", next_segment, seq=next_seq)
+                self._emit(from_client, "A", segment, seq=seq)
+                index += 2
+            else:
+                self._emit(from_client, "PA", segment, seq=seq)
+                index += 1
+            if rng.random() < 0.2:
+                # 超时重传
+                self.gen.advance(0.2)
+                self._emit(from_client, "PA", segment, seq=seq)
+        self._emit(not from_client, "A")
+
+    def close(self) -> None:
+        self._emit(True, "FA")
+        self.client_seq += 1
+        self._emit(False, "FA")
+        self.server_seq += 1
+        self._emit(True, "A")
+
+
+class _Generator:
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.packets: list = []
+        self.now = BASE_TIME
+        self.next_port = 30000
+
+    def add(self, pkt) -> None:
+        self.now += self.rng.uniform(0.00005, 0.002)
+        pkt.time = round(self.now, 6)
+        self.packets.append(pkt)
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+    def flow(self, dport: int = 80) -> _Flow:
+        self.next_port += 1
+        if self.next_port > 60999:
+            self.next_port = 30001
+        return _Flow(self, self.next_port, self.rng.choice(SERVER_IPS), dport)
+
+    # ---------- HTTP 报文 ----------
+
+    def request(self) -> bytes:
+        rng = self.rng
+        path = f"{rng.choice(PATHS)}/{rng.randrange(10000)}"
+        if rng.random() < 0.3:
+            body = b'{"id": %d, "name": "item-%d"}' % (rng.randrange(1000), rng.randrange(1000))
+            return (b"POST %s HTTP/1.1\r\nHost: example.com\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: %d\r\n\r\n" % (path.encode(), len(body))) + body
+        return (b"GET %s HTTP/1.1\r\nHost: example.com\r\nUser-Agent: bench/1.0\r\n"
+                b"Accept: */*\r\nConnection: keep-alive\r\n\r\n" % path.encode())
+
+    def response(self, size: int = None) -> bytes:
+        rng = self.rng
+        if size is None:
+            size = rng.randrange(20, 800)
+        body = bytes(rng.getrandbits(8) % 26 + 97 for _ in range(min(size, 256)))
+        body = (body * (size // len(body) + 1))[:size]
+        status = b"200 OK" if rng.random() < 0.9 else b"404 Not Found"
+        return (b"HTTP/1.1 %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n"
+                % (status, size)) + body
+
+    # ---------- 场景 ----------
+
+    def http_keepalive(self) -> None:
+        flow = self.flow(self.rng.choice((80, 8080)))
+        flow.handshake()
+        for _ in range(self.rng.randrange(5, 20)):
+            flow.send(True, self.request())
+            flow.send(False, self.response())
+        flow.close()
+
+    def tls(self) -> None:
+        rng = self.rng
+        flow = self.flow(443)
+        flow.handshake()
+        client_hello = b"\x16\x03\x01\x00\xc8\x01\x00\x00\xc4\x03\x03" + bytes(rng.getrandbits(8) for _ in range(196))
+        flow.send(True, client_hello)
+        server_hello = b"\x16\x03\x03\x00\x5a\x02\x00\x00\x56\x03\x03" + bytes(rng.getrandbits(8) for _ in range(86))
+        flow.send(False, server_hello + b"\x14\x03\x03\x00\x01\x01")
+        for _ in range(rng.randrange(2, 8)):
+            size = rng.randrange(100, 4000)
+            flow.send(True, b"\x17\x03\x03" + size.to_bytes(2, "big") + bytes(size))
+            size = rng.randrange(100, 6000)
+            flow.send(False, b"\x17\x03\x03" + size.to_bytes(2, "big") + bytes(size))
+        flow.close()
+
+    def large_bodies(self) -> None:
+        flow = self.flow(80)
+        flow.handshake()
+        for _ in range(self.rng.randrange(1, 3)):
+            flow.send(True, self.request())
+            flow.send(False, self.response(self.rng.randrange(64 * 1024, 512 * 1024)), ack_every=2)
+        flow.close()
+
+    def retransmissions(self) -> None:
+        flow = self.flow(80)
+        flow.handshake()
+        for _ in range(self.rng.randrange(2, 6)):
+            flow.send_with_loss(True, self.request())
+            flow.send_with_loss(False, self.response(self.rng.randrange(1000, 12000)))
+        flow.close()
+
+    def short_flows(self) -> None:
+        flow = self.flow(self.rng.choice((80, 3000, 8000)))
+        flow.handshake()
+        flow.send(True, self.request())
+        flow.send(False, self.response(self.rng.randrange(20, 200)))
+        flow.close()
+
+    def mixed(self) -> None:
+        rng = self.rng
+        choice = rng.random()
+        if choice < 0.3:
+            self.short_flows()
+        elif choice < 0.55:
+            self.http_keepalive()
+        elif choice < 0.8:
+            self.tls()
+        elif choice < 0.9:
+            self.retransmissions()
+        else:
+            self.large_bodies()
+
+
+SCENARIOS = ("http_keepalive", "tls", "large_bodies", "retransmissions", "short_flows", "mixed")
+
+
+def generate(scenario: str, packets: int, seed: int = 1) -> list:
+    """
+    生成 Scapy 数据包列表（按时间排序，每个包带 time 属性）
+    :param scenario: 见 SCENARIOS
+    :param packets: 数据包数量（最后一个连接可能被截断）
+    :param seed: 随机种子
+    """
+    if scenario not in SCENARIOS:
+        raise ValueError(f"Unknown scenario: {scenario}")
+    gen = _Generator(seed)
+    build: Callable[[], None] = getattr(gen, scenario)
+    while len(gen.packets) < packets:
+        build()
+        gen.advance(gen.rng.uniform(0.001, 0.05))
+    return gen.packets[:packets]
+
+
+def generate_all(packets: int, seed: int = 1) -> Dict[str, List]:
+    return {scenario: generate(scenario, packets, seed) for scenario in SCENARIOS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="mixed")
+    parser.add_argument("--packets", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", required=True, help="输出 pcap 路径")
+    args = parser.parse_args()
+
+    packets = generate(args.scenario, args.packets, args.seed)
+    wrpcap(args.output, packets)
+    print(f"Wrote {len(packets)} packets ({args.scenario}, seed={args.seed}) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
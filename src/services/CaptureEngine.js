@@ -1,5 +1,142 @@
 import { PacketType } from '../models/types';
 
+// ===== 紧凑二进制编码（与 backend/services/wire_format.py 对应）=====
+const WIRE_VERSION = 1;
+const FLAG_RESET_TABLE = 0x01;
+const PKT_TCP = 0x01;
+const PKT_HTTP = 0x02;
+const PKT_TLS = 0x04;
+const PKT_RETRANS = 0x08;
+const PKT_OUT_OF_ORDER = 0x10;
+const PKT_RAW_TIME = 0x20;
+const PKT_EXTRA = 0x40;
+const PKT_HTTP_JSON = 0x80;
+const HTTP_REQUEST = 0;
+const PACKET_HEADER_SIZE = 29;
+
+const utf8Decoder = new TextDecoder('utf-8');
+const pad = (n, width) => String(n).padStart(width, '0');
+
+// 当天毫秒数 -> HH:MM:SS.mmm
+function formatTime(ms) {
+    return `${pad(Math.floor(ms / 3600000), 2)}:${pad(Math.floor(ms / 60000) % 60, 2)}:` +
+        `${pad(Math.floor(ms / 1000) % 60, 2)}.${pad(ms % 1000, 3)}`;
+}
+
+/**
+ * 解码一个二进制批次帧
+ * @param {ArrayBuffer} buffer 帧数据
+ * @param {string[]} strings 会话字符串表（原地追加/重置）
+ * @returns {object[]} 与 JSON 模式结构相同的数据包
+ */
+export function decodeBinaryBatch(buffer, strings) {
+    const view = new DataView(buffer);
+    const bytes = new Uint8Array(buffer);
+    let offset = 0;
+
+    // 变长字符串：长度 < 255 时 1 字节，否则 0xFF + u32
+    const readString = () => {
+        let length = bytes[offset];
+        offset += 1;
+        if (length === 0xFF) {
+            length = view.getUint32(offset, true);
+            offset += 4;
+        }
+        const text = utf8Decoder.decode(bytes.subarray(offset, offset + length));
+        offset += length;
+        return text;
+    };
+
+    if (bytes[0] !== 0x4E || bytes[1] !== 0x53) throw new Error('Bad wire magic');
+    const version = view.getUint8(2);
+    if (version !== WIRE_VERSION) throw new Error(`Unsupported wire version ${version}`);
+    const flags = view.getUint8(3);
+    const tableBase = view.getUint32(4, true);
+    const newStrings = view.getUint32(8, true);
+    const count = view.getUint32(12, true);
+    offset = 16;
+
+    if (flags & FLAG_RESET_TABLE) strings.length = 0;
+    if (tableBase !== strings.length) throw new Error('Wire string table out of sync');
+    for (let i = 0; i < newStrings; i++) strings.push(readString());
+
+    const packets = new Array(count);
+    for (let i = 0; i < count; i++) {
+        const id = view.getUint32(offset, true);
+        const time = view.getUint32(offset + 4, true);
+        const source = strings[view.getUint16(offset + 8, true)];
+        const destination = strings[view.getUint16(offset + 10, true)];
+        const method = strings[view.getUint16(offset + 12, true)];
+        const path = strings[view.getUint16(offset + 14, true)];
+        const protocol = strings[view.getUint16(offset + 16, true)];
+        const category = strings[view.getUint16(offset + 18, true)];
+        const latency = strings[view.getUint16(offset + 20, true)];
+        const size = view.getUint32(offset + 22, true);
+        const status = view.getUint16(offset + 26, true);
+        const pktFlags = view.getUint8(offset + 28);
+        offset += PACKET_HEADER_SIZE;
+
+        let tcp = null;
+        if (pktFlags & PKT_TCP) {
+            tcp = {
+                is_retransmission: !!(pktFlags & PKT_RETRANS),
+                is_out_of_order: !!(pktFlags & PKT_OUT_OF_ORDER),
+                stream_state: strings[view.getUint16(offset, true)],
+                retransmission_rate: view.getFloat32(offset + 2, true)
+            };
+            offset += 6;
+        }
+        const info = readString();
+        const body = readString();
+
+        let http = null;
+        if (pktFlags & PKT_HTTP) {
+            const type = bytes[offset];
+            const first = view.getUint16(offset + 1, true);
+            const second = strings[view.getUint16(offset + 3, true)];
+            const headerCount = view.getUint16(offset + 5, true);
+            offset += 7;
+            http = type === HTTP_REQUEST
+                ? { type: 'request', method: strings[first], url: second }
+                : { type: 'response', status_code: first, reason: second };
+            const headers = {};
+            for (let h = 0; h < headerCount; h++) {
+                headers[strings[view.getUint16(offset, true)]] = strings[view.getUint16(offset + 2, true)];
+                offset += 4;
+            }
+            http.headers = headers;
+            http.body = readString();
+        } else if (pktFlags & PKT_HTTP_JSON) {
+            http = JSON.parse(readString());
+        }
+        const tls = (pktFlags & PKT_TLS) ? JSON.parse(readString()) : null;
+
+        const packet = {
+            id,
+            timestamp: (pktFlags & PKT_RAW_TIME) ? strings[time] : formatTime(time),
+            source,
+            sourceIP: source,
+            destination,
+            method,
+            path,
+            protocol,
+            status,
+            latency,
+            size: `${size}B`,
+            info,
+            traceId: `pkt_${id}`,
+            category,
+            body,
+            tcp,
+            http,
+            tls
+        };
+        if (pktFlags & PKT_EXTRA) Object.assign(packet, JSON.parse(readString()));
+        packets[i] = packet;
+    }
+    return packets;
+}
+
 class CaptureEngine {
     constructor() {
         this.isActive = false;
@@ -8,6 +145,10 @@ class CaptureEngine {
         this.config = null;
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 5;
+        this.encoding = 'json';
+        this.wireStrings = [];
+        // 服务端发送队列溢出统计（带内通知累计）
+        this.overflow = { dropped: 0, aggregated: 0 };
     }
 
     // 配置引擎 (Hook PID, Connect Agent)
@@ -63,6 +204,10 @@ class CaptureEngine {
         console.log(`[Engine] Connecting to ${wsUrl}...`);
 
         this.websocket = new WebSocket(wsUrl);
+        this.websocket.binaryType = 'arraybuffer';
+        // 每个连接使用独立的字符串表
+        this.encoding = 'json';
+        this.wireStrings = [];
 
         this.websocket.onopen = () => {
             console.log("[Engine] WebSocket connected!");
@@ -74,7 +219,8 @@ class CaptureEngine {
                 const startConfig = {
                     targetPid: this.config.targetProcess.pid,
                     dbFilter: this.config.dbFilter,
-                    serverFilter: this.config.serverIp || ""  // 服务器IP过滤
+                    serverFilter: this.config.serverIp || "",  // 服务器IP过滤
+                    encoding: this.config.encoding || 'json'  // 配置 encoding: 'binary' 时使用紧凑二进制编码
                 };
                 this.websocket.send(JSON.stringify(startConfig));
             } else {
@@ -84,7 +230,8 @@ class CaptureEngine {
                         const startConfig = {
                             targetPid: this.config.targetProcess.pid,
                             dbFilter: this.config.dbFilter,
-                            serverFilter: this.config.serverIp || ""
+                            serverFilter: this.config.serverIp || "",
+                            encoding: this.config.encoding || 'json'
                         };
                         this.websocket.send(JSON.stringify(startConfig));
                     }
@@ -94,19 +241,54 @@ class CaptureEngine {
 
         this.websocket.onmessage = (event) => {
             try {
-                const packet = JSON.parse(event.data);
+                // 二进制批次帧
+                if (event.data instanceof ArrayBuffer) {
+                    decodeBinaryBatch(event.data, this.wireStrings)
+                        .forEach(packet => this._notifySubscribers(packet));
+                    return;
+                }
+
+                const message = JSON.parse(event.data);
 
                 // 检查是否是错误消息
-                if (packet.error) {
-                    console.error("[Engine] Server error:", packet.error);
+                if (message.error) {
+                    console.error("[Engine] Server error:", message.error);
+                    return;
+                }
+
+                // 编码协商结果：{ type: 'config', encoding: 'json' | 'binary' }
+                if (message.type === 'config') {
+                    this.encoding = message.encoding;
+                    console.log(`[Engine] Wire encoding: ${message.encoding}`);
+                    return;
+                }
+
+                // 发送队列溢出通知：服务端丢弃了部分数据包
+                if (message.type === 'drops') {
+                    this.overflow.dropped = message.total_dropped;
+                    console.warn(`[Engine] Server dropped ${message.dropped} packets (${message.policy}, total ${message.total_dropped})`);
+                    return;
+                }
+
+                // 聚合模式：服务端只推送统计，不推送逐包数据
+                if (message.type === 'aggregate') {
+                    this.overflow.aggregated += message.packets;
+                    console.warn(`[Engine] Aggregated ${message.packets} packets (${message.bytes}B)`, message.protocols);
+                    return;
+                }
+                if (message.type === 'aggregate-end') return;
+
+                // 批量消息：{ type: 'batch', packets: [...] }
+                if (message.type === 'batch') {
+                    message.packets.forEach(packet => this._notifySubscribers(packet));
                     return;
                 }
 
                 // DEBUG: 输出完整数据包（包括TCP/HTTP层）
-                console.log(`[Engine] Received packet:`, packet);
+                console.log(`[Engine] Received packet:`, message);
 
                 // 通知所有订阅者
-                this._notifySubscribers(packet);
+                this._notifySubscribers(message);
             } catch (e) {
                 console.error("[Engine] Failed to parse packet:", e);
             }
@@ -0,0 +1,89 @@
+"""
+测试用的数据包记录构造（不经过 Scapy，直接填充 PacketRecord 字段）
+"""
+from typing import List
+
+from backend.services.fast_decoder import PacketRecord, TCP_SYN, TCP_ACK, TCP_FIN, TCP_PSH
+
+CLIENT_IP = "192.168.1.10"
+
+
+def tcp_record(src_ip: str, sport: int, dst_ip: str, dport: int, seq: int, ack: int, flags: int,
+               payload: bytes = b'', timestamp: float = 0.0, window: int = 65535) -> PacketRecord:
+    record = PacketRecord()
+    record.timestamp = timestamp
+    record.frame = None
+    record.linktype = None
+    record.length = 54 + len(payload)
+    record.ip_version = 4
+    record.src_ip = src_ip
+    record.dst_ip = dst_ip
+    record.protocol = "TCP"
+    record.sport = sport
+    record.dport = dport
+    record.seq = seq
+    record.ack = ack
+    record.tcp_flags = flags
+    record.window = window
+    record.payload = payload
+    return record
+
+
+def udp_record(src_ip: str, sport: int, dst_ip: str, dport: int, payload: bytes = b'',
+               timestamp: float = 0.0) -> PacketRecord:
+    record = PacketRecord()
+    record.timestamp = timestamp
+    record.frame = None
+    record.linktype = None
+    record.length = 42 + len(payload)
+    record.ip_version = 4
+    record.src_ip = src_ip
+    record.dst_ip = dst_ip
+    record.protocol = "UDP"
+    record.sport = sport
+    record.dport = dport
+    record.payload = payload
+    return record
+
+
+def short_flow(client_port: int, server_ip: str, server_port: int, start: float,
+               request: bytes = b'GET / HTTP/1.1\r\n\r\n',
+               response: bytes = b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n', rtt: float = 0.01,
+               close: bool = True) -> List[PacketRecord]:
+    """一条完整的短连接：握手、一次请求/响应、双向 FIN（close=False 时不关闭）"""
+    c_seq, s_seq = 1000, 5000
+    t = start
+    records = [tcp_record(CLIENT_IP, client_port, server_ip, server_port, c_seq, 0, TCP_SYN, timestamp=t)]
+    t += rtt
+    records.append(tcp_record(server_ip, server_port, CLIENT_IP, client_port, s_seq, c_seq + 1,
+                              TCP_SYN | TCP_ACK, timestamp=t))
+    t += rtt / 10
+    c_seq += 1
+    s_seq += 1
+    records.append(tcp_record(CLIENT_IP, client_port, server_ip, server_port, c_seq, s_seq, TCP_ACK, timestamp=t))
+    records.append(tcp_record(CLIENT_IP, client_port, server_ip, server_port, c_seq, s_seq, TCP_PSH | TCP_ACK,
+                              request, timestamp=t))
+    c_seq += len(request)
+    t += rtt
+    records.append(tcp_record(server_ip, server_port, CLIENT_IP, client_port, s_seq, c_seq, TCP_PSH | TCP_ACK,
+                              response, timestamp=t))
+    s_seq += len(response)
+    t += rtt / 10
+    records.append(tcp_record(CLIENT_IP, client_port, server_ip, server_port, c_seq, s_seq, TCP_ACK, timestamp=t))
+    if close:
+        records.append(tcp_record(CLIENT_IP, client_port, server_ip, server_port, c_seq, s_seq,
+                                  TCP_FIN | TCP_ACK, timestamp=t))
+        t += rtt
+        records.append(tcp_record(server_ip, server_port, CLIENT_IP, client_port, s_seq, c_seq + 1,
+                                  TCP_FIN | TCP_ACK, timestamp=t))
+        t += rtt / 10
+        records.append(tcp_record(CLIENT_IP, client_port, server_ip, server_port, c_seq + 1, s_seq + 1,
+                                  TCP_ACK, timestamp=t))
+    return records
+
+
+def interleave(flows: List[List[PacketRecord]]) -> List[PacketRecord]:
+    """多条连接的数据包按时间戳合并（稳定排序，同一连接内保持顺序）"""
+    records = [record for flow in flows for record in flow]
+    records.sort(key=lambda record: record.timestamp)
+    return records
@@ -0,0 +1,83 @@
+"""
+多进程流水线：共享内存环形缓冲区的回绕、写满丢弃，以及 pipeline 模式下依赖解析状态的查询明确报错
+"""
+import pytest
+
+from backend.services.capture_pipeline import FrameRing
+from backend.services.checkpoint import Checkpointer
+from backend.services.packet_capture import PacketCaptureEngine
+
+
+def _frame(i: int, size: int = 40) -> bytes:
+    return bytes([i]) * size
+
+
+@pytest.fixture
+def ring():
+    producer = FrameRing.create(256)
+    consumer = FrameRing.attach(producer.name, producer.capacity)
+    yield producer, consumer
+    consumer.close()
+    producer.close()
+
+
+def test_wrap_keeps_frames_in_order(ring):
+    producer, consumer = ring
+    # 每条记录 16 字节头 + 40 字节帧 = 56 字节：写满 4 条后尾部只剩 32 字节
+    for i in range(4):
+        assert producer.write(_frame(i), 1, 100.0 + i)
+    assert producer.stats()['used_bytes'] == 224
+    assert consumer.read() == (_frame(0), 1, 100.0)
+    # 尾部放不下：写入回绕标记，记录从缓冲区开头写起
+    assert producer.write(_frame(4), 113, 104.0)
+    # 已用空间包含跳过的 32 字节尾部，缓冲区正好写满
+    assert producer.stats()['used_bytes'] == 256
+    assert [consumer.read()[0][0] for _ in range(4)] == [1, 2, 3, 4]
+    assert consumer.read() is None
+    assert producer.stats() == {'used_bytes': 0, 'capacity': 256, 'dropped': 0}
+
+    # 长度不同的记录回绕多次后仍按写入顺序读出
+    for i in range(5, 40):
+        assert producer.write(_frame(i, 8 + i % 5 * 8), 1, float(i))
+        frame, linktype, timestamp = consumer.read()
+        assert frame == _frame(i, 8 + i % 5 * 8) and timestamp == float(i)
+    assert consumer.read() is None
+
+
+def test_full_ring_drops_new_frames(ring):
+    producer, consumer = ring
+    for i in range(4):
+        assert producer.write(_frame(i), 1, 0.0)
+    # 回绕还需要 32 字节尾部 + 56 字节记录，空间不足：丢弃新帧，已写入的帧不受影响
+    assert not producer.write(_frame(4), 1, 0.0)
+    assert not producer.write(b'x' * 300, 1, 0.0)
+    assert producer.stats()['dropped'] == 2
+    assert consumer.read()[0] == _frame(0)
+    # 读出一条后回绕的记录正好放得下，缓冲区再次写满
+    assert producer.write(_frame(5), 1, 0.0)
+    assert not producer.write(_frame(6, 8), 1, 0.0)
+    assert [consumer.read()[0][0] for _ in range(4)] == [1, 2, 3, 5]
+    assert consumer.read() is None and consumer.stats()['dropped'] == 3
+
+
+def test_pipeline_mode_rejects_worker_state_queries(tmp_path):
+    engine = PacketCaptureEngine(1, capture_mode="pipeline")
+    queries = [
+        lambda: engine.get_packet_detail(1),
+        lambda: engine.get_http_body(1),
+        lambda: engine.query_http_transactions(),
+        lambda: engine.get_http_latency(),
+        lambda: engine.query_streams(),
+        lambda: engine.get_expert_stats(),
+        lambda: engine.get_udp_flows(),
+        lambda: engine.follow_stream("TCP-1"),
+    ]
+    for query in queries:
+        with pytest.raises(ValueError, match="pipeline mode"):
+            query()
+    with pytest.raises(ValueError, match="pipeline mode"):
+        PacketCaptureEngine(1, capture_mode="pipeline", checkpointer=Checkpointer(str(tmp_path / "c.ckpt")))
+
+    # 其他模式照常查询
+    engine = PacketCaptureEngine(1, capture_mode="fast")
+    assert engine.get_packet_detail(1) is None and engine.query_streams()['streams'] == []
@@ -0,0 +1,161 @@
+"""
+检查点：全量 + 增量记录往返后，恢复的状态与抓包时一致；只恢复同一个进程写入的检查点
+"""
+import os
+
+import pytest
+
+from backend.services.checkpoint import (Checkpointer, Deferred, _decode, _encode, apply_checkpoint,
+                                         is_same_process, process_identity)
+from backend.services.fast_decoder import TCP_ACK
+from backend.services.http_parser import parse_message
+from backend.services.http_stream import HTTPStreamParser
+from backend.services.tcp_stream import ShardedTCPStreamManager, TCPStreamManager
+
+from tests.packets import CLIENT_IP, interleave, short_flow, tcp_record
+
+SERVERS = ["10.0.0.5", "10.0.0.6", "172.16.3.7"]
+
+
+def _round_trip(state: dict) -> dict:
+    """与写入文件相同的编码/解码"""
+    return _decode(_encode(state))
+
+
+def _flows(first: int, count: int, start: float, close: bool = True):
+    return interleave([
+        short_flow(20000 + i, SERVERS[i % len(SERVERS)], 8080, start + (i - first) * 0.002,
+                   request=b'POST /api HTTP/1.1\r\n\r\n' + b'x' * (i % 50), close=close)
+        for i in range(first, first + count)
+    ])
+
+
+def _streams(manager) -> list:
+    return sorted(manager.get_all_streams(), key=lambda summary: summary['stream_id'])
+
+
+@pytest.mark.parametrize("make_live, make_restored", [
+    (lambda: TCPStreamManager(payload_retention="none", close_linger=0.05),
+     lambda: TCPStreamManager(payload_retention="none", close_linger=0.05)),
+    (lambda: ShardedTCPStreamManager(shards=4, payload_retention="none", close_linger=0.05),
+     lambda: ShardedTCPStreamManager(shards=3, payload_retention="none", close_linger=0.05)),
+])
+def test_streams_retired_between_deltas(make_live, make_restored):
+    """两次增量之间开始并结束的流：流已不在活动表中，它对服务器汇总的更新仍要写入增量"""
+    live = make_live()
+    states = []
+    start = 1_700_000_000.0
+    for batch in range(6):
+        # 每批的连接在下一次检查点之前全部结束（最后一批留一部分不关闭）：
+        # 另一个服务器上的报文推进时间，增量中只剩这一个有变化的流
+        for record in _flows(batch * 40, 40, start + batch * 10, close=batch < 5):
+            live.process_record(record, record.timestamp)
+        ticker = tcp_record(CLIENT_IP, 40000, "10.9.9.9", 443, 1, 1, TCP_ACK, timestamp=start + batch * 10 + 5)
+        live.process_record(ticker, ticker.timestamp)
+        states.append(_round_trip(live.checkpoint_state(full=batch == 0)))
+    assert live.get_eviction_stats()['evicted']['fin'] > 150
+
+    restored = make_restored()
+    for state in states:
+        restored.restore_state(state)
+    assert _streams(restored) == _streams(live)
+    assert restored.get_server_stats() == live.get_server_stats()
+    assert restored.get_eviction_stats()['evicted'] == live.get_eviction_stats()['evicted']
+    servers = {server['server']: server for server in restored.get_server_stats()}
+    assert sum(server['streams'] for server in servers.values()) == 241
+    assert servers['10.0.0.5:8080']['request_rtt']['count'] == 80
+
+
+def test_delta_only_carries_changes():
+    manager = TCPStreamManager(payload_retention="none", close_linger=0.05)
+    for record in _flows(0, 30, 1_700_000_000.0, close=False):
+        manager.process_record(record, record.timestamp)
+    full = manager.checkpoint_state(full=True)
+    assert full['full'] and len(full['streams']) == 30
+
+    for record in _flows(100, 2, 1_700_000_100.0, close=False):
+        manager.process_record(record, record.timestamp)
+    delta = manager.checkpoint_state(full=False)
+    assert not delta['full']
+    assert len(delta['streams']) == 2
+    assert {endpoint for endpoint, _ in delta['servers']} == {"10.0.0.6:8080", "172.16.3.7:8080"}
+
+
+def _exchange(parser: HTTPStreamParser, i: int, t: float, respond: bool = True) -> None:
+    stream_id = f"{CLIENT_IP}:{30000 + i % 7}-10.0.0.5:80"
+    body = b'{"id": %d}' % i
+    request = parse_message(b'POST /api/items/%d HTTP/1.1\r\nHost: api.example\r\nContent-Length: %d\r\n\r\n%s'
+                            % (i, len(body), body), t)
+    parser.add_request(request, stream_id)
+    if respond:
+        response = parse_message(b'HTTP/1.1 201 Created\r\nContent-Length: 2\r\n\r\nok', t + 0.02 + i % 5 * 0.01)
+        parser.add_response(response, stream_id)
+
+
+def _transactions(parser: HTTPStreamParser) -> list:
+    return [(trans.request.method, trans.request.url, trans.request.headers.fields, bytes(trans.request.body),
+             trans.response.status_code, bytes(trans.response.body), trans.duration)
+            for trans in parser.transactions]
+
+
+def test_http_full_and_delta_round_trip():
+    live = HTTPStreamParser(capacity=50)
+    states = []
+    t = 1_700_000_000.0
+    for i in range(120):
+        _exchange(live, i, t + i)
+        if i % 25 == 0:
+            states.append(_round_trip(live.checkpoint_state(full=not states)))
+    _exchange(live, 999, t + 200, respond=False)
+    states.append(_round_trip(live.checkpoint_state(full=False)))
+
+    restored = HTTPStreamParser(capacity=50)
+    for state in states:
+        restored.restore_state(state)
+    assert _transactions(restored) == _transactions(live)
+    assert [request.url for requests in restored.pending_requests.values() for request in requests] == \
+        ["/api/items/999"]
+    assert restored.latency.query() == live.latency.query()
+
+
+def test_http_state_is_built_by_the_writer():
+    """采集时不复制消息体：事务在写入之前被淘汰也能正确写出"""
+    parser = HTTPStreamParser(capacity=10)
+    for i in range(10):
+        _exchange(parser, i, 1_700_000_000.0 + i)
+    state = parser.checkpoint_state(full=True)
+    assert isinstance(state['transactions'], Deferred)
+    for i in range(10, 30):
+        _exchange(parser, i, 1_700_000_100.0 + i)
+
+    restored = HTTPStreamParser(capacity=10)
+    restored.restore_state(_round_trip(state))
+    assert [trans.request.url for trans in restored.transactions] == [f"/api/items/{i}" for i in range(10)]
+
+
+def test_restore_only_for_the_same_process(tmp_path):
+    identity = process_identity(os.getpid())
+    assert identity is not None and is_same_process(identity)
+    # PID 被复用（启动时间不同）或进程已不存在
+    assert not is_same_process((os.getpid(), identity[1] - 60))
+    assert not is_same_process(None) and process_identity(2 ** 22 + 1) is None
+
+    path = str(tmp_path / "1234.ckpt")
+    checkpointer = Checkpointer(path)
+    checkpointer.save({'full': True, 'process': identity, 'value': 1})
+    checkpointer.save({'full': False, 'process': identity, 'value': 2})
+    checkpointer.close()
+
+    def accept(state):
+        return is_same_process(state.get('process'))
+
+    restored = []
+    assert apply_checkpoint(path, restored.append, accept=accept) == 2
+    assert [state['value'] for state in restored] == [1, 2]
+
+    # 同一 PID 的另一个进程写入的检查点：整个文件都不应用
+    checkpointer = Checkpointer(path)
+    checkpointer.save({'full': True, 'process': (os.getpid(), identity[1] - 60), 'value': 3})
+    checkpointer.close()
+    restored = []
+    assert apply_checkpoint(path, restored.append, accept=accept) == 0 and restored == []
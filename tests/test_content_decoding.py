@@ -0,0 +1,130 @@
+"""
+Content-Encoding 解码（含 br 的输出上限），后台解码队列的上限，以及解码结果计入事务存储的字节预算
+"""
+import gzip
+import threading
+import zlib
+
+import pytest
+
+from backend.services import content_decoding
+from backend.services.content_decoding import ContentDecoder, DecompressWorker, decode_content
+from backend.services.http_parser import HTTPHeaders
+from backend.services.http_store import HTTPTransactionStore
+from backend.services.http_stream import HTTPRequest, HTTPResponse, HTTPTransaction
+
+TEXT = b"hello netshark " * 1000
+
+
+def _deflate(data: bytes, wbits: int) -> bytes:
+    compressor = zlib.compressobj(wbits=wbits)
+    return compressor.compress(data) + compressor.flush()
+
+
+def test_decode_content_codings():
+    assert decode_content(gzip.compress(TEXT), "gzip").data == TEXT
+    # 多个 gzip 成员首尾相接
+    assert decode_content(gzip.compress(TEXT) + gzip.compress(TEXT), "x-gzip").data == TEXT * 2
+    # deflate 带 zlib 头和裸 deflate 都能解开
+    assert decode_content(_deflate(TEXT, zlib.MAX_WBITS), "deflate").data == TEXT
+    assert decode_content(_deflate(TEXT, -zlib.MAX_WBITS), "deflate").data == TEXT
+    # 服务器最后应用的编码最先解开
+    assert decode_content(_deflate(gzip.compress(TEXT), zlib.MAX_WBITS), "gzip, deflate").data == TEXT
+    assert decode_content(TEXT, "identity").data is TEXT
+
+
+def test_decode_content_limits_and_errors():
+    decoded = decode_content(gzip.compress(TEXT), "gzip", max_size=1000)
+    assert decoded.truncated and decoded.data == TEXT[:1000]
+
+    decoded = decode_content(b"not gzip at all", "gzip")
+    assert decoded.error is not None and decoded.data == b"not gzip at all"
+
+    decoded = decode_content(TEXT, "compress")
+    assert decoded.error == "unsupported content-encoding: compress" and decoded.data is TEXT
+
+
+@pytest.mark.parametrize("output_limit", [True, False])
+def test_decode_brotli_within_output_cap(monkeypatch, output_limit):
+    brotli = pytest.importorskip("brotli")
+    # 旧版 brotli 没有输出上限参数：小块送入输入
+    monkeypatch.setattr(content_decoding, "_BROTLI_OUTPUT_LIMIT",
+                        output_limit and content_decoding._BROTLI_OUTPUT_LIMIT)
+    body = brotli.compress(TEXT)
+    assert decode_content(body, "br").data == TEXT
+    assert decode_content(gzip.compress(body), "br, gzip").data == TEXT
+    decoder = ContentDecoder("br")
+    for offset in range(0, len(body), 7):
+        decoder.feed(body[offset:offset + 7])
+    assert decoder.finish().data == TEXT
+
+    # 压缩比极高的消息体：一百多字节的输入解出 16MB，解码在上限处停止
+    bomb = brotli.compress(b'\0' * (16 << 20))
+    decoded = decode_content(bomb, "br", max_size=1000)
+    assert decoded.truncated and decoded.data == b'\0' * 1000
+    if content_decoding._BROTLI_OUTPUT_LIMIT:
+        assert len(content_decoding._BrotliStage().decompress(bomb, 1000)) < 64 * 1024
+
+
+def test_worker_drops_when_queue_is_full():
+    worker = DecompressWorker(max_pending=2)
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def blocking(decoded):
+        started.set()
+        release.wait(5)
+        results.append(decoded.data)
+
+    body = gzip.compress(TEXT)
+    assert worker.submit(body, "gzip", blocking)
+    assert started.wait(5)
+    # 工作线程阻塞在第一个回调中：队列再放两个任务后满
+    assert worker.submit(body, "gzip", lambda d: results.append(d.data))
+    assert worker.submit(body, "gzip", lambda d: results.append(d.data))
+    assert not worker.submit(body, "gzip", lambda d: results.append(d.data))
+    stats = worker.stats()
+    assert stats['dropped'] == 1 and stats['pending'] == 2
+
+    release.set()
+    worker.close()
+    assert results == [TEXT] * 3
+    assert worker.stats()['submitted'] == 3 and worker.completed == 3
+
+
+def _transaction(index: int, body: bytes) -> HTTPTransaction:
+    stream_id = f"192.168.1.10:{40000 + index}-10.0.0.1:80"
+    headers = HTTPHeaders([(b'Content-Encoding', b'gzip')])
+    request = HTTPRequest("GET", f"/files/{index}", "HTTP/1.1", HTTPHeaders([(b'Host', b'example.com')]), b'',
+                          1_700_000_000.0 + index, stream_id)
+    response = HTTPResponse("HTTP/1.1", 200, "OK", headers, body, 1_700_000_000.0 + index + 0.01, stream_id)
+    return HTTPTransaction(request=request, response=response, duration=10.0)
+
+
+def test_decoded_bodies_count_against_store_budget():
+    body = gzip.compress(TEXT)
+    store = HTTPTransactionStore(capacity=100, max_bytes=len(TEXT) * 2 + len(body) * 3)
+    transactions = [_transaction(i, body) for i in range(3)]
+    for transaction in transactions:
+        store.append(transaction)
+    assert store.retained_bytes == len(body) * 3
+
+    store.set_decoded(transactions[1].response, decode_content(body, "gzip"))
+    store.set_decoded(transactions[2].response, decode_content(body, "gzip"))
+    assert len(store) == 3 and store.retained_bytes == len(body) * 3 + len(TEXT) * 2
+
+    # 第三个解码结果超出预算：淘汰最旧的事务
+    store.set_decoded(transactions[0].response, decode_content(body, "gzip"))
+    assert [t.seq for t in store] == [1, 2]
+    assert transactions[0].response.decoded is None
+    assert store.retained_bytes == (len(body) + len(TEXT)) * 2
+
+    # 已淘汰的事务不再缓存；尚未写入的消息在写入时连同解码结果一起计入
+    store.set_decoded(transactions[0].response, decode_content(body, "gzip"))
+    assert transactions[0].response.decoded is None
+    pending = _transaction(3, body)
+    store.set_decoded(pending.response, decode_content(body, "gzip"))
+    store.append(pending)
+    assert [t.seq for t in store] == [2, 3]
+    assert store.retained_bytes == (len(body) + len(TEXT)) * 2
+    assert transactions[1].response.decoded is None
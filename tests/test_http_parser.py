@@ -0,0 +1,101 @@
+"""
+增量 HTTP/1.x 解析：chunked、流水线、读到连接关闭的消息体，以及任意切分的输入
+"""
+from backend.services.http_parser import EVENT_HEADERS, EVENT_MESSAGE, HTTPConnectionParser, parse_message
+from backend.services.tcp_reassembly import ReassemblyBuffer
+
+
+class _Connection:
+    """两个方向的重组缓存 + 连接解析器，按字节流顺序送入数据"""
+
+    def __init__(self, max_body: int = 1 << 20):
+        self.parser = HTTPConnectionParser(max_body)
+        self.outbound = ReassemblyBuffer()
+        self.inbound = ReassemblyBuffer()
+        self.outbound.add(1000, b'', syn=True)
+        self.inbound.add(5000, b'', syn=True)
+        self._seq = {id(self.outbound): 1001, id(self.inbound): 5001}
+        self.events = []
+
+    def send(self, buffer: ReassemblyBuffer, data: bytes, fin: bool = False, step: int = 0) -> None:
+        pieces = [data[i:i + step] for i in range(0, len(data), step)] if step else [data]
+        for i, piece in enumerate(pieces):
+            last = fin and i == len(pieces) - 1
+            buffer.add(self._seq[id(buffer)], piece, fin=last)
+            self._seq[id(buffer)] += len(piece)
+            self.events += self.parser.feed(self.outbound, self.inbound, float(len(self.events)))
+
+    def request(self, data: bytes, **kwargs) -> None:
+        self.send(self.outbound, data, **kwargs)
+
+    def response(self, data: bytes, **kwargs) -> None:
+        self.send(self.inbound, data, **kwargs)
+
+    def messages(self) -> list:
+        return [message for event, message in self.events if event == EVENT_MESSAGE]
+
+
+CHUNKED = (b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\nContent-Type: text/plain\r\n\r\n"
+           b"5;ext=1\r\nhello\r\n7\r\n, world\r\n0\r\nX-Trailer: done\r\n\r\n")
+
+
+def test_chunked_body_in_any_split():
+    for step in (0, 1, 3, 17):
+        connection = _Connection()
+        connection.request(b"GET / HTTP/1.1\r\nHost: example.com\r\n\r\n")
+        connection.response(CHUNKED, step=step)
+        request, response = connection.messages()
+        assert request.method == "GET" and request.headers.get("host") == "example.com"
+        assert response.chunked and bytes(response.body) == b"hello, world" and response.body_size == 12
+        assert len(connection.outbound) == 0 and len(connection.inbound) == 0, step
+
+
+def test_pipelined_requests_and_responses():
+    connection = _Connection()
+    connection.request(b"GET /a HTTP/1.1\r\nHost: h\r\n\r\n"
+                       b"HEAD /b HTTP/1.1\r\nHost: h\r\n\r\n"
+                       b"POST /c HTTP/1.1\r\nHost: h\r\nContent-Length: 4\r\n\r\nbody")
+    connection.response(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+                        # HEAD 的响应有 Content-Length 但没有消息体
+                        b"HTTP/1.1 200 OK\r\nContent-Length: 1234\r\n\r\n"
+                        b"HTTP/1.1 100 Continue\r\n\r\n"
+                        b"HTTP/1.1 201 Created\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nnew\r\n0\r\n\r\n"
+                        b"HTTP/1.1 304 Not Modified\r\n\r\n", step=7)
+    messages = connection.messages()
+    assert [m.target for m in messages[:3]] == ["/a", "/b", "/c"]
+    assert bytes(messages[2].body) == b"body"
+    assert [(m.status, bytes(m.body)) for m in messages[3:]] == [
+        (200, b"ok"), (200, b""), (100, b""), (201, b"new"), (304, b"")]
+    assert connection.parser.stats() == {'messages': 8, 'bytes_skipped': 0}
+
+
+def test_body_until_close():
+    connection = _Connection()
+    connection.request(b"GET /stream HTTP/1.0\r\n\r\n")
+    connection.response(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\n\r\npart one, ")
+    connection.response(b"part two")
+    # 头部已完成，消息体要等到连接关闭
+    assert [event for event, _ in connection.events] == [EVENT_HEADERS, EVENT_MESSAGE, EVENT_HEADERS]
+    connection.response(b"", fin=True)
+    response = connection.messages()[-1]
+    assert bytes(response.body) == b"part one, part two"
+
+
+def test_resync_and_truncation():
+    connection = _Connection(max_body=10)
+    # 中途开始抓包：跳过半条消息，从下一条起始行开始解析
+    connection.request(b"tail of an earlier body\r\nGET /next HTTP/1.1\r\n\r\n")
+    connection.response(b"HTTP/1.1 200 OK\r\nContent-Length: 26\r\n\r\nabcdefghijklmnopqrstuvwxyz")
+    request, response = connection.messages()
+    assert request.target == "/next"
+    assert bytes(response.body) == b"abcdefghij" and response.truncated and response.body_size == 26
+    assert connection.parser.stats()['bytes_skipped'] == len(b"tail of an earlier body\r\n")
+
+
+def test_parse_message_without_copy():
+    data = b"HTTP/1.1 404 Not Found\r\nContent-Length: 5\r\nX-A: 1\r\nx-a: 2\r\n\r\nmissingEXTRA"
+    message = parse_message(data, 1.0)
+    assert (message.status, message.reason) == (404, "Not Found")
+    assert isinstance(message.body, memoryview) and bytes(message.body) == b"missi"
+    assert message.headers.get_all("X-A") == ["1", "2"]
+    assert parse_message(b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n", 1.0) is None
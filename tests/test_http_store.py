@@ -0,0 +1,93 @@
+"""
+HTTP 事务存储：索引查询与全量扫描一致，按数量和字节预算淘汰，统计增量维护
+"""
+import random
+
+from backend.services.http_parser import HTTPHeaders
+from backend.services.http_store import HTTPTransactionStore, request_host, url_template
+from backend.services.http_stream import HTTPRequest, HTTPResponse, HTTPTransaction
+
+HOSTS = [b"api.example.com", b"static.example.com", b"auth.example.com"]
+PATHS = ["/api/users/{}", "/api/orders/{}/items", "/static/app.js", "/health"]
+STATUSES = [200] * 8 + [404, 500, 503]
+
+
+def _transaction(rng: random.Random, timestamp: float, index: int, body_size: int = 0) -> HTTPTransaction:
+    stream_id = f"192.168.1.10:{40000 + index % 50}-10.0.0.1:80"
+    duration = rng.lognormvariate(3, 1.5)
+    request = HTTPRequest("GET", rng.choice(PATHS).format(rng.randrange(1000)), "HTTP/1.1",
+                          HTTPHeaders([(b'Host', rng.choice(HOSTS))]), b'', timestamp, stream_id)
+    response = HTTPResponse("HTTP/1.1", rng.choice(STATUSES), "", HTTPHeaders(), b'x' * body_size,
+                            timestamp + duration / 1000, stream_id)
+    return HTTPTransaction(request=request, response=response, duration=duration, is_retry=index % 7 == 0)
+
+
+def _build(count: int, body_size: int = 0, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    transactions = [_transaction(rng, 1_700_000_000.0 + i * 0.01, i, body_size) for i in range(count)]
+    # 抓包时事务在收到响应时配对写入
+    transactions.sort(key=lambda trans: trans.response.timestamp)
+    return transactions
+
+
+def _scan(transactions: list, predicate, limit: int = 100) -> list:
+    return [t.seq for t in reversed(transactions) if predicate(t)][:limit]
+
+
+def test_queries_match_full_scan():
+    transactions = _build(3000)
+    store = HTTPTransactionStore(capacity=1000)
+    for transaction in transactions:
+        store.append(transaction)
+    retained = transactions[-1000:]
+    assert len(store) == 1000 and store.evicted == 2000
+
+    probe = retained[500]
+    t_mid = probe.response.timestamp
+    cases = [
+        (dict(host="API.example.com"), lambda t: request_host(t.request) == "api.example.com"),
+        (dict(template="/api/users/{id}"), lambda t: url_template(t.request.url) == "/api/users/{id}"),
+        (dict(status=404), lambda t: t.response.status_code == 404),
+        (dict(status_class=5), lambda t: t.response.status_code // 100 == 5),
+        (dict(stream_id=probe.request.stream_id), lambda t: t.request.stream_id == probe.request.stream_id),
+        (dict(start=t_mid, end=t_mid + 2), lambda t: t_mid <= t.response.timestamp <= t_mid + 2),
+        (dict(min_duration=50, max_duration=200), lambda t: 50 <= t.duration <= 200),
+        (dict(host="static.example.com", status_class=2, before=probe.seq),
+         lambda t: (t.seq < probe.seq and request_host(t.request) == "static.example.com"
+                    and t.response.status_code // 100 == 2)),
+    ]
+    for filters, predicate in cases:
+        assert [t.seq for t in store.query(**filters)] == _scan(retained, predicate), filters
+
+
+def test_stats_follow_eviction():
+    transactions = _build(500)
+    store = HTTPTransactionStore(capacity=200)
+    for transaction in transactions:
+        store.append(transaction)
+    retained = transactions[-200:]
+    stats = store.stats()
+    status_codes = {}
+    for transaction in retained:
+        status_codes[transaction.response.status_code] = status_codes.get(transaction.response.status_code, 0) + 1
+    assert stats['status_codes'] == status_codes
+    assert stats['retry_count'] == sum(t.is_retry for t in retained)
+    assert abs(stats['avg_duration'] - sum(t.duration for t in retained) / 200) < 1e-6
+    assert [t.seq for t in store.latest(5)] == [t.seq for t in retained[-5:]]
+
+
+def test_byte_budget_evicts_oldest():
+    transactions = _build(100, body_size=1000)
+    store = HTTPTransactionStore(capacity=1000, max_bytes=10_500)
+    for transaction in transactions:
+        store.append(transaction)
+    assert len(store) == 10
+    assert store.retained_bytes == 10_000
+    assert [t.seq for t in store] == list(range(90, 100))
+    assert [t.seq for t in store.query()] == list(range(99, 89, -1))
+
+    # 单个超出预算的事务仍然保留
+    huge = _build(1, body_size=50_000, seed=2)[0]
+    store.append(huge)
+    assert list(store) == [huge]
+    assert store.stats()['retained_bytes'] == 50_000
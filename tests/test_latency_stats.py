@@ -0,0 +1,79 @@
+"""
+端点延迟分位数：直方图精度、合并、滑动窗口和端点上限
+"""
+import random
+
+import pytest
+
+from backend.services.latency_stats import (OVERFLOW_ENDPOINT, EndpointLatencyTracker, LatencyHistogram,
+                                            bucket_index, bucket_range)
+
+
+def test_buckets_cover_values():
+    for value in list(range(300)) + [10 ** k + d for k in range(3, 10) for d in (-1, 0, 1)]:
+        lo, hi = bucket_range(bucket_index(value))
+        assert lo <= value < hi
+        assert hi - lo <= max(1, lo // 64)
+
+
+def test_quantiles_within_relative_error():
+    rng = random.Random(3)
+    values = [int(rng.lognormvariate(9, 1.5)) for _ in range(20000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    values.sort()
+    for q, estimate in zip((0.5, 0.9, 0.99), histogram.quantiles((0.5, 0.9, 0.99))):
+        exact = values[int(q * len(values)) - 1]
+        assert abs(estimate - exact) <= exact / 64 + 1
+    assert (histogram.min, histogram.max, histogram.count) == (values[0], values[-1], len(values))
+
+
+def test_merge_equals_single_histogram():
+    rng = random.Random(5)
+    values = [rng.randrange(1, 5_000_000) for _ in range(5000)]
+    whole, left, right = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for i, value in enumerate(values):
+        whole.record(value)
+        (left if i % 2 else right).record(value)
+    left.merge(right)
+    assert left.summary() == whole.summary()
+    assert LatencyHistogram.from_state(whole.state()).summary() == whole.summary()
+
+
+def test_sliding_window_and_queries():
+    tracker = EndpointLatencyTracker(slot_seconds=10, horizon=60)
+    for second in range(120):
+        tracker.record("GET", "api", "/users/{id}", 10.0 if second < 100 else 500.0, 1000.0 + second)
+        tracker.record("POST", "api", "/orders", 50.0, 1000.0 + second)
+    # 最近 20 秒（两个时间片）只有慢请求
+    users = tracker.query(window=20, method="GET")[0]
+    assert users["count"] == 20 and users["p50_ms"] == pytest.approx(500, rel=1 / 64)
+    # 全部时间：120 次，p50 仍是 10ms
+    users = tracker.query(method="GET")[0]
+    assert users["count"] == 120 and users["p50_ms"] == pytest.approx(10, rel=1 / 64)
+    # 超出保留时长的时间片已丢弃，窗口最多覆盖 60 秒
+    assert tracker.query(window=1000, method="GET")[0]["count"] == 60
+    assert [e["url_template"] for e in tracker.query(sort_by="p99")] == ["/users/{id}", "/orders"]
+    assert tracker.overall()["count"] == 240
+    with pytest.raises(ValueError):
+        tracker.query(sort_by="median")
+
+
+def test_endpoint_limit_and_merge():
+    tracker = EndpointLatencyTracker(max_endpoints=3)
+    for i in range(10):
+        tracker.record("GET", "api", f"/t{i}", 1.0, 100.0 + i)
+    assert len(tracker) == 4
+    overflow = [e for e in tracker.query() if (e["method"], e["host"], e["url_template"]) == OVERFLOW_ENDPOINT]
+    assert overflow[0]["count"] == 7
+
+    other = EndpointLatencyTracker()
+    other.record("GET", "api", "/t0", 3.0, 200.0)
+    merged = EndpointLatencyTracker()
+    merged.merge(tracker)
+    merged.merge(other)
+    assert merged.query(template="/t0")[0]["count"] == 2
+    assert merged.overall()["count"] == 11
+    with pytest.raises(ValueError):
+        merged.merge(EndpointLatencyTracker(slot_seconds=5))
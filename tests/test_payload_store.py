@@ -0,0 +1,113 @@
+"""
+payload 落盘存储：偏移/长度记账、跨段读写、删除最旧的段、关闭后释放，以及流中报文的按需读回
+"""
+import threading
+
+from backend.services.payload_store import PayloadStore, header_prefix
+from backend.services.tcp_stream import TCPStreamManager
+
+from tests.packets import short_flow
+
+REQUEST = b'POST /upload HTTP/1.1\r\nHost: a\r\nContent-Length: 2000\r\n\r\n' + bytes(range(200)) * 10
+RESPONSE = b'HTTP/1.1 201 Created\r\nContent-Length: 0\r\n\r\n'
+
+
+def test_header_prefix():
+    assert header_prefix(REQUEST) == REQUEST[:REQUEST.index(b'\r\n\r\n') + 4]
+    assert header_prefix(b'\x16\x03\x01' + b'x' * 2000) == b'\x16\x03\x01' + b'x' * 1021
+    # 头部结尾超出上限时按上限截断
+    assert header_prefix(b'a' * 50 + b'\r\n\r\n', limit=20) == b'a' * 20
+
+
+def test_offsets_and_reads_across_segments(tmp_path):
+    store = PayloadStore(directory=str(tmp_path), segment_size=64)
+    payloads = [bytes([i]) * size for i, size in enumerate((10, 54, 1, 100, 0, 37))]
+    offsets = [store.append(payload) for payload in payloads]
+    # 偏移是全局线性编址，不按段对齐：第二个正好填满第一个段，第四个跨越两个段边界
+    assert offsets == [0, 10, 64, 65, 165, 165]
+    for offset, payload in zip(offsets, payloads):
+        assert store.read(offset, len(payload)) == payload
+    assert store.read(60, 10) == bytes([1]) * 4 + bytes([2]) + bytes([3]) * 5
+    assert store.bytes_written == 202 and store.stats()['segments'] == 4
+    # 越界、负数偏移/长度
+    for offset, length in ((200, 3), (202, 1), (-1, 5), (0, -1)):
+        assert store.read(offset, length) is None, (offset, length)
+    assert store.read(202, 0) == b''
+    store.close()
+
+
+def test_oldest_segments_are_dropped(tmp_path):
+    store = PayloadStore(directory=str(tmp_path), segment_size=64, max_bytes=128)
+    offsets = [store.append(bytes([i]) * 40) for i in range(8)]
+    # 写入 320 字节共 5 个段，只保留最后 2 个
+    assert store.stats() == {'bytes_written': 320, 'segments': 2, 'disk_bytes': 128, 'segments_dropped': 3}
+    assert [store.read(offset, 40) is not None for offset in offsets] == [False] * 5 + [True] * 3
+    # 起点在已删除的段中时整体不可读
+    assert store.read(190, 10) is None and store.read(192, 10) == bytes([4]) * 8 + bytes([5]) * 2
+    store.close()
+
+
+def test_close_releases_segments(tmp_path):
+    store = PayloadStore(directory=str(tmp_path), segment_size=64, max_bytes=128)
+    for _ in range(3):
+        store.append(b'x' * 64)
+    live = [segment for segment in store._segments if segment is not None]
+    store.close()
+    assert all(segment.map.closed and segment.file.closed for segment in live)
+    assert store.stats()['segments'] == 0 and store.stats()['bytes_written'] == 192
+    # 关闭后不再写入和读取，重复关闭无影响
+    assert store.append(b'y') == -1 and store.read(128, 10) is None
+    store.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_concurrent_reads_while_appending(tmp_path):
+    store = PayloadStore(directory=str(tmp_path), segment_size=4096)
+    written = []
+    errors = []
+
+    def reader():
+        while len(written) < 500:
+            for offset, payload in list(written[-20:]):
+                if store.read(offset, len(payload)) != payload:
+                    errors.append(offset)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for i in range(500):
+        payload = bytes([i % 256]) * (i % 300 + 1)
+        written.append((store.append(payload), payload))
+    thread.join()
+    assert errors == []
+    store.close()
+
+
+def _packets(manager: TCPStreamManager) -> list:
+    for record in short_flow(40000, "10.0.0.5", 8080, 1.0, request=REQUEST, response=RESPONSE):
+        manager.process_record(record, record.timestamp)
+    return [packet for packet in next(iter(manager.streams.values())).packets if packet.payload_len]
+
+
+def test_stream_payloads_read_back_lazily(tmp_path):
+    manager = TCPStreamManager(payload_retention="full",
+                               payload_store=PayloadStore(directory=str(tmp_path), segment_size=1024))
+    request, response = _packets(manager)
+    # 内存中只保留偏移和长度
+    assert request.payload == b'' and (request.payload_offset, request.payload_len) == (0, len(REQUEST))
+    assert response.payload_offset == len(REQUEST)
+    assert manager.read_payload(request) == REQUEST and manager.read_payload(response) == RESPONSE
+    stream_id = next(iter(manager.streams.values())).stream_id
+    assert [segment['data'] for segment in manager.follow_stream(stream_id)] == [REQUEST, RESPONSE]
+    # 落盘存储关闭后读不回
+    manager.close()
+    assert manager.read_payload(request) is None
+    assert [segment['truncated'] for segment in manager.follow_stream(stream_id)] == [True, True]
+
+    # headers 模式只保留头部，none 模式不保留
+    manager = TCPStreamManager(payload_retention="headers")
+    request, response = _packets(manager)
+    assert manager.read_payload(request) == header_prefix(REQUEST) and manager.read_payload(response) == RESPONSE
+    assert manager.payload_store is None
+    manager = TCPStreamManager(payload_retention="none")
+    request, _ = _packets(manager)
+    assert manager.read_payload(request) is None
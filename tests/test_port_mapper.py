@@ -0,0 +1,49 @@
+"""
+端口映射：按需刷新在后台线程中进行，新监听的端口无需等待定时刷新
+"""
+import socket
+import time
+
+from backend.services.port_mapper import PortMapper
+
+
+def _wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_requested_refresh_runs_on_mapper_thread():
+    mapper = PortMapper(refresh_interval=60.0)
+    changes = []
+    mapper.add_listener(changes.append)
+    mapper.start_auto_refresh()
+    server = socket.socket()
+    try:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        port = server.getsockname()[1]
+        mapper.request_refresh()
+        assert _wait_for(lambda: mapper.get_pid_by_port(port) is not None)
+        assert changes
+        assert mapper.get_metrics()['refresh_requests'] == 1
+    finally:
+        server.close()
+        mapper.stop_auto_refresh()
+    assert mapper._thread is None
+
+
+def test_refresh_requests_are_coalesced():
+    mapper = PortMapper(refresh_interval=60.0)
+    mapper.start_auto_refresh()
+    try:
+        for _ in range(1000):
+            mapper.request_refresh()
+        time.sleep(0.3)
+    finally:
+        mapper.stop_auto_refresh()
+    # 限频：0.3 秒内最多约 6 次
+    assert 1 <= mapper.refresh_count <= 8
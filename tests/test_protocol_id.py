@@ -0,0 +1,70 @@
+"""
+应用层协议识别：首字节分派、按连接缓存的识别结果、重试上限和缓存容量
+"""
+from backend.services.protocol_id import (HTTP_REQUEST, HTTP_RESPONSE, PROTO_DNS, PROTO_HTTP, PROTO_JSON,
+                                          PROTO_MYSQL, PROTO_QUIC, PROTO_SSH, PROTO_TLS, ProtocolIdentifier,
+                                          classify, classify_udp, http_request_target, tls_version)
+
+CLIENT_HELLO = bytes((0x16, 0x03, 0x01, 0x00, 0x40, 0x01)) + b'\x00' * 63
+APP_DATA = bytes((0x17, 0x03, 0x03, 0x00, 0x20)) + b'\xaa' * 32
+
+
+def test_first_byte_dispatch():
+    assert classify(b"GET /a HTTP/1.1\r\n") == (PROTO_HTTP, HTTP_REQUEST)
+    assert classify(b"PATCH /a HTTP/1.1\r\n") == (PROTO_HTTP, HTTP_REQUEST)
+    assert classify(b"HTTP/1.1 200 OK\r\n") == (PROTO_HTTP, HTTP_RESPONSE)
+    assert classify(b"SSH-2.0-OpenSSH_9.6\r\n") == (PROTO_SSH, None)
+    assert classify(CLIENT_HELLO) == (PROTO_TLS, "TLSv1.0") and tls_version(APP_DATA) == "TLSv1.2"
+    assert classify(b'  \n {"a": 1}') == (PROTO_JSON, None) and classify(b'[1, 2]') == (PROTO_JSON, None)
+    # 首字节命中但前缀不符、首字节不在表中、记录层版本无效
+    for payload in (b"GETX / HTTP/1.1", b"GE", b"Hello", b"\x00\x01\x02", bytes((0x16, 0x03, 0x09)), b"  x", b""):
+        assert classify(payload) is None, payload
+    assert http_request_target(b"POST /api/v1?x=1 HTTP/1.1\r\nHost: a\r\n\r\n") == ("POST", "/api/v1?x=1")
+    assert http_request_target(b"HTTP/1.1 200 OK\r\n\r\n") is None
+
+
+def test_udp_classification():
+    assert classify_udp(b'\x12\x34' + b'\x00' * 10, 53000, 53) == PROTO_DNS
+    assert classify_udp(b'\x12\x34', 53000, 53) is None
+    long_header = bytes((0xc3, 0x00, 0x00, 0x00, 0x01, 0x08)) + b'\x00' * 20
+    assert classify_udp(long_header, 50000, 9999) == PROTO_QUIC
+    assert classify_udp(b'\x40' + b'\x00' * 20, 50000, 443) == PROTO_QUIC
+    assert classify_udp(b'\x40' + b'\x00' * 20, 50000, 9999) is None
+
+
+def test_verdict_cached_per_flow():
+    identifier = ProtocolIdentifier()
+    assert identifier.identify("tls", CLIENT_HELLO, 50000, 443) == PROTO_TLS
+    # 已识别的连接不再检查内容：续传的数据（不以记录头开头）也归为 TLS
+    assert identifier.identify("tls", APP_DATA, 443, 50000) == PROTO_TLS
+    assert identifier.identify("tls", b"\xaa" * 100, 443, 50000) == PROTO_TLS
+    assert identifier.identify("http", b"GET / HTTP/1.1\r\n\r\n", 50001, 8081) == PROTO_HTTP
+    assert identifier.identify("http", b"body continues", 50001, 8081) == PROTO_HTTP
+    assert identifier.stats() == {'flows': 2, 'cache_hits': 3, 'detections': 2}
+    assert identifier.get_verdict("tls") == PROTO_TLS and identifier.is_settled("http")
+    # 没有 payload 的报文不识别，也不计数
+    assert identifier.identify("tls", b"", 443, 50000) is None
+    identifier.forget("tls")
+    assert identifier.get_verdict("tls") is None and not identifier.is_settled("tls")
+    # 内容无法识别时按端口兜底；SSH 端口上的数据直接归为 SSH
+    assert identifier.identify("mysql", b"\x4a\x00\x00\x00\x0a", 3306, 50002) == PROTO_MYSQL
+    assert identifier.identify("ssh", b"\x00\x00\x01\x2c", 50003, 22) == PROTO_SSH
+    # 不使用缓存
+    assert identifier.identify(None, APP_DATA) == PROTO_TLS and identifier.stats()['flows'] == 3
+
+
+def test_retry_limit_and_capacity():
+    identifier = ProtocolIdentifier(max_flows=3)
+    for attempt in range(ProtocolIdentifier.MAX_ATTEMPTS):
+        assert not identifier.is_settled("binary")
+        assert identifier.identify("binary", b"\x00\x01", 40000, 40001) is None
+    # 多次无法识别后放弃：之后即使出现 HTTP 报文也不再检查
+    assert identifier.is_settled("binary") and identifier.get_verdict("binary") is None
+    detections = identifier.detections
+    assert identifier.identify("binary", b"GET / HTTP/1.1\r\n\r\n", 40000, 40001) is None
+    assert identifier.detections == detections
+
+    # 超出容量时淘汰最久未使用的连接
+    for key in ("a", "b", "c"):
+        identifier.identify(key, APP_DATA)
+    assert identifier.stats()['flows'] == 3 and not identifier.is_settled("binary")
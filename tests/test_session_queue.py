@@ -0,0 +1,70 @@
+"""
+实时抓包会话队列：各溢出策略的丢弃/聚合和通知消息，以及从其他线程写入时唤醒事件循环
+"""
+import asyncio
+import threading
+
+import pytest
+
+from backend.services.session_queue import SessionQueue
+
+
+def _packets(start: int, count: int) -> list:
+    return [{"id": i, "protocol": "TCP" if i % 2 else "UDP", "destination": f"10.0.0.{i % 3}:80", "size": "100B"}
+            for i in range(start, start + count)]
+
+
+async def _fill_and_drain(policy: str, batches: list):
+    queue = SessionQueue(asyncio.get_running_loop(), max_packets=10, policy=policy)
+    for batch in batches:
+        queue.put(batch)
+    packets, notices = await queue.get()
+    return queue, [packet["id"] for packet in packets], notices
+
+
+def test_drop_oldest_keeps_latest():
+    queue, ids, notices = asyncio.run(_fill_and_drain("drop-oldest", [_packets(0, 8), _packets(8, 8)]))
+    assert ids == list(range(6, 16))
+    assert notices == [{"type": "drops", "policy": "drop-oldest", "dropped": 6, "total_dropped": 6,
+                        "capacity": 10}]
+    assert queue.stats()['high_water'] == 10 and queue.stats()['depth'] == 0
+
+
+def test_drop_newest_keeps_history():
+    queue, ids, notices = asyncio.run(_fill_and_drain("drop-newest", [_packets(0, 8), _packets(8, 8)]))
+    assert ids == list(range(10))
+    assert notices[0]["dropped"] == 6 and queue.delivered == 10
+
+
+def test_aggregate_until_drained():
+    async def scenario():
+        queue, ids, notices = await _fill_and_drain("aggregate", [_packets(0, 8), _packets(8, 8), _packets(16, 4)])
+        assert ids == list(range(10))
+        aggregate, end = notices
+        assert aggregate["packets"] == 10 and aggregate["bytes"] == 1000
+        assert aggregate["protocols"] == {"TCP": 5, "UDP": 5}
+        assert end == {"type": "aggregate-end", "total_aggregated": 10}
+        # 队列取空后恢复逐包推送
+        queue.put(_packets(20, 2))
+        packets, notices = await queue.get()
+        assert [packet["id"] for packet in packets] == [20, 21] and notices == []
+    asyncio.run(scenario())
+
+
+def test_producer_thread_wakes_consumer():
+    async def scenario():
+        queue = SessionQueue(asyncio.get_running_loop(), max_packets=1000)
+        producer = threading.Thread(target=lambda: [queue.put(_packets(i * 10, 10)) for i in range(50)])
+        producer.start()
+        received = []
+        while len(received) < 500:
+            packets, _ = await asyncio.wait_for(queue.get(), 5)
+            received += [packet["id"] for packet in packets]
+        producer.join()
+        assert received == list(range(500))
+    asyncio.run(scenario())
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        SessionQueue(None, policy="block")
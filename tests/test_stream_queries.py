@@ -0,0 +1,144 @@
+"""
+TCP 流查询：排序分页，抓包线程处理数据包的同时从其他线程查询，内存预算淘汰后流ID保持唯一，
+以及分片共用的全局内存预算
+"""
+import threading
+
+from backend.services.tcp_stream import ShardedTCPStreamManager, TCPStreamManager
+
+from backend.services.fast_decoder import TCP_ACK, TCP_PSH
+
+from tests.packets import CLIENT_IP, interleave, short_flow, tcp_record
+
+SERVERS = ["10.0.0.5", "10.0.0.6", "172.16.3.7"]
+
+
+def _flows(count: int, start: float = 1_700_000_000.0, close_every: int = 2):
+    return interleave([
+        short_flow(20000 + i, SERVERS[i % len(SERVERS)], 80 + i % 2, start + i * 0.003,
+                   request=b'GET /%d HTTP/1.1\r\n\r\n' % i + b'x' * (i % 97), close=i % close_every == 0)
+        for i in range(count)
+    ])
+
+
+def _all_pages(manager, sort_by: str, limit: int) -> list:
+    streams = []
+    cursor = None
+    while True:
+        page = manager.query_streams(sort_by, limit, cursor)
+        streams.extend(page['streams'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return streams
+
+
+def test_pages_cover_every_stream_in_order():
+    manager = TCPStreamManager(payload_retention="none", close_linger=0.01)
+    for record in _flows(300):
+        manager.process_record(record, record.timestamp)
+
+    streams = _all_pages(manager, "bytes", 7)
+    assert sorted(s['stream_id'] for s in streams) == sorted(s['stream_id'] for s in manager.get_all_streams())
+    totals = [s['total_bytes'] for s in streams]
+    assert totals == sorted(totals, reverse=True)
+
+
+def test_sharded_pages_match_single_manager():
+    single = TCPStreamManager(payload_retention="none", close_linger=0.01)
+    sharded = ShardedTCPStreamManager(shards=4, payload_retention="none", close_linger=0.01)
+    for record in _flows(300):
+        single.process_record(record, record.timestamp)
+        sharded.process_record(record, record.timestamp)
+
+    for sort_by in ("bytes", "packets", "duration"):
+        expected = [s['stream_id'] for s in _all_pages(single, sort_by, 11)]
+        assert [s['stream_id'] for s in _all_pages(sharded, sort_by, 11)] == expected
+
+
+def test_queries_while_capturing():
+    """API 线程池的查询与抓包线程并发：流在查询期间被创建、结束和按内存预算淘汰"""
+    manager = ShardedTCPStreamManager(shards=4, payload_retention="headers", close_linger=0.01,
+                                      memory_budget=400_000, max_retired=200)
+    records = _flows(3000)
+    done = threading.Event()
+    errors = []
+
+    def query():
+        try:
+            while not done.is_set():
+                page = manager.query_streams("bytes", 20)
+                manager.query_streams("retransmission_rate", 20, page['next_cursor'])
+                manager.get_all_streams()
+                manager.get_server_stats()
+                manager.get_eviction_stats()
+                for summary in page['streams'][:3]:
+                    manager.follow_stream(summary['stream_id'])
+        except Exception as e:  # pragma: no cover - 失败时在主线程断言
+            errors.append(e)
+
+    threads = [threading.Thread(target=query) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    try:
+        for record in records:
+            manager.process_record(record, record.timestamp)
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+
+    assert errors == []
+    assert sum(server['streams'] for server in manager.get_server_stats()) == 3000
+
+
+def test_budget_ignores_unconsumed_data_and_ids_stay_unique():
+    manager = TCPStreamManager(payload_retention="none", memory_budget=60_000)
+    manager.wants_reassembly = lambda stream, record: True
+    # 10 个下载中的流，未被消费的重组数据远超内存预算
+    for i in range(10):
+        for record in short_flow(30000 + i, "10.0.0.5", 80, 1.0 + i, close=False):
+            manager.process_record(record, record.timestamp)
+        manager.process_record(tcp_record("10.0.0.5", 80, CLIENT_IP, 30000 + i, 5001 + 38, 0, TCP_ACK | TCP_PSH,
+                                          b'x' * 100_000, 1.5 + i), 1.5 + i)
+    stats = manager.get_eviction_stats()
+    assert stats['active_streams'] == 10 and stats['evicted']['memory'] == 0
+    assert stats['reassembly_bytes'] >= 10 * 100_000 and stats['memory_used'] < 60_000
+
+    # 对象开销超出预算时按 LRU 淘汰；被淘汰的流再次出现时使用新的ID
+    for i in range(30):
+        for record in short_flow(31000 + i, "10.0.0.6", 80, 20.0 + i, close=False):
+            manager.process_record(record, record.timestamp)
+    for record in short_flow(30000, "10.0.0.5", 80, 60.0, close=False):
+        manager.process_record(record, record.timestamp)
+    assert manager.get_eviction_stats()['evicted']['memory'] > 0
+    ids = [summary['stream_id'] for summary in manager.get_all_streams()]
+    assert len(ids) == len(set(ids))
+    first = manager.get_stream_stats("10.0.0.5:80-192.168.1.10:30000")
+    again = manager.get_stream_stats("10.0.0.5:80-192.168.1.10:30000#2")
+    assert not first['active'] and first['close_reason'] == "memory" and first['total_bytes'] > 100_000
+    assert again['active'] and again['total_packets'] == 6
+    assert manager.follow_stream("10.0.0.5:80-192.168.1.10:30000") is None
+    assert manager.follow_stream("10.0.0.5:80-192.168.1.10:30000#2") is not None
+    assert manager.get_eviction_stats()['reassembly_bytes'] == sum(s.buffered for s in manager.streams.values())
+
+
+def test_shards_share_global_budget():
+    manager = ShardedTCPStreamManager(shards=4, payload_retention="none", memory_budget=200_000)
+    # 流量集中在一个分片：超出平均份额但总用量低于预算时不淘汰
+    flows = [short_flow(20000 + i, "10.0.0.5", 80, 1.0 + i * 0.01, close=False) for i in range(400)]
+    flows = [flow for flow in flows if manager.shard_of_record(flow[0]) == 0][:40]
+    for record in interleave(flows):
+        manager.process_record(record, record.timestamp)
+    stats = manager.get_eviction_stats()
+    assert stats['memory_budget'] == 200_000 and stats['evicted']['memory'] == 0
+    assert stats['memory_per_shard'][0] > 200_000 // 4 and stats['active_streams'] == 40
+
+    # 其他分片的流量让总用量超出：超过份额的分片在推进定时器时淘汰自己的流，总用量回到预算以内
+    others = [short_flow(30000 + i, "10.0.0.6", 80, 10.0 + i * 0.01, close=False) for i in range(400)]
+    others = [flow for flow in others if manager.shard_of_record(flow[0]) != 0][:40]
+    for record in interleave(others):
+        manager.process_record(record, record.timestamp)
+    manager.expire(11.0)
+    stats = manager.get_eviction_stats()
+    assert stats['evicted']['memory'] > 0 and stats['memory_used'] <= 200_000
+    assert stats['streams_per_shard'][0] < 40
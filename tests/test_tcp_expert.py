@@ -0,0 +1,123 @@
+"""
+TCP 专家分析的汇总：按流和按服务器端点的握手/数据 RTT、事件计数，以及跨分片合并和检查点状态
+"""
+from backend.services.fast_decoder import TCP_ACK, TCP_PSH, TCP_RST, TCP_SYN
+from backend.services.tcp_expert import RTTStats, ServerExpert
+from backend.services.tcp_stream import ShardedTCPStreamManager, TCPStreamManager
+
+from tests.packets import CLIENT_IP, interleave, short_flow, tcp_record
+
+SERVER = "10.0.0.5"
+DATA = TCP_ACK | TCP_PSH
+TROUBLED_EVENTS = {'dup_ack': 2, 'fast_retransmission': 1, 'zero_window': 1, 'rst_after_data': 1}
+
+
+def _troubled_flow(client_port: int, t: float) -> list:
+    """两个数据段，服务器三次确认第一个（两次重复 ACK）后快速重传，随后零窗口并 RST"""
+    def client(seq, ack, flags, dt=0.0, payload=b''):
+        return tcp_record(CLIENT_IP, client_port, SERVER, 80, seq, ack, flags, payload, t + dt)
+
+    def server(seq, ack, flags, dt=0.0, window=65535):
+        return tcp_record(SERVER, 80, CLIENT_IP, client_port, seq, ack, flags, b'', t + dt, window)
+
+    return [
+        client(1000, 0, TCP_SYN), server(5000, 1001, TCP_SYN | TCP_ACK, 0.01), client(1001, 5001, TCP_ACK, 0.011),
+        client(1001, 5001, DATA, 0.02, b'x' * 100), client(1101, 5001, DATA, 0.03, b'y' * 100),
+        server(5001, 1101, TCP_ACK, 0.05), server(5001, 1101, TCP_ACK, 0.051), server(5001, 1101, TCP_ACK, 0.052),
+        client(1101, 5001, DATA, 0.06, b'y' * 100),
+        server(5001, 1201, TCP_ACK, 0.08, window=0), server(5001, 1201, TCP_RST | TCP_ACK, 0.1)
+    ]
+
+
+def _records() -> list:
+    return interleave([
+        _troubled_flow(40000, 1.0),
+        _troubled_flow(40001, 1.5),
+        short_flow(40002, SERVER, 80, 2.0, rtt=0.04),
+        short_flow(40003, "10.0.0.6", 80, 2.0),
+        short_flow(40004, "10.0.0.4", 80, 2.0)
+    ])
+
+
+def _feed(manager, records: list):
+    for record in records:
+        manager.process_record(record, record.timestamp)
+    return manager
+
+
+def test_rtt_samples_per_stream_and_server():
+    manager = TCPStreamManager(payload_retention="none")
+    for i, rtt in enumerate((0.01, 0.02, 0.04)):
+        _feed(manager, short_flow(40000 + i, SERVER, 80, 1.0 + i, rtt=rtt))
+    # 握手 SYN -> ACK 为 1.1 个 RTT；请求由响应确认（1 个 RTT），响应由客户端 ACK 确认（0.1 个 RTT）
+    server, = manager.get_server_stats()
+    assert server == {
+        'server': f"{SERVER}:80",
+        'streams': 3,
+        'handshake_rtt': {'count': 3, 'min_ms': 11.0, 'avg_ms': 25.667, 'max_ms': 44.0},
+        'request_rtt': {'count': 3, 'min_ms': 10.0, 'avg_ms': 23.333, 'max_ms': 40.0},
+        'response_rtt': {'count': 3, 'min_ms': 1.0, 'avg_ms': 2.333, 'max_ms': 4.0},
+        'events': {}
+    }
+    stream = next(iter(manager.streams.values())).expert.to_dict()
+    assert (stream['handshake_rtt_ms'], stream['handshake_server_rtt_ms'], stream['handshake_client_rtt_ms']) == \
+        (11.0, 10.0, 1.0)
+
+
+def test_events_aggregate_per_server():
+    manager = _feed(TCPStreamManager(payload_retention="none", close_linger=10.0), _records())
+    servers = manager.get_server_stats()
+    # 连接数降序，相同时按端点排序
+    assert [(s['server'], s['streams']) for s in servers] == [(f"{SERVER}:80", 3), ("10.0.0.4:80", 1),
+                                                               ("10.0.0.6:80", 1)]
+    busy = servers[0]
+    assert busy['events'] == {event: count * 2 for event, count in TROUBLED_EVENTS.items()}
+    assert all(not server['events'] for server in servers[1:])
+    # 快速重传之后的 ACK 不取样（Karn 算法）：每个异常流只有第一个数据段的 30ms 样本
+    assert busy['request_rtt'] == {'count': 3, 'min_ms': 30.0, 'avg_ms': 33.333, 'max_ms': 40.0}
+    assert busy['response_rtt']['count'] == 1 and busy['handshake_rtt']['count'] == 3
+
+    # 服务器汇总等于其各流的计数之和
+    streams = [stream.expert.to_dict() for stream in manager.streams.values()
+               if stream.expert.server.server == busy['server']]
+    totals = {}
+    for stream in streams:
+        for event, count in stream['events'].items():
+            totals[event] = totals.get(event, 0) + count
+    assert totals == busy['events']
+    assert sorted(s['request_rtt']['count'] for s in streams) == [1, 1, 1]
+
+
+def test_sharded_merge_and_state_round_trip():
+    records = _records()
+    single = _feed(TCPStreamManager(payload_retention="none"), records).get_server_stats()
+    sharded = _feed(ShardedTCPStreamManager(shards=4, payload_retention="none"), records)
+    assert sharded.get_server_stats() == single
+
+    # 检查点状态原地恢复，合并两份等于计数翻倍
+    state = sharded.checkpoint_state()
+    restored = {}
+    for endpoint, server_state in state['servers']:
+        server = restored[endpoint] = ServerExpert(endpoint)
+        server.load_state(server_state)
+    assert sorted(restored) == sorted(server['server'] for server in single)
+    busy = restored[f"{SERVER}:80"]
+    assert busy.to_dict() == single[0]
+    # 合并空汇总不改变结果
+    busy.merge(ServerExpert(busy.server))
+    assert busy.to_dict() == single[0]
+    other = ServerExpert(busy.server)
+    other.load_state(busy.to_state())
+    busy.merge(other)
+    assert busy.streams == 6 and busy.counts['dup_ack'] == 8 and busy.handshake_rtt.count == 6
+    assert busy.handshake_rtt.min == other.handshake_rtt.min and busy.handshake_rtt.max == other.handshake_rtt.max
+
+
+def test_rtt_stats_merge():
+    empty, stats = RTTStats(), RTTStats()
+    assert empty.to_dict() == {'count': 0}
+    for sample in (0.002, 0.010, 0.003):
+        stats.add(sample)
+    empty.merge(stats)
+    stats.merge(RTTStats())
+    assert empty.to_dict() == stats.to_dict() == {'count': 3, 'min_ms': 2.0, 'avg_ms': 5.0, 'max_ms': 10.0}
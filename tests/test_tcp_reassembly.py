@@ -0,0 +1,123 @@
+"""
+TCP 单方向重组：乱序、重复、重叠、序列号回绕、FIN 先到和缓存上限，以及没有消费方的流只跟踪序列号
+"""
+import random
+
+from backend.services.fast_decoder import TCP_ACK, TCP_PSH
+from backend.services.tcp_reassembly import (SEG_AHEAD, SEG_DROPPED, SEG_DUPLICATE, SEG_EMPTY, SEG_HOLE_FILL,
+                                             SEG_IN_ORDER, ReassemblyBuffer)
+from backend.services.tcp_stream import TCPStreamManager
+
+from tests.packets import CLIENT_IP, short_flow, tcp_record
+
+DATA = bytes(range(256)) * 40
+
+
+def _segments(data: bytes, isn: int, size: int = 100) -> list:
+    return [((isn + 1 + offset) % (1 << 32), data[offset:offset + size]) for offset in range(0, len(data), size)]
+
+
+def test_out_of_order_duplicates_and_overlaps():
+    rng = random.Random(7)
+    for isn in (1000, (1 << 32) - 2500):  # 第二种情况在数据中间回绕
+        buffer = ReassemblyBuffer()
+        assert buffer.add(isn, b'', syn=True) == SEG_EMPTY
+        segments = _segments(DATA, isn)
+        # 乱序、部分重传，另加一些与边界错开的重叠报文
+        shuffled = segments + rng.sample(segments, 10)
+        rng.shuffle(shuffled)
+        for seq, payload in shuffled:
+            buffer.add(seq, payload)
+            overlap = rng.randrange(len(DATA) - 150)
+            buffer.add((isn + 1 + overlap) % (1 << 32), DATA[overlap:overlap + 150])
+        assert bytes(buffer.data) == DATA
+        assert buffer.pending_bytes == 0 and buffer.missing_bytes() == 0
+        assert buffer.bytes_delivered == len(DATA)
+
+
+def test_segment_results_and_fin_after_hole():
+    buffer = ReassemblyBuffer()
+    buffer.add(0, b'', syn=True)
+    assert buffer.add(1, b"abc") == SEG_IN_ORDER
+    # FIN 先于前面缺失的数据到达
+    assert buffer.add(7, b"ghi", fin=True) == SEG_AHEAD
+    assert not buffer.fin_seen and buffer.missing_bytes() == 3
+    assert buffer.add(1, b"abc") == SEG_DUPLICATE
+    assert buffer.add(4, b"def") == SEG_HOLE_FILL
+    assert bytes(buffer.data) == b"abcdefghi" and buffer.fin_seen
+    assert buffer.add(10 + (1 << 31), b"far away") == SEG_DROPPED
+
+
+def test_consume_and_header_scan():
+    buffer = ReassemblyBuffer()
+    buffer.add(0, b"GET / HTTP/1.1\r\nHost: a\r\n")
+    assert buffer.header_end() == -1
+    buffer.add(25, b"\r\nbody")
+    end = buffer.header_end()
+    assert bytes(buffer.data[:end]) == b"GET / HTTP/1.1\r\nHost: a"
+    buffer.consume(end + 4)
+    assert bytes(buffer.data) == b"body" and buffer.header_end() == -1
+
+
+def test_buffer_limits():
+    buffer = ReassemblyBuffer(max_bytes=1000, max_pending=300)
+    buffer.add(0, b'', syn=True)
+    buffer.add(1, b"x" * 800)
+    # 乱序缓存满后丢弃
+    assert buffer.add(1001, b"y" * 200) == SEG_AHEAD
+    assert buffer.add(1301, b"z" * 200) == SEG_DROPPED
+    assert buffer.pending_bytes == 200
+    # 按序缓存超出上限：清空未消费的数据，继续跟踪序列号
+    buffer.add(801, b"w" * 200)
+    assert buffer.overflows == 1 and len(buffer) == 0
+    assert buffer.add(1201, b"v" * 10) == SEG_IN_ORDER and bytes(buffer.data) == b"v" * 10
+
+
+def test_track_only_keeps_no_bytes():
+    buffer = ReassemblyBuffer(keep_data=False)
+    buffer.add(0, b'', syn=True)
+    assert buffer.add(1, b"abc") == SEG_IN_ORDER
+    # 空洞直接跳过，FIN 在报文结尾生效
+    assert buffer.add(7, b"ghi", fin=True) == SEG_AHEAD
+    assert buffer.fin_seen and buffer.next_seq == 11
+    assert len(buffer) == 0 and buffer.pending_bytes == 0
+
+    # 开始保留数据后从当前序列号重组；track_only() 丢弃已缓存的数据
+    buffer = ReassemblyBuffer(keep_data=False)
+    buffer.add(1, b"abc")
+    buffer.keep_data = True
+    buffer.add(4, b"def")
+    buffer.add(10, b"jkl")
+    assert bytes(buffer.data) == b"def" and buffer.pending_bytes == 3
+    buffer.track_only()
+    assert len(buffer) == 0 and buffer.pending_bytes == 0
+    assert buffer.add(7, b"ghi") == SEG_IN_ORDER and len(buffer) == 0 and buffer.next_seq == 10
+
+
+def test_only_consumed_streams_reassemble():
+    manager = TCPStreamManager(payload_retention="none")
+    manager.wants_reassembly = lambda stream, record: record.payload.startswith(b"GET ")
+    tls = short_flow(40000, "10.0.0.5", 443, 1.0, request=b'\x16\x03\x01' + b'x' * 5000,
+                     response=b'\x16\x03\x03' + b'y' * 5000, close=False)
+    http = short_flow(40001, "10.0.0.5", 80, 1.0, close=False)
+    for record in tls + http:
+        manager.process_record(record, record.timestamp)
+    # 后续的大量数据（没有消费方的流不保留任何字节）
+    for i in range(50):
+        manager.process_record(tcp_record("10.0.0.5", 443, CLIENT_IP, 40000, 5001 + 5003 + i * 1000, 0,
+                                          TCP_ACK | TCP_PSH, b'z' * 1000, 2.0 + i), 2.0 + i)
+
+    streams = {stream.dst_port: stream for stream in manager.streams.values()}
+    tls_stream, http_stream = streams[443], streams[80]
+    assert tls_stream.reassembly is False
+    assert len(tls_stream.outbound) == len(tls_stream.inbound) == 0
+    assert tls_stream.inbound.pending_bytes == 0 and tls_stream.inbound.offset == 5003 + 50 * 1000
+    assert http_stream.reassembly is True and bytes(http_stream.outbound.data) == b'GET / HTTP/1.1\r\n\r\n'
+    assert manager.memory_used < 20000
+
+    # 未设置消费方时所有流只跟踪序列号
+    manager = TCPStreamManager(payload_retention="none")
+    for record in http:
+        manager.process_record(record, record.timestamp)
+    stream = next(iter(manager.streams.values()))
+    assert stream.reassembly is None and len(stream.outbound) == len(stream.inbound) == 0
@@ -0,0 +1,69 @@
+"""
+TCP 重传记分板：各类重传的分类、ACK 裁剪和区间数量上限
+"""
+from backend.services.fast_decoder import TCP_ACK, TCP_FIN, TCP_PSH, TCP_SYN
+from backend.services.tcp_retrans import (SEG_FAST_RETRANSMISSION, SEG_KEEP_ALIVE, SEG_NEW, SEG_OUT_OF_ORDER,
+                                          SEG_RETRANSMISSION, SEG_SPURIOUS_RETRANSMISSION, RetransmissionDetector)
+
+DATA = TCP_ACK | TCP_PSH
+
+
+def _detector(isn: int) -> RetransmissionDetector:
+    detector = RetransmissionDetector()
+    assert detector.on_segment(isn, 0, TCP_SYN) == SEG_NEW
+    detector.on_ack(isn + 1)
+    return detector
+
+
+def test_classification():
+    for isn in (1000, (1 << 32) - 150):  # 第二种情况在数据中间回绕
+        base = (isn + 1) % (1 << 32)
+
+        def seq(offset: int) -> int:
+            return (base + offset) % (1 << 32)
+
+        detector = _detector(isn)
+        assert detector.on_segment(seq(0), 100, DATA) == SEG_NEW
+        assert detector.on_segment(seq(200), 100, DATA) == SEG_NEW
+        # 补上中间的空洞（抓包中乱序）
+        assert detector.on_segment(seq(100), 100, DATA) == SEG_OUT_OF_ORDER
+        # 完整重传，以及与已发送数据部分重叠、同时带新数据的报文
+        assert detector.on_segment(seq(0), 100, DATA) == SEG_RETRANSMISSION
+        assert detector.on_segment(seq(250), 150, DATA) == SEG_RETRANSMISSION
+
+        # 对端确认到 200，之后两个重复 ACK：重传 200 是快速重传
+        assert not detector.on_ack(seq(200), 1000, pure=True)
+        assert detector.on_ack(seq(200), 1000, pure=True)
+        assert detector.on_ack(seq(200), 1000, pure=True)
+        assert detector.on_segment(seq(200), 100, DATA) == SEG_FAST_RETRANSMISSION
+        # 已确认的数据再次出现
+        assert detector.on_segment(seq(0), 100, DATA) == SEG_SPURIOUS_RETRANSMISSION
+        # keep-alive：next_seq - 1 的 1 字节探测
+        assert detector.on_segment(seq(399), 1, TCP_ACK) == SEG_KEEP_ALIVE
+        assert detector.on_segment(seq(400), 0, TCP_FIN | TCP_ACK) == SEG_NEW
+
+        detector.on_ack(seq(401))
+        assert len(detector) == 0
+        assert detector.stats() == {'in_flight_ranges': 0, 'in_flight_bytes': 0, 'dup_acks': 2, 'merges': 0}
+
+
+def test_dup_acks_need_pure_acks_and_same_window():
+    detector = _detector(0)
+    detector.on_segment(1, 100, DATA)
+    detector.on_ack(1, 500, pure=True)
+    assert not detector.on_ack(1, 500, pure=False)
+    assert not detector.on_ack(1, 600, pure=True)
+    assert detector.on_ack(1, 600, pure=True)
+    assert detector.dup_acks == 1
+
+
+def test_ranges_are_bounded_without_acks():
+    detector = RetransmissionDetector(max_ranges=4)
+    detector.on_segment(0, 0, TCP_SYN)
+    # 只抓到每隔一个的报文，对端 ACK 全部缺失
+    for i in range(0, 40, 2):
+        detector.on_segment(1 + i * 100, 100, DATA)
+    assert len(detector) == 4 and detector.merges == 16
+    # 合并后的最低区间 [0, 3300) 包含了中间缺失的部分
+    detector.on_ack(1 + 3000)
+    assert detector.stats()['in_flight_bytes'] == 300 + 3 * 100
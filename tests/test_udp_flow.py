@@ -0,0 +1,70 @@
+"""
+UDP 流表：检查点往返，以及处理数据包的同时从其他线程查询
+"""
+import threading
+
+from backend.services.checkpoint import _decode, _encode
+from backend.services.udp_flow import UDPFlowTracker
+
+from tests.packets import CLIENT_IP, udp_record
+
+DNS_QUERY = bytes.fromhex("12340100000100000000000003777777076578616d706c6503636f6d0000010001")
+
+
+def _records(count: int, start: float = 1_700_000_000.0):
+    records = []
+    for i in range(count):
+        t = start + i * 0.01
+        port = 30000 + i % 500
+        records.append(udp_record(CLIENT_IP, port, "10.0.0.53", 53, DNS_QUERY, t))
+        records.append(udp_record("10.0.0.53", 53, CLIENT_IP, port, DNS_QUERY + b'\x00' * (i % 40), t + 0.002))
+    return records
+
+
+def _snapshot(tracker: UDPFlowTracker) -> list:
+    return sorted(tracker.get_all_flows(), key=lambda flow: (flow['stream_id'], flow['active']))
+
+
+def test_checkpoint_full_and_delta_round_trip():
+    live = UDPFlowTracker(idle_timeout=2.0, max_flows=300)
+    states = []
+    for i, record in enumerate(_records(4000)):
+        live.process_record(record, record.timestamp)
+        if i % 900 == 0:
+            states.append(_decode(_encode(live.checkpoint_state(full=not states))))
+    states.append(_decode(_encode(live.checkpoint_state(full=False))))
+
+    restored = UDPFlowTracker(idle_timeout=2.0, max_flows=300)
+    for state in states:
+        restored.restore_state(state)
+    assert _snapshot(restored) == _snapshot(live)
+    assert restored.stats()['evicted'] == live.stats()['evicted']
+    assert restored.get_protocol_stats() == {'DNS': len(restored)}
+
+
+def test_queries_while_capturing():
+    tracker = UDPFlowTracker(idle_timeout=0.5, max_flows=200)
+    done = threading.Event()
+    errors = []
+
+    def query():
+        try:
+            while not done.is_set():
+                flows = tracker.get_all_flows()
+                tracker.stats()
+                for flow in flows[:5]:
+                    tracker.get_flow_stats(flow['stream_id'])
+        except Exception as e:  # pragma: no cover - 失败时在主线程断言
+            errors.append(e)
+
+    threads = [threading.Thread(target=query) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    try:
+        for record in _records(20000):
+            tracker.process_record(record, record.timestamp)
+    finally:
+        done.set()
+        for thread in threads:
+            thread.join()
+    assert errors == []
@@ -0,0 +1,82 @@
+"""
+实时推送二进制编码：编码/解码往返、字符串表重置，以及一批的字符串超过表容量时拆帧
+"""
+import pytest
+
+from backend.services.wire_format import FLAG_RESET_TABLE, PacketWireEncoder, decode_batch
+
+
+def _packet(i: int, path: str = "/api/users", **fields) -> dict:
+    packet = {
+        'id': i, 'timestamp': f"10:00:{i % 60:02d}.{i % 1000:03d}", 'source': "192.168.1.10:50000",
+        'sourceIP': "192.168.1.10:50000", 'destination': "10.0.0.5:80", 'method': "GET", 'path': path,
+        'protocol': "HTTP", 'status': 200, 'latency': "-", 'size': f"{100 + i}B", 'info': f"GET {path} HTTP/1.1",
+        'traceId': f"pkt_{i}", 'category': "client", 'body': "",
+        'tcp': {'is_retransmission': i % 3 == 0, 'is_out_of_order': False, 'stream_state': "ESTABLISHED",
+                'retransmission_rate': 0.25},
+        'http': {'type': 'request', 'method': "GET", 'url': path, 'headers': {'Host': "example.com"}, 'body': ""},
+        'tls': None
+    }
+    packet.update(fields)
+    return packet
+
+
+def _decode_all(frames: list, strings: list) -> list:
+    packets = []
+    for frame in frames:
+        packets += decode_batch(frame, strings)
+    return packets
+
+
+def test_round_trip():
+    packets = [
+        _packet(1),
+        _packet(2, http={'type': 'response', 'status_code': 404, 'reason': "Not Found",
+                         'headers': {'Content-Type': "text/plain"}, 'body': "missing"}),
+        # 结构化编码不支持的 HTTP 段、TLS、非标准时间/大小、额外字段
+        _packet(3, http={'type': 'response', 'status_code': "bad"}, protocol="TLS",
+                tls={'version': "TLS 1.2", 'content_type': "Handshake"}),
+        _packet(4, timestamp="2024-01-01", size="1.2KB", sourceIP="other", traceId="custom", tcp=None, http=None,
+                extra_field=[1, 2], info="中文 " + "x" * 300),
+    ]
+    encoder = PacketWireEncoder()
+    strings = []
+    decoded = _decode_all(encoder.encode(packets), strings)
+    assert decoded == packets
+    # 字符串表随会话保留：第二批只传新字符串
+    frames = encoder.encode([_packet(5)])
+    assert len(frames) == 1 and decode_batch(frames[0], strings) == [_packet(5)]
+    assert len(strings) == encoder.stats()['strings']
+
+
+def test_table_reset_between_batches():
+    encoder = PacketWireEncoder()
+    encoder.MAX_STRINGS = 40
+    strings = []
+    for batch in range(10):
+        packets = [_packet(batch * 4 + i, path=f"/items/{batch}/{i}") for i in range(4)]
+        frames = encoder.encode_batch(packets)
+        assert len(frames) == 1
+        assert decode_batch(frames[0], strings) == packets
+    assert encoder.table_resets > 0 and len(strings) <= 40
+
+    # 解码端的字符串表与编码端不同步时报错
+    with pytest.raises(ValueError):
+        decode_batch(encoder.encode_batch([_packet(99, path="/new")])[0], [])
+
+
+def test_batch_larger_than_table_is_split():
+    encoder = PacketWireEncoder()
+    encoder.MAX_STRINGS = 30
+    strings = []
+    packets = [_packet(i, path=f"/unique/{i}") for i in range(40)]
+    frames = encoder.encode(packets)
+    assert len(frames) > 1 and frames[0][3] & FLAG_RESET_TABLE
+    assert _decode_all(frames, strings) == packets
+
+    # 单个数据包的头部超过表容量：HTTP 段退回 JSON
+    headers = {f"X-Header-{i}": f"value-{i}" for i in range(40)}
+    big = _packet(100, http={'type': 'request', 'method': "GET", 'url': "/", 'headers': headers, 'body': ""})
+    frames = encoder.encode([big, _packet(101)])
+    assert _decode_all(frames, strings) == [big, _packet(101)]
+    assert encoder.stats()['packets'] == 42